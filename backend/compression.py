@@ -0,0 +1,113 @@
+"""Response compression middleware (brotli when available, else gzip)"""
+import gzip
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "application/vnd.vocalize", "application/msgpack", "text/")
+
+
+def choose_encoding(accept_encoding):
+    """Best content-coding we support from an Accept-Encoding header"""
+    offered = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        offered[name.strip().lower()] = quality
+    if brotli is not None and offered.get("br", 0) > 0:
+        return "br"
+    if offered.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def vary_on_encoding(headers):
+    """Response headers with Accept-Encoding added to Vary (names lowercased, one Vary header)"""
+    headers = [(k.lower(), v) for k, v in headers]
+    vary = [item.strip() for k, v in headers if k == b"vary"
+            for item in v.decode("latin-1").split(",") if item.strip()]
+    if not any(item.lower() in ("accept-encoding", "*") for item in vary):
+        vary.append("Accept-Encoding")
+    return [(k, v) for k, v in headers if k != b"vary"] + [(b"vary", ", ".join(vary).encode("latin-1"))]
+
+
+class CompressionMiddleware:
+    """
+    Compress complete (non-streamed) responses above minimum_size bytes
+
+    Streamed responses and ones that already carry a Content-Encoding
+    pass through untouched. Every response says Vary: Accept-Encoding,
+    compressed or not, so caches never hand one client's encoding to
+    another.
+    """
+
+    def __init__(self, app, minimum_size=500, gzip_level=6, brotli_quality=5):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        start_message = None
+        started = False
+
+        async def send_start():
+            nonlocal started
+            started = True
+            await send(start_message)
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = {**message, "headers": vary_on_encoding(message.get("headers", []))}
+                if encoding is None:
+                    await send_start()
+                return
+            if started:
+                await send(message)
+                return
+            if message["type"] != "http.response.body":
+                await send_start()
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            response_headers = dict(start_message["headers"])
+            content_type = response_headers.get(b"content-type", b"").decode("latin-1")
+            if (message.get("more_body", False)
+                    or b"content-encoding" in response_headers
+                    or len(body) < self.minimum_size
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)):
+                await send_start()
+                await send(message)
+                return
+
+            if encoding == "br":
+                body = brotli.compress(body, quality=self.brotli_quality)
+            else:
+                body = gzip.compress(body, self.gzip_level)
+            start_message["headers"] = [(k, v) for k, v in start_message["headers"] if k != b"content-length"]
+            start_message["headers"] += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(body)).encode()),
+            ]
+            await send_start()
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+        if start_message is not None and not started:
+            # The app ended the response without a body message
+            await send_start()
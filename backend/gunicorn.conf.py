@@ -0,0 +1,27 @@
+"""
+Gunicorn settings for production (Koyeb)
+    gunicorn -c gunicorn.conf.py main:app
+
+The app is imported once in the master (preload_app), so every worker
+forks with the engine loaded; each worker then starts its own conversion
+process pool and STT connection pool (vocalize_engine.workers).
+"""
+import os
+
+cores = os.cpu_count() or 1
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+# Conversion runs in the process pools, so web workers are mostly I/O-bound
+workers = int(os.getenv("WEB_CONCURRENCY", max(2, cores // 2)))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+# SIGTERM: stop accepting, give in-flight analyses (STT of a 10 minute
+# recording takes a while) this long to finish
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 120))
+timeout = int(os.getenv("WORKER_TIMEOUT", 300))
+keepalive = 5
+
+# Read by vocalize_engine.workers to size each worker's share of the cores
+os.environ["WEB_CONCURRENCY"] = str(workers)
+os.environ.setdefault("GRACEFUL_TIMEOUT", str(graceful_timeout))
@@ -4,20 +4,94 @@ Deployed on Koyeb
 """
 import sys
 import os
-import shutil
-from fastapi import FastAPI, UploadFile, File
+import time
+import math
+import uuid
+import asyncio
+import threading
+import functools
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 
-# Add current directory to path for imports
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+try:
+    import vocalize_engine  # noqa: F401
+except ImportError:
+    # Source checkout without `pip install -e .`: the engine lives at the repo root
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from evaluation_engine.stt_api_key import analyze_audio_with_api_key
+from vocalize_engine import analyze_acoustic_fluency, analyze_audio_with_api_key, analyze_fluency, hedging, workers
+from vocalize_engine import analyze_audio_streaming, credentials, fingerprint, percentiles, profiling, sharedpcm
+from vocalize_engine.breaker import stt_breaker
+from vocalize_engine.channels import analyze_channels_with_api_key, channel_layout
+from vocalize_engine.codecs import prepare_for_stt
+from vocalize_engine.encoding import encode_result, from_columnar, negotiate_format
+from vocalize_engine.probe import probe_audio
+from vocalize_engine.profiles import PROFILES, get_profile
+from vocalize_engine.store import AnalysisStore, file_hash
+from vocalize_engine.stt import stt_endpoints
+from vocalize_engine.planner import audio_duration
+from vocalize_engine.timeline import FluencyIndex, TimelineError, window_count
+from vocalize_engine.ingest import IngestError
+
+from compression import CompressionMiddleware
+from streaming_upload import ingest_upload, save_raw_upload, save_upload, save_upload_prefix
 
 load_dotenv()
 API_KEY = os.getenv("GOOGLE_API_KEY")
 
-app = FastAPI()
+# Several keys / projects (STT_CREDENTIALS): each STT call goes to the least-loaded one with quota left
+stt_pool = credentials.load_pool()
+STT_AUTH = stt_pool or API_KEY
+
+# Uploads are rejected as soon as they cross either limit
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 50 * 1024 * 1024))
+MAX_AUDIO_SECONDS = float(os.getenv("MAX_AUDIO_SECONDS", 600))
+
+# Whole-request budget for /analyze; clients may ask for less with X-Request-Timeout (seconds)
+ANALYZE_TIMEOUT = float(os.getenv("ANALYZE_TIMEOUT", 120))
+
+# Optional SQLite history; results are kept for /rescore and /history when set
+ANALYSIS_DB = os.getenv("ANALYSIS_DB")
+store = AnalysisStore(ANALYSIS_DB) if ANALYSIS_DB else None
+
+# FluencyIndex per (analysis_id, profile) for /history/{id}/window, least recently used first
+INDEX_CACHE_SIZE = 64
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+# Near-duplicate audio (re-encoded copies of stored recordings); loaded from the store on first use
+fingerprints = fingerprint.FingerprintIndex()
+
+# Population sketches for percentile ranks (merged across workers via PERCENTILES_FILE)
+population = percentiles.Population()
+
+# Token for /admin/* and the X-Profile request header (both disabled when unset)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Seconds a stopping worker waits for in-flight analyses (match gunicorn's graceful_timeout)
+GRACEFUL_TIMEOUT = float(os.getenv("GRACEFUL_TIMEOUT", 120))
+
+# Import/compile the engine now: under gunicorn (preload_app) this runs once
+# in the master and every worker forks with it already loaded
+workers.preload()
+
+@asynccontextmanager
+async def lifespan(app):
+    # Per worker: start conversion processes and the STT HTTP pool before traffic
+    await run_in_threadpool(workers.warm)
+    if stt_endpoints:
+        # Probing is per worker: the first round picks the endpoint before traffic arrives
+        stt_endpoints.start()
+    yield
+    # No new requests by now; let running analyses finish, then release the pools
+    await run_in_threadpool(workers.drain, GRACEFUL_TIMEOUT)
+    await run_in_threadpool(population.flush)
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS for Vercel frontend
 app.add_middleware(
@@ -32,44 +106,589 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip/brotli for clients that send Accept-Encoding
+app.add_middleware(CompressionMiddleware)
+
+
+def render(result, request, fields=None, format=None):
+    """Encode a result in the layout the client negotiated (format= or Accept)"""
+    fmt = negotiate_format(format, request.headers.get("accept"))
+    body, media_type = encode_result(result, fmt, fields)
+    return Response(content=body, media_type=media_type)
+
+async def run_cpu(fn, *args, **kwargs):
+    """Run CPU-bound engine work in this worker's process pool"""
+    loop = asyncio.get_running_loop()
+    trace = profiling.current.get()
+    if trace is None:
+        return await loop.run_in_executor(workers.process_pool(), functools.partial(fn, *args, **kwargs))
+    result, record = await loop.run_in_executor(
+        workers.process_pool(),
+        functools.partial(profiling.run_profiled, trace.kinds, fn.__name__, fn, *args, **kwargs))
+    trace.add(record)
+    return result
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run blocking (I/O) engine work in the thread pool"""
+    trace = profiling.current.get()
+    if trace is None:
+        return await run_in_threadpool(fn, *args, **kwargs)
+    result, record = await run_in_threadpool(profiling.run_profiled, trace.kinds, fn.__name__, fn, *args, **kwargs)
+    trace.add(record)
+    return result
+
+def tracked(endpoint):
+    """Count the endpoint's requests as in flight (drained on shutdown)"""
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        with workers.in_flight():
+            return await endpoint(*args, **kwargs)
+    return wrapper
+
+def is_admin(request):
+    return bool(ADMIN_TOKEN) and request.headers.get("x-admin-token") == ADMIN_TOKEN
+
+def profiled(endpoint):
+    """
+    Profile the request's pipeline when asked (X-Profile from an admin) or sampled
+    The artifact id comes back in X-Profile-Id; fetch it from /admin/profiles.
+    """
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        request = kwargs["request"]
+        header = request.headers.get("x-profile") if is_admin(request) else None
+        kinds = profiling.requested_kinds(header)
+        if kinds is None:
+            return await endpoint(*args, **kwargs)
+        trace = profiling.RequestProfile(kinds, request.url.path)
+        token = profiling.current.set(trace)
+        try:
+            response = await endpoint(*args, **kwargs)
+        finally:
+            profiling.current.reset(token)
+        if not isinstance(response, Response):
+            response = JSONResponse(response)
+        await run_in_threadpool(trace.save, status=response.status_code)
+        response.headers["X-Profile-Id"] = trace.id
+        return response
+    return wrapper
+
+def request_deadline(request):
+    """time.monotonic() deadline for this request, passed down to every STT call"""
+    timeout = ANALYZE_TIMEOUT
+    try:
+        timeout = min(timeout, float(request.headers.get("x-request-timeout", timeout)))
+    except ValueError:
+        pass
+    return time.monotonic() + timeout
+
+# Acoustic-only answers given while STT was unavailable (this worker)
+_degraded = {"count": 0}
+
+async def degraded(failure, audio, raw_path, converted_path, profile):
+    """
+    Local acoustic estimate in place of an STT result, flagged "degraded"
+    Returns (result, None), or (None, 503 response) when the audio can't be
+    decoded to PCM here.
+    """
+    try:
+        if audio["path"] != converted_path:
+            # Opus/FLAC went to the API untouched, or WAV was streamed as uploaded; the acoustic pass
+            # needs 16kHz mono PCM
+            await run_cpu(prepare_for_stt, raw_path, converted_path, allow_native=False)
+        result = await run_cpu(analyze_acoustic_fluency, converted_path, profile)
+    except Exception as e:
+        retry_after = math.ceil(failure.get("retry_after") or stt_breaker.retry_after())
+        return None, JSONResponse({**failure, "fallback_error": str(e)}, status_code=503,
+                                  headers={"Retry-After": str(retry_after)} if retry_after else None)
+    _degraded["count"] += 1
+    result.update(degraded=True, degraded_reason=failure["error"])
+    return result, None
+
+async def analyze_by_channel(request, upload_id, annotate, profile, deadline, timeline=None, reference=None):
+    """
+    /analyze?channels=true: each channel of a WAV is a separate speaker
+    Channels are converted side by side in the process pool, each into a
+    shared-memory segment lent from this worker's pool (only names and
+    sizes are pickled); the segments go back to the pool afterwards.
+    A reference passage is aligned against every channel.
+    Returns the result dict, or a response for errors.
+    """
+    raw_path = f"/tmp/temp_upload_{upload_id}"
+    try:
+        form = {}
+        with profiling.stage("ingest_upload"):
+            await save_upload(request, raw_path, MAX_UPLOAD_BYTES, form=form)
+        reference = form_reference(reference, form)
+        channels, target_rate = await run_in_threadpool(channel_layout, raw_path, MAX_AUDIO_SECONDS)
+        if timeline:
+            seconds, _ = await run_in_threadpool(audio_duration, raw_path, "LINEAR16")
+            error = timeline_error(timeline, seconds)
+            if error:
+                return error
+        size = await run_in_threadpool(sharedpcm.converted_size, raw_path, target_rate)
+        with sharedpcm.lend(channels, size) as segments:
+            handles = await asyncio.gather(*(run_cpu(sharedpcm.convert_shared, raw_path, segment,
+                                                     target_rate=target_rate, channel=channel)
+                                             for channel, segment in enumerate(segments)))
+            result = await run_blocking(analyze_channels_with_api_key, handles, STT_AUTH, "auto",
+                                        annotate=annotate, sample_rate_hertz=target_rate, profile=profile,
+                                        deadline=deadline, timeline=timeline, reference=reference)
+            if result.get("deadline_exceeded"):
+                return JSONResponse(result, status_code=504)
+            if result.get("stt_unavailable"):
+                # Acoustic estimate per speaker while Google is down (never stored)
+                estimates = await asyncio.gather(*(run_cpu(analyze_acoustic_fluency, handle, profile)
+                                                   for handle in handles))
+                _degraded["count"] += 1
+                return {"channels": [{"channel": channel, **estimate} for channel, estimate in enumerate(estimates)],
+                        "speakers": channels, "degraded": True, "degraded_reason": result["error"]}
+            return result
+    finally:
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+
+def rank(metrics, cohort=None, observe=True):
+    """Percentile ranks of metrics in their cohort, then count them in (blocking: may flush)"""
+    ranks = population.ranks(metrics, cohort, "auto")
+    if observe:
+        population.observe(metrics, cohort, "auto")
+    return ranks
+
+def near_duplicate(fp):
+    """(stored analysis, match) for near-identical audio, or (None, None); blocking: syncs the index"""
+    fingerprints.sync(store)
+    match = fingerprints.lookup(fp, "auto")
+    if match is None:
+        return None, None
+    stored = store.get(match["key"])
+    return (stored, {"analysis_id": match["key"], "bit_error_rate": match["bit_error_rate"],
+                     "shift": match["shift"]}) if stored else (None, None)
+
+def save_analysis(result, content_hash, user, session, profile, fp=None):
+    """Store result and its fingerprint; returns the analysis_id (blocking: SQLite writes)"""
+    analysis_id = store.save(result, content_hash, user_id=user, session_id=session, language="auto",
+                             profile=profile)
+    if fp is not None:
+        store.save_fingerprint(analysis_id, fingerprint.to_bytes(fp))
+        fingerprints.add(analysis_id, fp, "auto")
+    return analysis_id
+
+def profile_error(profile):
+    """400 response for an unknown scoring profile, else None"""
+    try:
+        get_profile(profile)
+    except ValueError as e:
+        return JSONResponse({"error": str(e), "profiles": sorted(PROFILES)}, status_code=400)
+    return None
+
+def timeline_error(timeline, seconds=0.0):
+    """400 response for a timeline window that is too short or too many windows over seconds, else None"""
+    if timeline is None:
+        return None
+    try:
+        window_count(timeline, seconds)
+    except TimelineError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    return None
+
+def reference_error(reference):
+    """400 response unless reference is passage text or a list of its words (or absent), else None"""
+    if reference is None or isinstance(reference, str):
+        return None
+    if isinstance(reference, list) and all(isinstance(word, str) for word in reference):
+        return None
+    return JSONResponse({"error": "reference must be the passage text or a list of its words"}, status_code=400)
+
+def form_reference(reference, form):
+    """The reference query parameter, else the "reference" form field"""
+    return reference or form.get("reference", b"").decode("utf-8", "replace") or None
+
+def words_end(words):
+    """End time of the last word (what a timeline series runs to)"""
+    return max((float(w["endTime"]) for w in words), default=0.0)
+
+def cohort_error(cohort):
+    """400 response for a cohort name that can't be a sketch key, else None"""
+    if cohort and (len(cohort) > 64 or "|" in cohort):
+        return JSONResponse({"error": "cohort must be at most 64 characters, without '|'"}, status_code=400)
+    return None
+
+def store_disabled():
+    return JSONResponse({"error": "Analysis store disabled (set ANALYSIS_DB)"}, status_code=404)
+
+def rescored(stored, annotate=False, profile=None, timeline=None, reference=None):
+    """A stored analysis in /analyze's shape, metrics recomputed with profile"""
+    metrics = analyze_fluency(stored["words"], annotate=annotate, profile=profile, timeline=timeline,
+                              reference=reference)
+    result = {
+        "transcript": stored["transcript"],
+        "word_count": stored["word_count"],
+        "words": stored["words"],
+        "fluency_metrics": metrics,
+    }
+    if "annotations" in metrics:
+        result["annotations"] = metrics.pop("annotations")
+    return result
+
 @app.get("/")
 def home():
     return {"status": "Fluency Analysis API Running on Koyeb"}
 
 @app.get("/health")
 def health():
-    return {"status": "healthy"}
-
-from convert_audio import convert_to_google_format
+    return {"status": "healthy", "pid": os.getpid(), "in_flight": workers.active_count()}
 
 @app.post("/analyze")
-async def analyze_audio(file: UploadFile = File(...)):
+@tracked
+@profiled
+async def analyze_audio(request: Request, annotate: bool = False, fields: str = None, format: str = None,
+                        profile: str = None, user: str = None, session: str = None, stream: bool = False,
+                        channels: bool = False, timeline: float = None, reference: str = None,
+                        cohort: str = None):
+    """
+    Analyze the recording in form field "file"; WAV is converted while it uploads
+    stream=true saves WAV as uploaded and converts it in 100ms slices onto
+    gRPC streaming_recognize (no base64, first results sooner, up to ~5
+    minutes without splitting).
+    channels=true treats each channel of a WAV as its own speaker and
+    returns per-channel transcripts and fluency_metrics (not stored).
+    timeline=60 adds fluency_metrics["timeline"]: the metrics per 60s window.
+    A "reference" form field (or query parameter) with the passage being
+    read aloud adds fluency_metrics["reading"]: accuracy and the alignment
+    (for every channel with channels=true).
+    "percentiles" ranks the metrics against earlier analyses in cohort
+    (default "all"); see /percentiles.
+    With ANALYSIS_DB set the result is stored under user/session, and audio
+    that was already transcribed is rescored from the store instead of STT:
+    the same bytes, or near-identical audio by acoustic fingerprint
+    ("near_duplicate": the stored analysis and its bit error rate).
+    While STT is unavailable (circuit open, 5xx, quota) the answer is a local
+    acoustic estimate flagged "degraded" (header X-Degraded), or 503.
+    """
+    deadline = request_deadline(request)
+    error = profile_error(profile) or timeline_error(timeline) or cohort_error(cohort)
+    if error:
+        return error
     # Use /tmp/ for temp files
-    upload_path = f"/tmp/temp_upload_{file.filename}"
-    converted_path = f"/tmp/temp_converted_{file.filename}.wav"
+    upload_id = uuid.uuid4().hex
+    converted_path = f"/tmp/temp_converted_{upload_id}.wav"
+    raw_path = f"/tmp/temp_upload_{upload_id}"
+    pcm_path = f"/tmp/temp_pcm_{upload_id}.wav"
     
     try:
-        with open(upload_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        # Convert audio to Google-compatible format
-        convert_to_google_format(upload_path, converted_path)
+        if channels:
+            result = await analyze_by_channel(request, upload_id, annotate, profile, deadline, timeline,
+                                              reference)
+            if isinstance(result, Response):
+                return result
+            response = render(result, request, fields, format)
+            if result.get("degraded"):
+                response.headers["X-Degraded"] = "stt-unavailable"
+            return response
+
+        form = {}
+        with profiling.stage("ingest_upload"):
+            if stream:
+                # Kept as uploaded: recognize_streaming converts WAV in 100ms slices as it streams
+                summary = await save_raw_upload(request, raw_path, MAX_UPLOAD_BYTES, MAX_AUDIO_SECONDS,
+                                                form=form)
+            else:
+                # WAV is kept at its native rate when sending that is cheaper than resampling
+                summary = await ingest_upload(request, converted_path, max_bytes=MAX_UPLOAD_BYTES,
+                                              max_seconds=MAX_AUDIO_SECONDS, raw_file=raw_path,
+                                              target_rate=None, form=form)
+        reference = form_reference(reference, form)
+        audio = {"path": converted_path, "encoding": "LINEAR16", "sample_rate_hertz": summary.get("target_rate")}
+        if stream and summary["container"] == "wav":
+            audio["path"] = raw_path
+        elif summary["container"] != "wav":
+            # Opus/FLAC go to the API untouched; anything else is decoded
+            audio = await run_cpu(prepare_for_stt, raw_path, converted_path)
+        if timeline:
+            # Refuse a series that can't be built before paying for STT (WebM's length is only a bound)
+            seconds, exact = await run_in_threadpool(audio_duration, audio["path"], audio["encoding"])
+            error = exact and timeline_error(timeline, seconds)
+            if error:
+                return error
         
-        # Analyze using API Key
-        result = analyze_audio_with_api_key(converted_path, API_KEY, "auto")
+        content_hash = cached = None
+        if store:
+            # Hashing reads the whole file and find() is a SQLite query: both off the event loop
+            content_hash = await run_in_threadpool(file_hash, audio["path"])
+            cached = await run_in_threadpool(store.find, content_hash, "auto")
+        fp = near = None
+        if store and not cached and fingerprints.threshold:
+            # Same speech in different bytes (re-exported / re-encoded): reuse that analysis
+            fp = await run_cpu(fingerprint.fingerprint_audio, audio["path"], audio["encoding"], pcm_path)
+            if fp is not None:
+                cached, near = await run_in_threadpool(near_duplicate, fp)
+        if cached:
+            result = rescored(cached, annotate, profile, timeline, reference)
+        else:
+            # Analyze using API Key (blocking HTTP; keep it off the event loop)
+            if stream and audio["encoding"] == "LINEAR16":
+                result = await run_blocking(analyze_audio_streaming, audio["path"], STT_AUTH, "auto",
+                                            annotate=annotate, profile=profile, deadline=deadline,
+                                            timeline=timeline, reference=reference)
+            else:
+                result = await run_blocking(analyze_audio_with_api_key, audio["path"], STT_AUTH, "auto",
+                                            annotate=annotate, encoding=audio["encoding"],
+                                            sample_rate_hertz=audio["sample_rate_hertz"],
+                                            profile=profile, deadline=deadline, timeline=timeline,
+                                            reference=reference)
+            if result.get("deadline_exceeded"):
+                return JSONResponse(result, status_code=504)
+            if result.get("stt_unavailable"):
+                # Google down / over quota: answer from the audio alone (never stored)
+                result, error = await degraded(result, audio, raw_path, converted_path, profile)
+                if error:
+                    return error
+                response = render(result, request, fields, format)
+                response.headers["X-Degraded"] = "stt-unavailable"
+                return response
+        
+        if "error" not in result.get("fluency_metrics", {"error": True}):
+            # A cached recording was already counted when it was first analyzed
+            result["percentiles"] = await run_in_threadpool(rank, result["fluency_metrics"], cohort,
+                                                            observe=not cached)
+        
+        if store and "error" not in result:
+            # A near duplicate's fingerprint is already stored under the analysis it matched
+            result["analysis_id"] = await run_in_threadpool(save_analysis, result, content_hash, user, session,
+                                                            profile, None if near else fp)
+            result["cached"] = bool(cached)
+            if near:
+                result["near_duplicate"] = near
             
-        return result
+        return render(result, request, fields, format)
+        
+    except IngestError as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code)
+        
+    except TimelineError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+        
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return {"error": str(e)}
+        
+    finally:
+        for path in (converted_path, raw_path, pcm_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+@app.post("/prescore")
+@tracked
+@profiled
+async def prescore_audio(request: Request, fields: str = None, format: str = None, profile: str = None):
+    """Provisional acoustic-only score for practice mode (no STT call)"""
+    error = profile_error(profile)
+    if error:
+        return error
+    upload_id = uuid.uuid4().hex
+    converted_path = f"/tmp/temp_converted_{upload_id}.wav"
+    raw_path = f"/tmp/temp_upload_{upload_id}"
+    
+    try:
+        with profiling.stage("ingest_upload"):
+            summary = await ingest_upload(request, converted_path, max_bytes=MAX_UPLOAD_BYTES,
+                                          max_seconds=MAX_AUDIO_SECONDS, raw_file=raw_path)
+        if summary["container"] != "wav":
+            # The acoustic pass needs PCM, so even Opus/FLAC are decoded
+            await run_cpu(prepare_for_stt, raw_path, converted_path, allow_native=False)
+        
+        return render(await run_cpu(analyze_acoustic_fluency, converted_path, profile), request, fields, format)
+        
+    except IngestError as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code)
         
     except Exception as e:
         print(f"Error: {str(e)}")
         return {"error": str(e)}
         
     finally:
-        # Cleanup both files
-        if os.path.exists(upload_path):
-            os.remove(upload_path)
-        if os.path.exists(converted_path):
-            os.remove(converted_path)
+        for path in (converted_path, raw_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+@app.post("/probe")
+async def probe(request: Request):
+    """
+    Duration, format, speech ratio, STT plan/cost and whether /analyze would
+    accept the upload; reads the header and a sparse energy scan only
+    """
+    raw_path = f"/tmp/temp_probe_{uuid.uuid4().hex}"
+    try:
+        # Oversized uploads are still described (and marked not accepted), from their first bytes
+        total_bytes = await save_upload_prefix(request, raw_path, MAX_UPLOAD_BYTES)
+        return await run_in_threadpool(probe_audio, raw_path, max_bytes=MAX_UPLOAD_BYTES,
+                                       max_seconds=MAX_AUDIO_SECONDS, total_bytes=total_bytes)
+    except IngestError as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code)
+    finally:
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+
+@app.get("/percentiles")
+def percentile_summary(cohort: str = None):
+    """Approximate population quantiles (p10-p90) of every metric in a cohort"""
+    return {**population.summary(cohort, "auto"), "cohorts": population.cohorts()}
+
+@app.get("/metrics")
+def metrics():
+    """This worker's STT latency/hedging counters, circuit breaker, credentials, endpoints and degraded answers"""
+    out = {"pid": os.getpid(), "stt": hedging.stats.snapshot(), "breaker": stt_breaker.snapshot(),
+           "degraded": _degraded["count"]}
+    if stt_pool:
+        out["credentials"] = stt_pool.snapshot()
+    if stt_endpoints:
+        out["endpoints"] = stt_endpoints.snapshot()
+    return out
+
+@app.get("/admin/profiles")
+def admin_profiles(request: Request):
+    """Saved request profiles, newest first (X-Admin-Token required)"""
+    if not is_admin(request):
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    return {"profiles": profiling.list_profiles()}
+
+@app.get("/admin/profiles/{profile_id}")
+def admin_profile(request: Request, profile_id: str):
+    """One profile: stage timings, top functions and allocation sites"""
+    if not is_admin(request):
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    summary = profiling.load(profile_id)
+    if not summary:
+        return JSONResponse({"error": "Unknown profile_id"}, status_code=404)
+    return summary
+
+@app.get("/admin/profiles/{profile_id}/pstats")
+def admin_profile_pstats(request: Request, profile_id: str):
+    """The merged cProfile stats (python -m pstats / snakeviz)"""
+    path = profiling.pstats_path(profile_id) if is_admin(request) else None
+    if not path:
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
+
+@app.get("/profiles")
+def list_profiles():
+    """Scoring profiles accepted by ?profile= and /rescore"""
+    return {"profiles": [p.describe() for p in PROFILES.values()]}
+
+@app.post("/rescore")
+async def rescore(request: Request, fields: str = None, format: str = None):
+    """
+    Recompute fluency metrics from stored word timings (no STT, no audio)
+    Body: {"words": [...] or columnar {"word", "startMs", "endMs"},
+           "profile": "esl", "annotate": false}
+    or {"analysis_id": 42, ...} to rescore a stored analysis
+    "timeline": 60 adds a per-window series; "ranges": [[t0, t1], ...]
+    adds "windows", the metrics for each [t0, t1) range; "reference": the
+    passage read aloud adds read-aloud accuracy
+    """
+    try:
+        body = await request.json()
+        words = from_columnar(body["words"]) if "analysis_id" not in body else None
+    except (ValueError, KeyError, TypeError):
+        return JSONResponse({"error": "Expected JSON with a \"words\" list or columnar words"}, status_code=400)
+    profile = body.get("profile")
+    timeline = body.get("timeline")
+    ranges = body.get("ranges") or []
+    try:
+        timeline = float(timeline) if timeline is not None else None
+        ranges = [(float(t0), float(t1)) for t0, t1 in ranges]
+    except (ValueError, TypeError):
+        return JSONResponse({"error": "Expected \"timeline\" seconds and \"ranges\" as [[t0, t1], ...]"},
+                            status_code=400)
+    reference = body.get("reference") or None
+    error = profile_error(profile) or timeline_error(timeline) or reference_error(reference)
+    if error:
+        return error
+
+    if words is None:
+        if not store:
+            return store_disabled()
+        stored = await run_in_threadpool(store.get, body["analysis_id"])
+        if not stored:
+            return JSONResponse({"error": "Unknown analysis_id"}, status_code=404)
+        words = stored["words"]
+    error = timeline_error(timeline, words_end(words))
+    if error:
+        return error
+
+    metrics = analyze_fluency(words, annotate=bool(body.get("annotate")) or bool(ranges), profile=profile,
+                              timeline=timeline, reference=reference)
+    result = {"profile": get_profile(profile).name, "fluency_metrics": metrics}
+    if "annotations" in metrics:
+        annotations = metrics.pop("annotations")
+        if body.get("annotate"):
+            result["annotations"] = annotations
+        if ranges:
+            index = FluencyIndex(words, annotations["flags"], profile)
+            result["windows"] = [index.window(t0, t1) for t0, t1 in ranges]
+    return render(result, request, fields, format)
+
+@app.get("/history")
+def history(user: str, since: float = None, until: float = None, limit: int = 100):
+    """A user's stored metric summaries, newest first (created_at is unix time)"""
+    if not store:
+        return store_disabled()
+    return {"user": user, "analyses": store.history(user, since, until, min(limit, 1000))}
+
+@app.get("/history/{analysis_id}")
+def history_item(request: Request, analysis_id: int, fields: str = None, format: str = None):
+    """One stored analysis with transcript and words"""
+    if not store:
+        return store_disabled()
+    stored = store.get(analysis_id)
+    if not stored:
+        return JSONResponse({"error": "Unknown analysis_id"}, status_code=404)
+    return render(stored, request, fields, format)
+
+def stored_index(analysis_id, profile=None):
+    """
+    FluencyIndex over a stored analysis's words, or None for an unknown id
+    Only indexes that were built are cached (an id that is not saved yet is
+    looked up again next time); stored words never change, so entries stay
+    valid until evicted.
+    """
+    key = (analysis_id, profile)
+    with _indexes_lock:
+        index = _indexes.pop(key, None)
+    if index is None:
+        stored = store.get(analysis_id)
+        if not stored:
+            return None
+        index = FluencyIndex(stored["words"], profile=profile)
+    with _indexes_lock:
+        _indexes[key] = index  # most recently used last
+        while len(_indexes) > INDEX_CACHE_SIZE:
+            del _indexes[next(iter(_indexes))]
+    return index
+
+@app.get("/history/{analysis_id}/window")
+def history_window(analysis_id: int, start: float = 0.0, end: float = None, profile: str = None):
+    """Fluency metrics for the words of a stored analysis that start in [start, end)"""
+    if not store:
+        return store_disabled()
+    error = profile_error(profile)
+    if error:
+        return error
+    index = stored_index(analysis_id, profile)
+    if index is None:
+        return JSONResponse({"error": "Unknown analysis_id"}, status_code=404)
+    return index.window(start, end if end is not None else index.end)
+
+@app.post("/history/rescore")
+def history_rescore(profile: str, user: str = None, since: float = None, write: bool = False):
+    """Bulk rescore stored analyses; write=true replaces their stored metrics"""
+    if not store:
+        return store_disabled()
+    error = profile_error(profile)
+    if error:
+        return error
+    return store.rescore(profile, user_id=user, since=since, write=write)
 
 if __name__ == "__main__":
     import uvicorn
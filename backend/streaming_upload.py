@@ -0,0 +1,179 @@
+"""Streaming upload ingestion for /analyze and /prescore
+Parses the multipart body as it arrives and feeds the audio part straight
+into vocalize_engine.ingest, so bad input is rejected from its first bytes
+and conversion overlaps with the upload.
+"""
+from starlette.concurrency import run_in_threadpool
+
+from vocalize_engine.convert import TARGET_RATE
+from vocalize_engine.ingest import IngestError, UploadIngest, WavIngest, inspect_upload
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+MULTIPART_OVERHEAD = 64 * 1024  # headers/boundaries/other fields allowed on top of max_bytes
+MAX_FORM_FIELD_BYTES = 1024 * 1024  # text fields kept next to the audio (e.g. a reference passage)
+
+
+def multipart_feeder(boundary, field, ingest, form=None):
+    """
+    MultipartParser that forwards the bytes of form field `field` to ingest
+    form: dict that receives the other fields' values (bytes, up to MAX_FORM_FIELD_BYTES each)
+    """
+    part = {"headers": {}, "name": b"", "value": b"", "target": False, "found": False, "field": None}
+
+    def on_part_begin():
+        part["headers"] = {}
+        part["target"] = False
+
+    def on_header_field(data, start, end):
+        part["name"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][part["name"].lower()] = part["value"]
+        part["name"] = part["value"] = b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        part["target"] = options.get(b"name") == field.encode() and not part["found"]
+        part["found"] = part["found"] or part["target"]
+        part["field"] = None
+        if form is not None and not part["target"] and options.get(b"name"):
+            part["field"] = options[b"name"].decode("utf-8", "replace")
+            form[part["field"]] = b""
+
+    def on_part_data(data, start, end):
+        if part["target"]:
+            ingest.feed(data[start:end])
+        elif part["field"] is not None:
+            form[part["field"]] += data[start:end]
+            if len(form[part["field"]]) > MAX_FORM_FIELD_BYTES:
+                raise IngestError(f"Form field '{part['field']}' exceeds {MAX_FORM_FIELD_BYTES} bytes", 413)
+
+    callbacks = {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+    }
+    return MultipartParser(boundary, callbacks), part
+
+
+async def ingest_upload(request, output_file, field="file", max_bytes=None, max_seconds=None, raw_file=None,
+                        target_rate=TARGET_RATE, form=None):
+    """
+    Stream the uploaded WAV into output_file (16000Hz mono) as it arrives
+
+    target_rate=None keeps the native rate when that is cheaper to send
+    (rates.choose_sample_rate); summary["target_rate"] is the rate written.
+    Accepts multipart/form-data (audio in `field`) or a raw audio body.
+    With raw_file, WebM/Ogg/FLAC/... uploads are also accepted and saved
+    there as-is (summary["container"] tells which file was written).
+    form: dict filled with the other multipart fields (name -> bytes).
+    Returns the ingest summary; raises IngestError on rejection.
+    """
+    if raw_file:
+        ingest = UploadIngest(output_file, raw_file, max_bytes=max_bytes, max_seconds=max_seconds,
+                              target_rate=target_rate)
+    else:
+        ingest = WavIngest(output_file, max_bytes=max_bytes, max_seconds=max_seconds, target_rate=target_rate)
+    body_limit = max_bytes + MULTIPART_OVERHEAD if max_bytes else None
+    try:
+        await pump_request(request, ingest, field, body_limit, max_bytes, form)
+        return await run_in_threadpool(ingest.finish)
+    except Exception:
+        ingest.abort()
+        raise
+
+
+async def pump_request(request, sink, field="file", body_limit=None, max_bytes=None, form=None):
+    """Feed the audio bytes of a multipart or raw request body to sink.feed()"""
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    received = 0
+    if content_type == b"multipart/form-data":
+        boundary = params.get(b"boundary")
+        if not boundary:
+            raise IngestError("Missing multipart boundary", 400)
+        parser, part = multipart_feeder(boundary, field, sink, form)
+        async for chunk in request.stream():
+            received += len(chunk)
+            if body_limit and received > body_limit:
+                raise IngestError(f"Upload exceeds {max_bytes} bytes", 413)
+            # Conversion is CPU work; keep it off the event loop
+            await run_in_threadpool(parser.write, chunk)
+        parser.finalize()
+        if not part["found"]:
+            raise IngestError(f"Missing form field '{field}'", 400)
+    else:
+        async for chunk in request.stream():
+            await run_in_threadpool(sink.feed, chunk)
+
+
+class PrefixSink:
+    """Keeps the first keep_bytes of an upload in a file and counts the rest"""
+
+    def __init__(self, path, keep_bytes):
+        self.path = path
+        self.keep_bytes = keep_bytes
+        self.bytes_received = 0
+        self._file = open(path, 'wb')
+
+    def feed(self, chunk):
+        room = self.keep_bytes - self.bytes_received
+        if room > 0:
+            self._file.write(bytes(chunk[:room]))
+        self.bytes_received += len(chunk)
+
+    def close(self):
+        self._file.close()
+
+
+async def save_upload(request, path, max_bytes=None, field="file", form=None):
+    """
+    Save the uploaded audio to path unchanged (for work that needs the
+    original, e.g. per-channel analysis); raises IngestError past max_bytes
+    form: dict filled with the other multipart fields, as in ingest_upload
+    """
+    sink = PrefixSink(path, max_bytes or float("inf"))
+    body_limit = max_bytes + MULTIPART_OVERHEAD if max_bytes else None
+    try:
+        await pump_request(request, sink, field, body_limit, max_bytes, form)
+    finally:
+        sink.close()
+    if not sink.bytes_received:
+        raise IngestError("Empty upload", 400)
+    if max_bytes and sink.bytes_received > max_bytes:
+        raise IngestError(f"Upload exceeds {max_bytes} bytes", 413)
+    return sink.bytes_received
+
+
+async def save_raw_upload(request, path, max_bytes=None, max_seconds=None, field="file", form=None):
+    """
+    save_upload, then ingest_upload's format and duration checks
+    For callers that convert the audio themselves (stream=true converts it
+    while it streams to Google). Returns the ingest.inspect_upload summary.
+    """
+    await save_upload(request, path, max_bytes, field, form)
+    return await run_in_threadpool(inspect_upload, path, max_seconds)
+
+
+async def save_upload_prefix(request, path, keep_bytes, field="file"):
+    """
+    Save up to keep_bytes of the uploaded audio to path without converting it
+    Never rejects for size; returns the full upload size in bytes.
+    """
+    sink = PrefixSink(path, keep_bytes)
+    try:
+        await pump_request(request, sink, field)
+    finally:
+        sink.close()
+    if not sink.bytes_received:
+        raise IngestError("Empty upload", 400)
+    return sink.bytes_received
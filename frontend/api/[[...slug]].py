@@ -10,9 +10,6 @@ from fastapi import FastAPI, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
-# Add current directory to path for imports
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-
 load_dotenv()
 API_KEY = os.getenv("GOOGLE_API_KEY")
 
@@ -59,11 +56,11 @@ async def analyze_audio(file: UploadFile = File(...)):
             shutil.copyfileobj(file.file, buffer)
         
         # Step 2: Import and convert audio
-        from convert_audio import convert_to_google_format
+        from vocalize_engine import convert_to_google_format
         convert_to_google_format(upload_path, converted_path)
         
         # Step 3: Import and analyze
-        from evaluation_engine.stt_api_key import analyze_audio_with_api_key
+        from vocalize_engine import analyze_audio_with_api_key
         
         if not API_KEY:
             return {"error": "GOOGLE_API_KEY not set in environment"}
@@ -0,0 +1,94 @@
+"""vocalize_engine.acoustic: the provisional score from the energy envelope, and /prescore"""
+import math
+import random
+
+import pytest
+
+from vocalize_engine.acoustic import analyze_acoustic_fluency, read_pcm16
+from vocalize_engine.conformance import write_wav
+
+RATE = 16000
+
+
+def syllables(count, gap=0.06):
+    """count 150ms voiced bursts, gap seconds of room noise apart (one word-like run)"""
+    out = []
+    for i in range(count):
+        n = int(0.15 * RATE)
+        out += [8000 * math.sin(math.pi * t / n) * math.sin(2 * math.pi * 180 * t / RATE) for t in range(n)]
+        if i < count - 1:
+            out += silence(gap)
+    return out
+
+
+def silence(seconds):
+    r = random.Random(0)
+    return [r.gauss(0, 20) for _ in range(int(seconds * RATE))]
+
+
+def speech_wav(path, *parts):
+    return write_wav(str(path), [(round(v),) for part in parts for v in part], RATE, 2)
+
+
+@pytest.fixture(scope="module")
+def phrases(tmp_path_factory):
+    """6 syllables, a 1.3s pause, 3 syllables, a 1.8s (long) pause, 3 syllables"""
+    return speech_wav(tmp_path_factory.mktemp("acoustic") / "phrases.wav",
+                      silence(0.3), syllables(6), silence(1.3), syllables(3), silence(1.8),
+                      syllables(3), silence(0.3))
+
+
+def test_counts_syllables_and_pauses(phrases):
+    result = analyze_acoustic_fluency(phrases)
+    assert result["provisional"]
+    acoustic = result["acoustic"]
+    assert acoustic["syllables"] == 12
+    assert acoustic["pause_count"] == 2
+    assert acoustic["duration"] == pytest.approx(0.6 + 12 * 0.15 + 9 * 0.06 + 3.1, abs=0.02)
+    metrics = result["fluency_metrics"]
+    assert metrics["long_pauses"] == 1
+    assert metrics["filler_rate"] == 0.0
+    assert metrics["pause_frequency"] == round(2 / (12 / 1.5), 2)
+
+
+def test_pauses_follow_the_profile(phrases):
+    # standard: long over 1.5s; executive: over 1.2s; esl: over 2.0s
+    assert analyze_acoustic_fluency(phrases, "executive")["fluency_metrics"]["long_pauses"] == 2
+    esl = analyze_acoustic_fluency(phrases, "esl")
+    assert esl["acoustic"]["pause_count"] == 2
+    assert esl["fluency_metrics"]["long_pauses"] == 0
+
+
+def test_silence_is_no_speech(tmp_path):
+    path = write_wav(str(tmp_path / "silence.wav"), [(0,)] * RATE, RATE, 2)
+    assert analyze_acoustic_fluency(path) == {"fluency_metrics": {"fluency_score": 0, "error": "No speech"},
+                                              "provisional": True}
+
+
+def test_empty_recording_is_no_speech(tmp_path):
+    path = write_wav(str(tmp_path / "blip.wav"), [(100,)] * 10, RATE, 2)
+    assert analyze_acoustic_fluency(path)["fluency_metrics"]["error"] == "No speech"
+
+
+def test_needs_converted_pcm(tmp_path):
+    path = write_wav(str(tmp_path / "stereo.wav"), [(0, 0)] * 100, RATE, 2)
+    with pytest.raises(ValueError, match="16-bit mono"):
+        read_pcm16(path)
+
+
+def test_prescore_endpoint(monkeypatch, phrases):
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+
+    import main
+
+    async def run_inline(fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    monkeypatch.setattr(main, "run_cpu", run_inline)   # no process pool needed here
+    client = TestClient(main.app)
+    with open(phrases, "rb") as f:
+        response = client.post("/prescore?profile=esl", files={"file": ("phrases.wav", f, "audio/wav")})
+    assert response.status_code == 200
+    assert response.json() == analyze_acoustic_fluency(phrases, "esl")
+    assert client.post("/prescore?profile=nope", content=b"").status_code == 400
@@ -0,0 +1,71 @@
+"""backend/main.py request validation through FastAPI's TestClient (no STT calls)"""
+import pytest
+
+pytest.importorskip("httpx")  # TestClient
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from vocalize_engine.timeline import MAX_WINDOWS  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def client():
+    # No `with`: the lifespan (process pool, endpoint probes) is not needed here
+    return TestClient(main.app)
+
+
+def words_until(seconds, step=0.5):
+    n = int(seconds / step)
+    return [{"word": f"w{i}", "startTime": i * step, "endTime": i * step + 0.4} for i in range(n)]
+
+
+def test_rescore_timeline(client):
+    response = client.post("/rescore", json={"words": words_until(30), "timeline": 10})
+    assert response.status_code == 200
+    assert response.json()["fluency_metrics"]["timeline"]["start"] == [0, 10, 20]
+
+
+@pytest.mark.parametrize("timeline", [0.5, 0])
+def test_rescore_rejects_a_short_timeline_window(client, timeline):
+    response = client.post("/rescore", json={"words": words_until(5), "timeline": timeline})
+    assert response.status_code == 400
+
+
+def test_rescore_rejects_too_many_timeline_windows(client):
+    words = words_until(5) + [{"word": "late", "startTime": MAX_WINDOWS + 500, "endTime": MAX_WINDOWS + 500.4}]
+    response = client.post("/rescore", json={"words": words, "timeline": 1})
+    assert response.status_code == 400
+    assert str(MAX_WINDOWS) in response.json()["error"]
+    assert client.post("/rescore", json={"words": words, "timeline": 2}).status_code == 200
+
+
+def test_analyze_rejects_too_many_timeline_windows_before_stt(client, monkeypatch, tmp_path):
+    from vocalize_engine import timeline
+    from vocalize_engine.conformance import write_wav
+
+    def stt(*args, **kwargs):
+        raise AssertionError("STT called")
+
+    monkeypatch.setattr(main, "analyze_audio_with_api_key", stt)
+    monkeypatch.setattr(timeline, "MAX_WINDOWS", 3)
+    path = write_wav(str(tmp_path / "five_seconds.wav"), [(0,)] * (5 * 16000), 16000, 2)
+    with open(path, "rb") as f:
+        response = client.post("/analyze?timeline=1", files={"file": ("five_seconds.wav", f, "audio/wav")})
+    assert response.status_code == 400
+    assert "3 windows" in response.json()["error"]
+
+
+def test_rescore_reference(client):
+    words = [{"word": w, "startTime": i, "endTime": i + 0.5} for i, w in enumerate("the cat sat".split())]
+    for reference in ("The cat sat.", ["the", "cat", "sat"]):
+        response = client.post("/rescore", json={"words": words, "reference": reference})
+        assert response.status_code == 200
+        assert response.json()["fluency_metrics"]["reading"]["accuracy"] == 1.0
+
+
+@pytest.mark.parametrize("reference", [123, {"text": "the cat"}, ["the", 1], [["the"]]])
+def test_rescore_rejects_a_malformed_reference(client, reference):
+    words = [{"word": "the", "startTime": 0, "endTime": 0.5}]
+    response = client.post("/rescore", json={"words": words, "reference": reference})
+    assert response.status_code == 400
+    assert "reference" in response.json()["error"]
@@ -0,0 +1,181 @@
+"""vocalize_engine.breaker with an injected clock, and /analyze's degraded acoustic fallback"""
+import json
+
+import pytest
+
+from vocalize_engine import hedging, stt
+from vocalize_engine.bench import bundled_wavs
+from vocalize_engine.breaker import CLOSED, HALF_OPEN, MIN_TIMEOUT_BUDGET, OPEN, CircuitBreaker, is_failure
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker("test", failure_threshold=3, cooldown=30, clock=clock)
+
+
+def test_failure_statuses():
+    assert all(is_failure(code) for code in (500, 503, 429, 403, 401))
+    assert not any(is_failure(code) for code in (200, 400, 404, 413))
+
+
+def test_opens_after_consecutive_failures(breaker):
+    breaker.failure("HTTP 503")
+    breaker.failure("HTTP 503")
+    breaker.success()          # resets the run
+    breaker.failure("HTTP 503")
+    breaker.failure("HTTP 503")
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.failure("HTTP 502")
+    assert breaker.state == OPEN
+    assert breaker.trips == 1
+    unavailable = breaker.unavailable()
+    assert unavailable == {"error": "STT unavailable (test circuit open: HTTP 502)", "stt_unavailable": True,
+                           "retry_after": 30.0}
+    assert breaker.rejected == 1
+
+
+def test_half_open_probe_closes_on_success(breaker, clock):
+    for _ in range(3):
+        breaker.failure("HTTP 503")
+    clock.now += 29
+    assert not breaker.allow()
+    assert breaker.retry_after() == 1.0
+    clock.now += 1
+    assert breaker.allow()              # the probe
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()          # only one probe at a time
+    breaker.success()
+    assert breaker.state == CLOSED
+    assert breaker.retry_after() == 0.0
+    assert breaker.unavailable() is None
+
+
+def test_failed_probe_reopens(breaker, clock):
+    for _ in range(3):
+        breaker.failure("HTTP 503")
+    clock.now += 30
+    assert breaker.allow()
+    breaker.failure("HTTP 503")
+    assert breaker.state == OPEN
+    assert (breaker.trips, breaker.reopens) == (1, 1)
+    assert breaker.retry_after() == 30.0
+
+
+def test_lost_probe_does_not_wedge_half_open(breaker, clock):
+    for _ in range(3):
+        breaker.failure("HTTP 503")
+    clock.now += 30
+    assert breaker.allow()              # a probe that never reports back
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+
+def test_record_status_and_timeouts(breaker):
+    assert breaker.record_status(400) is False      # bad audio: the service answered
+    assert breaker.record_status(429) is True
+    assert breaker.record_timeout(MIN_TIMEOUT_BUDGET - 1) is False   # the client's own short budget
+    assert breaker.record_timeout(MIN_TIMEOUT_BUDGET) is True
+    snapshot = breaker.snapshot()
+    assert (snapshot["consecutive_failures"], snapshot["successes"], snapshot["failures"]) == (2, 1, 2)
+    assert snapshot["last_failure"] == f"timeout after {MIN_TIMEOUT_BUDGET:.0f}s"
+
+
+class Response:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+        self.text = json.dumps(body)
+
+    def json(self):
+        return self.body
+
+
+def test_recognize_content_fails_fast_once_open(monkeypatch, breaker, clock):
+    status = {"code": 503}
+    sent = []
+
+    def post(url, deadline=None, **kwargs):
+        sent.append(url)
+        if status["code"] != 200:
+            return Response(status["code"], {"error": {"message": "unavailable"}})
+        return Response(200, {"results": [{"alternatives": [{"transcript": "hello", "words": [
+            {"word": "hello", "startTime": "0.1s", "endTime": "0.5s"}]}]}]})
+
+    monkeypatch.setattr(hedging, "post", post)
+    monkeypatch.setattr(stt, "stt_endpoints", None)
+    results = [stt.recognize_content(b"\0" * 3244, "key", breaker=breaker) for _ in range(10)]
+    assert len(sent) == 3
+    assert all(r.get("stt_unavailable") for r in results)
+    assert breaker.rejected == 7
+
+    status["code"] = 200
+    clock.now += 30
+    assert "error" not in stt.recognize_content(b"\0" * 3244, "key", breaker=breaker)
+    assert breaker.state == CLOSED
+    assert len(sent) == 4
+
+
+# /analyze while STT is unavailable
+
+@pytest.fixture
+def api(monkeypatch):
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+
+    import main
+
+    async def run_inline(fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    monkeypatch.setattr(main, "run_cpu", run_inline)   # no process pool needed here
+    monkeypatch.setattr(main, "store", None)
+    monkeypatch.setattr(main, "analyze_audio_with_api_key", lambda *args, **kwargs: {
+        "error": "STT unavailable (stt circuit open: HTTP 503)", "stt_unavailable": True, "retry_after": 12})
+    return main, TestClient(main.app)
+
+
+def upload(client, path="/analyze"):
+    wav = next(p for p in bundled_wavs() if p.endswith("test_audio.wav"))
+    with open(wav, "rb") as f:
+        return client.post(path, files={"file": ("test_audio.wav", f, "audio/wav")})
+
+
+def test_degraded_acoustic_answer(api):
+    main, client = api
+    before = main._degraded["count"]
+    response = upload(client)
+    assert response.status_code == 200
+    assert response.headers["x-degraded"] == "stt-unavailable"
+    result = response.json()
+    assert result["degraded"] and result["provisional"]
+    assert result["degraded_reason"].startswith("STT unavailable")
+    assert result["fluency_metrics"]["fluency_score"] > 0
+    assert main._degraded["count"] == before + 1
+
+
+def test_503_when_the_fallback_fails_too(api, monkeypatch):
+    main, client = api
+
+    def broken(*args, **kwargs):
+        raise ValueError("no PCM")
+
+    monkeypatch.setattr(main, "analyze_acoustic_fluency", broken)
+    response = upload(client)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "12"
+    assert response.json()["fallback_error"] == "no PCM"
@@ -0,0 +1,166 @@
+"""vocalize_engine.channels: splitting a multi-speaker WAV and per-channel analysis"""
+import threading
+import wave
+from array import array
+
+import pytest
+
+from vocalize_engine import channels, planner, sharedpcm
+from vocalize_engine.channels import (analyze_channels_with_api_key, channel_layout, channel_pcm, channel_paths,
+                                      extract_channel, recognize_channels)
+from vocalize_engine.conformance import write_wav
+from vocalize_engine.convert import convert_pcm
+from vocalize_engine.ingest import IngestError
+from vocalize_engine.planner import NO_RESULTS
+from vocalize_engine.wavfile import open_wav
+
+
+def recognized(*words):
+    timed = [{"word": w, "startTime": 0.6 * i, "endTime": 0.6 * i + 0.5} for i, w in enumerate(words)]
+    return {"transcript": " ".join(words), "word_count": len(words), "words": timed, "plan": {"plan": "single"}}
+
+
+@pytest.fixture
+def stt(monkeypatch):
+    """recognize_channels answering results[i] for channel i"""
+    results = []
+    monkeypatch.setattr(channels, "recognize_channels", lambda paths, *args, **kwargs: results[:len(paths)])
+    return results
+
+
+def test_reference_is_aligned_per_channel(stt):
+    stt.extend([recognized("the", "cat", "sat"), recognized("the", "dog", "sat"), {"error": NO_RESULTS}])
+    result = analyze_channels_with_api_key(["a", "b", "c"], "key", reference="The cat sat.")
+    first, second, silent = result["channels"]
+    assert first["fluency_metrics"]["reading"]["correct"] == 3
+    assert second["fluency_metrics"]["reading"]["substitutions"] == 1
+    assert silent == {"channel": 2, "error": NO_RESULTS}
+    assert result["speakers"] == 2
+
+
+def test_silent_channels_alone_are_the_error(stt):
+    stt.extend([{"error": NO_RESULTS}, {"error": NO_RESULTS}])
+    assert analyze_channels_with_api_key(["a", "b"], "key") == {"error": NO_RESULTS}
+    stt[1] = {"error": "API request failed: 400"}
+    assert analyze_channels_with_api_key(["a", "b"], "key") == {"error": "API request failed: 400"}
+
+
+@pytest.mark.parametrize("flag", ["deadline_exceeded", "stt_unavailable"])
+def test_errors_the_caller_acts_on_win(stt, flag):
+    failure = {"error": "x", flag: True}
+    stt.extend([recognized("the", "cat"), failure])
+    assert analyze_channels_with_api_key(["a", "b"], "key") is failure
+
+
+def test_per_speaker_metrics_and_annotations(stt):
+    stt.extend([recognized("um", "the", "cat"), recognized("the", "dog", "sat", "down")])
+    result = analyze_channels_with_api_key(["a", "b"], "key", annotate=True)
+    first, second = result["channels"]
+    assert first["fluency_metrics"]["filler_rate"] == 0.33 and second["fluency_metrics"]["filler_rate"] == 0.0
+    assert first["annotations"] and "annotations" not in first["fluency_metrics"]
+    assert (first["word_count"], second["word_count"], result["speakers"]) == (3, 4, 2)
+
+
+# Splitting a WAV into its channels
+
+RATE = 16000
+
+
+@pytest.fixture
+def stereo(tmp_path):
+    """A speaks on the left channel for the first second, B on the right for the next"""
+    frames = [(3000 if i < RATE and i % 40 < 20 else 0, -2000 if i >= RATE and i % 64 < 32 else 0)
+              for i in range(2 * RATE)]
+    return write_wav(str(tmp_path / "stereo.wav"), frames, RATE, 2)
+
+
+def mono(tmp_path, stereo, channel):
+    with open_wav(stereo) as wav_in:
+        frames = [(wav_in.samples()[i * 2 + channel],) for i in range(wav_in.n_frames)]
+    return write_wav(str(tmp_path / f"mono{channel}.wav"), frames, RATE, 2)
+
+
+@pytest.mark.parametrize("target_rate", [RATE, 8000])
+def test_each_channel_converts_like_a_mono_file(tmp_path, stereo, target_rate):
+    with open_wav(stereo) as wav_in:
+        pcms = [channel_pcm(wav_in, c, target_rate, "stdlib") for c in (0, 1)]
+    for channel, pcm in enumerate(pcms):
+        with open_wav(mono(tmp_path, stereo, channel)) as wav_in:
+            assert pcm == convert_pcm(wav_in, "stdlib", target_rate)
+    assert pcms[0] != pcms[1]
+
+
+def test_channel_out_of_range(stereo):
+    with open_wav(stereo) as wav_in, pytest.raises(ValueError, match="Channel 2 out of range"):
+        channel_pcm(wav_in, 2)
+
+
+def test_extract_channel(tmp_path, stereo):
+    out = extract_channel(stereo, str(tmp_path / "right.wav"), 1, target_rate=8000)
+    with wave.open(out) as w:
+        assert (w.getnchannels(), w.getsampwidth(), w.getframerate(), w.getnframes()) == (1, 2, 8000, 16000)
+        right = array("h", w.readframes(w.getnframes()))
+    assert not any(right[:7000]) and any(right[9000:])     # B only speaks in the second second
+
+
+def test_channel_layout(tmp_path, stereo):
+    assert channel_layout(stereo) == (2, RATE)
+    for kwargs, status in (({"max_seconds": 1}, 413), ({"max_channels": 1}, 400)):
+        with pytest.raises(IngestError) as raised:
+            channel_layout(stereo, **kwargs)
+        assert raised.value.status_code == status
+    ogg = tmp_path / "a.ogg"
+    ogg.write_bytes(b"OggS" + bytes(100))
+    with pytest.raises(IngestError, match="needs a WAV upload") as raised:
+        channel_layout(str(ogg))
+    assert raised.value.status_code == 415
+
+
+def test_channel_paths():
+    assert channel_paths("/tmp/x", 2) == ["/tmp/x_ch0.wav", "/tmp/x_ch1.wav"]
+
+
+def test_channels_are_recognized_concurrently(monkeypatch):
+    barrier = threading.Barrier(3, timeout=5)
+
+    def recognize(path, *args):
+        barrier.wait()              # only returns once all three channels are in flight
+        return {"path": path}
+
+    monkeypatch.setattr(planner, "recognize_planned", recognize)
+    assert recognize_channels(["a", "b", "c"], "key") == [{"path": "a"}, {"path": "b"}, {"path": "c"}]
+
+
+# The backend: /analyze?channels=true
+
+def test_analyze_by_channel(monkeypatch, stereo):
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+
+    import main
+
+    async def run_inline(fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    seen = []
+
+    def recognize(paths, api_key, language_code, sample_rate_hertz, deadline):
+        for path in paths:
+            assert isinstance(path, sharedpcm.SharedWav)     # converted into a lent segment, not a file
+            with sharedpcm.content(path) as data:
+                seen.append((bytes(data[44:]), sample_rate_hertz))
+        return [recognized("the", "cat"), recognized("um", "so", "the", "dog")]
+
+    monkeypatch.setattr(main, "run_cpu", run_inline)
+    monkeypatch.setattr(channels, "recognize_channels", recognize)
+    client = TestClient(main.app)
+    with open(stereo, "rb") as f:
+        response = client.post("/analyze?channels=true", files={"file": ("stereo.wav", f, "audio/wav")})
+    result = response.json()
+    assert response.status_code == 200 and result["speakers"] == 2
+    assert [c["word_count"] for c in result["channels"]] == [2, 4]
+    with open_wav(stereo) as wav_in:
+        assert seen == [(channel_pcm(wav_in, c, RATE), RATE) for c in (0, 1)]
+
+    response = client.post("/analyze?channels=true", files={"file": ("a.ogg", b"OggS" + bytes(100), "audio/ogg")})
+    assert response.status_code == 415
@@ -0,0 +1,110 @@
+"""vocalize_engine.codecs: identifying browser recordings by their first bytes"""
+import struct
+
+import pytest
+
+from vocalize_engine import codecs
+from vocalize_engine.codecs import prepare_for_stt, probe_media, sniff_container
+from vocalize_engine.conformance import write_wav
+
+
+def ogg_page(packet):
+    """First Ogg page (beginning of stream) carrying one packet"""
+    return (b"OggS" + bytes([0, 2]) + struct.pack("<qIII", 0, 1, 0, 0)
+            + bytes([1, len(packet)]) + packet)
+
+
+def opus_head(channels=2, input_rate=44100):
+    return b"OpusHead" + bytes([1, channels]) + struct.pack("<HIhB", 312, input_rate, 0, 0)
+
+
+def webm(codec_id):
+    """EBML header and the start of a Matroska segment with one audio track"""
+    ebml = b"\x1a\x45\xdf\xa3\x9f\x42\x86\x81\x01\x42\xf7\x81\x01\x42\x82\x84webm"
+    return ebml + b"\x18\x53\x80\x67\x01\xff\xff\xff\xff\xff\xff\xff\x16\x54\xae\x6b" + b"\x86" \
+        + bytes([0x80 | len(codec_id)]) + codec_id
+
+
+def flac(rate=44100, channels=2, bits=16, samples=441000):
+    packed = rate << 44 | (channels - 1) << 41 | (bits - 1) << 36 | samples
+    streaminfo = struct.pack(">HH", 4096, 4096) + b"\0" * 6 + struct.pack(">Q", packed) + b"\0" * 16
+    return b"fLaC" + bytes([0x80]) + len(streaminfo).to_bytes(3, "big") + streaminfo
+
+
+def media(container, codec, encoding=None, rate=None, channels=None):
+    return {"container": container, "codec": codec, "stt_encoding": encoding,
+            "sample_rate_hertz": rate, "channels": channels}
+
+
+@pytest.mark.parametrize("head, container", [
+    (b"RIFF\0\0\0\0WAVEfmt ", "wav"),
+    (b"OggS\0\2", "ogg"),
+    (b"\x1a\x45\xdf\xa3\x9f", "webm"),
+    (b"fLaC\0\0\0\x22", "flac"),
+    (b"\0\0\0\x20ftypM4A ", "mp4"),
+    (b"ID3\4\0", "mp3"),
+    (b"\xff\xfb\x90\x64", "mp3"),
+    (b"RIFF\0\0\0\0AVI LIST", None),
+    (b"", None),
+    (b"\xff", None),
+])
+def test_sniff_container(head, container):
+    assert sniff_container(head) == container
+
+
+@pytest.mark.parametrize("head, expected", [
+    # OpusHead's input rate is informational: Opus always decodes at 48kHz
+    (ogg_page(opus_head(channels=1, input_rate=16000)), media("ogg", "opus", "OGG_OPUS", 48000, 1)),
+    (ogg_page(opus_head(channels=2)), media("ogg", "opus", "OGG_OPUS", 48000, 2)),
+    (ogg_page(b"\x01vorbis" + b"\0" * 23), media("ogg", "vorbis")),
+    (webm(b"A_OPUS"), media("webm", "opus", "WEBM_OPUS", 48000)),
+    (webm(b"A_VORBIS"), media("webm", "vorbis")),
+    (webm(b"A_AAC"), media("webm", None)),
+    (flac(44100, 2), media("flac", "flac", "FLAC", 44100, 2)),
+    (flac(16000, 1, bits=24), media("flac", "flac", "FLAC", 16000, 1)),
+    (flac()[:20], media("flac", "flac", "FLAC")),                    # STREAMINFO cut off
+    (b"ID3\4\0" + b"\0" * 20, media("mp3", "mp3")),
+    (b"garbage!", media(None, None)),
+])
+def test_probe_media(head, expected):
+    assert probe_media(head) == expected
+
+
+def test_probe_media_reads_only_the_sniffed_prefix():
+    late = b"OggS" + b"\0" * codecs.SNIFF_BYTES + b"OpusHead"
+    assert probe_media(late)["codec"] is None
+
+
+def test_native_encodings_are_sent_as_is(tmp_path):
+    path = tmp_path / "recording.wav"           # MediaRecorder output, whatever the name says
+    path.write_bytes(webm(b"A_OPUS") + b"\0" * 100)
+    prepared = prepare_for_stt(str(path), str(tmp_path / "out.wav"))
+    assert prepared == {"container": "webm", "codec": "opus", "decoded": False, "path": str(path),
+                        "encoding": "WEBM_OPUS", "sample_rate_hertz": 48000}
+    assert not (tmp_path / "out.wav").exists()
+
+
+def test_decoding_needs_a_decoder(tmp_path, monkeypatch):
+    monkeypatch.setattr(codecs, "decoder_available", lambda: None)
+    path = tmp_path / "clip.flac"
+    path.write_bytes(flac())
+    with pytest.raises(ValueError, match="No audio decoder"):
+        prepare_for_stt(str(path), str(tmp_path / "out.wav"), allow_native=False)
+    mp3 = tmp_path / "clip.mp3"
+    mp3.write_bytes(b"ID3\4\0" + b"\0" * 100)
+    with pytest.raises(ValueError, match="No audio decoder"):
+        prepare_for_stt(str(mp3), str(tmp_path / "out.wav"))
+
+
+def test_unrecognized_uploads(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_bytes(b"hello world")
+    with pytest.raises(ValueError, match="unrecognized file header"):
+        prepare_for_stt(str(path), str(tmp_path / "out.wav"))
+
+
+def test_wav_is_converted(tmp_path):
+    path = write_wav(str(tmp_path / "stereo.wav"), [(100, -100)] * 4800, 48000, 2)
+    prepared = prepare_for_stt(path, str(tmp_path / "out.wav"), allow_native=False)
+    assert prepared == {"container": "wav", "codec": "pcm", "decoded": False, "path": str(tmp_path / "out.wav"),
+                        "encoding": "LINEAR16", "sample_rate_hertz": 16000}
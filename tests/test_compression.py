@@ -0,0 +1,103 @@
+"""backend/compression.py: negotiated compression and Vary on every response"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("httpx")  # TestClient
+from fastapi.testclient import TestClient  # noqa: E402
+from starlette.applications import Starlette  # noqa: E402
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse  # noqa: E402
+from starlette.routing import Route  # noqa: E402
+
+from compression import CompressionMiddleware, choose_encoding, vary_on_encoding  # noqa: E402
+
+BIG = {"words": [{"word": "market", "startTime": i} for i in range(200)]}
+
+
+async def large(request):
+    return JSONResponse(BIG)
+
+
+async def small(request):
+    return JSONResponse({"ok": True})
+
+
+async def streamed(request):
+    return StreamingResponse(iter([b"x" * 1000, b"y" * 1000]), media_type="text/plain")
+
+
+async def varies(request):
+    return PlainTextResponse("z" * 1000, headers={"Vary": "Origin"})
+
+
+app = Starlette(routes=[Route(path, endpoint) for path, endpoint in
+                        (("/large", large), ("/small", small), ("/streamed", streamed), ("/varies", varies))])
+app.add_middleware(CompressionMiddleware)
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip", "gzip"),
+    ("deflate, gzip;q=0.5", "gzip"),
+    ("gzip;q=0", None),
+    ("identity", None),
+    ("", None),
+])
+def test_choose_encoding(header, expected):
+    assert choose_encoding(header) == expected
+
+
+def test_large_json_is_compressed(client):
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(JSONResponse(BIG).body)
+    assert response.json() == BIG
+
+
+@pytest.mark.parametrize("path, accept", [
+    ("/large", "identity"),          # nothing usable offered
+    ("/large", ""),
+    ("/small", "gzip"),              # below minimum_size
+    ("/streamed", "gzip"),           # more_body
+])
+def test_uncompressed_responses_still_vary(client, path, accept):
+    response = client.get(path, headers={"Accept-Encoding": accept})
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+
+
+def test_existing_vary_is_extended_not_duplicated(client):
+    response = client.get("/varies", headers={"Accept-Encoding": "gzip"})
+    assert response.headers.get_list("vary") == ["Origin, Accept-Encoding"]
+    assert response.headers["content-encoding"] == "gzip"
+
+
+def test_vary_on_encoding():
+    assert vary_on_encoding([(b"Vary", b"accept-encoding")]) == [(b"vary", b"accept-encoding")]
+    assert vary_on_encoding([(b"vary", b"*")]) == [(b"vary", b"*")]
+    assert vary_on_encoding([(b"Vary", b"Origin"), (b"X-A", b"1"), (b"vary", b"Cookie")]) == [
+        (b"x-a", b"1"), (b"vary", b"Origin, Cookie, Accept-Encoding")]
+
+
+@pytest.mark.parametrize("accept", [b"gzip", b""])
+def test_start_is_flushed_when_the_app_sends_no_body(accept):
+    async def no_body(scope, receive, send):
+        await send({"type": "http.response.start", "status": 204, "headers": []})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", accept)]}
+    asyncio.run(CompressionMiddleware(no_body)(scope, receive, send))
+    assert sent == [{"type": "http.response.start", "status": 204, "headers": [(b"vary", b"Accept-Encoding")]}]
+
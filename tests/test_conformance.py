@@ -0,0 +1,42 @@
+"""Every converter backend must produce byte-identical PCM (vocalize_engine.conformance)"""
+import array
+
+import pytest
+
+from vocalize_engine.backends import available_backends, get_backend
+from vocalize_engine.bench import bundled_wavs
+from vocalize_engine.conformance import check_conformance, synthetic_fixtures, write_wav
+from vocalize_engine.wavfile import open_wav
+
+BACKENDS = available_backends()
+
+
+@pytest.fixture(scope="module")
+def fixtures(tmp_path_factory):
+    return synthetic_fixtures(str(tmp_path_factory.mktemp("fixtures")), seconds=0.25)
+
+
+def convert(path, backend):
+    with open_wav(path) as wav_in:
+        return array.array("h", get_backend(backend).convert(wav_in, 16000))
+
+
+@pytest.mark.skipif(len(BACKENDS) < 2, reason="only one converter backend installed (pip install -e .[numpy])")
+def test_backends_are_byte_identical(fixtures):
+    names = {"pcm8_mono_8k", "pcm24_stereo_48k", "float32_stereo_48k", "float64_mono_32k"}
+    assert names <= {path.rsplit("/", 1)[-1][:-4] for path in fixtures}
+    rows = check_conformance(bundled_wavs() + fixtures, BACKENDS, runs=1)
+    assert len(rows) == len(bundled_wavs()) + len(fixtures)
+    assert [row["file"] for row in rows if not row["identical"]] == []
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_8_bit_samples_are_unsigned(tmp_path, backend):
+    silence = write_wav(str(tmp_path / "silence.wav"), [(0,)] * 800, 8000, 1)   # stored as 128
+    assert set(convert(silence, backend)) == {0}
+
+    square = [(100,) if (i // 20) % 2 == 0 else (-100,) for i in range(800)]
+    pcm = convert(write_wav(str(tmp_path / "square.wav"), square, 8000, 1), backend)
+    # Away from the edges the output follows the input's sign
+    assert all(sample > 0 for sample in pcm[4:36]) and all(sample < 0 for sample in pcm[44:76])
+    assert max(pcm) > 30000   # normalized to the peak
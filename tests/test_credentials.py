@@ -0,0 +1,309 @@
+"""vocalize_engine.credentials with an injected clock and sleep (no network)"""
+import json
+
+import pytest
+
+from vocalize_engine import credentials, hedging, stt
+from vocalize_engine.breaker import FAILURE_THRESHOLD
+from vocalize_engine.credentials import (MAX_SHED_SECONDS, REST, SDK, SHED_SECONDS, Credential, CredentialPool,
+                                         TokenBucket, audio_seconds, load_pool)
+
+
+class Clock:
+    """Time that only moves when a test (or the pool's sleep) moves it"""
+
+    def __init__(self):
+        self.now = 100.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class Response:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+        self.text = json.dumps(body)
+
+    def json(self):
+        return self.body
+
+
+@pytest.fixture(autouse=True)
+def no_hedge_reserve(monkeypatch):
+    # Quotas as configured; test_hedging_leaves_room_for_duplicates covers the reserve
+    monkeypatch.setattr(hedging, "HEDGE_DELAY", "off")
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def pool_of(clock, *names, queue_wait=5.0, **limits):
+    return CredentialPool([Credential(name, name, clock=clock, **limits) for name in names],
+                          queue_wait=queue_wait, clock=clock, sleep=clock.sleep)
+
+
+def test_bucket_refills_at_its_rate_up_to_capacity(clock):
+    bucket = TokenBucket(rate=2.0, capacity=4.0, clock=clock)
+    assert all(bucket.take() for _ in range(4))
+    assert not bucket.take()
+    assert bucket.wait_time() == pytest.approx(0.5)
+    assert bucket.wait_time(10) == pytest.approx(2.0)   # never more than a full bucket
+    clock.now += 0.5
+    assert bucket.take()
+    clock.now += 100
+    assert bucket.level() == 1.0
+    fixed = TokenBucket(0.0, 1.0, clock)
+    assert fixed.take()
+    assert fixed.wait_time() == float("inf")
+
+
+def test_request_budget_is_split_between_workers(clock):
+    credential = Credential("a", "key", requests=60, window=60.0, share=2, clock=clock)
+    # 30 per worker a minute: a burst of 3, then 27 more over the window
+    assert credential.requests.capacity == pytest.approx(3.0)
+    assert credential.requests.rate * 60 == pytest.approx(27.0)
+    assert Credential("b", "key", requests=5, clock=clock).requests.capacity == 1.0
+
+
+def test_hedging_leaves_room_for_duplicates(monkeypatch, clock):
+    monkeypatch.setattr(hedging, "HEDGE_DELAY", "p95")
+    credential = Credential("a", "key", requests=100, window=60.0, clock=clock)
+    reserved = 100 * (1 - hedging.HEDGE_MAX_RATE)
+    assert credential.requests.capacity + credential.requests.rate * 60 == pytest.approx(reserved)
+
+
+def test_kinds_and_rest_calls_skip_service_accounts(clock):
+    account = Credential("sa", {"type": "service_account"}, clock=clock)
+    key = Credential("key", "secret", clock=clock)
+    assert (account.kind, key.kind) == (SDK, REST)
+    pool = CredentialPool([account, key], clock=clock, sleep=clock.sleep)
+    assert pool.acquire(REST)[0] is key
+    assert pool.acquire(REST)[0] is key
+    sdk_users = {pool.acquire(SDK)[0].name for _ in range(4)}
+    assert sdk_users == {"sa", "key"}   # the SDK takes API keys too
+
+
+def test_least_loaded_credential_first(clock):
+    pool = pool_of(clock, "a", "b", "c")
+    a, b, c = pool.credentials
+    with a.leased(), b.leased():
+        assert pool.acquire()[0] is c
+    # Same calls in flight: the fullest request bucket
+    assert pool.acquire()[0] is a
+    assert pool.acquire()[0] is b
+    assert pool.acquire(exclude={"a", "b"})[0] is c
+
+
+def test_429_sheds_with_doubling_cooldown(clock):
+    credential = Credential("a", "key", clock=clock)
+    assert credential.record_status(429) is True
+    assert not credential.healthy()
+    assert credential.shed_for == SHED_SECONDS
+    credential.record_status(429)   # still in flight when it was shed: no extra cooldown
+    assert (credential.shed_for, credential.usage["sheds"], credential.usage["throttled"]) == (SHED_SECONDS, 1, 2)
+    clock.now += SHED_SECONDS
+    assert credential.healthy()
+    credential.record_status(429)
+    assert credential.shed_for == 2 * SHED_SECONDS
+    for _ in range(10):
+        clock.now += credential.shed_for
+        credential.record_status(429)
+    assert credential.shed_for == MAX_SHED_SECONDS
+    clock.now += MAX_SHED_SECONDS
+    assert credential.record_status(200) is False
+    assert credential.shed_for == 0.0
+    assert credential.breaker.consecutive_failures == 0   # 429s don't trip its breaker
+
+
+def test_5xx_and_auth_errors_trip_the_credentials_breaker(clock):
+    credential = Credential("a", "key", clock=clock)
+    assert credential.record_status(400) is False      # bad audio: the service is up
+    for _ in range(FAILURE_THRESHOLD - 1):
+        assert credential.record_status(503) is True
+    assert credential.record_status(403) is True
+    assert not credential.healthy()
+    assert credential.unavailable()["stt_unavailable"]
+    snapshot = credential.snapshot()
+    assert (snapshot["state"], snapshot["failures"], snapshot["successes"]) == ("open", FAILURE_THRESHOLD, 1)
+    clock.now += credential.breaker.cooldown
+    assert credential.healthy()   # its probe may go out
+
+
+def test_call_retries_a_shed_credential_on_another_one(clock):
+    pool = pool_of(clock, "a", "b")
+    calls = []
+
+    def fn(credential):
+        calls.append(credential.name)
+        if credential.name == "a":
+            credential.record_status(429)
+            return {"error": "API request failed: 429", "stt_unavailable": True}
+        credential.record_status(200)
+        return {"transcript": "hello"}
+
+    assert pool.call(fn) == {"transcript": "hello"}
+    assert calls == ["a", "b"]
+    assert pool.call(fn) == {"transcript": "hello"}   # a sits out its cooldown
+    assert calls == ["a", "b", "b"]
+
+
+def test_every_credential_shed_fails_fast_with_retry_after(clock):
+    pool = pool_of(clock, "a", "b")
+    calls = []
+
+    def throttled(credential):
+        calls.append(credential.name)
+        credential.record_status(429)
+        return {"error": "API request failed: 429", "stt_unavailable": True}
+
+    assert pool.call(throttled)["error"] == "API request failed: 429"   # the last answer
+    assert sorted(calls) == ["a", "b"]
+    clock.now += 10
+    result = pool.call(throttled)
+    assert result["stt_unavailable"] and "shed or failing" in result["error"]
+    assert result["retry_after"] == SHED_SECONDS - 10
+    assert len(calls) == 2
+    assert pool.rejected == 2
+
+
+def test_an_unavailable_answer_from_a_healthy_credential_is_not_retried(clock):
+    pool = pool_of(clock, "a", "b")
+    calls = []
+
+    def down(credential):
+        calls.append(credential.name)
+        return {"error": "Speech recognition failed", "stt_unavailable": True}
+
+    assert pool.call(down)["stt_unavailable"]
+    assert calls == ["a"]
+
+
+def test_waits_for_a_refill_within_queue_wait(clock):
+    pool = pool_of(clock, "a", requests=60, window=60.0)   # burst 6, then 0.9/s
+    for _ in range(6):
+        assert pool.acquire()[0] is not None
+    credential, unavailable = pool.acquire()
+    assert credential is not None and unavailable is None
+    assert clock.slept == [pytest.approx(1 / 0.9)]
+    assert pool.waits == 1
+
+
+def test_over_quota_beyond_queue_wait_is_unavailable(clock):
+    pool = pool_of(clock, "a", requests=60, window=60.0, queue_wait=0.5)
+    for _ in range(6):
+        pool.acquire()
+    credential, unavailable = pool.acquire()
+    assert credential is None
+    assert unavailable["stt_unavailable"] and "over quota" in unavailable["error"]
+    assert unavailable["retry_after"] == round(1 / 0.9, 1)
+    assert clock.slept == []
+    assert pool.acquire(deadline=clock() + 10)[0] is None   # queue_wait still caps it
+
+
+def test_deadline_caps_the_queue_wait(clock):
+    pool = pool_of(clock, "a", requests=60, window=60.0)
+    for _ in range(6):
+        pool.acquire()
+    assert pool.acquire(deadline=clock() + 0.5)[0] is None
+    assert pool.acquire(deadline=clock() + 2)[0] is not None
+
+
+def test_audio_quota_bucket(clock):
+    credential = Credential("a", "key", audio_minutes_per_day=2, share=2, clock=clock)   # 60s per worker
+    assert credential.audio.capacity == 60
+    assert credential.take(audio_seconds=50)
+    requests_left = credential.requests.tokens
+    assert not credential.take(audio_seconds=20)
+    assert credential.requests.tokens == requests_left   # no request token spent on a refusal
+    assert credential.wait_time(20) == pytest.approx(10 / (60 / 86400))
+    assert credential.take()   # no audio: only the request bucket
+    assert Credential("b", "key", clock=clock).take(audio_seconds=10 ** 6)   # no audio quota set
+
+
+def test_snapshot(clock):
+    pool = pool_of(clock, "a", "b", audio_minutes_per_day=10)
+    a, b = pool.credentials
+    with a.leased(audio_seconds=12.34):
+        a.record_status(200)
+        in_flight = pool.snapshot()["credentials"]["a"]["in_flight"]
+    b.record_status(429)
+    snapshot = pool.snapshot()
+    assert in_flight == 1
+    assert (snapshot["waits"], snapshot["rejected"]) == (0, 0)
+    usage = snapshot["credentials"]
+    assert usage["a"]["state"] == "closed" and usage["a"]["kind"] == REST
+    assert (usage["a"]["requests"], usage["a"]["successes"], usage["a"]["audio_seconds"]) == (1, 1, 12.3)
+    assert usage["a"]["audio_seconds_available"] == 600
+    assert usage["b"]["state"] == "shed" and usage["b"]["shed_for"] == SHED_SECONDS
+    assert "shed_for" not in usage["a"]
+
+
+def test_audio_seconds():
+    assert audio_seconds(b"\0" * (44 + 32000)) == 1.0
+    assert audio_seconds(b"\0" * 10) == 0
+    assert audio_seconds(b"\0" * (44 + 16000), sample_rate_hertz=8000) == 1.0
+    assert audio_seconds(b"\0" * 19200, "FLAC") == 1.0
+    assert audio_seconds(b"\0" * 4000, "OGG_OPUS") == 1.0
+
+
+def test_load_pool(monkeypatch, tmp_path, clock):
+    monkeypatch.delenv("STT_CREDENTIALS", raising=False)
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    assert load_pool() is None
+    assert load_pool("") is None
+
+    account = tmp_path / "sa.json"
+    account.write_text(json.dumps({"type": "service_account", "project_id": "b"}))
+    spec = json.dumps([
+        {"name": "proj-a", "api_key": "key-a", "requests_per_minute": 300, "audio_minutes_per_day": 30},
+        {"service_account_file": str(account)},
+        {"service_account": {"type": "service_account", "project_id": "c"}},
+    ])
+    pool = load_pool(spec, clock=clock)
+    a, b, c = pool.credentials
+    assert [cred.name for cred in pool.credentials] == ["proj-a", "credential1", "credential2"]
+    assert (a.secret, a.kind, b.kind, c.kind) == ("key-a", REST, SDK, SDK)
+    assert b.secret["project_id"] == "b"
+    assert a.audio.capacity == 30 * 60 / 3   # split across WEB_CONCURRENCY
+    assert a.requests.capacity == pytest.approx(300 / 3 * credentials.BURST_FRACTION)
+
+    listed = tmp_path / "credentials.json"
+    listed.write_text(spec)
+    monkeypatch.setenv("STT_CREDENTIALS", str(listed))
+    assert len(load_pool(share=1)) == 3
+
+    with pytest.raises(ValueError):
+        load_pool(json.dumps([{"name": "nothing"}]))
+    with pytest.raises(ValueError):
+        CredentialPool([])
+
+
+def test_recognize_content_spreads_over_the_pool(monkeypatch, clock):
+    sent = []
+
+    def post(url, deadline=None, **kwargs):
+        key = url.rsplit("key=", 1)[1]
+        sent.append(key)
+        if key == "proj-c":   # over its daily quota
+            return Response(429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}})
+        return Response(200, {"results": [{"alternatives": [{"transcript": "hello", "words": [
+            {"word": "hello", "startTime": "0.1s", "endTime": "0.5s"}]}]}]})
+
+    monkeypatch.setattr(hedging, "post", post)
+    pool = pool_of(clock, "proj-c", "proj-a", "proj-b")
+    audio = b"\0" * (44 + 3200)
+    results = [stt.recognize_content(audio, pool) for _ in range(6)]
+    assert all("error" not in r for r in results)
+    assert sent.count("proj-c") == 1
+    usage = pool.snapshot()["credentials"]
+    assert usage["proj-c"]["state"] == "shed"
+    assert usage["proj-a"]["successes"] + usage["proj-b"]["successes"] == 6
+    assert usage["proj-a"]["audio_seconds"] + usage["proj-b"]["audio_seconds"] == pytest.approx(0.6, abs=0.1)
@@ -0,0 +1,106 @@
+"""vocalize_engine.encoding: format negotiation, fields= and the columnar layout"""
+import json
+
+import pytest
+
+from vocalize_engine import encoding
+from vocalize_engine.encoding import (COLUMNAR, JSON, MEDIA_TYPES, MSGPACK, encode_result, from_columnar,
+                                      negotiate_format, select_fields, synthetic_result, to_columnar)
+
+RESULT = {
+    "transcript": "um the market",
+    "word_count": 3,
+    "words": [{"word": "um", "startTime": 0.1, "endTime": 0.35},
+              {"word": "the", "startTime": 1.0, "endTime": 1.2},
+              {"word": "market", "startTime": 1.25, "endTime": 1.9}],
+    "fluency_metrics": {"wpm": 100.0, "fluency_score": 3.0},
+    "provisional": True,
+}
+
+
+@pytest.fixture(params=[True, False], ids=["msgpack", "no-msgpack"])
+def msgpack(request, monkeypatch):
+    monkeypatch.setattr(encoding, "msgpack_available", lambda: request.param)
+    return request.param
+
+
+@pytest.mark.parametrize("requested, accept, expected", [
+    (None, None, JSON),
+    ("json", "application/msgpack", JSON),                 # format= wins over Accept
+    ("columnar", None, COLUMNAR),
+    (None, "application/vnd.vocalize.columnar+json", COLUMNAR),
+    (None, "text/html, */*", JSON),
+    ("xml", None, JSON),                                    # unknown formats fall back to json
+])
+def test_negotiate_format(msgpack, requested, accept, expected):
+    assert negotiate_format(requested, accept) == expected
+
+
+def test_negotiate_msgpack(msgpack):
+    # Without msgpack an explicit request still gets the compact layout; Accept gets plain json
+    assert negotiate_format("msgpack") == (MSGPACK if msgpack else COLUMNAR)
+    assert negotiate_format(None, "application/x-msgpack, application/json") == (MSGPACK if msgpack else JSON)
+    assert negotiate_format(None, "application/msgpack, application/vnd.vocalize.columnar+json") == \
+        (MSGPACK if msgpack else JSON)
+
+
+@pytest.mark.parametrize("fields, expected", [
+    (None, set(RESULT)),
+    ("", set(RESULT)),
+    ("metrics", {"fluency_metrics", "provisional"}),
+    ("transcript, words,", {"transcript", "words", "provisional"}),
+    (["word_count", "nope"], {"word_count", "provisional"}),
+])
+def test_select_fields(fields, expected):
+    assert set(select_fields(RESULT, fields)) == expected
+
+
+def test_select_fields_keeps_errors():
+    assert select_fields({"error": "No words", "details": "x", "transcript": ""}, "metrics") == \
+        {"error": "No words", "details": "x"}
+
+
+def test_columnar_round_trip():
+    columnar = to_columnar(RESULT)
+    assert columnar["words"] == {"word": ["um", "the", "market"], "startMs": [100, 1000, 1250],
+                                 "endMs": [350, 1200, 1900]}
+    assert "word_count" not in columnar
+    assert from_columnar(columnar["words"]) == RESULT["words"]
+    assert from_columnar(RESULT["words"]) is RESULT["words"]
+    assert RESULT["word_count"] == 3    # the input is not modified
+
+
+def test_columnar_round_trip_of_a_long_result():
+    result = synthetic_result(minutes=2)
+    assert from_columnar(to_columnar(result)["words"]) == result["words"]
+
+
+def test_columnar_channels():
+    result = {"channels": [dict(RESULT, channel=0), {"channel": 1, "error": "No transcription results returned"}]}
+    first, second = to_columnar(result)["channels"]
+    assert first["words"]["word"] == ["um", "the", "market"] and first["channel"] == 0
+    assert second == result["channels"][1]
+
+
+def test_columnar_without_words():
+    assert to_columnar({"error": "x"}) == {"error": "x"}
+
+
+@pytest.mark.parametrize("fmt", [JSON, COLUMNAR])
+def test_encode_result(fmt):
+    body, media_type = encode_result(RESULT, fmt, "words")
+    assert media_type == MEDIA_TYPES[fmt]
+    words = json.loads(body)["words"]
+    assert from_columnar(words) == RESULT["words"]
+
+
+def test_encode_msgpack():
+    msgpack = pytest.importorskip("msgpack")
+    body, media_type = encode_result(RESULT, MSGPACK)
+    assert media_type == "application/msgpack"
+    assert msgpack.unpackb(body) == to_columnar(RESULT)
+
+
+def test_encode_unknown_format():
+    with pytest.raises(ValueError):
+        encode_result(RESULT, "xml")
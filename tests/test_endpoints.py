@@ -0,0 +1,196 @@
+"""vocalize_engine.endpoints with an injected session and clock (no network)"""
+import os
+import threading
+import time
+
+import pytest
+
+from vocalize_engine import endpoints, stt
+from vocalize_engine.endpoints import REGIONS, EndpointSet, load_endpoints, parse_endpoints
+
+FAR, NEAR, MID = "https://far.test/v1", "https://near.test/v1", "https://mid.test/v1"
+
+
+class Clock:
+    """Shared time plus each thread's own elapsed probe time (probe_all probes side by side)"""
+
+    def __init__(self):
+        self.now = 100.0
+        self.local = threading.local()
+
+    def __call__(self):
+        return self.now + getattr(self.local, "elapsed", 0.0)
+
+    def advance(self, seconds):
+        self.local.elapsed = getattr(self.local, "elapsed", 0.0) + seconds
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def close(self):
+        pass
+
+
+class Session:
+    """Probe GETs take delays[base] seconds of the fake clock and answer status[base] (or raise it)"""
+
+    def __init__(self, clock, delays):
+        self.clock = clock
+        self.delays = dict(delays)
+        self.status = {url: 403 for url in delays}   # unauthenticated GET: "up"
+        self.gets = []
+
+    def get(self, url, timeout=None):
+        base = url.rsplit("/operations", 1)[0]
+        self.gets.append(url)
+        self.clock.advance(self.delays[base])
+        if isinstance(self.status[base], Exception):
+            raise self.status[base]
+        return Response(self.status[base])
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def session(clock):
+    return Session(clock, {FAR: 0.24, NEAR: 0.03, MID: 0.09})
+
+
+@pytest.fixture
+def regional(clock, session):
+    return EndpointSet([FAR, NEAR, MID], interval=0, clock=clock, session=session)
+
+
+def test_parse_endpoints_expands_region_names():
+    assert parse_endpoints("eu, https://example.test/v1/ ,,global") == [
+        REGIONS["eu"], "https://example.test/v1/", REGIONS["global"]]
+
+
+def test_load_endpoints(monkeypatch):
+    monkeypatch.delenv("STT_ENDPOINTS", raising=False)
+    assert load_endpoints() is None
+    assert load_endpoints("  ") is None
+    loaded = load_endpoints("eu,us", interval=0)
+    assert [e.url for e in loaded.endpoints] == [REGIONS["eu"], REGIONS["us"]]
+    with pytest.raises(ValueError):
+        EndpointSet([])
+
+
+def test_first_endpoint_until_probed(regional, session):
+    assert regional.choose() == FAR
+    assert regional.choose() == FAR
+    assert regional.endpoints[0].selected == 2
+    assert session.gets == []   # interval=0: no prober
+
+
+def test_probes_pick_the_fastest(regional, session):
+    regional.probe_all()
+    assert regional.choose() == NEAR
+    assert regional.switches == 1
+    assert sorted(session.gets) == sorted(f"{url}/operations" for url in (FAR, NEAR, MID))
+    latency = {e.url: e.latency for e in regional.endpoints}
+    assert latency[NEAR] == pytest.approx(0.03)
+    assert latency[MID] == pytest.approx(0.09)
+
+
+def test_switch_margin_keeps_a_near_equal_endpoint(regional, session):
+    regional.probe_all()
+    session.delays[MID] = 0.027   # faster, but within SWITCH_MARGIN
+    for _ in range(10):
+        regional.probe_all()
+    assert regional.choose() == NEAR
+    session.delays[MID] = 0.01
+    for _ in range(10):
+        regional.probe_all()
+    assert regional.choose() == MID
+    assert regional.switches == 2
+
+
+def test_moving_average_smooths_one_slow_probe(regional, session):
+    regional.probe_all()
+    session.delays[NEAR] = 1.0
+    regional.probe_all()
+    near = regional.endpoints[1]
+    assert near.last_latency == pytest.approx(1.0)
+    assert near.latency == pytest.approx(endpoints.SMOOTHING * 1.0 + (1 - endpoints.SMOOTHING) * 0.03)
+
+
+def test_failed_call_moves_to_the_next_fastest_until_it_probes_well(regional, session):
+    regional.probe_all()
+    regional.failed(NEAR + "/", "HTTP 503")
+    assert regional.choose() == MID
+    assert regional.endpoints[1].call_failures == 1
+    regional.failed("https://unknown.test/v1", "HTTP 503")   # not ours: ignored
+    regional.probe_all()
+    assert regional.choose() == NEAR
+
+
+def test_5xx_and_errors_fail_probes_4xx_does_not(regional, session):
+    session.status[NEAR] = 503
+    session.status[MID] = ConnectionError("refused")
+    regional.probe_all()
+    health = {e.url: e.healthy for e in regional.endpoints}
+    assert health == {FAR: True, NEAR: False, MID: False}
+    assert regional.choose() == FAR
+    snapshot = {e["url"]: e for e in regional.snapshot()["endpoints"]}
+    assert snapshot[NEAR]["last_failure"] == "HTTP 503"
+    assert snapshot[MID]["last_failure"] == "ConnectionError"
+    assert snapshot[MID]["probe_failures"] == 1
+
+
+def test_all_down_keeps_the_last_pick(regional, session):
+    regional.probe_all()
+    regional.failed(NEAR, "HTTP 503")
+    assert regional.choose() == MID
+    regional.failed(FAR, "HTTP 503")
+    regional.failed(MID, "HTTP 503")
+    assert regional.choose() == MID   # nothing healthy: don't hop around
+
+
+def test_snapshot(regional, clock):
+    regional.probe_all()
+    clock.now += 5
+    snapshot = regional.snapshot()
+    assert snapshot["selected"] == NEAR
+    near = snapshot["endpoints"][1]
+    assert near["latency_ms"] == 30.0
+    assert near["probed_seconds_ago"] == pytest.approx(5, abs=0.5)
+
+
+def test_prober_runs_in_the_background_until_stopped(clock, session):
+    regional = EndpointSet([FAR, NEAR], interval=0.01, clock=clock, session=session)
+    assert regional.current.url == FAR and regional._prober_pid is None
+    regional.choose()                    # first call starts the prober (which may already have switched)
+    assert regional._prober_pid == os.getpid()
+    for _ in range(200):
+        if regional.current.url == NEAR:
+            break
+        time.sleep(0.01)
+    regional.stop()
+    assert regional.choose() == NEAR
+    assert regional.endpoints[1].probes >= 1
+
+
+def test_no_prober_for_a_single_endpoint(clock, session):
+    single = EndpointSet([NEAR], interval=0.01, clock=clock, session=session)
+    single.choose()
+    assert single._prober_pid is None
+
+
+def test_stt_routes_through_the_endpoint_set(monkeypatch, regional):
+    monkeypatch.setattr(stt, "stt_endpoints", regional)
+    regional.probe_all()
+    assert stt.base_url() == NEAR
+    stt.endpoint_failed(NEAR, "HTTP 500")
+    assert stt.base_url() == MID
+
+
+def test_stt_without_endpoints_uses_the_base_url(monkeypatch):
+    monkeypatch.setattr(stt, "stt_endpoints", None)
+    assert stt.base_url() == stt.STT_BASE_URL
+    stt.endpoint_failed(stt.STT_BASE_URL, "HTTP 500")   # nothing to report to
@@ -0,0 +1,183 @@
+"""vocalize_engine.fingerprint on short synthetic speech: re-encoded copies match, other speech does not"""
+import os
+import wave
+
+import pytest
+
+from vocalize_engine import fingerprint
+from vocalize_engine.fingerprint import (FP_RATE, FingerprintIndex, compare, fingerprint_file,
+                                         fingerprint_pcm, from_bytes, to_bytes)
+from vocalize_engine.store import AnalysisStore
+
+np = pytest.importorskip("numpy")
+
+SECONDS = 6.0
+
+
+def script(seed):
+    """Syllable plan of one utterance: (duration, pause after, f0, formant 1, formant 2)"""
+    r = np.random.default_rng(seed)
+    plan, t = [], 0.0
+    while t < SECONDS - 1:
+        syllable = (r.uniform(0.12, 0.3), r.choice([0.03, 0.05, 0.08, 0.3, 0.6], p=[.4, .3, .15, .1, .05]),
+                    r.uniform(95, 220), r.uniform(300, 900), r.uniform(900, 2600))
+        plan.append(syllable)
+        t += syllable[0] + syllable[1]
+    return plan
+
+
+def speak(plan, jitter=0.0, pitch=1.0, seed=0):
+    """Voiced syllables (harmonics shaped by two formants) with room noise between them, as int16"""
+    r = np.random.default_rng(seed)
+    out = [r.normal(0, 30, int(0.3 * FP_RATE))]
+    for duration, pause, f0, f1, f2 in plan:
+        duration *= 1 + r.uniform(-jitter, jitter)
+        pause *= 1 + r.uniform(-jitter, jitter)
+        t = np.arange(int(duration * FP_RATE)) / FP_RATE
+        voice = np.zeros_like(t)
+        for h in range(1, int(3400 / (f0 * pitch))):
+            f = h * f0 * pitch
+            voice += np.sin(2 * np.pi * f * t) / (1 + ((f - f1) / 150) ** 2 + ((f - f2) / 250) ** 2 * 0.5)
+        out.append(6000 * voice / np.abs(voice).max() * np.sin(np.pi * t / duration) ** 0.5)
+        out.append(r.normal(0, 30, int(pause * FP_RATE)))
+    return pcm(np.concatenate(out)[:int(SECONDS * FP_RATE)])
+
+
+def pcm(x):
+    return np.clip(np.round(x), -32768, 32767).astype(np.int16)
+
+
+@pytest.fixture(scope="module")
+def utterances():
+    return [speak(script(seed), seed=seed) for seed in range(4)]
+
+
+@pytest.fixture(scope="module")
+def index(utterances):
+    index = FingerprintIndex(threshold=0.20)
+    for key, x in enumerate(utterances):
+        index.add(key, fingerprint_pcm(x))
+    return index
+
+
+def flip_bits(fp, bits, seed=0):
+    """fp with `bits` of the 32 bits of every speech word flipped (a bit error rate of bits / 32)"""
+    r = np.random.default_rng(seed)
+    masks = [sum(1 << int(b) for b in r.choice(32, bits, replace=False)) for _ in range(len(fp))]
+    flipped = fp ^ np.array(masks, dtype=np.uint32)
+    flipped[fp == 0] = 0
+    flipped[(fp != 0) & (flipped == 0)] = 1
+    return flipped
+
+
+@pytest.mark.skipif("FINGERPRINT_THRESHOLD" in os.environ, reason="threshold set in the environment")
+def test_default_threshold_is_0_20(utterances):
+    # Between the worst re-encoded copy (0.17) and the closest retake (0.24) of the benchmark:
+    # 6 of 32 bits (0.19) off is still the same recording, 7 (0.22) is not
+    assert fingerprint.FINGERPRINT_THRESHOLD == 0.20
+    index = FingerprintIndex()
+    fp = fingerprint_pcm(utterances[0])
+    index.add(0, fp)
+    match = index.lookup(flip_bits(fp, 6))
+    assert match and match["key"] == 0 and 0.18 < match["bit_error_rate"] <= 0.20
+    assert index.lookup(flip_bits(fp, 7)) is None
+
+
+def test_resampled_copy_matches(tmp_path, utterances, index):
+    x = utterances[1]
+    rate = 48000
+    upsampled = np.interp(np.arange(int(len(x) * rate / FP_RATE)) * FP_RATE / rate, np.arange(len(x)), x)
+    path = str(tmp_path / "export_48k.wav")
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(pcm(upsampled).tobytes())
+    match = index.lookup(fingerprint_file(path))
+    assert match and match["key"] == 1
+    assert match["bit_error_rate"] <= 0.20
+
+
+def test_quieter_noisy_copy_matches(utterances, index):
+    noise = np.random.default_rng(7).normal(0, 60, len(utterances[2]))
+    match = index.lookup(fingerprint_pcm(pcm(utterances[2] * 0.35 + noise)))
+    assert match and match["key"] == 2
+
+
+def test_shifted_copy_matches(utterances, index):
+    lead_in = np.random.default_rng(8).normal(0, 30, int(0.27 * FP_RATE))
+    match = index.lookup(fingerprint_pcm(pcm(np.concatenate([lead_in, utterances[3][:-int(0.4 * FP_RATE)]]))))
+    assert match and match["key"] == 3
+    assert match["shift"] == pytest.approx(-0.27, abs=0.04)
+
+
+def test_distinct_recordings_do_not_match(utterances, index):
+    prints = [fingerprint_pcm(x) for x in utterances]
+    for i in range(len(prints)):
+        for j in range(i + 1, len(prints)):
+            assert compare(prints[i], prints[j])[0] > 0.35
+    assert index.lookup(fingerprint_pcm(speak(script(100), seed=100))) is None
+
+
+def test_retake_does_not_match(utterances, index):
+    # A second reading of the same passage (timing within 15%, pitch 3% up) gets its own analysis
+    retake = fingerprint_pcm(speak(script(0), jitter=0.15, pitch=1.03, seed=200))
+    assert compare(retake, fingerprint_pcm(utterances[0]))[0] > 0.20
+    assert index.lookup(retake) is None
+
+
+def test_too_little_speech_has_no_fingerprint(utterances):
+    assert fingerprint_pcm(utterances[0][:int(1.5 * FP_RATE)]) is None      # under MIN_SPEECH_SECONDS
+    assert fingerprint_pcm(np.zeros(5 * FP_RATE, dtype=np.int16)) is None
+
+
+def test_zero_threshold_disables_lookup(utterances):
+    index = FingerprintIndex(threshold=0)
+    fp = fingerprint_pcm(utterances[0])
+    index.add(0, fp)
+    assert index.lookup(fp) is None
+
+
+def test_bytes_round_trip(utterances):
+    fp = fingerprint_pcm(utterances[0])
+    assert np.array_equal(from_bytes(to_bytes(fp)), fp)
+
+
+def test_languages_are_kept_apart(utterances):
+    index = FingerprintIndex(threshold=0.20)
+    fp = fingerprint_pcm(utterances[0])
+    index.add(0, fp, "en-US")
+    assert index.lookup(fp, "de-DE") is None
+    assert index.lookup(fp, "en-US")["key"] == 0
+
+
+def test_sync_adds_each_stored_fingerprint_once(utterances):
+    store = AnalysisStore(":memory:")
+    index = FingerprintIndex(threshold=0.20)
+    ids = []
+    for x in utterances[:2]:
+        ids.append(store.save({"fluency_metrics": {}}, "hash", language="en-US"))
+        store.save_fingerprint(ids[-1], to_bytes(fingerprint_pcm(x)))
+    index.add(ids[0], fingerprint_pcm(utterances[0]), "en-US")   # this worker's own analysis
+
+    index.sync(store)
+    index.sync(store)
+    assert len(index) == 2
+
+    ids.append(store.save({"fluency_metrics": {}}, "hash", language="en-US"))
+    store.save_fingerprint(ids[-1], to_bytes(fingerprint_pcm(utterances[2])))
+    index.sync(store)
+    index.sync(store)
+    assert len(index) == 3
+    assert index.lookup(fingerprint_pcm(utterances[2]), "en-US")["key"] == ids[-1]
+    store.close()
+
+
+def test_oldest_entries_are_evicted(utterances):
+    index = FingerprintIndex(threshold=0.20, max_entries=2)
+    prints = [fingerprint_pcm(x) for x in utterances[:3]]
+    for key, fp in enumerate(prints):
+        index.add(key, fp)
+    assert len(index) == 2
+    assert index.lookup(prints[0]) is None
+    assert index.lookup(prints[2])["key"] == 2
@@ -0,0 +1,67 @@
+"""vocalize_engine.fluency: metrics and the per-word annotation stream"""
+import random
+
+import pytest
+
+from vocalize_engine.fluency import GAP_LONG, GAP_NONE, GAP_PAUSE, analyze_fluency
+
+
+def timed(*spec):
+    """Words from (word, start, end) triples"""
+    return [{"word": word, "startTime": start, "endTime": end} for word, start, end in spec]
+
+
+def random_words(seed, count=200):
+    r = random.Random(seed)
+    vocabulary = ["the", "market", "um", "uh", "like", "so,", "Actually", "you", "know", "grows", "i", "mean"]
+    words, t = [], 0.0
+    for _ in range(count):
+        t += r.choice([0.05, 0.1, 0.2, 0.9, 1.2, 1.6, 2.5])
+        end = t + r.uniform(0.1, 0.5)
+        words.append({"word": r.choice(vocabulary), "startTime": round(t, 2), "endTime": round(end, 2)})
+        t = end
+    return words
+
+
+def test_no_words():
+    assert analyze_fluency([], annotate=True) == {"fluency_score": 0, "error": "No words"}
+
+
+def test_annotations():
+    words = timed(("So", 0.0, 0.3), ("the", 0.4, 0.6), ("um", 1.5, 1.8), ("market", 3.5, 4.0), ("grows", 4.1, 4.5))
+    annotations = analyze_fluency(words, annotate=True)["annotations"]
+    assert annotations["flags"] == [1, 0, 1 | GAP_PAUSE << 1, GAP_LONG << 1, GAP_NONE]
+    assert annotations["pauses"] == [[2, 0.6, 1.5], [3, 1.8, 3.5]]
+
+
+def test_annotations_mark_every_word_of_a_filler_phrase():
+    words = timed(("it", 0.0, 0.2), ("you", 0.3, 0.5), ("know", 0.6, 0.8), ("grows", 0.9, 1.2))
+    metrics = analyze_fluency(words, annotate=True, profile="esl")
+    assert metrics["annotations"]["flags"] == [0, 1, 1, 0]
+    assert metrics["filler_rate"] == 0.5
+
+
+@pytest.mark.parametrize("profile", ["standard", "esl", "executive", "pa-hi"])
+def test_annotating_leaves_the_metrics_alone(profile):
+    for seed in range(5):
+        words = random_words(seed)
+        annotated = analyze_fluency(words, annotate=True, profile=profile)
+        annotations = annotated.pop("annotations")
+        assert annotated == analyze_fluency(words, profile=profile)
+        flags = annotations["flags"]
+        assert len(flags) == len(words)
+        assert round(sum(f & 1 for f in flags) / len(words), 2) == annotated["filler_rate"]
+        assert sum(f >> 1 == GAP_LONG for f in flags) == annotated["long_pauses"]
+        assert [p[0] for p in annotations["pauses"]] == [i for i, f in enumerate(flags) if f >> 1]
+
+
+def test_rescore_annotations():
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+
+    import main
+
+    words = timed(("um", 0.0, 0.3), ("the", 2.0, 2.2))
+    response = TestClient(main.app).post("/rescore", json={"words": words, "annotate": True})
+    assert response.status_code == 200
+    assert response.json()["annotations"] == {"flags": [1, GAP_LONG << 1], "pauses": [[1, 0.3, 2.0]]}
@@ -0,0 +1,139 @@
+"""vocalize_engine.hedging against a local stub of the Speech API"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from vocalize_engine.hedging import (FALLBACK_HEDGE_DELAY, MIN_HEDGE_DELAY, MIN_SAMPLES, DeadlineExceeded,
+                                     HedgeStats, hedge_delay, post)
+
+SLOW_SECONDS = 1.0
+
+
+class Stub(BaseHTTPRequestHandler):
+    """/fast answers at once, /hang never in time, /slow-first only its first call slowly, /unavailable 503"""
+    hits = {}
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.lock:
+            calls = self.hits[self.path] = self.hits.get(self.path, 0) + 1
+        if self.path == "/hang":
+            time.sleep(5)
+        elif self.path == "/slow-first" and calls == 1:
+            time.sleep(SLOW_SECONDS)
+        body = json.dumps({"results": []}).encode()
+        self.send_response(503 if self.path == "/unavailable" else 200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # an abandoned attempt
+
+
+@pytest.fixture(scope="module")
+def base():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Stub)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def hits():
+    Stub.hits.clear()
+    return Stub.hits
+
+
+def test_hedge_delay_settings():
+    tracker = HedgeStats()
+    assert hedge_delay(tracker, "off") is None
+    assert hedge_delay(tracker, "p95") == FALLBACK_HEDGE_DELAY  # too few samples yet
+    assert hedge_delay(tracker, "0.5") == 0.5
+    assert hedge_delay(tracker, "0") == MIN_HEDGE_DELAY
+
+    for ms in range(1, max(MIN_SAMPLES, 100) + 1):
+        tracker.record_latency(ms / 1000)
+    assert hedge_delay(tracker, "p95") == pytest.approx(0.096)
+    assert hedge_delay(tracker, "p50") == pytest.approx(0.051)
+
+
+def test_snapshot_counts():
+    tracker = HedgeStats()
+    tracker.record(False, False)
+    tracker.record(True, True)
+    tracker.record(True, False, deadline_exceeded=True)
+    snap = tracker.snapshot()
+    assert (snap["requests"], snap["hedged"], snap["hedge_wins"], snap["deadline_exceeded"]) == (3, 2, 1, 1)
+    assert snap["hedge_rate"] == pytest.approx(0.667)
+    assert tracker.recent_hedge_rate() == pytest.approx(2 / 3)
+
+
+def test_expired_deadline_sends_nothing(base, hits):
+    tracker = HedgeStats()
+    with pytest.raises(DeadlineExceeded):
+        post(base + "/fast", deadline=time.monotonic() - 1, tracker=tracker, json={})
+    assert hits == {}
+    assert tracker.deadline_exceeded == 1
+
+
+def test_hung_backend_gives_up_at_deadline(base):
+    tracker = HedgeStats()
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        post(base + "/hang", deadline=started + 0.5, hedge="off", tracker=tracker, json={})
+    assert time.monotonic() - started < 0.8
+    assert tracker.deadline_exceeded == 1
+
+
+def test_hedge_answers_for_a_slow_first_attempt(base, hits):
+    tracker = HedgeStats()
+    started = time.monotonic()
+    response = post(base + "/slow-first", deadline=started + 10, hedge="0.1", tracker=tracker, json={})
+    assert response.status_code == 200
+    assert time.monotonic() - started < SLOW_SECONDS / 2
+    assert hits["/slow-first"] == 2
+    assert (tracker.hedged, tracker.hedge_wins) == (1, 1)
+
+
+def test_hedging_off_waits_for_the_first_attempt(base, hits):
+    tracker = HedgeStats()
+    started = time.monotonic()
+    post(base + "/slow-first", deadline=started + 10, hedge="off", tracker=tracker, json={})
+    assert time.monotonic() - started >= SLOW_SECONDS
+    assert hits["/slow-first"] == 1
+    assert tracker.hedged == 0
+
+
+def test_no_hedge_over_the_rate_cap(base, hits):
+    tracker = HedgeStats()
+    for _ in range(10):
+        tracker.record(True, False)  # every recent request was hedged already
+    post(base + "/slow-first", deadline=time.monotonic() + 10, hedge="0.1", tracker=tracker, json={})
+    assert hits["/slow-first"] == 1
+
+
+def test_5xx_is_returned_for_the_caller_to_report(base):
+    response = post(base + "/unavailable", deadline=time.monotonic() + 5, hedge="off", tracker=HedgeStats(),
+                    json={})
+    assert response.status_code == 503
+
+
+def test_connection_errors_are_raised_not_hedged():
+    closed = ThreadingHTTPServer(("127.0.0.1", 0), Stub)
+    url = f"http://127.0.0.1:{closed.server_address[1]}/fast"
+    closed.server_close()
+    tracker = HedgeStats()
+    with pytest.raises(requests.ConnectionError):
+        post(url, deadline=time.monotonic() + 5, hedge="0.05", tracker=tracker, json={})
+    assert tracker.hedged == 0
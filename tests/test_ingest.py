@@ -0,0 +1,221 @@
+"""Streamed ingest (vocalize_engine.ingest, backend/streaming_upload.py) against the batch converter"""
+import asyncio
+import contextlib
+import io
+import struct
+
+import pytest
+
+from vocalize_engine.conformance import synthetic_fixtures, write_wav
+from vocalize_engine.convert import convert_to_google_format
+from vocalize_engine.ingest import IngestError, UploadIngest, WavIngest
+
+# 1 byte, sizes that land inside the header and inside 3/4/6/8-byte frames, and larger ones
+CHUNK_SIZES = [1, 5, 7, 13, 44, 101, 4097]
+
+
+@pytest.fixture(scope="module")
+def fixtures(tmp_path_factory):
+    """8-bit unsigned, 16/24/32-bit int, float32/64 and EXTENSIBLE layouts"""
+    return synthetic_fixtures(str(tmp_path_factory.mktemp("fixtures")), seconds=0.1)
+
+
+def batch(path, tmp_path, target_rate=16000):
+    out = str(tmp_path / "batch.wav")
+    with contextlib.redirect_stdout(io.StringIO()):
+        convert_to_google_format(path, out, target_rate=target_rate)
+    with open(out, "rb") as f:
+        return f.read()
+
+
+def streamed(data, chunk, out, ingest_class=WavIngest, **options):
+    ingest = ingest_class(out, **options)
+    for start in range(0, len(data), chunk):
+        ingest.feed(data[start:start + chunk])
+    summary = ingest.finish()
+    with open(out, "rb") as f:
+        return f.read(), summary
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def unknown_size(data):
+    """The same WAV as a streaming writer leaves it: data chunk size 0xFFFFFFFF"""
+    pos = data.index(b"data")
+    return data[:pos + 4] + struct.pack("<I", 0xFFFFFFFF) + data[pos + 8:]
+
+
+@pytest.mark.parametrize("chunk", CHUNK_SIZES)
+def test_streamed_output_matches_the_batch_converter(fixtures, tmp_path, chunk):
+    for path in fixtures:
+        expected = batch(path, tmp_path)
+        output, summary = streamed(read(path), chunk, str(tmp_path / "streamed.wav"))
+        assert output == expected, (path, chunk)
+        assert summary["target_rate"] == 16000
+
+
+@pytest.mark.parametrize("chunk", [3, 4097])
+def test_unknown_data_size_matches_the_batch_converter(fixtures, tmp_path, chunk):
+    for path in fixtures:
+        output, summary = streamed(unknown_size(read(path)), chunk, str(tmp_path / "streamed.wav"))
+        assert output == batch(path, tmp_path), (path, chunk)
+
+
+def test_native_rate_matches_the_batch_converter(fixtures, tmp_path):
+    for path in fixtures:
+        output, summary = streamed(read(path), 333, str(tmp_path / "streamed.wav"), target_rate=None)
+        assert output == batch(path, tmp_path, summary["target_rate"]), path
+
+
+def test_summary(fixtures, tmp_path):
+    path = next(p for p in fixtures if "pcm24_stereo_48k" in p)
+    data = read(path)
+    _, summary = streamed(data, 1000, str(tmp_path / "out.wav"), UploadIngest, raw_file=str(tmp_path / "raw"))
+    assert summary == {"sample_rate": 48000, "channels": 2, "sample_width": 3, "frames": 4800, "duration": 0.1,
+                       "bytes": len(data), "target_rate": 16000, "container": "wav"}
+
+
+def test_trailing_chunks_after_data_are_ignored(fixtures, tmp_path):
+    path = next(p for p in fixtures if "pcm16_stereo_44k" in p)
+    output, _ = streamed(read(path) + b"LIST\x04\x00\x00\x00abcd", 7, str(tmp_path / "out.wav"))
+    assert output == batch(path, tmp_path)
+
+
+@pytest.mark.parametrize("cut", [10, 30, 60, 1001])
+def test_truncated_upload(fixtures, tmp_path, cut):
+    path = next(p for p in fixtures if "pcm16_mono_16k" in p)
+    with pytest.raises(IngestError) as raised:
+        streamed(read(path)[:cut], 7, str(tmp_path / "out.wav"))
+    assert raised.value.status_code == 400
+
+
+def test_truncated_passthrough_upload(tmp_path):
+    path = write_wav(str(tmp_path / "in.wav"), [(i,) for i in range(1000)], 16000, 2)
+    with pytest.raises(IngestError, match="declared frames") as raised:
+        streamed(read(path)[:-100], 64, str(tmp_path / "out.wav"))
+    assert raised.value.status_code == 400
+
+
+def test_oversize_upload(fixtures, tmp_path):
+    path = next(p for p in fixtures if "pcm16_mono_16k" in p)
+    with pytest.raises(IngestError) as raised:
+        streamed(read(path), 512, str(tmp_path / "out.wav"), max_bytes=1000)
+    assert raised.value.status_code == 413
+
+
+def test_too_long_by_the_declared_size(tmp_path):
+    path = write_wav(str(tmp_path / "in.wav"), [(0,)] * 16000, 8000, 2)   # 2s
+    ingest = WavIngest(str(tmp_path / "out.wav"), max_seconds=1.5)
+    with pytest.raises(IngestError) as raised:
+        ingest.feed(read(path)[:64])   # rejected from the header alone
+    assert raised.value.status_code == 413
+    ingest.abort()
+
+
+def test_too_long_while_streaming_an_unknown_size(tmp_path):
+    path = write_wav(str(tmp_path / "in.wav"), [(0,)] * 16000, 8000, 2)
+    with pytest.raises(IngestError) as raised:
+        streamed(unknown_size(read(path)), 1024, str(tmp_path / "out.wav"), max_seconds=1.5)
+    assert raised.value.status_code == 413
+
+
+@pytest.mark.parametrize("data, status", [
+    (b"OggS" + b"\0" * 60, 415),                                          # not a WAV
+    (b"RIFF\0\0\0\0WAVEdata\0\0\0\0", 400),                                # data before fmt
+    (b"RIFF\0\0\0\0WAVEfmt \x10\0\0\0" + struct.pack("<HHIIHH", 2, 1, 8000, 8000, 1, 4), 415),  # ADPCM
+    (b"RIFF\0\0\0\0WAVE" + b"JUNK" + struct.pack("<I", 70000) + b"\0" * 70000, 400),  # no data chunk
+    (b"RIFF\0\0\0\0WAV", 400),                                             # ends inside the header
+])
+def test_rejected_headers(tmp_path, data, status):
+    with pytest.raises(IngestError) as raised:
+        streamed(data, 5, str(tmp_path / "out.wav"))
+    assert raised.value.status_code == status
+
+
+def test_upload_ingest_routes_other_containers_to_the_raw_file(tmp_path):
+    data = b"OggS" + bytes(range(256)) * 4
+    ingest = UploadIngest(str(tmp_path / "out.wav"), str(tmp_path / "raw"))
+    for start in range(0, len(data), 5):
+        ingest.feed(data[start:start + 5])
+    assert ingest.finish() == {"bytes": len(data), "container": "ogg"}
+    assert read(tmp_path / "raw") == data
+
+
+@pytest.mark.parametrize("data, status", [(b"", 400), (b"garbage" * 3, 415), (b"OggS" + b"\0" * 100, 413)])
+def test_upload_ingest_rejections(tmp_path, data, status):
+    with pytest.raises(IngestError) as raised:
+        streamed(data, 7, str(tmp_path / "out.wav"), UploadIngest, raw_file=str(tmp_path / "raw"), max_bytes=64)
+    assert raised.value.status_code == status
+
+
+# backend/streaming_upload.py: the multipart layer in front of the ingester
+
+class Request:
+    """The parts of a Starlette request pump_request reads; the body arrives in chunk-byte pieces"""
+
+    def __init__(self, body, content_type, chunk):
+        self.headers = {"content-type": content_type}
+        self.body = body
+        self.chunk = chunk
+
+    async def stream(self):
+        for start in range(0, len(self.body), self.chunk):
+            yield self.body[start:start + self.chunk]
+
+
+def multipart(audio, **fields):
+    boundary = "vocalizeboundary"
+    parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'.encode() + value.encode()
+             for name, value in fields.items()]
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="a.wav"\r\n'
+                 f'Content-Type: audio/wav\r\n\r\n'.encode() + audio)
+    body = b"\r\n".join(parts) + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+@pytest.fixture
+def streaming_upload():
+    pytest.importorskip("starlette")
+    pytest.importorskip("python_multipart")
+    import streaming_upload
+
+    return streaming_upload
+
+
+@pytest.mark.parametrize("chunk", [7, 37, 65536])
+def test_multipart_upload_matches_the_batch_converter(streaming_upload, fixtures, tmp_path, chunk):
+    path = next(p for p in fixtures if "float32_stereo_48k" in p)
+    body, content_type = multipart(read(path), reference="the cat sat")
+    form = {}
+    out = str(tmp_path / "out.wav")
+    summary = asyncio.run(streaming_upload.ingest_upload(Request(body, content_type, chunk), out, form=form))
+    assert read(out) == batch(path, tmp_path)
+    assert summary["frames"] == 4800
+    assert form == {"reference": b"the cat sat"}
+
+
+def test_raw_body_upload(streaming_upload, fixtures, tmp_path):
+    path = next(p for p in fixtures if "pcm8_mono_8k" in p)
+    out = str(tmp_path / "out.wav")
+    asyncio.run(streaming_upload.ingest_upload(Request(read(path), "audio/wav", 99), out))
+    assert read(out) == batch(path, tmp_path)
+
+
+def test_multipart_rejections(streaming_upload, fixtures, tmp_path):
+    path = next(p for p in fixtures if "pcm16_mono_16k" in p)
+    out = str(tmp_path / "out.wav")
+    oversize, content_type = multipart(read(path))
+    missing, _ = multipart(b"", other="x")
+    missing = missing.replace(b'name="file"', b'name="audio"')
+    cases = [
+        (Request(oversize, content_type, 64), {"max_bytes": 1000}, 413),
+        (Request(missing, content_type, 64), {}, 400),
+        (Request(oversize, "multipart/form-data", 64), {}, 400),   # no boundary
+    ]
+    for request, options, status in cases:
+        with pytest.raises(IngestError) as raised:
+            asyncio.run(streaming_upload.ingest_upload(request, out, **options))
+        assert raised.value.status_code == status
@@ -0,0 +1,132 @@
+"""vocalize_engine.percentiles: KLL rank error, merging, and the shared population file"""
+import random
+from bisect import bisect_left, bisect_right
+
+import pytest
+
+from vocalize_engine import percentiles
+from vocalize_engine.percentiles import MIN_POPULATION, SKETCH_K, KLLSketch, Population, merge_sketches
+
+MAX_RANK_ERROR = 0.02       # ~1-2 percentile points at k=200
+
+
+def exact_rank(sorted_values, x):
+    lo, hi = bisect_left(sorted_values, x), bisect_right(sorted_values, x)
+    return (lo + (hi - lo) / 2) / len(sorted_values)
+
+
+def weight(sketch):
+    return sum(len(items) << h for h, items in enumerate(sketch.levels))
+
+
+@pytest.fixture(scope="module")
+def values():
+    rng = random.Random(5)
+    return [max(0.0, rng.gauss(135, 25)) for _ in range(50_000)]
+
+
+@pytest.fixture(scope="module")
+def probes():
+    rng = random.Random(6)
+    return [rng.gauss(135, 30) for _ in range(200)]
+
+
+def sketch_of(values, seed=0):
+    sketch = KLLSketch(rng=random.Random(seed))
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+def test_empty_sketch():
+    assert KLLSketch().rank(1.0) is None and KLLSketch().quantile(0.5) is None
+
+
+def test_exact_until_the_first_compaction():
+    sketch = sketch_of([1, 2, 2, 3])
+    assert [sketch.rank(x) for x in (0, 1, 2, 2.5, 4)] == [0, 1 / 8, 2 / 4, 3 / 4, 1]
+    assert sketch.quantile(0.5) == 2
+
+
+def test_rank_error(values, probes):
+    sketch = sketch_of(values)
+    exact = sorted(values)
+    assert max(abs(sketch.rank(x) - exact_rank(exact, x)) for x in probes) <= MAX_RANK_ERROR
+    assert sketch.quantile(0.5) == pytest.approx(exact[len(exact) // 2], abs=2.0)
+    assert sketch._size() < 3 * SKETCH_K      # O(k) items for any n
+
+
+def test_compaction_loses_no_weight(values):
+    sketch = KLLSketch(rng=random.Random(0))
+    for i, value in enumerate(values[:5000], 1):
+        sketch.add(value)
+        assert sketch.n == weight(sketch) == i
+
+
+def test_merge_preserves_n_and_accuracy(values, probes):
+    parts = [sketch_of(values[i::4], seed=i) for i in range(4)]
+    merged = merge_sketches(*({"wpm": part} for part in parts))["wpm"]
+    assert merged.n == weight(merged) == len(values)
+    exact = sorted(values)
+    assert max(abs(merged.rank(x) - exact_rank(exact, x)) for x in probes) <= MAX_RANK_ERROR
+    assert [part.n for part in parts] == [len(values[i::4]) for i in range(4)]   # inputs untouched
+
+
+def test_merge_into_a_deeper_sketch(values):
+    small, large = sketch_of(values[:10]), sketch_of(values[10:])
+    assert small.merge(large).n == weight(small) == len(values)
+
+
+def test_round_trip(values):
+    sketch = sketch_of(values[:3000])
+    copy = KLLSketch.from_dict(sketch.to_dict())
+    assert (copy.n, copy.levels, copy.k) == (sketch.n, sketch.levels, sketch.k)
+
+
+# Population
+
+def test_no_rank_below_the_minimum_population():
+    population = Population("")
+    for i in range(MIN_POPULATION - 1):
+        population.observe({"wpm": 100 + i})
+    assert population.ranks({"wpm": 110}) == {"cohort": "all", "population": MIN_POPULATION - 1, "wpm": None}
+    population.observe({"wpm": 200})
+    assert population.ranks({"wpm": 110})["wpm"] == 52.5       # 10 below and a tie, of 20
+
+
+def test_cohorts_also_count_toward_all(monkeypatch):
+    monkeypatch.setattr(percentiles, "MAX_COHORTS", 2)
+    population = Population("")
+    population.observe({"wpm": 120, "note": "ignored"}, cohort="esl")
+    population.observe({"wpm": 130}, cohort="sales")          # one cohort too many: "all" only
+    assert population.cohorts() == ["all", "esl"]
+    assert population.summary("all")["metrics"]["wpm"]["population"] == 2
+    assert population.summary("esl")["metrics"]["wpm"]["population"] == 1
+
+
+def test_workers_merge_through_the_file(tmp_path, values):
+    path = str(tmp_path / "sketches.json")
+    workers = [Population(path, flush_every=10 ** 9) for _ in range(3)]
+    for i, value in enumerate(values[:3000]):
+        workers[i % 3].observe({"wpm": value})
+    assert workers[0].summary()["metrics"]["wpm"]["population"] == 1000   # its own delta only
+    for worker in workers:
+        worker.flush()
+    assert Population(path).summary()["metrics"]["wpm"]["population"] == 3000
+    assert workers[2].ranks({"wpm": 135})["population"] == 3000       # the last to flush sees everyone
+
+
+def test_flush_every(tmp_path):
+    path = str(tmp_path / "sketches.json")
+    population = Population(path, flush_every=5)
+    for i in range(5):
+        population.observe({"wpm": i})
+    assert Population(path).summary()["metrics"]["wpm"]["population"] == 5
+
+
+def test_failed_flush_keeps_the_delta(tmp_path):
+    population = Population(str(tmp_path / "missing" / "sketches.json"), flush_every=10 ** 9)
+    population.observe({"wpm": 120})
+    population.flush()
+    population.observe({"wpm": 130})
+    assert population.summary()["metrics"]["wpm"]["population"] == 2
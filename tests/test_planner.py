@@ -0,0 +1,174 @@
+"""vocalize_engine.planner: plan boundaries, durations of compressed audio, and split recognition"""
+import math
+import struct
+from array import array
+
+import pytest
+
+from vocalize_engine import planner, stt
+from vocalize_engine.planner import (CHUNK_SECONDS, INLINE_MAX_BYTES, MIN_OPUS_BYTES_PER_SECOND, NO_RESULTS,
+                                     SYNC_MAX_SECONDS, audio_duration, payload_bytes, plan_for, recognize_planned,
+                                     recognize_split, split_points, wav_bytes)
+
+# Largest audio whose base64 request body still fits inline
+MAX_INLINE_AUDIO = (INLINE_MAX_BYTES - planner.JSON_OVERHEAD) // 4 * 3
+
+
+def test_payload_bytes():
+    assert payload_bytes(3) == 4 + planner.JSON_OVERHEAD
+    assert payload_bytes(4) == 8 + planner.JSON_OVERHEAD
+    assert payload_bytes(MAX_INLINE_AUDIO) <= INLINE_MAX_BYTES < payload_bytes(MAX_INLINE_AUDIO + 1)
+
+
+@pytest.mark.parametrize("size, duration, expected", [
+    (1000, SYNC_MAX_SECONDS, "single"),
+    (1000, SYNC_MAX_SECONDS + 0.01, "split"),
+    (MAX_INLINE_AUDIO, 10, "single"),
+    (MAX_INLINE_AUDIO + 1, 10, "split"),
+])
+def test_linear16_boundaries(size, duration, expected):
+    assert plan_for(size, duration)["plan"] == expected
+
+
+@pytest.mark.parametrize("encoding", ["FLAC", "OGG_OPUS", "WEBM_OPUS"])
+@pytest.mark.parametrize("size, duration, decoder, expected", [
+    (1000, SYNC_MAX_SECONDS, None, "single"),
+    (1000, SYNC_MAX_SECONDS + 0.01, None, "long_running"),
+    (MAX_INLINE_AUDIO, 600, None, "long_running"),
+    (MAX_INLINE_AUDIO + 1, 10, None, "reject"),
+    (MAX_INLINE_AUDIO + 1, 10, "ffmpeg", "split"),
+    (MAX_INLINE_AUDIO + 1, 600, "pyav", "split"),
+])
+def test_compressed_boundaries(encoding, size, duration, decoder, expected):
+    assert plan_for(size, duration, True, encoding, decoder)["plan"] == expected
+
+
+def test_split_plan_details():
+    plan = plan_for(20 * 1000 * 1000, 625.0)
+    assert plan["chunks"] == math.ceil(625 / CHUNK_SECONDS) == 12
+    assert plan["reason"] == "625s > 60s sync limit and 26.7MB > 10MB inline limit: 12 parallel chunks of <= 55s"
+    assert plan["payload_bytes"] == payload_bytes(20 * 1000 * 1000)
+
+    decoded = plan_for(MAX_INLINE_AUDIO + 1, 120.0, True, "OGG_OPUS", "ffmpeg")
+    assert decoded["decode"] and decoded["chunks"] == 3
+    assert decoded["reason"].endswith("decode with ffmpeg, then split")
+
+
+def test_inexact_durations_are_marked():
+    plan = plan_for(100000, 133.3, False, "WEBM_OPUS")
+    assert plan["duration_exact"] is False
+    assert plan["reason"].startswith("~133s > 60s")
+    assert plan_for(1000, 61, False, "WEBM_OPUS", None)["plan"] == "long_running"
+
+
+def test_reject_reason():
+    plan = plan_for(MAX_INLINE_AUDIO + 1, 30, True, "FLAC")
+    assert plan["reason"] == "10.0MB > 10MB inline limit and no local decoder to split it"
+
+
+# audio_duration
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_duration_of_wav(tmp_path):
+    path = write(tmp_path, "a.wav", wav_bytes(array("h", bytes(2 * 24000)), 16000))
+    assert audio_duration(path, "LINEAR16") == (1.5, True)
+
+
+def test_duration_of_flac(tmp_path):
+    packed = 44100 << 44 | 1 << 41 | 15 << 36 | 44100 * 90
+    head = b"fLaC\x80\0\0\x22" + struct.pack(">HH", 4096, 4096) + b"\0" * 6 + struct.pack(">Q", packed)
+    assert audio_duration(write(tmp_path, "a.flac", head + b"\0" * 100), "FLAC") == (90.0, True)
+
+
+def test_duration_of_ogg_opus(tmp_path):
+    def page(granule, packet):
+        return b"OggS\0\0" + struct.pack("<qIII", granule, 1, 0, 0) + bytes([1, len(packet)]) + packet
+
+    head = page(0, b"OpusHead\1\1" + struct.pack("<HIhB", 312, 48000, 0, 0))
+    data = head + page(0, b"OpusTags") + b"\0" * 70000 + page(48000 * 75 + 312, b"\0" * 10)
+    assert audio_duration(write(tmp_path, "a.ogg", data), "OGG_OPUS") == (75.0, True)
+
+
+@pytest.mark.parametrize("element, seconds", [
+    (b"\x44\x89\x88" + struct.pack(">d", 61500.0), 61.5),
+    (b"\x44\x89\x84" + struct.pack(">f", 2000.0) + b"\0" * 4, 2.0),
+])
+def test_duration_of_webm_with_a_duration_element(tmp_path, element, seconds):
+    path = write(tmp_path, "a.webm", b"\x1a\x45\xdf\xa3" + b"\0" * 20 + element + b"\0" * 50)
+    assert audio_duration(path, "WEBM_OPUS") == (seconds, True)
+
+
+def test_duration_of_webm_without_one_is_a_bound(tmp_path):
+    path = write(tmp_path, "a.webm", b"\x1a\x45\xdf\xa3" + b"\0" * 74996)
+    assert audio_duration(path, "WEBM_OPUS") == (75000 / MIN_OPUS_BYTES_PER_SECOND, False)
+
+
+def test_plan_recognition(tmp_path):
+    path = write(tmp_path, "a.wav", wav_bytes(array("h", bytes(2 * 16000 * 61)), 16000))
+    plan = planner.plan_recognition(path)
+    assert plan["plan"] == "split" and plan["chunks"] == 2 and plan["bytes"] == 44 + 2 * 16000 * 61
+
+
+# Splitting
+
+def bursts(seconds, rate=100, quiet_at=()):
+    """Loud samples except for one quiet sample at each offset in quiet_at (seconds)"""
+    samples = array("h", [5000] * int(seconds * rate))
+    for t in quiet_at:
+        samples[int(t * rate)] = 0
+    return samples
+
+
+def test_split_points_cut_at_the_quietest_frame():
+    samples = bursts(120, quiet_at=[52.5, 103.0])
+    cuts = split_points(samples, 100)
+    assert cuts[0] == 0 and cuts[-1] == len(samples)
+    assert [c / 100 for c in cuts[1:-1]] == pytest.approx([52.5, 103.0], abs=planner.CUT_FRAME_SECONDS)
+    assert all(b - a <= CHUNK_SECONDS * 100 for a, b in zip(cuts, cuts[1:]))
+
+
+def test_short_audio_is_not_split():
+    assert split_points(bursts(CHUNK_SECONDS), 100) == [0, int(CHUNK_SECONDS * 100)]
+
+
+def test_recognize_split_shifts_word_times(tmp_path, monkeypatch):
+    rate = 1000
+    samples = bursts(120, rate, quiet_at=[52.5, 103.0])
+    path = write(tmp_path, "long.wav", wav_bytes(samples, rate))
+    chunks = []
+
+    def recognize(content, api_key, language_code, encoding, sample_rate_hertz, deadline):
+        chunks.append(len(content))
+        if len(chunks) == 3 and len(content) < 2 * rate * 20:
+            return {"error": NO_RESULTS}     # a silent last chunk
+        return {"transcript": "hi there", "word_count": 2,
+                "words": [{"word": "hi", "startTime": 1.0, "endTime": 1.5},
+                          {"word": "there", "startTime": 2.0, "endTime": 2.25}]}
+
+    monkeypatch.setattr(stt, "recognize_content", recognize)
+    result = recognize_split(path, "key", max_parallel=1)
+    cuts = result["chunks"]
+    assert cuts == pytest.approx([0, 52.5, 103.0, 120.0], abs=planner.CUT_FRAME_SECONDS)
+    assert [w["startTime"] for w in result["words"]] == [1.0, 2.0, cuts[1] + 1.0, cuts[1] + 2.0]
+    assert result["transcript"] == "hi there hi there" and result["word_count"] == 4
+
+
+def test_recognize_split_fails_on_a_chunk_error(tmp_path, monkeypatch):
+    path = write(tmp_path, "long.wav", wav_bytes(bursts(70, 1000), 1000))
+    monkeypatch.setattr(stt, "recognize_content", lambda *args: {"error": "API request failed: 400"})
+    assert recognize_split(path, "key") == {"error": "API request failed: 400"}
+
+
+def test_recognize_planned_rejects_before_any_request(tmp_path, monkeypatch):
+    monkeypatch.setattr(planner, "INLINE_MAX_BYTES", 10000)
+    monkeypatch.setattr(stt, "recognize_content", lambda *args: pytest.fail("STT called"))
+    monkeypatch.setattr("vocalize_engine.codecs.decoder_available", lambda: None)
+    path = write(tmp_path, "a.flac", b"fLaC" + b"\0" * 20000)
+    result = recognize_planned(path, "key", encoding="FLAC")
+    assert result["error"].startswith("Audio too large to recognize")
+    assert result["plan"]["plan"] == "reject"
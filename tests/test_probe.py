@@ -0,0 +1,149 @@
+"""vocalize_engine.probe: what an upload is, and why /analyze would take or refuse it"""
+import math
+import random
+import struct
+
+import pytest
+
+from vocalize_engine import planner, probe
+from vocalize_engine.bench import bundled_wavs
+from vocalize_engine.conformance import write_wav
+from vocalize_engine.planner import CHUNK_SECONDS, MIN_OPUS_BYTES_PER_SECOND
+from vocalize_engine.probe import MIN_SPEECH_RATIO, probe_audio
+
+RATE = 16000
+
+
+@pytest.fixture(autouse=True)
+def no_decoder(monkeypatch):
+    monkeypatch.setattr(probe, "decoder_available", lambda: None)
+
+
+def speech_wav(path, seconds, rate=RATE):
+    """0.3s bursts of noise between 0.3s of silence"""
+    r = random.Random(0)
+    burst = int(0.3 * rate)
+    frames = [(r.randint(-8000, 8000) if (i // burst) % 2 == 0 else 0,) for i in range(int(seconds * rate))]
+    return write_wav(str(path), frames, rate, 2)
+
+
+def test_accepted_wav(tmp_path):
+    result = probe_audio(speech_wav(tmp_path / "a.wav", 2.0))
+    assert result["accepted"] is True and result["reasons"] == [] and result["warnings"] == []
+    assert (result["container"], result["duration"], result["duration_exact"]) == ("wav", 2.0, True)
+    assert (result["sample_rate_hertz"], result["channels"], result["stt_sample_rate_hertz"]) == (RATE, 1, RATE)
+    assert result["speech_ratio"] == pytest.approx(0.5, abs=0.1)
+    assert result["estimated_conversion_seconds"] == 0.0       # already what STT is sent
+    assert result["plan"]["plan"] == "single"
+    assert result["billed_seconds"] == 15
+    assert result["estimated_cost_usd"] == round(15 / 60 * probe.PRICE_PER_MINUTE, 4)
+
+
+def test_silence_is_a_warning_not_a_reason(tmp_path):
+    result = probe_audio(write_wav(str(tmp_path / "a.wav"), [(0,)] * RATE, RATE, 2))
+    assert result["speech_ratio"] < MIN_SPEECH_RATIO
+    assert result["accepted"] is True and result["warnings"] == ["Little or no speech detected"]
+
+
+def test_oversized_upload(tmp_path):
+    path = speech_wav(tmp_path / "a.wav", 1.0)
+    result = probe_audio(path, max_bytes=1000)
+    assert result["accepted"] is False and result["reasons"] == ["Upload exceeds 1000 bytes"]
+    assert result["duration"] == 1.0                            # still described
+
+
+def test_unrecognized_header(tmp_path):
+    path = tmp_path / "a.bin"
+    path.write_bytes(b"not audio at all" * 10)
+    result = probe_audio(str(path))
+    assert result["accepted"] is False and result["container"] is None
+    assert result["reasons"] == ["Unsupported audio format (unrecognized file header)"]
+
+
+def test_invalid_wav(tmp_path):
+    path = tmp_path / "a.wav"
+    path.write_bytes(b"RIFF\x24\0\0\0WAVEdata\0\0\0\0")
+    result = probe_audio(str(path))
+    reason, = result["reasons"]
+    assert result["accepted"] is False and reason.startswith("Invalid WAV: ")
+    assert result["duration"] is None and result["plan"] is None
+
+
+def test_mp3_needs_a_decoder(tmp_path):
+    path = tmp_path / "a.mp3"
+    path.write_bytes(b"ID3\4\0" + b"\0" * 1000)
+    result = probe_audio(str(path))
+    assert result["accepted"] is False and result["codec"] == "mp3"
+    assert result["reasons"] == ["mp3 needs a local decoder (pip install av, or install ffmpeg)"]
+
+
+def test_exact_duration_over_the_limit(tmp_path):
+    result = probe_audio(speech_wav(tmp_path / "a.wav", 2.0), max_seconds=1)
+    assert result["reasons"] == ["Audio exceeds 1s"]
+    assert probe_audio(speech_wav(tmp_path / "b.wav", 1.0), max_seconds=1)["accepted"] is True
+
+
+def test_estimated_duration_may_exceed_the_limit(tmp_path):
+    # No Duration element: the length is a bound from the size at the lowest Opus bitrate
+    head = (b"\x1a\x45\xdf\xa3\x9f\x42\x86\x81\x01\x42\xf7\x81\x01\x42\x82\x84webm"
+            b"\x18\x53\x80\x67\x01\xff\xff\xff\xff\xff\xff\xff\x16\x54\xae\x6b\x86\x86A_OPUS")
+    path = tmp_path / "a.webm"
+    path.write_bytes(head + b"\0" * (30 * MIN_OPUS_BYTES_PER_SECOND - len(head)))
+    result = probe_audio(str(path), max_seconds=20)
+    assert (result["codec"], result["duration"], result["duration_exact"]) == ("opus", 30.0, False)
+    assert result["reasons"] == ["Audio may exceed 20s"]
+    assert result["estimated_conversion_seconds"] == 0.0       # sent to STT as it is
+
+
+def test_plan_rejection_is_a_reason(tmp_path, monkeypatch):
+    monkeypatch.setattr(planner, "INLINE_MAX_BYTES", 10000)
+    packed = 44100 << 44 | 1 << 41 | 15 << 36 | 44100 * 30
+    head = b"fLaC\x80\0\0\x22" + struct.pack(">HH", 4096, 4096) + b"\0" * 6 + struct.pack(">Q", packed)
+    path = tmp_path / "a.flac"
+    path.write_bytes(head + b"\0" * 20000)
+    result = probe_audio(str(path))
+    assert result["plan"]["plan"] == "reject"
+    assert result["accepted"] is False and result["reasons"] == [result["plan"]["reason"]]
+    assert result["estimated_cost_usd"] is None
+
+
+def test_prefix_is_extrapolated_from_the_upload_size(tmp_path):
+    # Only the first second was saved; the upload was 125s
+    path = speech_wav(tmp_path / "a.wav", 1.0)
+    total = 44 + 2 * RATE * 125
+    result = probe_audio(path, max_bytes=total - 1, total_bytes=total)
+    assert (result["bytes"], result["duration"], result["duration_exact"]) == (total, 125.0, False)
+    assert result["reasons"] == [f"Upload exceeds {total - 1} bytes"]
+    assert result["plan"]["plan"] == "split" and result["plan"]["chunks"] == math.ceil(125 / CHUNK_SECONDS)
+    assert result["billed_seconds"] == 60 + 60 + 15           # each 55s chunk is rounded up separately
+
+
+# The backend
+
+@pytest.fixture
+def client():
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+
+    import main
+
+    return TestClient(main.app)
+
+
+def test_probe_endpoint(client):
+    wav = next(p for p in bundled_wavs() if p.endswith("test_audio.wav"))
+    with open(wav, "rb") as f:
+        result = client.post("/probe", files={"file": ("test_audio.wav", f, "audio/wav")}).json()
+    assert result["accepted"] is True and result["container"] == "wav" and result["duration"] > 0
+    assert result["plan"]["plan"] in ("single", "split")
+
+
+def test_probe_endpoint_describes_oversized_uploads(client, tmp_path, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "MAX_UPLOAD_BYTES", 8000)
+    with open(speech_wav(tmp_path / "a.wav", 2.0), "rb") as f:
+        result = client.post("/probe", files={"file": ("a.wav", f, "audio/wav")}).json()
+    assert result["accepted"] is False and result["reasons"] == ["Upload exceeds 8000 bytes"]
+    assert result["bytes"] == 44 + 2 * RATE * 2 and result["duration"] == 2.0
+    assert client.post("/probe", files={"file": ("a.wav", b"", "audio/wav")}).status_code == 400
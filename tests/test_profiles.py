@@ -0,0 +1,121 @@
+"""vocalize_engine.profiles: the standard profile keeps the original rules; others and loading"""
+import json
+import random
+
+import pytest
+
+from vocalize_engine.fluency import analyze_fluency
+from vocalize_engine.profiles import PROFILE_SETTINGS, PROFILES, ScoringProfile, get_profile, load_profiles
+
+
+def baseline_fluency(words):
+    """analyze_fluency as it was before profiles (hardcoded fillers, gaps and rubric)"""
+    if not words:
+        return {"fluency_score": 0, "error": "No words"}
+    fillers = ['um', 'uh', 'like', 'you know', 'basically', 'actually', 'so']
+    filler_count = sum(1 for w in words if w['word'].lower() in fillers)
+    pause_count = 0
+    long_pauses = 0
+    for i in range(1, len(words)):
+        gap = float(words[i]['startTime']) - float(words[i - 1]['endTime'])
+        if gap > 0.8:
+            pause_count += 1
+        if gap > 1.5:
+            long_pauses += 1
+    duration = float(words[-1]['endTime']) - float(words[0]['startTime'])
+    wpm = (len(words) / duration) * 60 if duration > 0 else 0
+    score = 5.0
+    if wpm < 120 or wpm > 150:
+        score -= 1.0
+    if (filler_count / len(words)) > 0.10:
+        score -= 1.0
+    score -= (long_pauses * 0.5)
+    return {
+        "wpm": round(wpm, 1),
+        "avg_word_time": round(duration / len(words), 2),
+        "filler_rate": round(filler_count / len(words), 2),
+        "pause_frequency": round(pause_count / len(words), 2),
+        "long_pauses": long_pauses,
+        "fluency_score": max(0, round(score, 1))
+    }
+
+
+def random_words(seed):
+    r = random.Random(seed)
+    vocabulary = ["So", "so,", "UM", "uh", "like", "you", "know", "Basically", "actually.", "the", "market",
+                  "grows", "er", "matlab", "हाँ"]
+    words, t = [], r.uniform(0, 2)
+    for _ in range(r.randint(1, 120)):
+        t += r.choice([0.0, 0.05, 0.3, 0.8, 0.81, 1.5, 1.6, 3.0])
+        end = t + r.choice([0.0, 0.1, 0.25, 0.6])
+        words.append({"word": r.choice(vocabulary), "startTime": str(round(t, 2)), "endTime": round(end, 2)})
+        t = end
+    return words
+
+
+def test_standard_reproduces_the_baseline_metrics():
+    for seed in range(300):
+        words = random_words(seed)
+        assert analyze_fluency(words) == baseline_fluency(words), seed
+        assert analyze_fluency(words, profile="standard") == baseline_fluency(words), seed
+
+
+def test_standard_is_the_default():
+    assert get_profile() is get_profile("standard") is PROFILES["standard"]
+    assert get_profile(PROFILES["esl"]) is PROFILES["esl"]
+
+
+def test_unknown_profile():
+    with pytest.raises(ValueError, match="Unknown scoring profile"):
+        get_profile("nope")
+
+
+def test_profiles_change_the_score():
+    words = [{"word": w, "startTime": 0.5 * i, "endTime": 0.5 * i + 0.4}
+             for i, w in enumerate("so I mean the market erm grows".split())]
+    # 120 WPM: standard and esl are happy with the pace, executive is not
+    assert analyze_fluency(words)["filler_rate"] == 0.14
+    assert analyze_fluency(words, profile="esl")["filler_rate"] == 0.57     # so, i mean, erm
+    assert analyze_fluency(words, profile="executive")["fluency_score"] == 5.0 - 1.0 - 1.5
+
+
+def test_attached_punctuation():
+    # standard only case-folds, as before; the others strip punctuation (and the danda)
+    words = [{"word": w, "startTime": i, "endTime": i + 0.5} for i, w in enumerate(["Matlab,", "हाँ।", "So,", "tea"])]
+    assert analyze_fluency(words)["filler_rate"] == 0.0
+    assert analyze_fluency(words, profile="pa-hi")["filler_rate"] == 0.75
+
+
+def test_invalid_settings():
+    with pytest.raises(ValueError, match="normalizer"):
+        ScoringProfile("x", normalizer="upper")
+    with pytest.raises(ValueError, match="pause_gap"):
+        ScoringProfile("x", pause_gap=2.0, long_pause_gap=1.0)
+
+
+def test_load_profiles_from_a_file(tmp_path):
+    path = tmp_path / "profiles.json"
+    path.write_text(json.dumps({"kids": {"base": "esl", "wpm_range": [60, 120]},
+                                "standard": {"max_score": 10}}))
+    profiles = load_profiles(PROFILE_SETTINGS, str(path))
+    assert profiles["kids"].wpm_range == (60.0, 120.0)
+    assert profiles["kids"].fillers == PROFILES["esl"].fillers
+    assert profiles["standard"].max_score == 10.0 and profiles["standard"].normalizer == "lower"
+
+    path.write_text(json.dumps({"kids": {"base": "missing"}}))
+    with pytest.raises(ValueError, match="unknown profile"):
+        load_profiles(PROFILE_SETTINGS, str(path))
+
+
+def test_profiles_endpoint():
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+
+    import main
+
+    client = TestClient(main.app)
+    described = client.get("/profiles").json()["profiles"]
+    assert [p["name"] for p in described] == list(PROFILES)
+    response = client.post("/rescore", json={"words": random_words(1), "profile": "nope"})
+    assert response.status_code == 400
+    assert response.json()["profiles"] == sorted(PROFILES)
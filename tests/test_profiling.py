@@ -0,0 +1,174 @@
+"""vocalize_engine.profiling: selecting requests, per-stage records, artifacts and the admin endpoints"""
+import os
+import pstats
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from vocalize_engine import profiling
+from vocalize_engine.bench import bundled_wavs
+from vocalize_engine.profiling import KINDS, RequestProfile, requested_kinds, run_profiled
+
+
+def busy_work(n):
+    return sum(str(i).count("7") for i in range(n))
+
+
+def allocate(n):
+    return [bytes(1024) for _ in range(n)]
+
+
+@pytest.mark.parametrize("header, kinds", [
+    ("cpu", ("cpu",)),
+    (" Alloc ", ("alloc",)),
+    ("alloc, cpu", KINDS),
+    ("all", KINDS),
+    ("1", KINDS),
+    ("memory", None),
+])
+def test_requested_kinds_from_the_header(header, kinds):
+    assert requested_kinds(header, sample_rate=0) == kinds
+
+
+def test_requested_kinds_by_sampling():
+    assert requested_kinds(None, sample_rate=0) is None
+    assert requested_kinds("", sample_rate=1.0) == KINDS
+    assert requested_kinds(None, sample_rate=1.0) == KINDS
+
+
+def test_run_profiled_cpu():
+    result, record = run_profiled(("cpu",), "busy", busy_work, 20000)
+    assert result == busy_work(20000)
+    assert record["stage"] == "busy" and record["pid"] == os.getpid() and record["wall"] > 0
+    assert any(function == "busy_work" for (_, _, function) in record["cpu"])
+    assert "alloc" not in record
+
+
+def test_run_profiled_alloc():
+    _, record = run_profiled(("alloc",), "allocate", allocate, 2000)
+    assert record["alloc"]["peak_kb"] >= 2000
+    assert any(__file__ in site["where"] for site in record["alloc"]["top"])
+    assert "cpu" not in record
+
+
+def test_one_profiled_stage_per_process():
+    # cProfile and tracemalloc are per process: a concurrent stage only gets its wall time
+    with profiling._busy:
+        result, record = run_profiled(KINDS, "busy", busy_work, 100)
+    assert result == busy_work(100)
+    assert record["skipped"] == "profiler busy in this process"
+    assert "cpu" not in record and "alloc" not in record
+
+
+def test_stage_is_a_no_op_unless_profiled():
+    with profiling.stage("ingest_upload"):
+        pass
+    trace = RequestProfile(KINDS, "/test")
+    token = profiling.current.set(trace)
+    try:
+        with profiling.stage("ingest_upload"):
+            pass
+    finally:
+        profiling.current.reset(token)
+    stage, = trace.stages
+    assert stage["stage"] == "ingest_upload" and stage["skipped"].startswith("timed only")
+
+
+def test_saved_artifact(tmp_path):
+    trace = RequestProfile(KINDS, "/test")
+    for name, fn, arg in (("busy", busy_work, 20000), ("allocate", allocate, 100)):
+        trace.add(run_profiled(trace.kinds, name, fn, arg)[1])
+    summary = trace.save(str(tmp_path), status=200)
+    assert [s["stage"] for s in summary["stages"]] == ["busy", "allocate"]
+    assert summary["status"] == 200 and summary["kinds"] == ["cpu", "alloc"]
+    assert "busy_work" in summary["top_functions"]
+
+    directory = str(tmp_path)
+    assert profiling.load(trace.id, directory) == summary
+    path = profiling.pstats_path(trace.id, directory)
+    assert any(function == "busy_work" for (_, _, function) in pstats.Stats(path).stats)
+    listed, = profiling.list_profiles(directory)
+    assert listed["id"] == trace.id and "top_functions" not in listed
+    assert listed["stages"] == [{"stage": s["stage"], "wall": s["wall"]} for s in summary["stages"]]
+
+
+def test_wall_time_only_has_no_pstats(tmp_path):
+    trace = RequestProfile(("alloc",), "/test")
+    trace.add(run_profiled(trace.kinds, "allocate", allocate, 10)[1])
+    trace.save(str(tmp_path))
+    assert profiling.load(trace.id, str(tmp_path))
+    assert profiling.pstats_path(trace.id, str(tmp_path)) is None
+
+
+@pytest.mark.parametrize("profile_id", ["../etc/passwd", "ABC", "0" * 31, "0" * 32])
+def test_unknown_or_malformed_ids(tmp_path, profile_id):
+    assert profiling.load(profile_id, str(tmp_path)) is None
+    assert profiling.pstats_path(profile_id, str(tmp_path)) is None
+
+
+def test_prune_keeps_the_newest(tmp_path):
+    ids = []
+    for i in range(4):
+        trace = RequestProfile(("cpu",), "/test")
+        trace.add(run_profiled(trace.kinds, "busy", busy_work, 10)[1])
+        trace.save(str(tmp_path))
+        os.utime(tmp_path / f"{trace.id}.json", (1000 + i, 1000 + i))
+        ids.append(trace.id)
+    profiling.prune(str(tmp_path), keep=2)
+    assert sorted(os.listdir(tmp_path)) == sorted(f"{i}.{ext}" for i in ids[2:] for ext in ("json", "prof"))
+    assert profiling.list_profiles(str(tmp_path / "missing")) == []
+
+
+# The backend: X-Profile from an admin
+
+@pytest.fixture
+def admin(monkeypatch):
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+
+    import main
+
+    threads = ThreadPoolExecutor(1)
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(main.workers, "process_pool", lambda: threads)   # run_cpu, profiled, in a thread
+    created = []
+    yield TestClient(main.app), created
+    threads.shutdown()
+    for profile_id in created:
+        for suffix in (".json", ".prof"):
+            path = os.path.join(profiling.PROFILE_DIR, profile_id + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def prescore(client, headers):
+    wav = next(p for p in bundled_wavs() if p.endswith("test_audio.wav"))
+    with open(wav, "rb") as f:
+        return client.post("/prescore", files={"file": ("test_audio.wav", f, "audio/wav")}, headers=headers)
+
+
+def test_admin_profiles_a_request(admin):
+    client, created = admin
+    headers = {"X-Admin-Token": "secret"}
+    response = prescore(client, {**headers, "X-Profile": "cpu"})
+    assert response.status_code == 200
+    profile_id = response.headers["x-profile-id"]
+    created.append(profile_id)
+
+    summary = client.get(f"/admin/profiles/{profile_id}", headers=headers).json()
+    assert summary["endpoint"] == "/prescore" and summary["status"] == 200
+    assert [s["stage"] for s in summary["stages"]] == ["ingest_upload", "analyze_acoustic_fluency"]
+    assert summary["stages"][1]["pid"] == os.getpid() and "skipped" not in summary["stages"][1]
+    assert "analyze_acoustic_fluency" in summary["top_functions"]
+    assert profile_id in [p["id"] for p in client.get("/admin/profiles", headers=headers).json()["profiles"]]
+    pstats_response = client.get(f"/admin/profiles/{profile_id}/pstats", headers=headers)
+    assert pstats_response.status_code == 200 and pstats_response.content
+
+
+def test_profiling_needs_the_admin_token(admin):
+    client, _ = admin
+    response = prescore(client, {"X-Admin-Token": "wrong", "X-Profile": "cpu"})
+    assert response.status_code == 200 and "x-profile-id" not in response.headers
+    assert client.get("/admin/profiles").status_code == 404
+    assert client.get(f"/admin/profiles/{'0' * 32}", headers={"X-Admin-Token": "secret"}).status_code == 404
+    assert client.get(f"/admin/profiles/{'0' * 32}/pstats", headers={"X-Admin-Token": "secret"}).status_code == 404
@@ -0,0 +1,96 @@
+"""vocalize_engine.rates: which rate LINEAR16 audio is sent to STT at, and why"""
+import pytest
+
+from vocalize_engine import rates
+from vocalize_engine.rates import choose_sample_rate, convert_cost, upload_seconds_per_byte
+
+FAST, SLOW = 125e6, 1.25e6      # 1Gbit/s and 10Mbit/s uplinks
+
+
+@pytest.fixture
+def costs(monkeypatch):
+    """Fixed converter costs (seconds of CPU per audio second) instead of a measurement"""
+    table = {"resample": 0.01, "native": 0.004}
+    calls = []
+
+    def fake(rate, target_rate=16000, backend=None):
+        calls.append((rate, target_rate, backend))
+        return table["native"] if target_rate == rate else table["resample"]
+
+    monkeypatch.setattr(rates, "convert_cost", fake)
+    monkeypatch.setattr(rates, "POLICY", "auto")
+    return table, calls
+
+
+@pytest.mark.parametrize("rate", [6000, 7999, 48001, 96000])
+@pytest.mark.parametrize("policy", ["auto", "native", "16000"])
+def test_outside_the_api_range_is_always_resampled(costs, rate, policy):
+    assert choose_sample_rate(rate, policy=policy) == (16000, f"{rate}Hz is outside the API's 8000-48000Hz range")
+
+
+@pytest.mark.parametrize("rate, policy, expected", [
+    (16000, "16000", (16000, "already 16000Hz")),
+    (16000, "native", (16000, "already 16000Hz")),
+    (44100, "16000", (16000, "policy: always 16000Hz")),
+    (44100, "native", (44100, "policy: native")),
+    (8000, "16000", (16000, "policy: always 16000Hz")),
+    (8000, "auto", (8000, "below 16000Hz: resampling would only add bytes")),
+    (11025, "auto", (11025, "below 16000Hz: resampling would only add bytes")),
+])
+def test_decisions_that_need_no_measurement(costs, rate, policy, expected):
+    _, calls = costs
+    assert choose_sample_rate(rate, policy=policy) == expected
+    assert calls == []
+
+
+def test_policy_defaults_to_the_environment(costs, monkeypatch):
+    monkeypatch.setattr(rates, "POLICY", "native")
+    assert choose_sample_rate(44100) == (44100, "policy: native")
+
+
+def test_fast_uplink_sends_native(costs):
+    # 32000 extra samples/s, base64'd over 1Gbit/s: ~0.7ms, cheaper than the 10ms resample
+    extra = 2 * 32000 * upload_seconds_per_byte(FAST)
+    assert choose_sample_rate(48000, uplink=FAST) == (
+        48000, f"native: {1000 * extra:.1f}ms per audio second vs 10.0ms to resample")
+
+
+def test_slow_uplink_resamples(costs):
+    extra = 2 * 32000 * upload_seconds_per_byte(SLOW)
+    assert choose_sample_rate(48000, uplink=SLOW) == (
+        16000, f"resample: 10.0ms per audio second vs {1000 * extra:.1f}ms to send native")
+
+
+@pytest.mark.parametrize("channels, sample_width, is_float", [(2, 2, False), (1, 3, False), (1, 4, True)])
+def test_native_conversion_cost_counts_unless_passthrough(costs, channels, sample_width, is_float):
+    # Mono 16-bit is sent as it is; anything else pays a conversion pass even at its own rate
+    table, calls = costs
+    table["native"] = 0.0095
+    assert choose_sample_rate(48000, uplink=FAST)[0] == 48000
+    assert choose_sample_rate(48000, channels, sample_width, is_float, uplink=FAST)[0] == 16000
+    assert (48000, 48000, None) in calls
+
+
+def test_a_tie_sends_native(costs):
+    table, _ = costs
+    table["resample"] = 2 * 32000 * upload_seconds_per_byte(FAST)
+    assert choose_sample_rate(48000, uplink=FAST)[0] == 48000
+
+
+def test_backend_is_passed_to_the_measurement(costs):
+    _, calls = costs
+    choose_sample_rate(44100, 2, backend="stdlib", uplink=FAST)
+    assert calls == [(44100, 44100, "stdlib"), (44100, 16000, "stdlib")]
+
+
+def test_upload_seconds_per_byte():
+    assert upload_seconds_per_byte(1e6) == pytest.approx(4 / 3 / 1e6)
+    assert upload_seconds_per_byte() == upload_seconds_per_byte(rates.UPLINK_BYTES_PER_SECOND)
+
+
+def test_convert_cost_is_measured_once():
+    convert_cost.cache_clear()
+    cost = convert_cost(22050, 16000, "stdlib")
+    assert cost > 0
+    assert convert_cost(22050, 16000, "stdlib") == cost
+    assert convert_cost.cache_info().hits == 1
@@ -0,0 +1,103 @@
+"""vocalize_engine.sharedpcm: lending segments, the WAV images in them, and resource tracking"""
+import os
+from array import array
+from multiprocessing import resource_tracker, shared_memory
+
+import pytest
+
+from vocalize_engine import sharedpcm
+from vocalize_engine.sharedpcm import (HEADER_BYTES, SHM_DIR, SegmentPool, SharedWav, attach, content, release,
+                                       share_pcm)
+from vocalize_engine.wavfile import open_wav
+
+PCM = array("h", range(-500, 500)).tobytes()
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """A fresh segment pool in place of this process's, unlinked afterwards"""
+    pool = SegmentPool(keep_bytes=1 << 20)
+    monkeypatch.setattr(sharedpcm, "segments", pool)
+    yield pool
+    for name in list(pool.lent):
+        pool.give_back(name)
+    pool.clear()
+
+
+@pytest.fixture
+def registrations(monkeypatch):
+    """Names registered with the resource tracker while the test runs"""
+    names = []
+    register = resource_tracker.register
+    monkeypatch.setattr(resource_tracker, "register",
+                        lambda name, rtype: (names.append(name.lstrip("/")), register(name, rtype)))
+    return names
+
+
+def exists(name):
+    try:
+        shared_memory.SharedMemory(name).close()
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def test_share_pcm_round_trip(pool):
+    handle = share_pcm(PCM, 16000)
+    try:
+        assert handle.size == HEADER_BYTES + len(PCM)
+        with content(handle) as data:
+            assert bytes(data[HEADER_BYTES:]) == PCM
+        with open_wav(handle) as wav_in:
+            assert (wav_in.rate, wav_in.channels, wav_in.n_frames) == (16000, 1, len(PCM) // 2)
+    finally:
+        release(handle)
+    assert not exists(handle.name)
+    release(handle)                                     # already gone: no-op
+
+
+def test_lent_segments_are_reused(pool):
+    with sharedpcm.lend(2, 1000) as (first, second):
+        assert first != second
+    with sharedpcm.lend(1, 500) as (again,):
+        assert again in (first, second)
+    assert pool.snapshot() == {"idle": 2, "idle_bytes": 2000, "lent": 0, "created": 2, "reused": 1}
+
+
+def test_idle_pool_is_bounded(pool):
+    with sharedpcm.lend(1, 1000) as (dropped,), sharedpcm.lend(1, 1 << 20) as (kept,):
+        pass                                            # kept goes back first and fills the pool
+    assert [segment.name for segment in pool.free] == [kept]
+    assert not exists(dropped)
+
+
+def test_reads_use_the_pool_mapping(pool, registrations):
+    with sharedpcm.lend(1, HEADER_BYTES + len(PCM)) as (name,):
+        handle = share_pcm(PCM, 16000, into=name)
+        with attach(handle) as view:
+            assert view.obj is pool.lent[name].buf.obj and bytes(view[HEADER_BYTES:]) == PCM
+    assert registrations == [name]                     # once, by lend()'s create
+
+
+@pytest.mark.skipif(SHM_DIR is None, reason="segments only grow through /dev/shm")
+def test_a_grown_segment_is_not_attached_again(pool, registrations):
+    # The writer needed more than was lent: pwrite extends the segment past the pool's mapping
+    with sharedpcm.lend(1, 100) as (name,):
+        handle = share_pcm(PCM, 16000, into=name)
+        assert handle.size > pool.lent[name].size
+        for _ in range(2):
+            with attach(handle) as view:
+                assert bytes(view[HEADER_BYTES:]) == PCM
+        assert registrations == [name]                 # no second SharedMemory for the same name
+    assert not exists(name) and pool.free == []        # the pool's mapping no longer covers it
+
+
+def test_forked_pool_leaves_the_parent_segments_alone(pool, monkeypatch):
+    with sharedpcm.lend(1, 1000) as (name,):
+        pid = os.getpid()
+        monkeypatch.setattr(os, "getpid", lambda: pid + 1)
+        assert pool.mapped(name, 10) is None           # not this process's segment
+        assert pool.give_back(name) is False
+        monkeypatch.setattr(os, "getpid", lambda: pid)
+    assert exists(name)
+    shared_memory.SharedMemory(name).unlink()
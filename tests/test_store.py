@@ -0,0 +1,181 @@
+"""vocalize_engine.store and the backend's use of it (history, rescoring, repeat uploads)"""
+import hashlib
+
+import pytest
+
+from vocalize_engine.bench import bundled_wavs
+from vocalize_engine.fluency import analyze_fluency
+from vocalize_engine.store import AnalysisStore, file_hash, pack_words, unpack_words
+
+
+def result_for(*spec):
+    words = [{"word": w, "startTime": start, "endTime": end} for w, start, end in spec]
+    return {"transcript": " ".join(w for w, _, _ in spec), "words": words, "fluency_metrics": analyze_fluency(words)}
+
+
+RESULT = result_for(("so", 0.1, 0.4), ("the", 0.5, 0.7), ("market", 2.6, 3.1), ("grows", 3.2, 3.6))
+
+
+@pytest.fixture
+def store():
+    store = AnalysisStore(":memory:")
+    yield store
+    store.close()
+
+
+def test_pack_words_round_trip():
+    words = RESULT["words"] + [{"word": "two\nlines", "startTime": "3.7", "endTime": 1234.5675}]
+    text, times = pack_words(words)
+    assert len(times) == 8 * len(words)
+    unpacked = unpack_words(text, times)
+    assert unpacked[:4] == RESULT["words"]
+    assert unpacked[4] == {"word": "two lines", "startTime": 3.7, "endTime": 1234.568}   # ms resolution
+    assert unpack_words(*pack_words([])) == []
+
+
+def test_save_and_get(store):
+    analysis_id = store.save(RESULT, "abc", user_id="u1", session_id="s1", language="en-US", profile="esl",
+                             created_at=1000.0)
+    assert store.get(analysis_id) == {
+        "id": analysis_id, "user_id": "u1", "session_id": "s1", "content_hash": "abc", "created_at": 1000.0,
+        "language": "en-US", "profile": "esl", "transcript": RESULT["transcript"], "word_count": 4,
+        "words": RESULT["words"], "fluency_metrics": RESULT["fluency_metrics"]}
+    assert store.get(analysis_id + 1) is None
+
+
+def test_find_returns_the_latest_for_the_language(store):
+    older = store.save(RESULT, "abc", language="auto", created_at=1.0)
+    newer = store.save(RESULT, "abc", language="auto", created_at=2.0)
+    other = store.save(RESULT, "abc", created_at=3.0)
+    assert store.find("abc", "auto")["id"] == newer != older
+    assert store.find("abc")["id"] == other           # no language matches NULL only
+    assert store.find("abd", "auto") is None
+
+
+def test_history(store):
+    for i in range(5):
+        store.save(RESULT, f"h{i}", user_id="u1" if i % 2 == 0 else "u2", created_at=100.0 + i)
+    rows = store.history("u1")
+    assert [row["created_at"] for row in rows] == [104.0, 102.0, 100.0]
+    assert rows[0]["metrics"] == RESULT["fluency_metrics"] and "words" not in rows[0]
+    assert [row["created_at"] for row in store.history("u1", since=101, until=104)] == [102.0]
+    assert len(store.history("u1", limit=2)) == 2
+    assert store.history("nobody") == []
+
+
+def test_rescore(store):
+    ids = [store.save(RESULT, f"r{i}", user_id="u1", created_at=float(i)) for i in range(5)]
+    store.save(RESULT, "other", user_id="u2", created_at=10.0)
+    esl = analyze_fluency(RESULT["words"], profile="esl")
+    assert esl != RESULT["fluency_metrics"]
+
+    dry = store.rescore("esl", user_id="u1", batch_size=2)
+    assert (dry["profile"], dry["rescored"], dry["changed"]) == ("esl", 5, 5)
+    assert store.get(ids[0])["fluency_metrics"] == RESULT["fluency_metrics"]
+
+    assert store.rescore("standard")["changed"] == 0
+    written = store.rescore("esl", since=3.0, write=True)
+    assert written["rescored"] == 3                              # two of u1's and u2's
+    assert [store.get(i)["profile"] for i in ids] == ["standard"] * 3 + ["esl"] * 2
+    assert store.get(ids[4])["fluency_metrics"] == esl
+    assert store.rescore("esl")["changed"] == 3
+
+
+def test_fingerprints(store):
+    first = store.save(RESULT, "a", language="auto")
+    second = store.save(RESULT, "b")
+    store.save_fingerprint(first, b"\1\0\0\0")
+    store.save_fingerprint(second, b"\2\0\0\0")
+    store.save_fingerprint(second, b"\3\0\0\0")     # replaced, not duplicated
+    assert store.fingerprints() == [(first, "auto", b"\1\0\0\0"), (second, None, b"\3\0\0\0")]
+    assert store.fingerprints(after_id=first) == [(second, None, b"\3\0\0\0")]
+    assert store.fingerprints(limit=1) == [(first, "auto", b"\1\0\0\0")]
+
+
+def test_survives_reopening(tmp_path):
+    path = str(tmp_path / "analyses.db")
+    store = AnalysisStore(path)
+    analysis_id = store.save(RESULT, "abc")
+    store.close()
+    store = AnalysisStore(path)
+    assert store.get(analysis_id)["words"] == RESULT["words"]
+    store.close()
+
+
+def test_file_hash(tmp_path):
+    path = tmp_path / "audio"
+    path.write_bytes(b"x" * 3000)
+    assert file_hash(str(path), chunk_size=1024) == hashlib.sha256(b"x" * 3000).hexdigest()
+
+
+# The backend with ANALYSIS_DB set
+
+@pytest.fixture
+def api(monkeypatch, store):
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+
+    import main
+    from vocalize_engine import fingerprint, percentiles
+
+    async def run_inline(fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    calls = []
+
+    def stt(path, *args, **kwargs):
+        calls.append(path)
+        return {**RESULT, "word_count": 4}
+
+    monkeypatch.setattr(main, "run_cpu", run_inline)   # no process pool needed here
+    monkeypatch.setattr(main, "store", store)
+    monkeypatch.setattr(main, "fingerprints", fingerprint.FingerprintIndex())
+    monkeypatch.setattr(main, "population", percentiles.Population())
+    monkeypatch.setattr(main, "analyze_audio_with_api_key", stt)
+    return TestClient(main.app), calls
+
+
+def upload(client, query=""):
+    wav = next(p for p in bundled_wavs() if p.endswith("test_audio.wav"))
+    with open(wav, "rb") as f:
+        return client.post(f"/analyze{query}", files={"file": ("test_audio.wav", f, "audio/wav")})
+
+
+def test_repeat_upload_is_rescored_from_the_store(api):
+    client, calls = api
+    first = upload(client, "?user=u1&session=s1").json()
+    assert first["cached"] is False and len(calls) == 1
+    second = upload(client, "?user=u1&profile=esl").json()
+    assert len(calls) == 1
+    assert second["cached"] is True
+    assert second["fluency_metrics"] == analyze_fluency(RESULT["words"], profile="esl")
+    assert second["analysis_id"] != first["analysis_id"]
+
+    history = client.get("/history", params={"user": "u1"}).json()["analyses"]
+    assert [row["id"] for row in history] == [second["analysis_id"], first["analysis_id"]]
+    assert client.get(f"/history/{first['analysis_id']}").json()["words"] == RESULT["words"]
+    assert client.get("/history/999").status_code == 404
+
+
+def test_rescore_and_window_by_analysis_id(api):
+    client, _ = api
+    analysis_id = upload(client).json()["analysis_id"]
+    rescored = client.post("/rescore", json={"analysis_id": analysis_id, "profile": "esl"}).json()
+    assert rescored["fluency_metrics"] == analyze_fluency(RESULT["words"], profile="esl")
+    assert client.post("/rescore", json={"analysis_id": 999}).status_code == 404
+    window = client.get(f"/history/{analysis_id}/window", params={"start": 0, "end": 1}).json()
+    assert window["word_count"] == 2
+    bulk = client.post("/history/rescore", params={"profile": "esl", "write": "true"}).json()
+    assert bulk["rescored"] == 1 and bulk["changed"] == 1
+
+
+def test_store_disabled(monkeypatch):
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+
+    import main
+
+    monkeypatch.setattr(main, "store", None)
+    client = TestClient(main.app)
+    assert client.get("/history", params={"user": "u1"}).status_code == 404
+    assert client.post("/rescore", json={"analysis_id": 1}).status_code == 404
@@ -0,0 +1,231 @@
+"""vocalize_engine.streaming against a fake in-process streaming client, and ingest.inspect_upload"""
+import math
+import time
+from datetime import timedelta
+
+import pytest
+
+from vocalize_engine import streaming
+from vocalize_engine.breaker import CircuitBreaker
+from vocalize_engine.conformance import synthetic_fixtures, write_wav
+from vocalize_engine.convert import convert_pcm
+from vocalize_engine.credentials import Credential, CredentialPool
+from vocalize_engine.ingest import IngestError, inspect_upload
+from vocalize_engine.rates import choose_sample_rate
+from vocalize_engine.streaming import pcm_chunks, recognize_streaming
+from vocalize_engine.wavfile import open_wav
+
+speech = pytest.importorskip("google.cloud.speech")
+exceptions = pytest.importorskip("google.api_core.exceptions")
+
+WORD_SECONDS = 0.5
+
+
+class Client:
+    """
+    streaming_recognize that reads the request stream lazily, like gRPC, and
+    answers a final result for every result_every seconds of audio received
+    (none if silent); errors[i] is raised instead on the i-th call
+    """
+
+    def __init__(self, result_every=1.0, errors=(), silent=False):
+        self.result_every = result_every
+        self.silent = silent
+        self.errors = list(errors)
+        self.calls = []
+
+    def streaming_recognize(self, config, requests, timeout=None):
+        self.calls.append({"config": config, "timeout": timeout, "chunks": []})
+        if self.errors:
+            error = self.errors.pop(0)
+            if error is not None:
+                raise error
+        return self._responses(config.config.sample_rate_hertz, requests, self.calls[-1]["chunks"])
+
+    def _responses(self, rate, requests, chunks):
+        received = emitted = 0.0
+        for request in requests:
+            chunks.append(request.audio_content)
+            received += len(request.audio_content) / 2 / rate
+            if self.silent:
+                continue
+            if received - emitted >= self.result_every:
+                yield self._final(emitted, received)
+                emitted = received
+        if received > emitted and not self.silent:
+            yield self._final(emitted, received)
+
+    @staticmethod
+    def _final(start, end):
+        words = [speech.WordInfo(word=f"w{n}", start_time=timedelta(seconds=n * WORD_SECONDS),
+                                 end_time=timedelta(seconds=(n + 1) * WORD_SECONDS))
+                 for n in range(round(start / WORD_SECONDS), round(end / WORD_SECONDS))]
+        return speech.StreamingRecognizeResponse(results=[
+            speech.StreamingRecognitionResult(alternatives=[speech.SpeechRecognitionAlternative(
+                transcript=" ".join(w.word for w in words), words=words)], is_final=False),
+            speech.StreamingRecognitionResult(alternatives=[speech.SpeechRecognitionAlternative(
+                transcript=" ".join(w.word for w in words), words=words)], is_final=True),
+        ])
+
+
+@pytest.fixture(scope="module")
+def fixtures(tmp_path_factory):
+    return synthetic_fixtures(str(tmp_path_factory.mktemp("fixtures")), seconds=0.5)
+
+
+@pytest.fixture(scope="module")
+def speech_wav(tmp_path_factory):
+    """4s of 44.1kHz stereo, the shape of a typical browser upload"""
+    rate = 44100
+    return write_wav(str(tmp_path_factory.mktemp("upload") / "speech_44k_stereo.wav"),
+                     [(int(8000 * math.sin(i / 9)), int(6000 * math.sin(i / 7))) for i in range(4 * rate)],
+                     rate, 2)
+
+
+@pytest.fixture
+def breaker():
+    return CircuitBreaker("test")
+
+
+@pytest.mark.parametrize("target_rate", [16000, 8000])
+def test_pcm_chunks_match_the_batch_converter(fixtures, target_rate):
+    for path in fixtures:
+        with open_wav(path) as wav_in:
+            chunks = list(pcm_chunks(wav_in, target_rate))
+        with open_wav(path) as wav_in:
+            expected = convert_pcm(wav_in, "stdlib", target_rate)
+        assert b"".join(chunks) == expected, path
+        assert {len(chunk) for chunk in chunks[:-1]} == {2 * target_rate // 10}, path
+        assert 0 < len(chunks[-1]) <= 2 * target_rate // 10
+
+
+def test_streams_the_converted_audio(speech_wav, breaker):
+    client = Client()
+    result = recognize_streaming(speech_wav, client, target_rate=16000, breaker=breaker)
+    call, = client.calls
+    assert call["config"].config.sample_rate_hertz == 16000
+    assert call["config"].config.encoding == speech.RecognitionConfig.AudioEncoding.LINEAR16
+    with open_wav(speech_wav) as wav_in:
+        assert b"".join(call["chunks"]) == convert_pcm(wav_in, "stdlib", 16000)
+    assert result["word_count"] == 8
+    assert result["transcript"] == "w0 w1 w2 w3 w4 w5 w6 w7"   # interim results skipped
+    assert result["plan"] == {"plan": "stream", "duration": 4.0, "sample_rate_hertz": 16000,
+                              "reason": "converted and streamed in 100ms slices (streaming_recognize)"}
+    assert breaker.successes == 1
+
+
+def test_results_arrive_before_conversion_finishes(speech_wav, breaker):
+    timing = recognize_streaming(speech_wav, Client(), breaker=breaker)["timing"]
+    assert set(timing) == {"first_result", "converted", "total"}
+    assert timing["first_result"] < timing["converted"] <= timing["total"]
+
+
+def test_default_rate_is_chosen_for_the_input(speech_wav, breaker):
+    with open_wav(speech_wav) as w:
+        rate, _ = choose_sample_rate(w.rate, w.channels, w.sample_width, w.is_float, backend="stdlib")
+    result = recognize_streaming(speech_wav, Client(), breaker=breaker)
+    assert result["plan"]["sample_rate_hertz"] == rate
+
+
+def test_deadline_becomes_the_call_timeout(speech_wav, breaker):
+    client = Client()
+    recognize_streaming(speech_wav, client, deadline=time.monotonic() + 30, breaker=breaker)
+    assert 29 < client.calls[0]["timeout"] <= 30
+
+
+def test_too_long_to_stream(monkeypatch, speech_wav, breaker):
+    monkeypatch.setattr(streaming, "STREAM_MAX_SECONDS", 3.0)
+    client = Client()
+    result = recognize_streaming(speech_wav, client, breaker=breaker)
+    assert result["error"] == "Recording longer than 3s cannot be streamed"
+    assert client.calls == []
+
+
+def test_unreadable_file(tmp_path, breaker):
+    path = tmp_path / "not.wav"
+    path.write_bytes(b"OggS" + b"\0" * 40)
+    assert recognize_streaming(str(path), Client(), breaker=breaker)["error"].startswith(
+        "Speech recognition failed")
+
+
+def test_silence_has_no_results(tmp_path, breaker):
+    path = write_wav(str(tmp_path / "short.wav"), [(0,)] * 16, 16000, 2)
+    client = Client(silent=True)
+    assert recognize_streaming(path, client, breaker=breaker) == {"error": "No transcription results returned"}
+
+
+def test_open_breaker_fails_fast(speech_wav):
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    breaker.failure("HTTP 503")
+    client = Client()
+    result = recognize_streaming(speech_wav, client, breaker=breaker)
+    assert result["stt_unavailable"]
+    assert client.calls == []
+
+
+def test_service_errors_go_to_the_breaker(speech_wav, breaker):
+    result = recognize_streaming(speech_wav, Client(errors=[exceptions.ServiceUnavailable("down")]),
+                                 breaker=breaker)
+    assert result["stt_unavailable"] and result["error"].startswith("Streaming recognition failed")
+    assert breaker.consecutive_failures == 1
+
+    result = recognize_streaming(speech_wav, Client(errors=[exceptions.InvalidArgument("bad audio")]),
+                                 breaker=breaker)
+    assert "stt_unavailable" not in result
+    assert breaker.consecutive_failures == 0
+
+
+def test_deadline_exceeded(speech_wav, breaker):
+    result = recognize_streaming(speech_wav, Client(errors=[exceptions.DeadlineExceeded("late")]),
+                                 breaker=breaker)
+    assert result["deadline_exceeded"]
+
+
+def test_analyze_audio_streaming_scores_the_words(speech_wav):
+    from vocalize_engine.stt import analyze_audio_streaming
+
+    result = analyze_audio_streaming(speech_wav, None, client=Client(), breaker=CircuitBreaker("test"))
+    assert result["word_count"] == 8
+    assert "fluency_metrics" in result and "timing" in result
+
+
+def test_analyze_audio_streaming_moves_off_a_throttled_credential(speech_wav):
+    from vocalize_engine.stt import analyze_audio_streaming
+
+    pool = CredentialPool([Credential("proj-a", {"type": "service_account"}),
+                           Credential("proj-b", {"type": "service_account"})])
+    client = Client(errors=[exceptions.TooManyRequests("quota"), None])
+    result = analyze_audio_streaming(speech_wav, pool, client=client)
+    assert result["word_count"] == 8
+    assert len(client.calls) == 2
+    usage = pool.snapshot()["credentials"]
+    assert usage["proj-a"]["state"] == "shed"
+    assert usage["proj-b"]["successes"] == 1
+
+
+def test_inspect_upload_wav(speech_wav):
+    assert inspect_upload(speech_wav, max_seconds=10) == {
+        "container": "wav", "bytes": 44 + 4 * 44100 * 4, "sample_rate": 44100, "channels": 2,
+        "sample_width": 2, "frames": 4 * 44100, "duration": 4.0}
+
+
+def test_inspect_upload_other_containers(tmp_path):
+    path = tmp_path / "clip.ogg"
+    path.write_bytes(b"OggS" + b"\0" * 60)
+    assert inspect_upload(str(path), max_seconds=1) == {"container": "ogg", "bytes": 64}
+
+
+@pytest.mark.parametrize("head", [b"garbage" * 4, b"RIFF\0\0\0\0WAVEjunk" + b"\0" * 8])
+def test_inspect_upload_rejects_unreadable_audio(tmp_path, head):
+    path = tmp_path / "upload"
+    path.write_bytes(head)
+    with pytest.raises(IngestError) as raised:
+        inspect_upload(str(path))
+    assert raised.value.status_code == 415
+
+
+def test_inspect_upload_rejects_long_recordings(speech_wav):
+    with pytest.raises(IngestError) as raised:
+        inspect_upload(speech_wav, max_seconds=3)
+    assert raised.value.status_code == 413
+    assert str(raised.value) == "Recording longer than 3s"
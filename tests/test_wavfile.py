@@ -0,0 +1,125 @@
+"""vocalize_engine.wavfile: the memory-mapped reader against the stdlib wave module"""
+import struct
+import wave
+
+import pytest
+
+from vocalize_engine.conformance import write_wav
+from vocalize_engine.wavfile import WAVE_FORMAT_IEEE_FLOAT, open_wav
+
+FRAMES = [(i * 97 % 2000 - 1000, -(i * 31 % 1500)) for i in range(50)]
+
+LAYOUTS = {
+    "pcm8": dict(sample_width=1, frames=[(v // 16, w // 16) for v, w in FRAMES]),
+    "pcm16": dict(sample_width=2, frames=FRAMES),
+    "pcm24": dict(sample_width=3, frames=[(v << 8, w << 8) for v, w in FRAMES]),
+    "pcm32": dict(sample_width=4, frames=[(v << 16, w << 16) for v, w in FRAMES]),
+    "pcm24_extensible": dict(sample_width=3, frames=[(v << 8, w << 8) for v, w in FRAMES], extensible=True),
+    "float32": dict(sample_width=4, frames=[(v / 1024, w / 1024) for v, w in FRAMES],
+                    format_tag=WAVE_FORMAT_IEEE_FLOAT),
+    "float64_extensible": dict(sample_width=8, frames=[(v / 1024, w / 1024) for v, w in FRAMES],
+                               format_tag=WAVE_FORMAT_IEEE_FLOAT, extensible=True),
+}
+
+
+def layout_wav(tmp_path, name):
+    spec = dict(LAYOUTS[name])
+    return write_wav(str(tmp_path / f"{name}.wav"), spec.pop("frames"), 8000, spec.pop("sample_width"), **spec)
+
+
+def riff(*chunks):
+    body = b"WAVE" + b"".join(chunk_id + struct.pack("<I", len(data)) + data + b"\0" * (len(data) & 1)
+                              for chunk_id, data in chunks)
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+def fmt_pcm16(channels=1, rate=16000):
+    return b"fmt ", struct.pack("<HHIIHH", 1, channels, rate, rate * 2 * channels, 2 * channels, 16)
+
+
+@pytest.mark.parametrize("name", LAYOUTS)
+def test_reads_every_layout(tmp_path, name):
+    spec = LAYOUTS[name]
+    expected = [v + 128 if spec["sample_width"] == 1 else v for frame in spec["frames"] for v in frame]
+    with open_wav(layout_wav(tmp_path, name)) as w:
+        assert (w.channels, w.rate, w.sample_width, w.n_frames) == (2, 8000, spec["sample_width"], 50)
+        assert w.is_float == (spec.get("format_tag") == WAVE_FORMAT_IEEE_FLOAT)
+        assert list(w.samples()) == pytest.approx(expected)
+        assert list(w.samples(10, 12)) == pytest.approx(expected[20:24])
+        assert w.duration == 50 / 8000
+
+
+def test_matches_the_wave_module(tmp_path):
+    path = layout_wav(tmp_path, "pcm16")
+    with wave.open(path, "rb") as reference, open_wav(path) as w:
+        assert bytes(w.frames()) == reference.readframes(reference.getnframes())
+        reference.setpos(7)
+        assert bytes(w.frames(7, 20)) == reference.readframes(13)
+
+
+def test_frames_are_zero_copy_views(tmp_path):
+    with open_wav(layout_wav(tmp_path, "pcm16")) as w:
+        view = w.frames(5, 10)
+        assert isinstance(view, memoryview) and view.readonly
+        assert len(view) == 5 * w.frame_size
+        assert len(w.frames(10, 5)) == 0
+        assert len(w.frames(-3)) == 3 * w.frame_size
+        del view
+
+
+@pytest.mark.parametrize("name", ["pcm8", "pcm16", "pcm24", "float32"])
+def test_as_array(tmp_path, name):
+    np = pytest.importorskip("numpy")
+    with open_wav(layout_wav(tmp_path, name)) as w:
+        data = w.as_array(3, 8)
+        assert data.shape == (5, 2)
+        assert data.ravel().tolist() == pytest.approx(list(w.samples(3, 8)))
+        if name != "pcm24":
+            assert not data.flags.writeable and np.shares_memory(data, np.frombuffer(w._mm, dtype=np.uint8))
+        del data
+
+
+def test_skips_other_chunks(tmp_path):
+    path = tmp_path / "chunks.wav"
+    path.write_bytes(riff((b"LIST", b"odd"), fmt_pcm16(), (b"fact", b"\1\0\0\0"), (b"data", b"\1\0\2\0\3\0")))
+    with open_wav(str(path)) as w:
+        assert list(w.samples()) == [1, 2, 3]
+
+
+@pytest.mark.parametrize("declared", [0, 0xFFFFFFFF])
+def test_streaming_writer_sizes_use_the_file_length(tmp_path, declared):
+    data = riff(fmt_pcm16(), (b"data", b"\1\0\2\0\3\0"))
+    path = tmp_path / "streamed.wav"
+    path.write_bytes(data[:-10] + struct.pack("<I", declared) + data[-6:])
+    with open_wav(str(path)) as w:
+        assert w.n_frames == 3
+
+
+def test_partial_last_frame_is_dropped(tmp_path):
+    path = tmp_path / "partial.wav"
+    path.write_bytes(riff(fmt_pcm16(channels=2), (b"data", b"\1\0\2\0\3\0")))
+    with open_wav(str(path)) as w:
+        assert w.n_frames == 1 and w.data_size == 4
+
+
+@pytest.mark.parametrize("content, message", [
+    (b"", "Empty file"),
+    (b"OggS" + b"\0" * 40, "RIFF"),
+    (riff((b"data", b"\0\0"), fmt_pcm16()), "data chunk before fmt"),
+    (riff(fmt_pcm16()), "No data chunk"),
+    (riff((b"fmt ", struct.pack("<HHIIHH", 2, 1, 8000, 4000, 1, 4)), (b"data", b"\0")), "format tag"),
+    (riff((b"fmt ", b"\1\0\1\0"), (b"data", b"\0")), "too short"),
+])
+def test_rejects_unreadable_files(tmp_path, content, message):
+    path = tmp_path / "bad.wav"
+    path.write_bytes(content)
+    with pytest.raises(ValueError, match=message):
+        open_wav(str(path))
+
+
+def test_close_with_live_views(tmp_path):
+    w = open_wav(layout_wav(tmp_path, "pcm16"))
+    view = w.frames()
+    w.close()               # the mapping stays valid for the view
+    assert len(bytes(view)) == 200
+    w.close()
@@ -0,0 +1,97 @@
+"""vocalize_engine.workers: per-process resources across forks, pool sizing and draining"""
+import os
+import threading
+import time
+
+import pytest
+
+from vocalize_engine import workers
+
+
+@pytest.fixture
+def fresh(monkeypatch):
+    """Pretend to be a newly forked process, and release whatever it created afterwards"""
+    monkeypatch.setattr(workers, "_state", {"pid": None, "session": None, "clients": {}, "pool": None,
+                                            "threads": None})
+    yield
+    workers.drain(timeout=5)
+
+
+@pytest.mark.parametrize("env, cores, expected", [
+    ({"CONVERT_PROCESSES": "3"}, 8, 3),
+    ({"CONVERT_PROCESSES": "0"}, 8, 1),
+    ({"WEB_CONCURRENCY": "4"}, 8, 2),
+    ({"WEB_CONCURRENCY": "4"}, 2, 1),
+    ({}, 6, 6),
+])
+def test_process_pool_size(monkeypatch, env, cores, expected):
+    monkeypatch.delenv("CONVERT_PROCESSES", raising=False)
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(os, "cpu_count", lambda: cores)
+    assert workers.process_pool_size() == expected
+
+
+def test_resources_are_created_once_per_process(fresh):
+    session = workers.http_session()
+    threads = workers.thread_pool()
+    assert workers.http_session() is session
+    assert workers.thread_pool() is threads
+    assert threads._max_workers == 2 * workers.HTTP_POOL_SIZE
+
+
+def test_a_forked_worker_gets_its_own(fresh, monkeypatch):
+    parent_session = workers.http_session()
+    parent_threads = workers.thread_pool()
+    pid = os.getpid()
+    monkeypatch.setattr(os, "getpid", lambda: pid + 1)       # as seen from the child after fork
+    child_session = workers.http_session()
+    assert child_session is not parent_session
+    assert workers.thread_pool() is not parent_threads
+    assert workers.http_session() is child_session
+    # The parent's objects are left alone, not closed: they belong to the parent
+    assert parent_session.adapters and not parent_threads._shutdown
+    parent_threads.shutdown()
+
+
+def test_session_is_shared_between_threads(fresh):
+    sessions = []
+    threads = [threading.Thread(target=lambda: sessions.append(workers.http_session())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(s) for s in sessions}) == 1
+
+
+def test_drain_waits_for_in_flight_analyses(fresh):
+    released = threading.Event()
+
+    def analysis():
+        with workers.in_flight():
+            released.wait(5)
+
+    thread = threading.Thread(target=analysis)
+    thread.start()
+    while workers.active_count() == 0:
+        time.sleep(0.001)
+    workers.http_session()
+
+    started = time.monotonic()
+    assert workers.drain(timeout=0.05) is False       # still running: gives up after the timeout
+    assert 0.05 <= time.monotonic() - started < 1
+    threading.Timer(0.05, released.set).start()
+    assert workers.drain(timeout=5) is True
+    thread.join()
+    assert workers.active_count() == 0
+    assert workers._state["session"] is None and workers._state["pool"] is None
+
+
+def test_process_pool_runs_in_other_processes(fresh, monkeypatch):
+    monkeypatch.setenv("CONVERT_PROCESSES", "1")
+    pool = workers.warm()
+    assert workers.process_pool() is pool
+    assert pool.submit(workers._ping, None).result(timeout=60) != os.getpid()
+    assert workers.drain(timeout=5)
+    assert workers._state["pool"] is None
@@ -0,0 +1,36 @@
+"""Vocalize evaluation engine
+Audio conversion, Google STT and fluency analysis shared by every deploy
+(Koyeb backend, Vercel function, local scripts).
+
+Public names are resolved lazily so `python -m vocalize_engine.<module>`
+and light imports (e.g. fluency only) don't pull in the whole engine.
+"""
+import importlib
+
+_EXPORTS = {
+    "analyze_acoustic_fluency": "vocalize_engine.acoustic",
+    "analyze_audio_with_api_key": "vocalize_engine.stt",
+    "analyze_audio_streaming": "vocalize_engine.stt",
+    "analyze_audio_with_sdk": "vocalize_engine.stt",
+    "analyze_channels_with_api_key": "vocalize_engine.channels",
+    "analyze_fluency": "vocalize_engine.fluency",
+    "convert_to_google_format": "vocalize_engine.convert",
+    "fluency_score": "vocalize_engine.fluency",
+    "get_profile": "vocalize_engine.profiles",
+    "open_wav": "vocalize_engine.wavfile",
+    "recognize_speech_with_api_key": "vocalize_engine.stt",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module 'vocalize_engine' has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return __all__
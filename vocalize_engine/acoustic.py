@@ -0,0 +1,206 @@
+"""Acoustic-only fluency pre-score (no STT call)
+Works on the 16000Hz mono WAV produced by convert_to_google_format
+"""
+import math
+import operator
+import sys
+import wave
+from array import array
+
+from vocalize_engine.fluency import fluency_score
+from vocalize_engine.profiles import get_profile
+from vocalize_engine.wavfile import open_wav
+
+FRAME_SECONDS = 0.01          # 10ms analysis frames
+SMOOTH_FRAMES = 5             # moving-average window for the dB envelope
+SILENCE_DB_BELOW_PEAK = 25.0  # frames quieter than peak - 25dB are silence
+MIN_DIP_DB = 2.0              # dip required between two syllable nuclei
+MIN_NUCLEUS_GAP = 0.1         # nuclei closer than 100ms are merged
+MIN_SPEECH_RUN = 0.05         # shorter bursts are clicks, not speech
+MAX_BRIDGED_GAP = 0.1         # shorter silences are stop closures, not pauses
+SYLLABLES_PER_WORD = 1.5      # average for conversational English
+
+
+def read_pcm16(audio_file_path):
+    """Read a 16-bit mono WAV (path or sharedpcm.SharedWav) into an array('h') plus its sample rate"""
+    with open_wav(audio_file_path) as wav_in:
+        if wav_in.sample_width != 2 or wav_in.channels != 1 or wav_in.is_float:
+            raise ValueError("Expected 16-bit mono WAV (run convert_to_google_format first)")
+        rate = wav_in.rate
+        samples = array('h')
+        samples.frombytes(wav_in.frames())
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    return samples, rate
+
+
+def energy_envelope(samples, rate):
+    """Smoothed per-frame energy in dB"""
+    frame_len = max(1, int(rate * FRAME_SECONDS))
+    mul = operator.mul
+    db = []
+    for start in range(0, len(samples) - frame_len + 1, frame_len):
+        frame = samples[start:start + frame_len]
+        power = sum(map(mul, frame, frame)) / frame_len
+        db.append(10 * math.log10(power + 1.0))
+
+    # Centered moving average via prefix sums (window shrinks at the edges)
+    prefix = [0.0]
+    for level in db:
+        prefix.append(prefix[-1] + level)
+    half = SMOOTH_FRAMES // 2
+    n = len(db)
+    return [
+        (prefix[min(n, i + half + 1)] - prefix[max(0, i - half)]) / (min(n, i + half + 1) - max(0, i - half))
+        for i in range(n)
+    ]
+
+
+def speech_threshold(db):
+    """dB level above which a frame counts as speech (relative to peak and noise floor)"""
+    ranked = sorted(db)
+    floor = ranked[int(0.10 * (len(ranked) - 1))]
+    peak = ranked[int(0.99 * (len(ranked) - 1))]
+    return max(peak - SILENCE_DB_BELOW_PEAK, floor + 3.0)
+
+
+def speech_runs(db, threshold):
+    """(start, end) frame index pairs of speech, with tiny gaps bridged"""
+    runs = []
+    start = None
+    for i, level in enumerate(db):
+        if level > threshold:
+            if start is None:
+                start = i
+        elif start is not None:
+            runs.append([start, i])
+            start = None
+    if start is not None:
+        runs.append([start, len(db)])
+
+    bridge = int(MAX_BRIDGED_GAP / FRAME_SECONDS)
+    merged = []
+    for run in runs:
+        if merged and run[0] - merged[-1][1] <= bridge:
+            merged[-1][1] = run[1]
+        else:
+            merged.append(run)
+
+    min_len = int(MIN_SPEECH_RUN / FRAME_SECONDS)
+    return [(s, e) for s, e in merged if e - s >= min_len]
+
+
+def count_syllable_nuclei(db, runs, threshold):
+    """Count envelope peaks inside speech separated by a sufficient dip"""
+    min_gap = int(MIN_NUCLEUS_GAP / FRAME_SECONDS)
+    nuclei = 0
+    for start, end in runs:
+        last_peak = None
+        dip = None
+        for i in range(start, end):
+            level = db[i]
+            if dip is None or level < dip:
+                dip = level
+            is_peak = (
+                level > threshold
+                and (i == 0 or level >= db[i - 1])
+                and (i + 1 >= len(db) or level > db[i + 1])
+            )
+            if not is_peak:
+                continue
+            if last_peak is None:
+                nuclei += 1
+                last_peak, dip = (i, level), level
+            elif (i - last_peak[0] >= min_gap
+                  and min(level, last_peak[1]) - dip >= MIN_DIP_DB):
+                nuclei += 1
+                last_peak, dip = (i, level), level
+            elif level > last_peak[1]:
+                # Same nucleus, louder frame: move the peak without counting
+                last_peak = (i, level)
+    return nuclei
+
+
+def analyze_acoustic_fluency(audio_file_path, profile=None):
+    """
+    Provisional fluency metrics from the energy envelope alone
+
+    Returns the same fluency_metrics schema as analyze_fluency, flagged as
+    provisional. Fillers cannot be heard without a transcript, so
+    filler_rate is always 0. Pause thresholds and scoring follow profile.
+    """
+    profile = get_profile(profile)
+    samples, rate = read_pcm16(audio_file_path)
+    db = energy_envelope(samples, rate)
+    if not db:
+        return {"fluency_metrics": {"fluency_score": 0, "error": "No speech"}, "provisional": True}
+
+    threshold = speech_threshold(db)
+
+    runs = speech_runs(db, threshold)
+    if not runs:
+        return {"fluency_metrics": {"fluency_score": 0, "error": "No speech"}, "provisional": True}
+
+    syllables = count_syllable_nuclei(db, runs, threshold)
+
+    pause_count = 0
+    long_pauses = 0
+    for (_, prev_end), (next_start, _) in zip(runs, runs[1:]):
+        gap = (next_start - prev_end) * FRAME_SECONDS
+        if gap > profile.pause_gap:
+            pause_count += 1
+        if gap > profile.long_pause_gap:
+            long_pauses += 1
+
+    speech_frames = sum(e - s for s, e in runs)
+    duration = (runs[-1][1] - runs[0][0]) * FRAME_SECONDS
+    est_words = max(1.0, syllables / SYLLABLES_PER_WORD)
+    wpm = (est_words / duration) * 60 if duration > 0 else 0
+
+    return {
+        "fluency_metrics": {
+            "wpm": round(wpm, 1),
+            "avg_word_time": round(duration / est_words, 2),
+            "filler_rate": 0.0,
+            "pause_frequency": round(pause_count / est_words, 2),
+            "long_pauses": long_pauses,
+            "fluency_score": fluency_score(wpm, 0.0, long_pauses, profile)
+        },
+        "provisional": True,
+        "acoustic": {
+            "syllables": syllables,
+            "speaking_rate": round(syllables / duration, 2) if duration > 0 else 0,
+            "pause_count": pause_count,
+            "speech_ratio": round(speech_frames / len(db), 2),
+            "duration": round(len(db) * FRAME_SECONDS, 2)
+        }
+    }
+
+
+# Benchmark on the bundled recordings: python -m vocalize_engine.acoustic
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    from vocalize_engine.bench import bundled_wavs, timeit
+    from vocalize_engine.convert import convert_to_google_format
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for path in bundled_wavs():
+            with wave.open(path, 'rb') as w:
+                ready = w.getframerate() == 16000 and w.getnchannels() == 1 and w.getsampwidth() == 2
+            if not ready:
+                path = convert_to_google_format(path, os.path.join(tmp, os.path.basename(path)))
+            paths.append(path)
+
+        print(f"\n  {'File':<36} {'Audio':>7} {'Mean':>9} {'Max':>9}  WPM    Score")
+        print("  " + "─" * 80)
+        for path in paths:
+            mean_s, max_s, result = timeit(lambda: analyze_acoustic_fluency(path), runs=20)
+            metrics = result["fluency_metrics"]
+            audio_s = result["acoustic"]["duration"]
+            print(f"  {os.path.basename(path):<36} {audio_s:>6.1f}s "
+                  f"{1000 * mean_s:>7.1f}ms {1000 * max_s:>7.1f}ms  "
+                  f"{metrics['wpm']:<6} {metrics['fluency_score']}")
+    print()
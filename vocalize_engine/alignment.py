@@ -0,0 +1,273 @@
+"""Read-aloud accuracy: align the recognized words against a reference text
+
+Exercises where the learner reads a given passage also need accuracy next
+to the fluency metrics: which words were read, skipped, misread, repeated
+or added. The recognized words are aligned against the reference with
+Myers' O(ND) diff (N words, D edits): a good reading of a 3000-word passage
+has a few dozen edits, so the alignment costs little more than one pass
+instead of the N x M table of a classic edit distance.
+
+Between two matched words, skipped reference words and inserted words are
+paired up as substitutions (misreadings); what is left over is a skip or
+an insertion. An insertion that repeats one of the last few reference
+words is a repetition, and a filler ("um") is a filler. Neither counts
+against accuracy.
+
+Readings that are too far from the reference to be the same passage
+(more than MAX_EDIT_FRACTION edits) are reported as not matching instead
+of spending quadratic time aligning them.
+"""
+from vocalize_engine.profiles import get_profile, normalize_plain
+
+MAX_EDIT_FRACTION = 0.4   # edits / (reference + recognized words)
+MAX_EDITS = 1500          # hard cap on D, whatever the passage length
+REPEAT_LOOKBACK = 3       # an insertion equal to one of the last N reference words is a repetition
+
+MATCH = "match"
+SUBSTITUTION = "substitution"
+SKIP = "skip"
+INSERTION = "insertion"
+REPETITION = "repetition"
+FILLER = "filler"
+
+
+class TooManyEdits(ValueError):
+    """The reading differs from the reference by more than max_edits words"""
+
+
+def tokenizer(profile=None):
+    """Token normalizer for alignment: the profile's, but always punctuation-stripped"""
+    profile = get_profile(profile)
+    return normalize_plain if profile.normalizer == "lower" else profile.normalize
+
+
+def reference_tokens(text, profile=None):
+    """(tokens as written, normalized tokens) of a reference text; punctuation-only tokens are dropped"""
+    normalize = tokenizer(profile)
+    written, tokens = [], []
+    for token in text.split():
+        normalized = normalize(token)
+        if normalized:
+            written.append(token)
+            tokens.append(normalized)
+    return written, tokens
+
+
+def diff(a, b, max_edits=None):
+    """
+    Shortest edit script between sequences a and b (Myers, O((N+M)D))
+
+    Returns (a_index, b_index) pairs in order: (i, j) for a match, (i, None)
+    for a deleted a[i], (None, j) for an inserted b[j]. Raises TooManyEdits
+    when more than max_edits insertions/deletions are needed.
+    """
+    n, m = len(a), len(b)
+    max_d = n + m if max_edits is None else min(n + m, max_edits)
+    offset = max_d + 1
+    v = [0] * (2 * max_d + 3)
+    trace = []  # trace[d]: v[-d-1 .. d+1] as it was before step d
+    for d in range(max_d + 1):
+        trace.append(v[offset - d - 1:offset + d + 2])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]          # down: insert b[y]
+            else:
+                x = v[offset + k - 1] + 1      # right: delete a[x]
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                return _backtrack(trace, d, n, m)
+    raise TooManyEdits(f"more than {max_d} edits")
+
+
+def _backtrack(trace, d_final, x, y):
+    path = []
+    for d in range(d_final, 0, -1):
+        before = trace[d]  # index k + d + 1
+        k = x - y
+        if k == -d or (k != d and before[k - 1 + d + 1] < before[k + 1 + d + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = before[prev_k + d + 1]
+        prev_y = prev_x - prev_k
+        while x > prev_x and y > prev_y:
+            x -= 1
+            y -= 1
+            path.append((x, y))
+        if x == prev_x:
+            path.append((None, prev_y))
+        else:
+            path.append((prev_x, None))
+        x, y = prev_x, prev_y
+    while x > 0 and y > 0:
+        x -= 1
+        y -= 1
+        path.append((x, y))
+    path.reverse()
+    return path
+
+
+def align_reading(words, reference, profile=None, fillers=None, max_edits=None):
+    """
+    Accuracy of a read-aloud attempt
+
+    words: recognized word timings (as in analyze_fluency)
+    reference: the passage as text, or a list of its words
+    fillers: per-word filler flags from analyze_fluency (else single-word fillers of profile)
+
+    Returns {"reference_words", "correct", "accuracy", "word_error_rate",
+    "substitutions", "skips", "insertions", "repetitions", "fillers",
+    "wcpm", "alignment"}; alignment is one [op, reference_index, word_index]
+    per aligned item, in passage order (None where a side has no word).
+    """
+    profile = get_profile(profile)
+    _, ref = reference_tokens(reference if isinstance(reference, str) else " ".join(reference), profile)
+    if not ref:
+        return {"error": "Empty reference text"}
+    normalize = tokenizer(profile)
+    hyp = [normalize(w['word']) for w in words]
+    if fillers is None:
+        fillers = [token in profile.filler_words for token in hyp]
+
+    limit = max(1, int(MAX_EDIT_FRACTION * (len(ref) + len(hyp))))
+    try:
+        path = diff(ref, hyp, min(limit, MAX_EDITS if max_edits is None else max_edits))
+    except TooManyEdits:
+        return {"error": "Reading does not match the reference text", "reference_words": len(ref)}
+
+    alignment = []
+    counts = {MATCH: 0, SUBSTITUTION: 0, SKIP: 0, INSERTION: 0, REPETITION: 0, FILLER: 0}
+    skipped, inserted = [], []
+    next_ref = 0  # reference words before this have been passed
+
+    def flush():
+        # A run between two matches: fillers and repetitions first, then pair
+        # misreadings; what is left is a skip or an insertion
+        extra = []
+        for j in inserted:
+            if fillers[j]:
+                alignment.append([FILLER, None, j])
+                counts[FILLER] += 1
+            elif hyp[j] in ref[max(0, next_ref - REPEAT_LOOKBACK):next_ref] or (j and hyp[j] == hyp[j - 1]):
+                alignment.append([REPETITION, None, j])
+                counts[REPETITION] += 1
+            else:
+                extra.append(j)
+        pairs = min(len(skipped), len(extra))
+        for i, j in zip(skipped, extra):
+            alignment.append([SUBSTITUTION, i, j])
+        for i in skipped[pairs:]:
+            alignment.append([SKIP, i, None])
+        for j in extra[pairs:]:
+            alignment.append([INSERTION, None, j])
+        counts[SUBSTITUTION] += pairs
+        counts[SKIP] += len(skipped) - pairs
+        counts[INSERTION] += len(extra) - pairs
+        skipped.clear()
+        inserted.clear()
+
+    for i, j in path:
+        if i is None:
+            inserted.append(j)
+        elif j is None:
+            skipped.append(i)
+        else:
+            flush()
+            alignment.append([MATCH, i, j])
+            counts[MATCH] += 1
+            next_ref = i + 1
+    flush()
+
+    matched = [j for op, _, j in alignment if op == MATCH]
+    duration = float(words[matched[-1]]['endTime']) - float(words[matched[0]]['startTime']) if matched else 0
+    errors = counts[SUBSTITUTION] + counts[SKIP] + counts[INSERTION]
+    return {
+        "reference_words": len(ref),
+        "correct": counts[MATCH],
+        "accuracy": round(counts[MATCH] / len(ref), 3),
+        "word_error_rate": round(errors / len(ref), 3),
+        "substitutions": counts[SUBSTITUTION],
+        "skips": counts[SKIP],
+        "insertions": counts[INSERTION],
+        "repetitions": counts[REPETITION],
+        "fillers": counts[FILLER],
+        # Words correct per minute, the usual oral-reading fluency measure
+        "wcpm": round(counts[MATCH] / duration * 60, 1) if duration > 0 else 0,
+        "alignment": alignment,
+    }
+
+
+# Myers alignment vs a full edit-distance table: python -m vocalize_engine.alignment [words]
+if __name__ == "__main__":
+    import random
+    import sys
+
+    from vocalize_engine.bench import timeit
+
+    def levenshtein(a, b):
+        """Classic O(N x M) edit distance (insert/delete only, to compare with D)"""
+        prev = list(range(len(b) + 1))
+        for i, x in enumerate(a, 1):
+            row = [i]
+            for j, y in enumerate(b, 1):
+                row.append(prev[j - 1] if x == y else 1 + min(prev[j], row[j - 1]))
+            prev = row
+        return prev[-1]
+
+    def reading(passage, rng, error_rate):
+        """Read passage aloud with skips, misreadings, repetitions and fillers at error_rate"""
+        out, truth = [], {SKIP: 0, SUBSTITUTION: 0, REPETITION: 0, FILLER: 0}
+        for i, word in enumerate(passage):
+            roll = rng.random()
+            if roll < error_rate / 4:
+                truth[SKIP] += 1
+                continue
+            if roll < error_rate / 2:
+                truth[SUBSTITUTION] += 1
+                out.append(f"misread{i}")
+                continue
+            out.append(word)
+            if roll < 3 * error_rate / 4:
+                truth[REPETITION] += 1
+                out.append(word)
+            elif roll < error_rate:
+                truth[FILLER] += 1
+                out.append("um")
+        t = 0.0
+        words = []
+        for token in out:
+            words.append({"word": token, "startTime": round(t, 2), "endTime": round(t + 0.3, 2)})
+            t += 0.4
+        return words, truth
+
+    rng = random.Random(11)
+    vocabulary = [f"word{i}" for i in range(400)] + ["the", "a", "of", "and", "to", "in"] * 40
+    sizes = [int(sys.argv[1])] if len(sys.argv) > 1 else [500, 2000, 5000]
+    failures = []
+    print(f"\n  {'Passage':>8} {'Errors':>7} {'D':>5} {'Myers':>9} {'N x M table':>12}  Found (truth)")
+    print("  " + "─" * 92)
+    for size in sizes:
+        passage = [rng.choice(vocabulary) for _ in range(size)]
+        for error_rate in (0.02, 0.10):
+            words, truth = reading(passage, rng, error_rate)
+            myers_s, _, result = timeit(lambda: align_reading(words, passage), runs=3)
+            d = sum(1 for i, j in diff(passage, [w["word"] for w in words]) if i is None or j is None)
+            table = f"{1000 * timeit(lambda: levenshtein(passage, [w['word'] for w in words]), runs=1)[0]:>10.0f}ms" \
+                if size <= 2000 else f"{'(skipped)':>12}"
+            found = {op: result[op + "s"] for op in (SKIP, SUBSTITUTION, REPETITION, FILLER)}
+            print(f"  {size:>8} {error_rate:>6.0%} {d:>5} {1000 * myers_s:>7.1f}ms {table}  "
+                  + "  ".join(f"{op[:5]} {found[op]} ({truth[op]})" for op in found))
+            if result["correct"] + found[SKIP] + found[SUBSTITUTION] != size:
+                failures.append(f"{size} words at {error_rate:.0%}: reference words unaccounted for")
+            if any(abs(found[op] - truth[op]) > max(2, 0.1 * truth[op]) for op in found):
+                failures.append(f"{size} words at {error_rate:.0%}: found {found}, expected {truth}")
+    if "error" not in align_reading(words, [rng.choice(vocabulary) for _ in range(sizes[-1])]):
+        failures.append("an unrelated passage was aligned")
+    for failure in failures:
+        print(f"  ❌ {failure}")
+    print("  ✓ all checks passed\n" if not failures else "")
+    sys.exit(1 if failures else 0)
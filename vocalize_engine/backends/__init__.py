@@ -0,0 +1,43 @@
+"""Interchangeable sample-processing backends for the converter
+
+Every backend implements convert(wav_in, target_rate) -> mono int16 PCM bytes
+and must produce byte-identical output (see vocalize_engine.conformance).
+"""
+import importlib
+import os
+
+# name -> module providing convert(); numpy is optional
+BACKENDS = {
+    "stdlib": "vocalize_engine.backends.stdlib",
+    "numpy": "vocalize_engine.backends.numpy_backend",
+}
+
+
+def available_backends():
+    """Names of the backends whose dependencies are installed"""
+    names = []
+    for name, module in BACKENDS.items():
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def get_backend(name=None):
+    """
+    Resolve a backend module by name
+
+    Defaults to $VOCALIZE_CONVERT_BACKEND, then numpy when installed,
+    then the pure-Python stdlib backend.
+    """
+    name = name or os.getenv("VOCALIZE_CONVERT_BACKEND")
+    if name:
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown converter backend: {name}")
+        return importlib.import_module(BACKENDS[name])
+    try:
+        return importlib.import_module(BACKENDS["numpy"])
+    except ImportError:
+        return importlib.import_module(BACKENDS["stdlib"])
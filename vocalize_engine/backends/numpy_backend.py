@@ -0,0 +1,52 @@
+"""NumPy converter backend
+Vectorized version of the stdlib backend. Every step mirrors the pure-Python
+arithmetic (same operation order, truncation and floor division) so the
+output is byte-identical.
+"""
+import numpy as np
+
+name = "numpy"
+
+
+def convert(wav_in, target_rate=16000):
+    """Mono int16 PCM bytes at target_rate from an open WavFile"""
+    n_channels = wav_in.channels
+    sample_width = wav_in.sample_width
+    rate = wav_in.rate
+
+    data = wav_in.as_array()
+    if wav_in.is_float:
+        data = (data.astype(np.float64) * 2147483647).astype(np.int64)
+        sample_width = 4
+    elif sample_width == 1:
+        data = data.astype(np.int64) - 128
+    else:
+        data = data.astype(np.int64)
+
+    # Mono: floor of the channel mean, like sum(frame) // n_channels
+    if n_channels > 1:
+        samples = data.sum(axis=1) // n_channels
+    else:
+        samples = data[:, 0]
+
+    if rate != target_rate:
+        original_length = len(samples)
+        new_length = int(original_length * target_rate / rate)
+        if new_length > 1:
+            pos = (np.arange(new_length, dtype=np.int64) * (original_length - 1)) / (new_length - 1)
+        else:
+            pos = np.zeros(new_length)
+        idx = pos.astype(np.int64)
+        frac = pos - idx
+        nxt = np.minimum(idx + 1, original_length - 1)
+        val = samples[idx] * (1 - frac) + samples[nxt] * frac
+        val = np.where(idx + 1 < original_length, val, samples[idx])
+        samples = val.astype(np.int64)
+
+    if sample_width != 2 and len(samples):
+        max_val = int(np.abs(samples).max())
+        if max_val > 0:
+            scale = 32767 / max_val
+            samples = (samples * scale).astype(np.int64)
+
+    return np.clip(samples, -32768, 32767).astype('<i2').tobytes()
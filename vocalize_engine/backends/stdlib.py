@@ -0,0 +1,76 @@
+"""Pure-Python converter backend (no third-party dependencies)
+Used on Vercel, where scipy/numpy would add ~130MB to the bundle.
+The step helpers are shared with the streaming converter (ingest.py).
+"""
+import sys
+from array import array
+
+name = "stdlib"
+
+
+def to_int_samples(samples, sample_width, is_float):
+    """Integer samples on a signed grid; returns (samples, effective_width)"""
+    if is_float:
+        # Scale floats onto the 32-bit integer grid; normalized later
+        return [int(s * 2147483647) for s in samples], 4
+    if sample_width == 1:
+        # 8-bit WAV is unsigned
+        return [s - 128 for s in samples], 1
+    return samples, sample_width
+
+
+def mix_to_mono(samples, n_channels):
+    """Average interleaved channels (strided views, no per-frame slicing)"""
+    if n_channels == 1:
+        return list(samples)
+    channels = [samples[c::n_channels] for c in range(n_channels)]
+    return [sum(frame) // n_channels for frame in zip(*channels)]
+
+
+def interpolate(samples, i, original_length, new_length, offset=0):
+    """Linear-interpolated output sample i; samples[0] is input sample `offset`"""
+    # Calculate position in original array
+    pos = i * (original_length - 1) / (new_length - 1) if new_length > 1 else 0
+    idx = int(pos)
+    frac = pos - idx
+
+    if idx + 1 < original_length:
+        val = samples[idx - offset] * (1 - frac) + samples[idx + 1 - offset] * frac
+    else:
+        val = samples[idx - offset]
+    return int(val)
+
+
+def normalize(samples):
+    """Scale so the peak hits the int16 limit (used for non-16-bit input)"""
+    max_val = max(abs(s) for s in samples) if samples else 1
+    if max_val > 0:
+        scale = 32767 / max_val
+        samples = [int(s * scale) for s in samples]
+    return samples
+
+
+def pack_int16(samples):
+    """Clamp to the int16 range and pack as little-endian PCM"""
+    pcm = array('h', [max(-32768, min(32767, s)) for s in samples])
+    if sys.byteorder == 'big':
+        pcm.byteswap()
+    return pcm.tobytes()
+
+
+def convert(wav_in, target_rate=16000):
+    """Mono int16 PCM bytes at target_rate from an open WavFile"""
+    samples, sample_width = to_int_samples(wav_in.samples(), wav_in.sample_width, wav_in.is_float)
+    samples = mix_to_mono(samples, wav_in.channels)
+
+    # Resample using linear interpolation
+    if wav_in.rate != target_rate:
+        original_length = len(samples)
+        new_length = int(original_length * target_rate / wav_in.rate)
+        samples = [interpolate(samples, i, original_length, new_length) for i in range(new_length)]
+
+    # Normalize to 16-bit range if needed
+    if sample_width != 2:
+        samples = normalize(samples)
+
+    return pack_int16(samples)
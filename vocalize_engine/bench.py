@@ -0,0 +1,24 @@
+"""Shared helpers for the engine's benchmark entry points"""
+import glob
+import os
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLES_DIR = os.path.join(REPO_ROOT, "evaluation_engine")
+
+
+def bundled_wavs():
+    """The sample recordings shipped with the repo (empty for installed wheels)"""
+    return sorted(glob.glob(os.path.join(SAMPLES_DIR, "*.wav")))
+
+
+def timeit(fn, runs=10):
+    """Call fn() runs times; return (mean_seconds, max_seconds, last_result)"""
+    timings = []
+    result = None
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - t0)
+    return sum(timings) / len(timings), max(timings), result
+
@@ -0,0 +1,206 @@
+"""Circuit breaker around the Speech API
+
+When Google is down or the key is over quota, every request would otherwise
+wait for its own failure. The breaker counts consecutive service failures
+(5xx, 429/403 quota/key errors, connection errors and timeouts on calls
+that had a real budget) and, after STT_BREAKER_FAILURES of them, opens:
+callers get an immediate "unavailable" result for STT_BREAKER_COOLDOWN
+seconds. Then one request is let through as a probe (half-open); its
+success closes the breaker, its failure opens it again.
+
+Client errors (400: bad audio, payload too large) prove the service is up
+and count as successes. State is per process (one breaker per gunicorn
+worker), like the hedging stats.
+
+    STT_BREAKER_FAILURES   consecutive failures that open the breaker (5)
+    STT_BREAKER_COOLDOWN   seconds open before a probe is allowed (30)
+"""
+import os
+import threading
+import time
+
+FAILURE_THRESHOLD = int(os.getenv("STT_BREAKER_FAILURES", 5))
+COOLDOWN = float(os.getenv("STT_BREAKER_COOLDOWN", 30))
+
+# A timeout only says the service is down if the call had this long to answer
+# (a client asking for X-Request-Timeout: 0.5 proves nothing)
+MIN_TIMEOUT_BUDGET = 10.0
+
+# Statuses that mean "the service can't answer us", not "this audio is bad"
+FAILURE_STATUSES = {401, 403, 429}
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+def is_failure(status_code):
+    return status_code >= 500 or status_code in FAILURE_STATUSES
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe (thread-safe)"""
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probe_started = None
+        self.trips = 0          # closed -> open
+        self.reopens = 0        # failed probes
+        self.rejected = 0       # calls failed fast while open
+        self.successes = 0
+        self.failures = 0
+        self.last_failure = None
+
+    def allow(self):
+        """May a call go out now? (in half-open only the probe may)"""
+        with self._lock:
+            now = self.clock()
+            if self.state == OPEN and now - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                self.probe_started = None
+            if self.state == HALF_OPEN:
+                # A probe that never reported back (e.g. it failed before
+                # sending) must not wedge the breaker half-open
+                if self.probe_started is None or now - self.probe_started >= self.cooldown:
+                    self.probe_started = now
+                    return True
+            if self.state == CLOSED:
+                return True
+            self.rejected += 1
+            return False
+
+    def retry_after(self):
+        """Seconds until a probe will be allowed (0 when closed)"""
+        with self._lock:
+            if self.state == CLOSED:
+                return 0.0
+            since = self.opened_at if self.state == OPEN else self.probe_started
+            return max(0.0, round(self.cooldown - (self.clock() - (since or 0)), 1))
+
+    def success(self):
+        with self._lock:
+            self.successes += 1
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                self.state = CLOSED
+                self.opened_at = self.probe_started = None
+
+    def failure(self, reason=None):
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_failure = reason
+            if self.state == HALF_OPEN:
+                self.reopens += 1
+                self._open()
+            elif self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+                self.trips += 1
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = self.clock()
+        self.probe_started = None
+
+    def record_status(self, status_code):
+        """Record an HTTP answer; returns True when it counts as a failure"""
+        if is_failure(status_code):
+            self.failure(f"HTTP {status_code}")
+            return True
+        self.success()
+        return False
+
+    def record_timeout(self, budget):
+        """Record a call that ran out of time after being given budget seconds"""
+        if budget >= MIN_TIMEOUT_BUDGET:
+            self.failure(f"timeout after {budget:.0f}s")
+            return True
+        return False
+
+    def unavailable(self):
+        """Fail-fast result when the breaker rejects a call, else None"""
+        if self.allow():
+            return None
+        return {"error": f"STT unavailable ({self.name} circuit open: {self.last_failure})",
+                "stt_unavailable": True, "retry_after": self.retry_after()}
+
+    def snapshot(self):
+        retry_after = self.retry_after()
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "cooldown": self.cooldown,
+                "retry_after": retry_after,
+                "trips": self.trips,
+                "reopens": self.reopens,
+                "rejected": self.rejected,
+                "successes": self.successes,
+                "failures": self.failures,
+                "last_failure": self.last_failure,
+            }
+
+
+stt_breaker = CircuitBreaker("stt")
+
+
+# Outage behaviour against a local stub: python -m vocalize_engine.breaker (tests: tests/test_breaker.py)
+if __name__ == "__main__":
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from vocalize_engine import stt
+
+    OUTAGE_LATENCY = 0.5   # a struggling backend answers 503 slowly
+    state = {"down": True}
+
+    class Stub(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            if state["down"]:
+                time.sleep(OUTAGE_LATENCY)
+                status, body = 503, {"error": {"message": "The service is currently unavailable."}}
+            else:
+                status, body = 200, {"results": [{"alternatives": [{"transcript": "hello", "words": [
+                    {"word": "hello", "startTime": "0.1s", "endTime": "0.5s"}]}]}]}
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Stub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stt.STT_BASE_URL = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    def outage(breaker, n=20):
+        """Mean seconds per recognize call during the outage"""
+        started = time.perf_counter()
+        for _ in range(n):
+            stt.recognize_content(b"\0" * 3200, "key", breaker=breaker)
+        return (time.perf_counter() - started) / n
+
+    print(f"\n  Stub outage: every call answers 503 after {1000 * OUTAGE_LATENCY:.0f}ms")
+    print(f"\n  {'Breaker':<10} {'Per call':>9} {'Sent':>5} {'Failed fast':>12}")
+    print("  " + "─" * 40)
+    off = CircuitBreaker("off", failure_threshold=10 ** 9)
+    on = CircuitBreaker("on", failure_threshold=5, cooldown=0.5)
+    for label, breaker in (("off", off), ("on", on)):
+        per_call = outage(breaker)
+        print(f"  {label:<10} {1000 * per_call:>7.0f}ms {breaker.failures:>5} {breaker.rejected:>12}")
+
+    # Recovery: after the cooldown one probe goes out and closes the breaker
+    state["down"] = False
+    time.sleep(on.cooldown)
+    result = stt.recognize_content(b"\0" * 3200, "key", breaker=on)
+    print(f"\n  After recovery: probe {'ok' if 'error' not in result else result['error']}, state {on.state}\n")
+    server.shutdown()
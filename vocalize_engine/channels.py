@@ -0,0 +1,255 @@
+"""Per-channel recognition for multi-speaker recordings
+
+convert_to_google_format averages every channel into mono, which merges
+interview recordings where each speaker has their own channel. Here each
+channel is extracted to its own mono WAV and recognized on its own, so
+every speaker gets their own transcript, word timings and fluency_metrics.
+
+Channels are independent end to end: extract_channel runs once per channel
+(the backend runs sharedpcm.convert_shared(..., channel=n) in its process
+pool side by side, so each channel comes back as a shared-memory handle
+rather than a file) and recognize_channels sends every channel through the
+planner concurrently, so a stereo interview takes about as long as its
+longest channel, not the sum.
+
+Separate requests rather than the API's enableSeparateRecognitionPerChannel:
+Google bills each channel either way, and per-channel requests keep the
+planner's split/long-running plans for long interviews.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from vocalize_engine.backends import get_backend
+from vocalize_engine.convert import TARGET_RATE, convert_pcm
+from vocalize_engine.fluency import analyze_fluency
+from vocalize_engine.ingest import IngestError
+from vocalize_engine.planner import NO_RESULTS
+from vocalize_engine.rates import choose_sample_rate
+from vocalize_engine.wavfile import open_wav
+
+MAX_CHANNELS = 8
+
+
+class ChannelView:
+    """One channel of an open WavFile, read the way the converter backends read a mono file"""
+
+    channels = 1
+
+    def __init__(self, wav_in, channel):
+        self.wav_in = wav_in
+        self.channel = channel
+        self.rate = wav_in.rate
+        self.sample_width = wav_in.sample_width
+        self.is_float = wav_in.is_float
+        self.n_frames = wav_in.n_frames
+
+    def samples(self, start=0, stop=None):
+        """This channel's samples for frames [start, stop) (strided view, no copy)"""
+        return self.wav_in.samples(start, stop)[self.channel::self.wav_in.channels]
+
+    def as_array(self, start=0, stop=None):
+        return self.wav_in.as_array(start, stop)[:, self.channel:self.channel + 1]
+
+
+def channel_pcm(wav_in, channel, target_rate=TARGET_RATE, backend=None):
+    """16-bit mono PCM bytes of one channel of an open WavFile, at target_rate"""
+    if not 0 <= channel < wav_in.channels:
+        raise ValueError(f"Channel {channel} out of range ({wav_in.channels} channels)")
+    if wav_in.channels == 1:
+        return convert_pcm(wav_in, backend, target_rate)
+    return get_backend(backend).convert(ChannelView(wav_in, channel), target_rate)
+
+
+def extract_channel(input_file, output_file, channel, target_rate=TARGET_RATE, backend=None):
+    """Write one channel of input_file as a 16-bit mono WAV at target_rate; returns output_file"""
+    import wave
+
+    with open_wav(input_file) as wav_in:
+        pcm = channel_pcm(wav_in, channel, target_rate, backend)
+
+    with wave.open(output_file, 'wb') as wav_out:
+        wav_out.setnchannels(1)
+        wav_out.setsampwidth(2)
+        wav_out.setframerate(target_rate)
+        wav_out.writeframes(pcm)
+    return output_file
+
+
+def channel_layout(path, max_seconds=None, max_channels=MAX_CHANNELS):
+    """
+    (channels, rate to send each channel at) for an uploaded WAV
+    Raises IngestError (with the HTTP status) when it can't be split.
+    """
+    try:
+        wav_in = open_wav(path)
+    except ValueError as e:
+        raise IngestError(f"Per-channel analysis needs a WAV upload: {e}", 415)
+    with wav_in:
+        if max_seconds and wav_in.duration > max_seconds:
+            raise IngestError(f"Recording longer than {max_seconds}s", 413)
+        if wav_in.channels > max_channels:
+            raise IngestError(f"{wav_in.channels} channels; at most {max_channels} are analyzed separately", 400)
+        # Each channel goes through the converter on its own, as mono
+        target_rate, _ = choose_sample_rate(wav_in.rate, 1, wav_in.sample_width, wav_in.is_float)
+        return wav_in.channels, target_rate
+
+
+def channel_paths(output_prefix, channels):
+    """Per-channel output paths: <prefix>_ch0.wav, <prefix>_ch1.wav, ..."""
+    return [f"{output_prefix}_ch{channel}.wav" for channel in range(channels)]
+
+
+def recognize_channels(paths, api_key, language_code="en-US", sample_rate_hertz=TARGET_RATE, deadline=None):
+    """
+    recognize_planned on every channel WAV (path or SharedWav) concurrently; one result per path
+
+    A silent channel (no results) is not an error on its own; it comes back
+    as that channel's {"error": ...}.
+    """
+    # Imported here: stt builds on fluency and planner on stt
+    from vocalize_engine.planner import recognize_planned
+
+    def recognize(path):
+        return recognize_planned(path, api_key, language_code, "LINEAR16", sample_rate_hertz, deadline)
+
+    with ThreadPoolExecutor(max_workers=max(1, len(paths))) as pool:
+        return list(pool.map(recognize, paths))
+
+
+def analyze_channels_with_api_key(paths, api_key, language_code="en-US", annotate=False,
+                                  sample_rate_hertz=TARGET_RATE, profile=None, deadline=None, timeline=None,
+                                  reference=None):
+    """
+    Per-speaker analysis of channel WAVs from extract_channel (or SharedWavs from convert_shared)
+    reference: passage every speaker read aloud (a "reading" block per channel)
+
+    Returns {"channels": [{"channel", "transcript", "word_count", "words",
+    "fluency_metrics", "plan"} or {"channel", "error"}], "speakers"}.
+    If no channel has speech, or STT failed in a way the caller must act
+    on (deadline, service unavailable), that channel's error is returned
+    instead so /analyze can answer 504 / fall back like a mono request.
+    """
+    results = recognize_channels(paths, api_key, language_code, sample_rate_hertz, deadline)
+    for result in results:
+        if result.get("deadline_exceeded") or result.get("stt_unavailable"):
+            return result
+    if all("error" in result for result in results):
+        return next((r for r in results if r["error"] != NO_RESULTS), results[0])
+
+    channels = []
+    for channel, result in enumerate(results):
+        if "error" in result:
+            channels.append({"channel": channel, "error": result["error"]})
+            continue
+        metrics = analyze_fluency(result["words"], annotate=annotate, profile=profile, timeline=timeline,
+                                  reference=reference)
+        entry = {
+            "channel": channel,
+            "transcript": result["transcript"],
+            "word_count": result["word_count"],
+            "words": result["words"],
+            "fluency_metrics": metrics,
+            "plan": result["plan"],
+        }
+        if "annotations" in metrics:
+            entry["annotations"] = metrics.pop("annotations")
+        channels.append(entry)
+    return {"channels": channels, "speakers": sum(1 for c in channels if "error" not in c)}
+
+
+# Serial vs concurrent channels against a local stand-in of the API:
+# python -m vocalize_engine.channels
+if __name__ == "__main__":
+    import base64
+    import contextlib
+    import io
+    import json
+    import sys
+    import tempfile
+    import threading
+    import time
+    from concurrent.futures import ProcessPoolExecutor
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from vocalize_engine import stt
+    from vocalize_engine.conformance import write_wav
+
+    LATENCY = 0.15            # per request
+    SECONDS_PER_MINUTE = 1.0  # processing time per minute of audio
+    SECONDS = 40.0
+
+    class StandIn(BaseHTTPRequestHandler):
+        """Words every 0.4s wherever the channel is loud, so each speaker gets their own"""
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            rate = body["config"]["sampleRateHertz"]
+            audio = base64.b64decode(body["audio"]["content"])[44:]
+            seconds = len(audio) / 2 / rate
+            time.sleep(LATENCY + seconds / 60 * SECONDS_PER_MINUTE)
+            words, t = [], 0.0
+            while t + 0.3 < seconds:
+                at = 2 * int((t + 0.15) * rate)
+                if abs(int.from_bytes(audio[at:at + 2], 'little', signed=True)) > 1000:
+                    words.append({"word": "word", "startTime": f"{t:.1f}s", "endTime": f"{t + 0.3:.1f}s"})
+                t += 0.4
+            data = json.dumps({"results": [{"alternatives": [{"transcript": " ".join(w["word"] for w in words),
+                                                              "words": words}]}]} if words else {}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stt.STT_BASE_URL = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    def interview(rate, channels):
+        """Speakers take 5s turns; each is only audible on their own channel"""
+        frames = []
+        for i in range(int(SECONDS * rate)):
+            turn = int(i / rate / 5) % channels
+            tone = 8000 if (i * 360 // rate) % 2 else -8000  # 180Hz square wave
+            frames.append(tuple(tone if c == turn else 0 for c in range(channels)))
+        return frames
+
+    failures = []
+    print(f"\n  Stand-in: {LATENCY * 1000:.0f}ms/request + {SECONDS_PER_MINUTE:.1f}s per audio minute; "
+          f"{SECONDS:.0f}s interviews, speakers alternate every 5s")
+    print(f"\n  {'Input':<22} {'Serial':>9} {'Concurrent':>11}  Words per channel")
+    print("  " + "─" * 72)
+    with tempfile.TemporaryDirectory() as tmp, ProcessPoolExecutor() as processes:
+        for rate, channels in ((16000, 2), (48000, 2), (16000, 4)):
+            path = write_wav(os.path.join(tmp, f"{rate}_{channels}.wav"), interview(rate, channels), rate, 2)
+            paths = channel_paths(os.path.join(tmp, f"{rate}_{channels}"), channels)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                # Splitting externally, then one call after another
+                started = time.perf_counter()
+                for channel, out in enumerate(paths):
+                    extract_channel(path, out, channel)
+                    stt.analyze_audio_with_api_key(out, "key")
+                serial_s = time.perf_counter() - started
+
+                started = time.perf_counter()
+                list(processes.map(extract_channel, [path] * channels, paths, range(channels)))
+                result = analyze_channels_with_api_key(paths, "key")
+                concurrent_s = time.perf_counter() - started
+
+            counts = [c.get("word_count", 0) for c in result.get("channels", [])]
+            print(f"  {f'{rate}Hz x{channels}':<22} {1000 * serial_s:>7.0f}ms {1000 * concurrent_s:>9.0f}ms  {counts}")
+            if "error" in result or len(counts) != channels:
+                failures.append(f"{rate}Hz x{channels}: {result.get('error', counts)}")
+            elif min(counts) == 0 or max(counts) > 1.2 * sum(counts) / channels:
+                failures.append(f"{rate}Hz x{channels}: speakers were not kept apart {counts}")
+            if concurrent_s >= serial_s:
+                failures.append(f"{rate}Hz x{channels}: concurrent not faster than serial")
+    server.shutdown()
+    for failure in failures:
+        print(f"  ❌ {failure}")
+    print("  ✓ all checks passed\n" if not failures else "")
+    sys.exit(1 if failures else 0)
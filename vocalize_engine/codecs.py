@@ -0,0 +1,219 @@
+"""Container/codec detection and optional decoding of browser recordings
+
+MediaRecorder falls back to WebM/Opus (Chrome, Firefox) or Ogg, and still
+names the file recording.wav. Uploads are identified by magic bytes:
+    - WAV goes through the normal converter (at its native rate when that
+      is cheaper, see rates)
+    - encodings the Speech API accepts natively (OGG_OPUS, WEBM_OPUS, FLAC)
+      are sent as-is, skipping decode entirely
+    - anything else is decoded to 16000Hz mono WAV by an optional local
+      decoder: PyAV (`pip install av`) or an `ffmpeg` binary on PATH
+"""
+import os
+import shutil
+import struct
+import subprocess
+import wave
+
+from vocalize_engine.convert import TARGET_RATE, convert_to_google_format
+from vocalize_engine.rates import choose_sample_rate
+from vocalize_engine.wavfile import open_wav
+
+SNIFF_BYTES = 4096
+
+
+def sniff_container(head):
+    """Container name from the first bytes of a file, or None if unknown"""
+    head = bytes(head[:16])
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        return "wav"
+    if head[:4] == b'OggS':
+        return "ogg"
+    if head[:4] == b'\x1a\x45\xdf\xa3':
+        return "webm"
+    if head[:4] == b'fLaC':
+        return "flac"
+    if head[4:8] == b'ftyp':
+        return "mp4"
+    if head[:3] == b'ID3' or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return "mp3"
+    return None
+
+
+def probe_media(head):
+    """
+    Identify container, codec and native STT settings from the file head
+
+    Returns {"container", "codec", "stt_encoding", "sample_rate_hertz",
+    "channels"}; stt_encoding is None when the audio must be decoded first.
+    """
+    head = bytes(head[:SNIFF_BYTES])
+    container = sniff_container(head)
+    info = {"container": container, "codec": None, "stt_encoding": None,
+            "sample_rate_hertz": None, "channels": None}
+
+    if container == "wav":
+        info.update(codec="pcm", stt_encoding="LINEAR16")
+    elif container == "ogg":
+        # Opus always decodes at 48000Hz (OpusHead's input rate is informational), a rate the API accepts
+        if b'OpusHead' in head:
+            pos = head.index(b'OpusHead')
+            info.update(codec="opus", stt_encoding="OGG_OPUS", sample_rate_hertz=48000)
+            if len(head) >= pos + 10:
+                info["channels"] = head[pos + 9]
+        elif b'\x01vorbis' in head:
+            info["codec"] = "vorbis"
+    elif container == "webm":
+        # CodecID element values from the Matroska track entry
+        if b'A_OPUS' in head:
+            info.update(codec="opus", stt_encoding="WEBM_OPUS", sample_rate_hertz=48000)
+        elif b'A_VORBIS' in head:
+            info["codec"] = "vorbis"
+    elif container == "flac":
+        info.update(codec="flac", stt_encoding="FLAC")
+        if len(head) >= 26:
+            # STREAMINFO: 20-bit sample rate, 3-bit channels-1, after 10 bytes of block sizes
+            packed, = struct.unpack('>Q', head[18:26])
+            info["sample_rate_hertz"] = packed >> 44
+            info["channels"] = ((packed >> 41) & 0x7) + 1
+    elif container == "mp3":
+        info["codec"] = "mp3"
+    elif container == "mp4":
+        info["codec"] = "aac"
+    return info
+
+
+def decoder_available():
+    """Name of the local decoder that will be used, or None"""
+    try:
+        import av  # noqa: F401
+        return "pyav"
+    except ImportError:
+        pass
+    return "ffmpeg" if shutil.which("ffmpeg") else None
+
+
+def decode_to_wav(input_file, output_file, target_rate=TARGET_RATE):
+    """Decode any container/codec the local decoder knows to 16-bit mono WAV"""
+    decoder = decoder_available()
+    if decoder == "pyav":
+        _decode_pyav(input_file, output_file, target_rate)
+    elif decoder == "ffmpeg":
+        subprocess.run(
+            ["ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-i", input_file,
+             "-ac", "1", "-ar", str(target_rate), "-c:a", "pcm_s16le", "-f", "wav", output_file],
+            check=True,
+        )
+    else:
+        raise ValueError("No audio decoder available (pip install av, or install ffmpeg)")
+    return output_file
+
+
+def _decode_pyav(input_file, output_file, target_rate):
+    import av
+
+    with av.open(input_file) as container:
+        if not container.streams.audio:
+            raise ValueError("No audio stream found")
+        stream = container.streams.audio[0]
+        resampler = av.AudioResampler(format="s16", layout="mono", rate=target_rate)
+        with wave.open(output_file, 'wb') as wav_out:
+            wav_out.setnchannels(1)
+            wav_out.setsampwidth(2)
+            wav_out.setframerate(target_rate)
+            for frame in container.decode(stream):
+                for out in resampler.resample(frame):
+                    wav_out.writeframes(bytes(out.planes[0])[:out.samples * 2])
+            for out in resampler.resample(None):
+                wav_out.writeframes(bytes(out.planes[0])[:out.samples * 2])
+
+
+def prepare_for_stt(input_file, output_file, allow_native=True):
+    """
+    Get any supported upload ready for recognition
+
+    Returns {"path", "encoding", "sample_rate_hertz", "container", "codec",
+    "decoded"}. With allow_native=False (local analysis needs PCM) natively
+    accepted encodings are decoded too. WAV keeps its own rate when
+    rates.choose_sample_rate says sending it is cheaper than resampling
+    (always 16000Hz with allow_native=False).
+    """
+    with open(input_file, 'rb') as f:
+        info = probe_media(f.read(SNIFF_BYTES))
+    if info["container"] is None:
+        raise ValueError("Unsupported audio format (unrecognized file header)")
+
+    prepared = {"container": info["container"], "codec": info["codec"], "decoded": False}
+    if info["container"] == "wav":
+        target_rate = TARGET_RATE
+        if allow_native:
+            with open_wav(input_file) as wav_in:
+                target_rate, _ = choose_sample_rate(wav_in.rate, wav_in.channels, wav_in.sample_width,
+                                                    wav_in.is_float)
+        convert_to_google_format(input_file, output_file, target_rate=target_rate)
+        prepared.update(path=output_file, encoding="LINEAR16", sample_rate_hertz=target_rate)
+    elif allow_native and info["stt_encoding"]:
+        prepared.update(path=input_file, encoding=info["stt_encoding"],
+                        sample_rate_hertz=info["sample_rate_hertz"])
+    else:
+        decode_to_wav(input_file, output_file)
+        prepared.update(path=output_file, encoding="LINEAR16", sample_rate_hertz=TARGET_RATE, decoded=True)
+    return prepared
+
+
+# Decode cost vs the WAV path: python -m vocalize_engine.codecs
+if __name__ == "__main__":
+    import contextlib
+    import io
+    import tempfile
+
+    from vocalize_engine.bench import bundled_wavs, timeit
+
+    if decoder_available() != "pyav":
+        raise SystemExit("The benchmark encodes its fixtures with PyAV: pip install av")
+    import av
+
+    def encode(wav_path, out_path, container_format, codec, rate):
+        with av.open(wav_path) as src, av.open(out_path, 'w', format=container_format) as dst:
+            out_stream = dst.add_stream(codec, rate=rate, layout="mono")
+            resampler = av.AudioResampler(format=out_stream.format.name, layout="mono", rate=rate)
+            for frame in src.decode(audio=0):
+                for chunk in resampler.resample(frame):
+                    for packet in out_stream.encode(chunk):
+                        dst.mux(packet)
+            for packet in out_stream.encode(None):
+                dst.mux(packet)
+        return out_path
+
+    source = bundled_wavs()[0]
+    variants = [("webm", "libopus", 48000), ("ogg", "libopus", 48000), ("ogg", "vorbis", 44100),
+                ("flac", "flac", 16000), ("mp3", "libmp3lame", 44100), ("mp4", "aac", 44100)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "out.wav")
+        with wave.open(source, 'rb') as w:
+            seconds = w.getnframes() / w.getframerate()
+        files = [("wav", "pcm", source)]
+        for container_format, codec, rate in variants:
+            name = os.path.join(tmp, f"sample_{codec}.{container_format}")
+            try:
+                files.append((container_format, codec, encode(source, name, container_format, codec, rate)))
+            except (av.FFmpegError, ValueError) as e:
+                print(f"  (skipping {codec}: {e})")
+
+        print(f"\n  Source: {os.path.basename(source)} ({seconds:.1f}s)")
+        print(f"\n  {'Container':<10} {'Codec':<11} {'Size':>9} {'Native':>10} {'Decode':>10} {'x rt':>7}")
+        print("  " + "─" * 62)
+        with contextlib.redirect_stdout(io.StringIO()):
+            rows = []
+            for container_format, codec, path in files:
+                size = os.path.getsize(path)
+                native = prepare_for_stt(path, out)
+                native_s, _, _ = timeit(lambda: prepare_for_stt(path, out), runs=5)
+                decode_s, _, _ = timeit(lambda: prepare_for_stt(path, out, allow_native=False), runs=5)
+                rows.append((container_format, codec, size, native, native_s, decode_s))
+        for container_format, codec, size, native, native_s, decode_s in rows:
+            native_cell = f"{1000 * native_s:>8.1f}ms" if not native["decoded"] else f"{'-':>10}"
+            print(f"  {container_format:<10} {codec:<11} {size / 1024:>7.1f}K {native_cell} "
+                  f"{1000 * decode_s:>8.1f}ms {seconds / decode_s:>6.0f}x")
+    print()
@@ -0,0 +1,127 @@
+"""Cross-backend conformance and speed check for the converter
+
+Converts the bundled recordings plus synthetic fixtures covering every input
+format the reader accepts, with every installed backend, and reports whether
+all backends produce byte-identical PCM (tests/test_conformance.py asserts it).
+
+Run: python -m vocalize_engine.conformance
+"""
+import hashlib
+import math
+import os
+import struct
+import tempfile
+
+from vocalize_engine.backends import available_backends, get_backend
+from vocalize_engine.bench import bundled_wavs, timeit
+from vocalize_engine.convert import TARGET_RATE
+from vocalize_engine.wavfile import WAVE_FORMAT_EXTENSIBLE, WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_PCM, open_wav
+
+# KSDATAFORMAT_SUBTYPE_* GUID tail shared by PCM and IEEE float
+GUID_TAIL = b'\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71'
+
+
+def write_wav(path, frames, rate, sample_width, format_tag=WAVE_FORMAT_PCM, extensible=False):
+    """Write interleaved frames (list of per-frame tuples) with any supported layout"""
+    channels = len(frames[0])
+    if format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        code = '<f' if sample_width == 4 else '<d'
+        raw = b''.join(struct.pack(code, v) for frame in frames for v in frame)
+    elif sample_width == 1:
+        raw = bytes(v + 128 for frame in frames for v in frame)
+    else:
+        raw = b''.join(v.to_bytes(sample_width, 'little', signed=True) for frame in frames for v in frame)
+
+    block_align = channels * sample_width
+    bits = sample_width * 8
+    if extensible:
+        fmt = struct.pack('<HHIIHHHHI', WAVE_FORMAT_EXTENSIBLE, channels, rate, rate * block_align,
+                          block_align, bits, 22, bits, 0) + struct.pack('<H', format_tag) + GUID_TAIL
+    else:
+        fmt = struct.pack('<HHIIHH', format_tag, channels, rate, rate * block_align, block_align, bits)
+    body = (b'WAVE' + b'fmt ' + struct.pack('<I', len(fmt)) + fmt
+            + b'data' + struct.pack('<I', len(raw)) + raw)
+    with open(path, 'wb') as f:
+        f.write(b'RIFF' + struct.pack('<I', len(body)) + body)
+    return path
+
+
+def synthetic_fixtures(directory, seconds=1.0):
+    """Tone + chirp fixtures in every layout the reader supports"""
+    fixtures = []
+
+    def signal(rate, channels):
+        n = int(rate * seconds)
+        return [
+            tuple(0.6 * math.sin(2 * math.pi * (220 + 110 * c) * i / rate)
+                  + 0.3 * math.sin(2 * math.pi * 40 * i * i / (rate * n)) for c in range(channels))
+            for i in range(n)
+        ]
+
+    layouts = [
+        ("pcm8_mono_8k", 8000, 1, 1, WAVE_FORMAT_PCM, False),
+        ("pcm16_mono_16k", 16000, 1, 2, WAVE_FORMAT_PCM, False),
+        ("pcm16_stereo_44k", 44100, 2, 2, WAVE_FORMAT_PCM, False),
+        ("pcm24_stereo_48k", 48000, 2, 3, WAVE_FORMAT_PCM, True),
+        ("pcm32_3ch_22k", 22050, 3, 4, WAVE_FORMAT_PCM, False),
+        ("float32_stereo_48k", 48000, 2, 4, WAVE_FORMAT_IEEE_FLOAT, True),
+        ("float64_mono_32k", 32000, 1, 8, WAVE_FORMAT_IEEE_FLOAT, False),
+    ]
+    for name, rate, channels, width, tag, extensible in layouts:
+        frames = signal(rate, channels)
+        if tag == WAVE_FORMAT_PCM:
+            peak = (1 << (8 * width - 1)) - 1
+            frames = [tuple(int(v * peak) for v in frame) for frame in frames]
+        fixtures.append(write_wav(os.path.join(directory, name + ".wav"), frames, rate, width, tag, extensible))
+    return fixtures
+
+
+def check_conformance(paths, backends=None, runs=3):
+    """
+    Convert every path with every backend
+
+    Returns a list of rows: {file, seconds, digests, timings, identical}
+    """
+    backends = backends or available_backends()
+    rows = []
+    for path in paths:
+        digests = {}
+        timings = {}
+        with open_wav(path) as wav_in:
+            seconds = wav_in.duration
+            for name in backends:
+                module = get_backend(name)
+                mean_s, _, pcm = timeit(lambda: module.convert(wav_in, TARGET_RATE), runs=runs)
+                digests[name] = hashlib.sha256(pcm).hexdigest()[:12]
+                timings[name] = mean_s
+                del pcm
+        rows.append({
+            "file": os.path.basename(path),
+            "seconds": seconds,
+            "digests": digests,
+            "timings": timings,
+            "identical": len(set(digests.values())) == 1,
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    backends = available_backends()
+    print(f"\n  Backends: {', '.join(backends)}")
+    if len(backends) < 2:
+        print("  ⚠ Only one backend installed; install numpy to compare\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rows = check_conformance(bundled_wavs() + synthetic_fixtures(tmp), backends)
+
+    header = "".join(f" {name + ' (x rt)':>16}" for name in backends)
+    print(f"\n  {'File':<34} {'Audio':>6}{header}  Output")
+    print("  " + "─" * (50 + 17 * len(backends)))
+    for row in rows:
+        cells = "".join(
+            f" {1000 * row['timings'][name]:>7.1f}ms {row['seconds'] / row['timings'][name]:>5.0f}x"
+            for name in backends
+        )
+        status = "✓ identical" if row["identical"] else "✗ MISMATCH " + str(row["digests"])
+        print(f"  {row['file']:<34} {row['seconds']:>5.1f}s{cells}  {status}")
+    print()
@@ -0,0 +1,59 @@
+"""Audio converter - Converts to 16000Hz (or a given rate) mono WAV
+One API over interchangeable sample backends (stdlib, numpy)
+"""
+import os
+import wave
+
+from vocalize_engine.backends import get_backend
+from vocalize_engine.wavfile import open_wav
+
+TARGET_RATE = 16000
+
+
+def is_passthrough(wav_in, target_rate):
+    """16-bit mono already at target_rate: the data chunk is the output as-is"""
+    return wav_in.rate == target_rate and wav_in.channels == 1 and wav_in.sample_width == 2 and not wav_in.is_float
+
+
+def convert_pcm(wav_in, backend=None, target_rate=TARGET_RATE):
+    """16-bit mono PCM bytes at target_rate from an open WavFile"""
+    if is_passthrough(wav_in, target_rate):
+        return bytes(wav_in.frames())
+    return get_backend(backend).convert(wav_in, target_rate)
+
+
+def convert_to_google_format(input_file, output_file=None, backend=None, target_rate=TARGET_RATE):
+    """
+    Convert audio to Google-compatible format (16000Hz mono WAV)
+
+    backend: "stdlib" or "numpy" (default: see backends.get_backend)
+    target_rate: output rate (see rates.choose_sample_rate for when to keep the native one)
+    """
+    if output_file is None:
+        base, ext = os.path.splitext(input_file)
+        output_file = f"{base}_converted{ext}"
+    
+    print(f"Loading: {input_file}")
+    
+    with open_wav(input_file) as wav_in:
+        print(f"   {wav_in.rate}Hz, channels={wav_in.channels}, frames={wav_in.n_frames}")
+        pcm = convert_pcm(wav_in, backend, target_rate)
+    
+    # Write output WAV file
+    with wave.open(output_file, 'wb') as wav_out:
+        wav_out.setnchannels(1)  # Mono
+        wav_out.setsampwidth(2)  # 16-bit
+        wav_out.setframerate(target_rate)
+        wav_out.writeframes(pcm)
+    
+    print(f"Saved: {output_file}\n")
+    return output_file
+
+
+if __name__ == "__main__":
+    import sys
+    
+    if len(sys.argv) > 1:
+        convert_to_google_format(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    else:
+        print("Usage: python -m vocalize_engine.convert input.wav [output.wav]")
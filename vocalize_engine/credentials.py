@@ -0,0 +1,440 @@
+"""Quota-aware dispatch of STT calls over several keys / projects
+
+One GOOGLE_API_KEY caps throughput at one project's quota, and once it is
+exhausted every request fails together. A CredentialPool holds several
+credentials (API keys, and service-account infos for the SDK paths) and
+sends each STT call to the least-loaded healthy one:
+
+- each credential has token buckets for its request rate and audio quota,
+  so calls are spread before Google starts refusing them;
+- a credential that answers 429 is shed for STT_KEY_SHED_SECONDS (doubling
+  while it keeps answering 429) and the call is retried on another one;
+- 5xx / connection failures go to the credential's own circuit breaker.
+
+Anywhere an api_key is accepted (recognize_content, recognize_planned,
+analyze_audio_with_api_key, ...) a pool can be passed instead; every
+single request (including each chunk of a split recording) is dispatched
+on its own. Credential objects implement the circuit-breaker interface, so
+the recognizers report to them exactly as they report to stt_breaker.
+
+Buckets are per process: limits are divided by WEB_CONCURRENCY so the
+workers together stay within each project's quota.
+
+    STT_CREDENTIALS        JSON list (or path to a JSON file) of credentials:
+                           [{"name": "proj-a", "api_key": "...",
+                             "requests_per_minute": 900, "audio_minutes_per_day": 480},
+                            {"name": "proj-b", "service_account_file": "sa.json"}]
+    STT_KEY_SHED_SECONDS   first cooldown of a key that answered 429 (60)
+    STT_QUEUE_WAIT         seconds a call may wait for a bucket to refill (5)
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from vocalize_engine import hedging
+from vocalize_engine.breaker import CLOSED, OPEN, CircuitBreaker
+
+SHED_SECONDS = float(os.getenv("STT_KEY_SHED_SECONDS", 60))
+MAX_SHED_SECONDS = 900.0
+QUEUE_WAIT = float(os.getenv("STT_QUEUE_WAIT", 5))
+BURST_FRACTION = 0.1          # share of a window's requests that may go out back to back
+DEFAULT_REQUESTS_PER_MINUTE = 900
+
+REST, SDK = "rest", "sdk"
+
+
+class TokenBucket:
+    """rate tokens per second up to capacity (thread-safe; clock injectable)"""
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, n=1.0):
+        """Take n tokens if they are there; returns whether it did"""
+        with self._lock:
+            self._refill()
+            if self.tokens < n:
+                return False
+            self.tokens -= n
+            return True
+
+    def wait_time(self, n=1.0):
+        """Seconds until n tokens are available (inf if never)"""
+        with self._lock:
+            self._refill()
+            missing = min(n, self.capacity) - self.tokens
+            if missing <= 0:
+                return 0.0
+            return missing / self.rate if self.rate > 0 else float("inf")
+
+    def level(self):
+        """Fill level, 0-1"""
+        with self._lock:
+            self._refill()
+            return self.tokens / self.capacity if self.capacity else 0.0
+
+
+class Credential:
+    """
+    One API key or service account, with its buckets, health and usage
+
+    Passed to the recognizers as their breaker: unavailable / success /
+    failure / record_status / record_timeout feed the usage counters, shed
+    the credential on 429 and otherwise go to its own CircuitBreaker.
+    """
+
+    def __init__(self, name, secret, requests=DEFAULT_REQUESTS_PER_MINUTE, window=60.0,
+                 audio_minutes_per_day=None, share=1, clock=time.monotonic):
+        self.name = name
+        self.secret = secret
+        self.kind = REST if isinstance(secret, str) else SDK
+        self.clock = clock
+        # At most `requests` in any `window` seconds: burst + rate * window <= requests.
+        # Hedged duplicates go out on the same key, so leave their share of the quota to them.
+        if hedging.HEDGE_DELAY.strip().lower() != "off":
+            requests *= 1 - hedging.HEDGE_MAX_RATE
+        burst = max(1.0, requests / share * BURST_FRACTION)
+        self.requests = TokenBucket((requests / share - burst) / window, burst, clock)
+        self.audio = None
+        if audio_minutes_per_day:
+            seconds = audio_minutes_per_day * 60 / share
+            self.audio = TokenBucket(seconds / 86400, seconds, clock)
+        self.breaker = CircuitBreaker(f"stt:{name}", clock=clock)
+        self._lock = threading.Lock()
+        self.shed_until = 0.0
+        self.shed_for = 0.0
+        self.in_flight = 0
+        self.usage = {"requests": 0, "successes": 0, "failures": 0, "throttled": 0, "sheds": 0,
+                      "audio_seconds": 0.0}
+
+    # Routing
+
+    def healthy(self):
+        """Not shed after a 429 and its breaker would let a call through (no side effects)"""
+        now = self.clock()
+        if now < self.shed_until:
+            return False
+        breaker = self.breaker
+        return breaker.state == CLOSED or (breaker.state == OPEN and now - breaker.opened_at >= breaker.cooldown)
+
+    def wait_time(self, audio_seconds=0.0):
+        wait = self.requests.wait_time()
+        if self.audio is not None and audio_seconds:
+            wait = max(wait, self.audio.wait_time(audio_seconds))
+        return wait
+
+    def take(self, audio_seconds=0.0):
+        if self.audio is not None and audio_seconds and self.audio.wait_time(audio_seconds) > 0:
+            return False
+        if not self.requests.take():
+            return False
+        if self.audio is not None and audio_seconds:
+            self.audio.take(min(audio_seconds, self.audio.capacity))
+        return True
+
+    def load(self):
+        """Sort key: fewest calls in flight, then the fullest request bucket"""
+        return self.in_flight, -self.requests.level()
+
+    @contextmanager
+    def leased(self, audio_seconds=0.0):
+        with self._lock:
+            self.in_flight += 1
+            self.usage["requests"] += 1
+            self.usage["audio_seconds"] += audio_seconds
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def shed(self):
+        """Take this credential out of rotation; each 429 after a shed doubles the time"""
+        with self._lock:
+            now = self.clock()
+            if now < self.shed_until:
+                return  # calls that were already in flight when it was shed
+            self.shed_for = min(MAX_SHED_SECONDS, self.shed_for * 2 if self.shed_for else SHED_SECONDS)
+            self.shed_until = now + self.shed_for
+            self.usage["sheds"] += 1
+
+    # Breaker interface used by recognize_content & co.
+
+    def unavailable(self):
+        return self.breaker.unavailable()
+
+    def success(self):
+        with self._lock:
+            self.usage["successes"] += 1
+            self.shed_for = 0.0
+        self.breaker.success()
+
+    def failure(self, reason=None):
+        with self._lock:
+            self.usage["failures"] += 1
+        self.breaker.failure(reason)
+
+    def record_status(self, status_code):
+        if status_code == 429:
+            # Over this project's quota: the others may still have room
+            with self._lock:
+                self.usage["throttled"] += 1
+            self.shed()
+            return True
+        if status_code >= 500 or status_code in (401, 403):
+            self.failure(f"HTTP {status_code}")
+            return True
+        self.success()
+        return False
+
+    def record_timeout(self, budget):
+        if self.breaker.record_timeout(budget):
+            with self._lock:
+                self.usage["failures"] += 1
+            return True
+        return False
+
+    def snapshot(self):
+        now = self.clock()
+        with self._lock:
+            usage = dict(self.usage, audio_seconds=round(self.usage["audio_seconds"], 1))
+            shed = max(0.0, self.shed_until - now)
+            in_flight = self.in_flight
+        state = "shed" if shed else self.breaker.state
+        out = {"kind": self.kind, "state": state, "in_flight": in_flight,
+               "requests_available": round(self.requests.level() * self.requests.capacity, 1), **usage}
+        if shed:
+            out["shed_for"] = round(shed, 1)
+        if self.audio is not None:
+            out["audio_seconds_available"] = round(self.audio.level() * self.audio.capacity)
+        return out
+
+
+class CredentialPool:
+    """Credentials that STT calls are spread over; see call()"""
+
+    def __init__(self, credentials, queue_wait=QUEUE_WAIT, clock=time.monotonic, sleep=time.sleep):
+        if not credentials:
+            raise ValueError("A credential pool needs at least one credential")
+        self.credentials = list(credentials)
+        self.queue_wait = queue_wait
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.rejected = 0
+
+    def __len__(self):
+        return len(self.credentials)
+
+    def acquire(self, kind=REST, audio_seconds=0.0, exclude=(), deadline=None):
+        """
+        Least-loaded healthy credential of kind with tokens left (tokens taken)
+        Waits up to queue_wait (and the deadline) for a bucket to refill.
+        Returns (credential, None), or (None, unavailable result).
+        """
+        usable = [c for c in self.credentials
+                  if c.name not in exclude and (kind == SDK or c.kind == REST)]
+        give_up = self.clock() + self.queue_wait
+        if deadline is not None:
+            give_up = min(give_up, deadline)
+        waited = False
+        while True:
+            healthy = [c for c in usable if c.healthy()]
+            if not healthy:
+                return None, self._unavailable(usable, "shed or failing")
+            with self._lock:
+                for credential in sorted(healthy, key=Credential.load):
+                    if credential.take(audio_seconds):
+                        if waited:
+                            self.waits += 1
+                        return credential, None
+            wait = min(c.wait_time(audio_seconds) for c in healthy)
+            if self.clock() + wait > give_up:
+                return None, self._unavailable(usable, "over quota", wait)
+            # Other callers may take the refill first; then wait again
+            self.sleep(wait)
+            waited = True
+
+    def _unavailable(self, usable, why, retry_after=None):
+        with self._lock:
+            self.rejected += 1
+        if retry_after is None or retry_after == float("inf"):
+            now = self.clock()
+            retry_after = min((max(c.shed_until - now, c.breaker.retry_after()) for c in usable), default=0.0)
+        return {"error": f"STT unavailable (all {len(usable)} credentials {why})", "stt_unavailable": True,
+                "retry_after": round(retry_after, 1)}
+
+    def call(self, fn, kind=REST, audio_seconds=0.0, deadline=None):
+        """
+        fn(credential) on the least-loaded healthy credential
+
+        fn passes credential.secret as its key and the credential as its
+        breaker. A call that gets the credential shed (429) is retried on
+        another one, until every credential has been tried.
+        """
+        tried = set()
+        result = None
+        while True:
+            credential, unavailable = self.acquire(kind, audio_seconds, tried, deadline)
+            if credential is None:
+                return result or unavailable   # the last 429 once every credential was tried
+            with credential.leased(audio_seconds):
+                result = fn(credential)
+            tried.add(credential.name)
+            if not (result.get("stt_unavailable") and not credential.healthy()):
+                return result
+            if deadline is not None and deadline <= self.clock():
+                return result
+
+    def snapshot(self):
+        with self._lock:
+            totals = {"waits": self.waits, "rejected": self.rejected}
+        return {**totals, "credentials": {c.name: c.snapshot() for c in self.credentials}}
+
+
+def audio_seconds(audio_content, encoding="LINEAR16", sample_rate_hertz=16000):
+    """Audio length of a request body for the quota buckets (estimated for compressed audio)"""
+    if encoding == "LINEAR16":
+        return max(0, len(audio_content) - 44) / 2 / (sample_rate_hertz or 16000)
+    if encoding == "FLAC":
+        return len(audio_content) / ((sample_rate_hertz or 16000) * 2 * 0.6)
+    return len(audio_content) * 8 / 32000   # Opus voice at ~32 kbps
+
+
+def load_pool(spec=None, share=None, clock=time.monotonic):
+    """
+    CredentialPool from STT_CREDENTIALS (a JSON list, or the path of a JSON file)
+    Returns None when it is unset.
+    """
+    spec = spec if spec is not None else os.getenv("STT_CREDENTIALS")
+    if not spec:
+        return None
+    if not spec.lstrip().startswith("["):
+        with open(spec) as f:
+            spec = f.read()
+    share = share or max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+    credentials = []
+    for i, entry in enumerate(json.loads(spec)):
+        if "api_key" in entry:
+            secret = entry["api_key"]
+        elif "service_account_file" in entry:
+            with open(entry["service_account_file"]) as f:
+                secret = json.load(f)
+        elif "service_account" in entry:
+            secret = entry["service_account"]
+        else:
+            raise ValueError(f"STT_CREDENTIALS[{i}] needs api_key, service_account or service_account_file")
+        credentials.append(Credential(
+            entry.get("name", f"credential{i}"), secret,
+            requests=entry.get("requests_per_minute", DEFAULT_REQUESTS_PER_MINUTE),
+            audio_minutes_per_day=entry.get("audio_minutes_per_day"), share=share, clock=clock))
+    return CredentialPool(credentials, clock=clock)
+
+
+# One key vs a pool against local stub projects with quotas: python -m vocalize_engine.credentials
+# (tests: tests/test_credentials.py)
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlparse
+
+    from vocalize_engine import stt
+    # The classes stt checks api_key against (not this __main__ module's copies)
+    from vocalize_engine.credentials import Credential, CredentialPool  # noqa: F811
+
+    QUOTA_PER_SECOND = 20      # per project; over it the stub answers 429
+    LATENCY = 0.05
+    REQUESTS = 400
+    CONCURRENCY = 16
+    revoked = {"proj-c"}       # answers 429 to everything (exhausted daily quota)
+
+    class Projects(BaseHTTPRequestHandler):
+        """Speech stand-in with a per-key sliding one-second quota"""
+        seen = {}
+        lock = threading.Lock()
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            key = parse_qs(urlparse(self.path).query)["key"][0]
+            now = time.monotonic()
+            with self.lock:
+                recent = [t for t in self.seen.get(key, []) if now - t < 1.0]
+                allowed = key not in revoked and len(recent) < QUOTA_PER_SECOND
+                if allowed:
+                    recent.append(now)
+                self.seen[key] = recent
+            time.sleep(LATENCY)
+            if allowed:
+                status, body = 200, {"results": [{"alternatives": [{"transcript": "hello", "words": [
+                    {"word": "hello", "startTime": "0.1s", "endTime": "0.5s"}]}]}]}
+            else:
+                status, body = 429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}}
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Projects)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stt.STT_BASE_URL = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    audio = b"\0" * 3244
+
+    def run(key):
+        Projects.seen = {}
+        time.sleep(1.0)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(CONCURRENCY) as pool:
+            results = list(pool.map(lambda _: stt.recognize_content(audio, key, breaker=CircuitBreaker(
+                "bench", failure_threshold=10 ** 9)) if isinstance(key, str) else stt.recognize_content(audio, key),
+                range(REQUESTS)))
+        seconds = time.perf_counter() - started
+        return seconds, sum("error" not in r for r in results)
+
+    def pool_of(names):
+        # The stub counts its quota per second instead of Google's per minute
+        return CredentialPool([Credential(name, name, requests=QUOTA_PER_SECOND, window=1.0) for name in names])
+
+    print(f"\n  Stub projects: {QUOTA_PER_SECOND} requests/s each (429 beyond), {1000 * LATENCY:.0f}ms latency; "
+          f"proj-c over its daily quota")
+    print(f"  {REQUESTS} recognize calls, {CONCURRENCY} at a time")
+    print(f"\n  {'Credentials':<30} {'Succeeded':>10} {'Seconds':>8} {'Calls/s':>8}")
+    print("  " + "─" * 60)
+    single_s, single_ok = run("proj-a")
+    print(f"  {'proj-a alone (no pool)':<30} {single_ok:>6}/{REQUESTS} {single_s:>8.2f} {single_ok / single_s:>8.1f}")
+    pool = pool_of(["proj-a", "proj-b", "proj-c", "proj-d"])
+    pool_s, pool_ok = run(pool)
+    print(f"  {'pool: proj-a, b, c, d':<30} {pool_ok:>6}/{REQUESTS} {pool_s:>8.2f} {pool_ok / pool_s:>8.1f}")
+
+    print(f"\n  {'Credential':<10} {'State':<7} {'Requests':>9} {'OK':>5} {'429':>5} {'Sheds':>6}")
+    print("  " + "─" * 48)
+    stats = pool.snapshot()
+    for name, usage in stats["credentials"].items():
+        print(f"  {name:<10} {usage['state']:<7} {usage['requests']:>9} {usage['successes']:>5} "
+              f"{usage['throttled']:>5} {usage['sheds']:>6}")
+    print(f"  waited for a refill {stats['waits']} times, rejected {stats['rejected']}")
+
+    # Everything shed: unavailable (degraded path), with a retry_after
+    revoked.update({"proj-a", "proj-b", "proj-d"})
+    drained = pool_of(["proj-a", "proj-b"])
+    result = stt.recognize_content(audio, drained)
+    again = stt.recognize_content(audio, drained)
+    print(f"\n  All keys throttled: {result.get('error')}; next call: {again.get('error')} "
+          f"(retry after {again.get('retry_after')}s)\n")
+    server.shutdown()
@@ -0,0 +1,180 @@
+"""Compact encodings for analysis results
+
+Layouts:
+    json      the classic result (list of word dicts)
+    columnar  words as parallel arrays with integer-millisecond times:
+              {"word": [...], "startMs": [...], "endMs": [...]}
+    msgpack   columnar layout packed with msgpack (optional dependency)
+
+Google reports word offsets at millisecond resolution or coarser, so the
+millisecond integers are lossless and much smaller than floats.
+"""
+import json
+
+JSON = "json"
+COLUMNAR = "columnar"
+MSGPACK = "msgpack"
+
+MEDIA_TYPES = {
+    JSON: "application/json",
+    COLUMNAR: "application/vnd.vocalize.columnar+json",
+    MSGPACK: "application/msgpack",
+}
+
+# Accept header values -> layout, in the order the server prefers them
+ACCEPT_TYPES = [
+    ("application/msgpack", MSGPACK),
+    ("application/x-msgpack", MSGPACK),
+    ("application/vnd.vocalize.columnar+json", COLUMNAR),
+]
+
+# Short names clients may pass in fields=
+FIELD_ALIASES = {"metrics": "fluency_metrics"}
+
+# Kept whatever fields= asks for: a client must never mistake these results
+# for normal ones
+ALWAYS_KEPT = ("error", "details", "provisional", "degraded", "degraded_reason")
+
+
+def msgpack_available():
+    try:
+        import msgpack  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def negotiate_format(requested=None, accept=None):
+    """
+    Pick a layout from an explicit format= value or the Accept header
+
+    When msgpack is not installed, an explicit format=msgpack gets the
+    columnar JSON layout instead and an Accept preference gets plain json.
+    """
+    fmt = requested
+    if not fmt and accept:
+        for media_type, layout in ACCEPT_TYPES:
+            if media_type in accept:
+                fmt = layout
+                break
+    if fmt not in MEDIA_TYPES:
+        return JSON
+    if fmt == MSGPACK and not msgpack_available():
+        return COLUMNAR if requested == MSGPACK else JSON
+    return fmt
+
+
+def select_fields(result, fields):
+    """
+    Keep only the requested top-level keys ("metrics" = fluency_metrics)
+
+    fields: comma-separated string or list; errors and the provisional /
+    degraded flags are always kept.
+    """
+    if not fields:
+        return result
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    wanted = {FIELD_ALIASES.get(f.strip(), f.strip()) for f in fields if f.strip()}
+    wanted.update(ALWAYS_KEPT)
+    return {k: v for k, v in result.items() if k in wanted}
+
+
+def to_columnar(result):
+    """Replace the list of word dicts with parallel arrays (times in ms)"""
+    if isinstance(result.get("channels"), list):
+        # Per-speaker results (/analyze?channels=true): each channel has its own words
+        return {**result, "channels": [to_columnar(channel) for channel in result["channels"]]}
+    words = result.get("words")
+    if not isinstance(words, list):
+        return result
+    columnar = dict(result)
+    columnar["words"] = {
+        "word": [w["word"] for w in words],
+        "startMs": [round(float(w["startTime"]) * 1000) for w in words],
+        "endMs": [round(float(w["endTime"]) * 1000) for w in words],
+    }
+    # Recoverable from the arrays; don't ship it twice
+    columnar.pop("word_count", None)
+    return columnar
+
+
+def from_columnar(words):
+    """Word dicts from either layout (inverse of to_columnar's "words")"""
+    if isinstance(words, dict):
+        return [
+            {"word": word, "startTime": start / 1000, "endTime": end / 1000}
+            for word, start, end in zip(words["word"], words["startMs"], words["endMs"])
+        ]
+    return words
+
+
+def encode_result(result, fmt=JSON, fields=None):
+    """Serialize a result; returns (body_bytes, media_type)"""
+    result = select_fields(result, fields)
+    if fmt == JSON:
+        body = json.dumps(result, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    elif fmt == COLUMNAR:
+        body = json.dumps(to_columnar(result), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    elif fmt == MSGPACK:
+        import msgpack
+        body = msgpack.packb(to_columnar(result), use_bin_type=True)
+    else:
+        raise ValueError(f"Unknown result format: {fmt}")
+    return body, MEDIA_TYPES[fmt]
+
+
+def synthetic_result(minutes=10, wpm=140):
+    """A realistic /analyze result for an N-minute recording (for benchmarks)"""
+    import random
+
+    from vocalize_engine.fluency import analyze_fluency
+
+    rng = random.Random(7)
+    vocabulary = ["the", "market", "is", "growing", "um", "we", "believe", "customers",
+                  "really", "value", "so", "quality", "and", "performance", "basically"]
+    words = []
+    t = 0.2
+    for _ in range(int(minutes * wpm)):
+        t += rng.uniform(0.05, 0.3) if rng.random() > 0.03 else rng.uniform(0.9, 2.0)
+        end = t + rng.uniform(0.15, 0.45)
+        words.append({"word": rng.choice(vocabulary), "startTime": round(t, 1), "endTime": round(end, 1)})
+        t = end
+    return {
+        "transcript": " ".join(w["word"] for w in words),
+        "word_count": len(words),
+        "words": words,
+        "fluency_metrics": analyze_fluency(words),
+    }
+
+
+# Payload-size benchmark: python -m vocalize_engine.encoding
+if __name__ == "__main__":
+    import gzip
+
+    from vocalize_engine.bench import timeit
+
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+
+    result = synthetic_result()
+    baseline = len(json.dumps(result).encode("utf-8"))  # what FastAPI sends today
+    print(f"\n  10-minute result, {result['word_count']} words; current response {baseline / 1024:.1f} KiB")
+
+    layouts = [(JSON, None), (COLUMNAR, None), (JSON, "metrics")]
+    if msgpack_available():
+        layouts.insert(2, (MSGPACK, None))
+    else:
+        print("  (msgpack not installed; skipping)")
+
+    print(f"\n  {'Layout':<22} {'Raw':>10} {'gzip':>10} {'brotli':>10} {'Encode':>9}")
+    print("  " + "─" * 66)
+    for fmt, fields in layouts:
+        mean_s, _, (body, _) = timeit(lambda: encode_result(result, fmt, fields), runs=20)
+        gz = len(gzip.compress(body, 6))
+        br = f"{len(brotli.compress(body, quality=5)) / 1024:>8.1f}K" if brotli else f"{'-':>9}"
+        label = fmt + (f" fields={fields}" if fields else "")
+        print(f"  {label:<22} {len(body) / 1024:>8.1f}K {gz / 1024:>8.1f}K {br:>10} {1000 * mean_s:>7.2f}ms")
+    print()
@@ -0,0 +1,312 @@
+"""Regional Speech API endpoints, picked by measured latency
+
+Every REST call used to go to speech.googleapis.com. From a deploy in
+Europe or Asia that can mean a cross-continent round trip for each
+multi-megabyte upload, when a regional endpoint (eu-speech, us-speech) or
+another front end is closer. With STT_ENDPOINTS set, each worker probes
+every endpoint in the background and REST calls go to the fastest healthy
+one:
+
+- a probe is one small unauthenticated GET (any answer below 500 means the
+  front end is up); its latency feeds a moving average per endpoint;
+- the selection only moves when another endpoint is SWITCH_MARGIN faster,
+  so near-equal endpoints don't flap and connections stay warm;
+- a call that can't connect or gets a 5xx marks its endpoint down until
+  its next successful probe, so the following calls go elsewhere at once.
+
+Until the first probe round is in, calls go to the first endpoint listed.
+Long-running operations are polled on the endpoint that started them. The
+SDK paths (service accounts, streaming) keep the client library's endpoint.
+
+    STT_ENDPOINTS        comma-separated base URLs or regions ("global", "eu", "us");
+                         unset: STT_BASE_URL only, no probing
+    STT_PROBE_INTERVAL   seconds between probe rounds (30; 0 turns probing off)
+"""
+import os
+import threading
+import time
+
+REGIONS = {
+    "global": "https://speech.googleapis.com/v1",
+    "eu": "https://eu-speech.googleapis.com/v1",
+    "us": "https://us-speech.googleapis.com/v1",
+}
+
+PROBE_INTERVAL = float(os.getenv("STT_PROBE_INTERVAL", 30))
+PROBE_TIMEOUT = 3.0
+SMOOTHING = 0.3        # weight of the newest probe in the moving average
+SWITCH_MARGIN = 0.2    # another endpoint must be this much faster to take over
+
+
+class Endpoint:
+    """One base URL with its probe history"""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.latency = None        # smoothed probe latency (seconds)
+        self.last_latency = None
+        self.healthy = True        # until a probe or a call says otherwise
+        self.probed_at = None
+        self.probes = 0
+        self.probe_failures = 0
+        self.call_failures = 0
+        self.selected = 0          # calls sent here
+        self.last_failure = None
+
+    def record_probe(self, seconds, now):
+        self.probes += 1
+        self.probed_at = now
+        self.last_latency = seconds
+        self.latency = seconds if self.latency is None else SMOOTHING * seconds + (1 - SMOOTHING) * self.latency
+        self.healthy = True
+
+    def record_failure(self, reason, now=None, probe=False):
+        if probe:
+            self.probes += 1
+            self.probe_failures += 1
+            self.probed_at = now
+        else:
+            self.call_failures += 1
+        self.healthy = False
+        self.last_failure = reason
+
+    def snapshot(self, now):
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "latency_ms": round(1000 * self.latency, 1) if self.latency is not None else None,
+            "last_latency_ms": round(1000 * self.last_latency, 1) if self.last_latency is not None else None,
+            "probed_seconds_ago": round(now - self.probed_at, 1) if self.probed_at is not None else None,
+            "probes": self.probes,
+            "probe_failures": self.probe_failures,
+            "call_failures": self.call_failures,
+            "selected": self.selected,
+            "last_failure": self.last_failure,
+        }
+
+
+class EndpointSet:
+    """Endpoints of one API, the current pick and the background prober (thread-safe)"""
+
+    def __init__(self, urls, interval=PROBE_INTERVAL, clock=time.monotonic, session=None):
+        if not urls:
+            raise ValueError("No STT endpoints configured")
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.interval = interval
+        self.clock = clock
+        self.session = session
+        self.current = self.endpoints[0]
+        self.switches = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._prober_pid = None
+
+    def _find(self, url):
+        url = url.rstrip("/")
+        return next((e for e in self.endpoints if e.url == url), None)
+
+    def _best(self):
+        """Fastest healthy measured endpoint, keeping the current one unless beaten by SWITCH_MARGIN"""
+        measured = [e for e in self.endpoints if e.healthy and e.latency is not None]
+        if not measured:
+            healthy = [e for e in self.endpoints if e.healthy]
+            return self.current if self.current.healthy or not healthy else healthy[0]
+        fastest = min(measured, key=lambda e: e.latency)
+        keep = self.current in measured and self.current.latency <= fastest.latency * (1 + SWITCH_MARGIN)
+        return self.current if keep else fastest
+
+    def _select(self):
+        best = self._best()
+        if best is not self.current:
+            self.current = best
+            self.switches += 1
+
+    def choose(self):
+        """Base URL for the next call (starts this process's prober on first use)"""
+        self.start()
+        with self._lock:
+            self.current.selected += 1
+            return self.current.url
+
+    def failed(self, url, reason):
+        """A call to url could not connect or got a 5xx: avoid it until it probes well again"""
+        with self._lock:
+            endpoint = self._find(url)
+            if endpoint is None:
+                return
+            endpoint.record_failure(reason)
+            self._select()
+
+    def probe(self, endpoint):
+        """One probe GET; records its latency or failure"""
+        from vocalize_engine.workers import http_session
+
+        session = self.session or http_session()
+        started = self.clock()
+        try:
+            response = session.get(f"{endpoint.url}/operations", timeout=PROBE_TIMEOUT)
+            response.close()
+            failure = f"HTTP {response.status_code}" if response.status_code >= 500 else None
+        except Exception as e:  # noqa: BLE001 - any failure to answer is a failed probe
+            failure = type(e).__name__
+        elapsed = self.clock() - started
+        with self._lock:
+            if failure:
+                endpoint.record_failure(failure, self.clock(), probe=True)
+            else:
+                endpoint.record_probe(elapsed, self.clock())
+        return failure is None
+
+    def probe_all(self):
+        """Probe every endpoint once (side by side: a hung one doesn't delay the rest), then re-select"""
+        probes = [threading.Thread(target=self.probe, args=(endpoint,), daemon=True) for endpoint in self.endpoints]
+        for thread in probes:
+            thread.start()
+        for thread in probes:
+            thread.join()
+        with self._lock:
+            self._select()
+
+    def start(self):
+        """Run the prober in this process (again after a fork; threads don't survive it)"""
+        if self.interval <= 0 or len(self.endpoints) < 2 or self._prober_pid == os.getpid():
+            return
+        with self._lock:
+            if self._prober_pid == os.getpid():
+                return
+            self._prober_pid = os.getpid()
+        threading.Thread(target=self._run, name="stt-probe", daemon=True).start()
+
+    def _run(self):
+        pid = os.getpid()
+        while self._prober_pid == pid:
+            self.probe_all()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def stop(self):
+        self._prober_pid = None
+        self._wake.set()
+
+    def snapshot(self):
+        with self._lock:
+            now = self.clock()
+            return {
+                "selected": self.current.url,
+                "switches": self.switches,
+                "probe_interval": self.interval,
+                "endpoints": [e.snapshot(now) for e in self.endpoints],
+            }
+
+
+def parse_endpoints(spec):
+    """Base URLs from a comma-separated list of URLs and region names"""
+    urls = []
+    for item in (part.strip() for part in spec.split(",")):
+        if item:
+            urls.append(REGIONS.get(item.lower(), item))
+    return urls
+
+
+def load_endpoints(spec=None, interval=None):
+    """EndpointSet from STT_ENDPOINTS, or None when it isn't set"""
+    spec = os.getenv("STT_ENDPOINTS") if spec is None else spec
+    if not spec or not spec.strip():
+        return None
+    return EndpointSet(parse_endpoints(spec), PROBE_INTERVAL if interval is None else interval)
+
+
+# Endpoint selection against local stand-ins with injected round-trip delays
+# (tests: tests/test_endpoints.py):
+#   python -m vocalize_engine.endpoints
+if __name__ == "__main__":
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from vocalize_engine import stt
+    from vocalize_engine.breaker import CircuitBreaker
+    from vocalize_engine.endpoints import EndpointSet
+
+    DELAYS = {"far": 0.24, "near": 0.03, "mid": 0.09}   # per request, first listed = the old default
+    CALLS = 40
+    INTERVAL = 0.3
+    state = {name: {"down": False} for name in DELAYS}
+
+    def stand_in(name):
+        class StandIn(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def answer(self, status, body):
+                time.sleep(DELAYS[name])
+                if state[name]["down"]:
+                    status, body = 503, {"error": {"message": "The service is currently unavailable."}}
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self.answer(403, {"error": {"message": "Method doesn't allow unregistered callers"}})
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                self.answer(200, {"results": [{"alternatives": [{"transcript": name, "words": [
+                    {"word": name, "startTime": "0.1s", "endTime": "0.5s"}]}]}]})
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    servers, urls = {}, {}
+    for name in DELAYS:
+        servers[name], urls[name] = stand_in(name)
+    audio = b"\0" * 32000 * 5   # 5s of 16kHz LINEAR16
+
+    def run(calls=CALLS):
+        """Mean seconds per call, errors, and which stand-in answered each call"""
+        answered, errors = [], 0
+        started = time.perf_counter()
+        for _ in range(calls):
+            result = stt.recognize_content(audio, "key", breaker=CircuitBreaker("bench", failure_threshold=10 ** 9),
+                                           deadline=time.monotonic() + 10)
+            if "error" in result:
+                errors += 1
+            else:
+                answered.append(result["transcript"])
+        return (time.perf_counter() - started) / calls, errors, answered
+
+    print("\n  Stand-ins: " + ", ".join(f"{name} {1000 * delay:.0f}ms/request" for name, delay in DELAYS.items()))
+    print(f"\n  {'Routing':<34} {'Per call':>9} {'Errors':>7}  Answered by")
+    print("  " + "─" * 72)
+
+    def report(label, per_call, errors, answered):
+        counts = {name: answered.count(name) for name in DELAYS if answered.count(name)}
+        print(f"  {label:<34} {1000 * per_call:>7.0f}ms {errors:>7}  {counts}")
+
+    stt.STT_BASE_URL = urls["far"]
+    fixed = run()
+    report("fixed (first endpoint)", *fixed)
+
+    stt.stt_endpoints = EndpointSet([urls[name] for name in DELAYS], interval=INTERVAL)
+    stt.stt_endpoints.start()
+    time.sleep(max(DELAYS.values()) + 0.1)    # first probe round
+    report("probed", *run())
+
+    # The nearest endpoint starts failing: the first 5xx moves calls elsewhere
+    state["near"]["down"] = True
+    report("nearest down", *run())
+
+    # ... and recovers: the next probe rounds bring it back
+    state["near"]["down"] = False
+    time.sleep(3 * INTERVAL)
+    report("nearest recovered", *run())
+
+    snapshot = stt.stt_endpoints.snapshot()
+    stt.stt_endpoints.stop()
+    latencies = {name: e["latency_ms"] for name, e in zip(DELAYS, snapshot["endpoints"])}
+    print(f"\n  Probe latency: {latencies}, switches: {snapshot['switches']}\n")
+    for server in servers.values():
+        server.shutdown()
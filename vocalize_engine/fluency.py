@@ -0,0 +1,188 @@
+"""Fluency metrics from word timings
+Thresholds, fillers and the score rubric come from a scoring profile
+(vocalize_engine.profiles); the default reproduces the original rules.
+"""
+from vocalize_engine.profiles import FILLERS, LONG_PAUSE_GAP, PAUSE_GAP, get_profile  # noqa: F401
+
+# Preceding-gap classes used in annotation flags
+GAP_NONE = 0
+GAP_PAUSE = 1
+GAP_LONG = 2
+
+
+def analyze_fluency(words, annotate=False, profile=None, timeline=None, reference=None):
+    """
+    Compute fluency metrics from word timings (single pass over words)
+
+    profile: ScoringProfile or profile name (default "standard")
+    timeline: window length in seconds; adds a "timeline" block with the
+        same metrics per fixed window (see vocalize_engine.timeline)
+    reference: text the speaker was reading aloud; adds a "reading" block
+        with accuracy and a word-by-word alignment (see vocalize_engine.alignment)
+
+    annotate=True adds an "annotations" block for transcript highlighting:
+        flags:  one int per word; bit 0 = filler, bits 1-2 = gap class
+                before the word (0 none, 1 pause, 2 long pause)
+        pauses: [word_index, gap_start, gap_end] for every pause, where
+                word_index is the word that follows the pause
+    """
+    if not words:
+        return {"fluency_score": 0, "error": "No words"}
+    
+    profile = get_profile(profile)
+    normalize = profile.normalize
+    filler_words = profile.filler_words
+    phrases = profile.filler_phrases
+    pause_gap = profile.pause_gap
+    long_pause_gap = profile.long_pause_gap
+    
+    filler_count = 0
+    pause_count = 0
+    long_pauses = 0
+    # Per-word flags also feed the timeline's interval index and the alignment
+    flags = [] if annotate or timeline or reference else None
+    pauses = [] if annotate else None
+    # Multi-word fillers mark earlier words: keep the last few tokens and all marks
+    tokens = [] if phrases else None
+    marked = bytearray(len(words)) if phrases else None
+    
+    prev_end = None
+    for i, w in enumerate(words):
+        start = float(w['startTime'])
+        token = normalize(w['word'])
+        is_filler = token in filler_words
+        filler_count += is_filler
+        
+        # Gap (pause) before this word
+        gap_class = GAP_NONE
+        if prev_end is not None:
+            gap = start - prev_end
+            if gap > pause_gap:
+                pause_count += 1
+                gap_class = GAP_PAUSE
+            if gap > long_pause_gap:
+                long_pauses += 1
+                gap_class = GAP_LONG
+            if annotate and gap_class:
+                pauses.append([i, round(prev_end, 2), round(start, 2)])
+        
+        if flags is not None:
+            flags.append(is_filler | (gap_class << 1))
+        if phrases:
+            tokens.append(token)
+            marked[i] = is_filler
+            if len(tokens) > profile.max_phrase_len:
+                del tokens[0]
+            for phrase in phrases.get(token, ()):
+                first = i + 1 - len(phrase)
+                if first >= 0 and tuple(tokens[-len(phrase):]) == phrase:
+                    for j in range(first, i + 1):
+                        if not marked[j]:
+                            marked[j] = 1
+                            filler_count += 1
+                            if flags is not None:
+                                flags[j] |= 1
+                    break
+        prev_end = float(w['endTime'])
+
+    duration = prev_end - float(words[0]['startTime'])
+    metrics = summarize(len(words), duration, filler_count, pause_count, long_pauses, profile)
+    if timeline:
+        from vocalize_engine.timeline import FluencyIndex
+
+        metrics["timeline"] = FluencyIndex(words, flags, profile).series(timeline)
+    if reference:
+        from vocalize_engine.alignment import align_reading
+
+        metrics["reading"] = align_reading(words, reference, profile, fillers=[f & 1 for f in flags])
+    if annotate:
+        metrics["annotations"] = {"flags": flags, "pauses": pauses}
+    return metrics
+
+
+def summarize(word_count, duration, filler_count, pause_count, long_pauses, profile=None):
+    """The metrics dict from counts over a run of words (duration: first start to last end)"""
+    wpm = (word_count / duration) * 60 if duration > 0 else 0
+    return {
+        "wpm": round(wpm, 1),
+        "avg_word_time": round(duration / word_count, 2),
+        "filler_rate": round(filler_count / word_count, 2),
+        "pause_frequency": round(pause_count / word_count, 2),
+        "long_pauses": long_pauses,
+        "fluency_score": fluency_score(wpm, filler_count / word_count, long_pauses, profile)
+    }
+
+
+def fluency_score(wpm, filler_rate, long_pauses, profile=None):
+    """0-5 heuristic score shared by the transcript and acoustic analyzers"""
+    return get_profile(profile).score(wpm, filler_rate, long_pauses)
+
+
+# Demo with sample data (for testing without API call)
+if __name__ == "__main__":
+    import json
+    
+    def print_header(text):
+        print("\n" + "="*70)
+        print(f"  {text}")
+        print("="*70)
+    
+    def print_metrics_table(metrics):
+        """Print metrics in a clean table format"""
+        print("\n  📊 FLUENCY ANALYSIS RESULTS")
+        print("  " + "─"*66)
+        print(f"  │ {'Metric':<30} │ {'Value':<15} │ {'Status':<15} │")
+        print("  " + "─"*66)
+        
+        # WPM
+        wpm_status = "✓ Optimal" if 120 <= metrics['wpm'] <= 150 else "⚠ Review"
+        print(f"  │ {'Words Per Minute (WPM)':<30} │ {metrics['wpm']:<15.1f} │ {wpm_status:<15} │")
+        
+        # Filler rate
+        filler_status = "✓ Good" if metrics['filler_rate'] <= 0.10 else "⚠ High"
+        print(f"  │ {'Filler Word Rate':<30} │ {metrics['filler_rate']*100:<15.1f}% │ {filler_status:<15} │")
+        
+        # Long pauses
+        pause_status = "✓ Good" if metrics['long_pauses'] == 0 else "⚠ Review"
+        print(f"  │ {'Long Pauses (>1.5s)':<30} │ {metrics['long_pauses']:<15} │ {pause_status:<15} │")
+        
+        print("  " + "─"*66)
+        
+        # Overall score
+        score = metrics['fluency_score']
+        stars = "⭐" * int(score)
+        if score >= 4.5:
+            status = " EXCELLENT"
+        elif score >= 3.5:
+            status = " GOOD"
+        elif score >= 2.5:
+            status = "FAIR"
+        else:
+            status = " NEEDS WORK"
+        
+        print(f"\n  🎯 OVERALL FLUENCY SCORE: {score:.1f}/5.0 {stars}")
+        print(f"  Assessment: {status}\n")
+    
+    # Test with sample data (no API call)
+    print_header("DEMO: Testing with Sample Data")
+    
+    sample_words = [
+        {"word": "I", "startTime": 0.1, "endTime": 0.2},
+        {"word": "believe", "startTime": 0.3, "endTime": 0.6},
+        {"word": "the", "startTime": 0.7, "endTime": 0.9},
+        {"word": "market", "startTime": 1.0, "endTime": 1.4},
+        {"word": "is", "startTime": 1.5, "endTime": 1.6},
+        {"word": "growing", "startTime": 1.7, "endTime": 2.2}
+    ]
+    
+    sample_transcript = " ".join([w["word"] for w in sample_words])
+    print(f"\n  📝 Sample Transcript: \"{sample_transcript}\"")
+    print(f"  ⏱️  Duration: {sample_words[-1]['endTime']:.1f} seconds")
+    
+    metrics = analyze_fluency(sample_words)
+    print_metrics_table(metrics)
+    
+    print_header("Ready for Real Audio Analysis")
+    print("  ✓ Set API key: $env:GOOGLE_API_KEY=\"your-api-key\"")
+    print("  ✓ Run: python -m vocalize_engine.fluency")
+    print("  ✓ Or import: from vocalize_engine import analyze_audio_with_api_key\n")
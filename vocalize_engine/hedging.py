@@ -0,0 +1,249 @@
+"""Deadline-aware, hedged POSTs to the Speech API
+
+Every STT call gets a timeout derived from the request's deadline (an
+absolute time.monotonic() value passed down from the endpoint), so a hung
+connection can never hold a worker past it.
+
+When the first attempt has not answered after the hedge delay (by default
+the observed p95 latency), one duplicate is sent and whichever answers
+first wins. requests cannot abort a call in flight, so the loser is
+abandoned: its result is discarded and its connection released when it
+completes, at the latest at the shared deadline. Hedges are capped at
+HEDGE_MAX_RATE of requests so a slow backend is not hit with 2x load.
+
+    STT_HEDGE_DELAY      "p95" (default), any "pNN", seconds, or "off"
+    STT_HEDGE_MAX_RATE   fraction of requests that may be hedged (0.1)
+    STT_TIMEOUT          timeout when the caller has no deadline (60s)
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from vocalize_engine.workers import http_session, thread_pool
+
+HEDGE_DELAY = os.getenv("STT_HEDGE_DELAY", "p95")
+HEDGE_MAX_RATE = float(os.getenv("STT_HEDGE_MAX_RATE", 0.1))
+DEFAULT_TIMEOUT = float(os.getenv("STT_TIMEOUT", 60))
+CONNECT_TIMEOUT = 5.0
+
+MIN_SAMPLES = 20            # observed latencies needed before trusting pNN
+FALLBACK_HEDGE_DELAY = 3.0  # hedge delay until then
+MIN_HEDGE_DELAY = 0.05
+MIN_HEDGE_BUDGET = 0.1      # don't hedge with less than this left before the deadline
+WINDOW = 1000               # latencies / outcomes remembered
+
+
+class DeadlineExceeded(TimeoutError):
+    """No response before the caller's deadline"""
+
+
+class HedgeStats:
+    """Rolling latency window and hedge counters (thread-safe)"""
+
+    def __init__(self, window=WINDOW):
+        self._lock = threading.Lock()
+        self.latencies = deque(maxlen=window)   # first-attempt latencies
+        self.outcomes = deque(maxlen=window)    # (hedged, hedge_won) per request
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.deadline_exceeded = 0
+
+    def record_latency(self, seconds):
+        with self._lock:
+            self.latencies.append(seconds)
+
+    def record(self, hedged, hedge_won, deadline_exceeded=False):
+        with self._lock:
+            self.requests += 1
+            self.hedged += hedged
+            self.hedge_wins += hedge_won
+            self.deadline_exceeded += deadline_exceeded
+            self.outcomes.append((hedged, hedge_won))
+
+    def percentile(self, q):
+        with self._lock:
+            ranked = sorted(self.latencies)
+        if not ranked:
+            return None
+        return ranked[min(len(ranked) - 1, int(q / 100 * len(ranked)))]
+
+    def recent_hedge_rate(self):
+        with self._lock:
+            return sum(h for h, _ in self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def snapshot(self):
+        p50, p95, p99 = (self.percentile(q) for q in (50, 95, 99))
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_rate": round(self.hedged / self.requests, 3) if self.requests else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "deadline_exceeded": self.deadline_exceeded,
+            "latency_p50": round(p50, 3) if p50 is not None else None,
+            "latency_p95": round(p95, 3) if p95 is not None else None,
+            "latency_p99": round(p99, 3) if p99 is not None else None,
+            "hedge_delay": hedge_delay(self),
+        }
+
+
+stats = HedgeStats()
+
+
+def hedge_delay(tracker=None, setting=None):
+    """Seconds to wait before hedging, or None when hedging is off"""
+    tracker = tracker or stats
+    setting = (setting or HEDGE_DELAY).strip().lower()
+    if setting == "off":
+        return None
+    if setting.startswith("p"):
+        if len(tracker.latencies) < MIN_SAMPLES:
+            return FALLBACK_HEDGE_DELAY
+        return max(MIN_HEDGE_DELAY, round(tracker.percentile(float(setting[1:])), 3))
+    return max(MIN_HEDGE_DELAY, float(setting))
+
+
+def remaining(deadline):
+    """Seconds until deadline (DEFAULT_TIMEOUT when there is none)"""
+    return DEFAULT_TIMEOUT if deadline is None else deadline - time.monotonic()
+
+
+def post(url, deadline=None, hedge=None, tracker=None, **kwargs):
+    """
+    POST with a deadline and an optional hedge; returns the winning Response
+
+    hedge: delay setting overriding STT_HEDGE_DELAY ("off" disables).
+    Raises DeadlineExceeded, or the first attempt's exception if it fails
+    outright (errors are not hedged; only slowness is).
+    """
+    tracker = tracker or stats
+    left = remaining(deadline)
+    if left <= 0:
+        tracker.record(False, False, deadline_exceeded=True)
+        raise DeadlineExceeded("Deadline passed before the STT request was sent")
+    deadline = time.monotonic() + left
+    session = http_session()
+    pool = thread_pool()
+
+    def attempt():
+        return session.post(url, timeout=(CONNECT_TIMEOUT, max(0.001, remaining(deadline))), **kwargs)
+
+    started = time.monotonic()
+    primary = pool.submit(attempt)
+    primary.add_done_callback(lambda f: tracker.record_latency(time.monotonic() - started))
+
+    attempts = [primary]
+    delay = hedge_delay(tracker, hedge)
+    if delay is not None:
+        wait(attempts, timeout=min(delay, remaining(deadline)))
+        if (not primary.done() and remaining(deadline) > MIN_HEDGE_BUDGET
+                and tracker.recent_hedge_rate() < HEDGE_MAX_RATE):
+            attempts.append(pool.submit(attempt))
+
+    pending = set(attempts)
+    winner = failure = None
+    while pending and winner is None:
+        done, pending = wait(pending, timeout=max(0, remaining(deadline)), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None and future.result().status_code < 500:
+                winner = future
+                break
+            failure = failure or future
+
+    hedged = len(attempts) > 1
+    for future in attempts:
+        if future is not winner:
+            future.cancel()
+            future.add_done_callback(_release)
+
+    if winner is not None:
+        tracker.record(hedged, winner is not primary)
+        return winner.result()
+    if failure is not None and not pending:
+        tracker.record(hedged, False)
+        if failure.exception() is not None:
+            raise failure.exception()
+        return failure.result()  # 5xx from every attempt: let the caller report it
+    tracker.record(hedged, False, deadline_exceeded=True)
+    raise DeadlineExceeded(f"No STT response within {time.monotonic() - started:.1f}s deadline")
+
+
+def _release(future):
+    """Close an abandoned attempt's response once it finishes"""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+# Tail latency against a local stub with injected latency (tests: tests/test_hedging.py):
+#   python -m vocalize_engine.hedging
+if __name__ == "__main__":
+    import json
+    import random
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    SLOW_RATE = 0.04
+    rng = random.Random(11)
+    lock = threading.Lock()
+
+    def injected_latency():
+        with lock:
+            if rng.random() < SLOW_RATE:
+                return rng.uniform(1.0, 2.0)    # the occasional slow response
+            return rng.uniform(0.03, 0.08)
+
+    class Stub(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            time.sleep(30 if self.path.startswith("/hang") else injected_latency())
+            body = json.dumps({"results": []}).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # an abandoned attempt whose client already gave up
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Stub)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def run(setting, n=400, concurrency=8):
+        tracker = HedgeStats()
+        latencies = []
+
+        def one(_):
+            started = time.monotonic()
+            post(base + "/recognize", deadline=time.monotonic() + 10, hedge=setting, tracker=tracker, json={})
+            return time.monotonic() - started
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(concurrency) as clients:
+            latencies = sorted(clients.map(one, range(n)))
+        pick = lambda q: latencies[min(n - 1, int(q / 100 * n))]  # noqa: E731
+        return pick(50), pick(95), pick(99), latencies[-1], tracker.snapshot()
+
+    print(f"\n  Stub: {100 * SLOW_RATE:.0f}% of responses take 1-2s, the rest 30-80ms")
+    print(f"\n  {'Hedging':<10} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7} {'Hedge rate':>11} {'Hedge wins':>11}")
+    print("  " + "─" * 66)
+    for setting in ("off", "p95", "0.2"):
+        p50, p95, p99, worst, snap = run(setting)
+        print(f"  {setting:<10} {1000 * p50:>5.0f}ms {1000 * p95:>5.0f}ms {1000 * p99:>5.0f}ms {1000 * worst:>5.0f}ms "
+              f"{100 * snap['hedge_rate']:>10.1f}% {snap['hedge_wins']:>11}")
+
+    # A hung backend must not outlive the deadline
+    started = time.monotonic()
+    try:
+        post(base + "/hang", deadline=time.monotonic() + 0.5, hedge="off", tracker=HedgeStats(), json={})
+    except DeadlineExceeded:
+        pass
+    print(f"\n  Hung backend, 0.5s deadline: gave up after {time.monotonic() - started:.2f}s\n")
+    server.shutdown()
@@ -0,0 +1,347 @@
+"""Streaming WAV ingestion
+Validates the RIFF header from the first bytes of an upload, enforces size
+and duration limits as data arrives, and converts frames to 16000Hz (or the
+rate rates.choose_sample_rate picks) mono while the rest of the upload is
+still in flight.
+
+Output is byte-identical to convert_to_google_format on the complete file.
+UploadIngest sniffs the first bytes and routes compressed browser
+recordings (WebM/Ogg/FLAC/...) to a raw file for codecs.prepare_for_stt.
+inspect_upload applies the same checks to an upload saved unchanged, for
+callers that convert it themselves (streaming.recognize_streaming).
+"""
+import os
+import struct
+import wave
+
+from vocalize_engine.codecs import sniff_container
+from vocalize_engine.backends.stdlib import interpolate, mix_to_mono, normalize, pack_int16, to_int_samples
+from vocalize_engine.convert import TARGET_RATE
+from vocalize_engine.rates import choose_sample_rate
+from vocalize_engine.wavfile import open_wav, parse_fmt_chunk, view_samples
+
+MAX_HEADER_BYTES = 64 * 1024  # fmt + metadata chunks before "data"
+
+
+class IngestError(ValueError):
+    """Upload rejected; status_code is the HTTP status to answer with"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class StreamingConverter:
+    """
+    Incremental convert_to_google_format over raw data-chunk bytes
+
+    n_frames is the frame count declared in the header. When it is unknown
+    (streaming writers leave it at 0/0xFFFFFFFF) samples are buffered and
+    resampled in finish(). Non-16-bit input needs the global peak for
+    normalization, so its output is also held back until finish().
+    """
+
+    def __init__(self, fmt, n_frames=None, target_rate=TARGET_RATE):
+        self.fmt = fmt
+        self.frame_size = fmt.channels * fmt.sample_width
+        self.target_rate = target_rate
+        self.n_frames = n_frames
+        self.new_length = int(n_frames * target_rate / fmt.rate) if n_frames is not None else None
+        self.normalize = fmt.sample_width != 2
+        # 16-bit mono at the target rate: the input bytes are already the output
+        self.passthrough = (fmt.rate == target_rate and fmt.channels == 1
+                            and fmt.sample_width == 2 and not fmt.is_float)
+        self._pending = b''      # partial frame carried to the next feed
+        self._buffer = []        # mono samples not yet consumed by the resampler
+        self._offset = 0         # input index of self._buffer[0]
+        self._next_out = 0       # next output sample index
+        self._held = []          # output held back for normalization
+        self.frames_in = 0
+
+    def feed(self, raw):
+        """Consume data bytes; returns int16 PCM ready to write (may be b'')"""
+        raw = self._pending + bytes(raw)
+        usable = len(raw) - len(raw) % self.frame_size
+        self._pending = raw[usable:]
+        if not usable:
+            return b''
+        if self.passthrough:
+            self.frames_in += usable // self.frame_size
+            return raw[:usable]
+
+        samples = view_samples(raw[:usable], self.fmt.sample_width, self.fmt.is_float)
+        samples, _ = to_int_samples(samples, self.fmt.sample_width, self.fmt.is_float)
+        mono = mix_to_mono(samples, self.fmt.channels)
+        self.frames_in += len(mono)
+
+        if self.n_frames is None:
+            self._buffer.extend(mono)
+            return b''
+        return self._emit(self._resample(mono, final=False))
+
+    def finish(self):
+        """Flush everything; raises IngestError if the upload was truncated"""
+        if self.passthrough:
+            if self.n_frames is not None and self.frames_in < self.n_frames:
+                raise IngestError(
+                    f"Upload ended after {self.frames_in} of {self.n_frames} declared frames", 400
+                )
+            return b''
+        if self.n_frames is None:
+            self.n_frames = self.frames_in
+            self.new_length = int(self.n_frames * self.target_rate / self.fmt.rate)
+            mono, self._buffer = self._buffer, []
+        elif self.frames_in < self.n_frames:
+            raise IngestError(
+                f"Upload ended after {self.frames_in} of {self.n_frames} declared frames", 400
+            )
+        else:
+            mono = []
+        out = self._emit(self._resample(mono, final=True))
+        if self.normalize:
+            out = pack_int16(normalize(self._held))
+            self._held = []
+        return out
+
+    def _resample(self, mono, final):
+        if self.fmt.rate == self.target_rate:
+            return mono
+
+        self._buffer.extend(mono)
+        available = self._offset + len(self._buffer)
+        original_length, new_length = self.n_frames, self.new_length
+        out = []
+        i = self._next_out
+        while i < new_length:
+            pos = i * (original_length - 1) / (new_length - 1) if new_length > 1 else 0
+            idx = int(pos)
+            needed = idx + 2 if idx + 1 < original_length else idx + 1
+            if needed > available and not final:
+                break
+            out.append(interpolate(self._buffer, i, original_length, new_length, self._offset))
+            i += 1
+        self._next_out = i
+
+        # Drop input that no future output sample can reference
+        if i < new_length:
+            keep_from = int(i * (original_length - 1) / (new_length - 1)) if new_length > 1 else 0
+            keep_from = min(keep_from, available)
+            drop = keep_from - self._offset
+            if drop > 0:
+                del self._buffer[:drop]
+                self._offset = keep_from
+        else:
+            self._buffer = []
+        return out
+
+    def _emit(self, samples):
+        if self.normalize:
+            self._held.extend(samples)
+            return b''
+        return pack_int16(samples)
+
+
+class WavIngest:
+    """
+    Feed upload bytes as they arrive; writes the converted WAV to output_file
+
+    Raises IngestError as soon as the header proves the input is not an
+    acceptable WAV, or a size/duration limit is exceeded.
+    target_rate=None picks the output rate from the header with
+    rates.choose_sample_rate; the summary reports it as "target_rate".
+    """
+
+    def __init__(self, output_file, max_bytes=None, max_seconds=None, target_rate=TARGET_RATE):
+        self.output_file = output_file
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.target_rate = target_rate
+        self.bytes_received = 0
+        self.fmt = None
+        self.converter = None
+        self._header = b''
+        self._data_remaining = None  # None while the data size is unknown
+        self._writer = None
+
+    def feed(self, chunk):
+        self.bytes_received += len(chunk)
+        if self.max_bytes and self.bytes_received > self.max_bytes:
+            raise IngestError(f"Upload exceeds {self.max_bytes} bytes", 413)
+
+        if self.converter is None:
+            self._header += bytes(chunk)
+            chunk = self._parse_header()
+            if chunk is None:
+                return
+
+        if self._data_remaining is not None:
+            chunk = chunk[:self._data_remaining]  # ignore trailing chunks (LIST etc.)
+            self._data_remaining -= len(chunk)
+        elif self.max_seconds:
+            frames = (self.converter.frames_in * self.converter.frame_size + len(chunk)) // self.converter.frame_size
+            if frames / self.fmt.rate > self.max_seconds:
+                raise IngestError(f"Recording longer than {self.max_seconds}s", 413)
+        self._writer.writeframesraw(self.converter.feed(chunk))
+
+    def finish(self):
+        """Complete the conversion; returns a summary of the input"""
+        if self.converter is None:
+            raise IngestError("Upload ended before the WAV header was complete", 400)
+        self._writer.writeframes(self.converter.finish())
+        self._writer.close()
+        self._writer = None
+        return {
+            "sample_rate": self.fmt.rate,
+            "channels": self.fmt.channels,
+            "sample_width": self.fmt.sample_width,
+            "frames": self.converter.frames_in,
+            "duration": round(self.converter.frames_in / self.fmt.rate, 2),
+            "bytes": self.bytes_received,
+            "target_rate": self.target_rate,
+        }
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _parse_header(self):
+        """Returns the data bytes that followed the header, or None if more is needed"""
+        buf = self._header
+        if len(buf) >= 12 and (buf[0:4] != b'RIFF' or buf[8:12] != b'WAVE'):
+            raise IngestError("Not a WAV file (RIFF header missing)", 415)
+
+        pos = 12
+        while pos + 8 <= len(buf):
+            chunk_id = buf[pos:pos + 4]
+            chunk_size, = struct.unpack_from('<I', buf, pos + 4)
+            body = pos + 8
+            if chunk_id == b'data':
+                if self.fmt is None:
+                    raise IngestError("data chunk before fmt chunk", 400)
+                self._start(chunk_size)
+                self._header = b''
+                return buf[body:]
+            if body + chunk_size > len(buf):
+                break
+            if chunk_id == b'fmt ':
+                try:
+                    self.fmt = parse_fmt_chunk(buf, body, chunk_size)
+                except (ValueError, struct.error) as e:
+                    raise IngestError(str(e), 415)
+            pos = body + chunk_size + (chunk_size & 1)
+
+        if len(buf) > MAX_HEADER_BYTES:
+            raise IngestError("WAV header too large or data chunk missing", 400)
+        return None
+
+    def _start(self, data_size):
+        frame_size = self.fmt.channels * self.fmt.sample_width
+        n_frames = None
+        if 0 < data_size < 0xFFFFFFFF:
+            n_frames = data_size // frame_size
+            self._data_remaining = n_frames * frame_size
+            if self.max_seconds and n_frames / self.fmt.rate > self.max_seconds:
+                raise IngestError(f"Recording longer than {self.max_seconds}s", 413)
+        if self.target_rate is None:
+            # The streaming converter is the stdlib code path, so weigh its cost
+            self.target_rate, _ = choose_sample_rate(self.fmt.rate, self.fmt.channels, self.fmt.sample_width,
+                                                     self.fmt.is_float, backend="stdlib")
+        self.converter = StreamingConverter(self.fmt, n_frames, self.target_rate)
+        self._writer = wave.open(self.output_file, 'wb')
+        self._writer.setnchannels(1)
+        self._writer.setsampwidth(2)
+        self._writer.setframerate(self.target_rate)
+
+
+class UploadIngest:
+    """
+    WavIngest for WAV uploads; other recognized containers are streamed
+    unchanged to raw_file (size limit only, duration is unknown until decode)
+
+    finish() adds "container" to the summary; when it is not "wav" the
+    caller still has to run codecs.prepare_for_stt on raw_file.
+    """
+
+    def __init__(self, output_file, raw_file, max_bytes=None, max_seconds=None, target_rate=TARGET_RATE):
+        self.output_file = output_file
+        self.raw_file = raw_file
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.target_rate = target_rate
+        self.container = None
+        self.bytes_received = 0
+        self._head = b''
+        self._target = None  # WavIngest, or the open raw file
+
+    def feed(self, chunk):
+        if self._target is None:
+            self._head += bytes(chunk)
+            if len(self._head) < 12:
+                return
+            chunk, self._head = self._head, b''
+            self._route(chunk)
+        self._forward(chunk)
+
+    def finish(self):
+        if self._target is None:
+            if not self._head:
+                raise IngestError("Empty upload", 400)
+            self._route(self._head)
+            self._forward(self._head)
+        if self.container == "wav":
+            summary = self._target.finish()
+        else:
+            self._target.close()
+            summary = {"bytes": self.bytes_received}
+        summary["container"] = self.container
+        return summary
+
+    def abort(self):
+        if self.container == "wav":
+            self._target.abort()
+        elif self._target is not None:
+            self._target.close()
+
+    def _forward(self, chunk):
+        if self.container == "wav":
+            self._target.feed(chunk)
+            return
+        self.bytes_received += len(chunk)
+        if self.max_bytes and self.bytes_received > self.max_bytes:
+            raise IngestError(f"Upload exceeds {self.max_bytes} bytes", 413)
+        self._target.write(chunk)
+
+    def _route(self, head):
+        self.container = sniff_container(head)
+        if self.container == "wav":
+            self._target = WavIngest(self.output_file, self.max_bytes, self.max_seconds, self.target_rate)
+        elif self.container is not None:
+            self._target = open(self.raw_file, 'wb')
+        else:
+            raise IngestError("Unsupported audio format (unrecognized file header)", 415)
+
+
+def inspect_upload(path, max_seconds=None):
+    """
+    UploadIngest's checks on an upload saved as-is; returns its summary
+
+    "container" and "bytes", plus the WAV format and "duration" for WAV.
+    Raises IngestError like the streaming ingesters.
+    """
+    with open(path, 'rb') as f:
+        container = sniff_container(f.read(16))
+    if container is None:
+        raise IngestError("Unsupported audio format (unrecognized file header)", 415)
+    summary = {"container": container, "bytes": os.path.getsize(path)}
+    if container != "wav":
+        return summary
+    try:
+        with open_wav(path) as wav_in:
+            summary.update(sample_rate=wav_in.rate, channels=wav_in.channels, sample_width=wav_in.sample_width,
+                           frames=wav_in.n_frames, duration=round(wav_in.duration, 2))
+    except (ValueError, struct.error) as e:
+        raise IngestError(str(e), 415)
+    if max_seconds and summary["frames"] / summary["sample_rate"] > max_seconds:
+        raise IngestError(f"Recording longer than {max_seconds}s", 413)
+    return summary
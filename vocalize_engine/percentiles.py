@@ -0,0 +1,333 @@
+"""Population percentile ranks from mergeable quantile sketches
+
+"Your WPM is in the 70th percentile" without scanning history: every
+analysis adds its metrics to a KLL sketch per (cohort, language, metric).
+An update is amortized O(1), a rank query reads a few hundred stored
+items, and two sketches merge into one that answers for both populations,
+which is what lets every worker (or every host) keep its own.
+
+Each web worker buffers what it observed in a delta and, every
+FLUSH_EVERY analyses or FLUSH_SECONDS, folds the delta into the shared
+PERCENTILES_FILE under a file lock. Ranks are answered from the last
+merged file plus the local delta. Files from other hosts merge with
+`python -m vocalize_engine.percentiles merge a.json b.json > merged.json`.
+
+    PERCENTILES_FILE   shared sketch file ("" keeps sketches in memory only)
+"""
+import fcntl
+import json
+import math
+import os
+import random
+import threading
+import time
+from bisect import bisect_left, bisect_right
+
+PERCENTILES_FILE = os.getenv("PERCENTILES_FILE", "/tmp/vocalize_percentiles.json")
+
+METRICS = ("wpm", "avg_word_time", "filler_rate", "pause_frequency", "long_pauses", "fluency_score")
+DEFAULT_COHORT = "all"
+MIN_POPULATION = 20     # fewer analyses than this: no rank yet
+FLUSH_EVERY = 50
+FLUSH_SECONDS = 30.0
+SKETCH_K = 200          # KLL accuracy parameter (~1-2 percentile points of rank error)
+MAX_COHORTS = 100       # cohort names come from clients; later ones only count toward "all"
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch over floats (Karnin, Lang, Liberty 2016)
+
+    Level h holds items that each stand for 2^h observations. When a level
+    outgrows its capacity it is sorted and every other item (random offset)
+    is promoted, so memory stays O(k) however many values are added.
+    """
+
+    def __init__(self, k=SKETCH_K, rng=None):
+        self.k = k
+        self.n = 0
+        self.levels = [[]]
+        self._rng = rng or random.Random()
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, math.ceil(self.k * (2 / 3) ** depth))
+
+    def _size(self):
+        return sum(len(items) for items in self.levels)
+
+    def add(self, value):
+        self.levels[0].append(float(value))
+        self.n += 1
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def _compress(self):
+        """One bottom-up pass: every level at capacity promotes half its items"""
+        for h in range(len(self.levels)):
+            items = self.levels[h]
+            if len(items) < self._capacity(h):
+                continue
+            if h + 1 == len(self.levels):
+                self.levels.append([])
+            items.sort()
+            # With an odd count one item stays behind, so no weight is lost
+            self.levels[h] = [items.pop()] if len(items) % 2 else []
+            self.levels[h + 1].extend(items[self._rng.getrandbits(1)::2])
+
+    def merge(self, other):
+        """Fold another sketch into this one (both populations)"""
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for h, items in enumerate(other.levels):
+            self.levels[h].extend(items)
+        self.n += other.n
+        self._compress()
+        return self
+
+    def rank(self, value):
+        """Fraction of observations below value (ties count half), 0..1"""
+        if not self.n:
+            return None
+        below = 0
+        total = 0
+        for h, items in enumerate(self.levels):
+            if not items:
+                continue
+            items.sort()
+            weight = 1 << h
+            lo, hi = bisect_left(items, value), bisect_right(items, value)
+            below += weight * (lo + (hi - lo) / 2)
+            total += weight * len(items)
+        return below / total
+
+    def quantile(self, q):
+        """Approximate value at fraction q of the population"""
+        weighted = sorted((value, 1 << h) for h, items in enumerate(self.levels) for value in items)
+        if not weighted:
+            return None
+        total = sum(w for _, w in weighted)
+        running = 0
+        for value, weight in weighted:
+            running += weight
+            if running >= q * total:
+                return value
+        return weighted[-1][0]
+
+    def to_dict(self):
+        return {"k": self.k, "n": self.n, "levels": self.levels}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data.get("k", SKETCH_K))
+        sketch.n = data["n"]
+        sketch.levels = [list(items) for items in data["levels"]] or [[]]
+        return sketch
+
+
+def sketch_key(cohort, language, metric):
+    return f"{cohort or DEFAULT_COHORT}|{language or 'auto'}|{metric}"
+
+
+def merge_sketches(*tables):
+    """{key: KLLSketch} tables merged into a new one"""
+    merged = {}
+    for table in tables:
+        for key, sketch in table.items():
+            if key in merged:
+                merged[key].merge(KLLSketch.from_dict(sketch.to_dict()))
+            else:
+                merged[key] = KLLSketch.from_dict(sketch.to_dict())
+    return merged
+
+
+def load_table(path):
+    """{key: KLLSketch} from a sketch file (empty if missing or unreadable)"""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return {key: KLLSketch.from_dict(value) for key, value in data.get("sketches", {}).items()}
+
+
+def dump_table(table):
+    return {"updated_at": time.time(), "sketches": {key: sketch.to_dict() for key, sketch in table.items()}}
+
+
+class Population:
+    """
+    This process's view of the population sketches
+
+    observe() only touches the in-memory delta; flush() merges it into
+    path under an exclusive lock (fcntl) and re-reads the merged result,
+    which is what ranks() compares against.
+    """
+
+    def __init__(self, path=PERCENTILES_FILE, flush_every=FLUSH_EVERY, flush_seconds=FLUSH_SECONDS):
+        self.path = path or None
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._merged = load_table(self.path) if self.path else {}
+        self._delta = {}
+        self._cohorts = {key.split("|")[0] for key in self._merged}
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+
+    def observe(self, metrics, cohort=None, language=None):
+        """Add one analysis's fluency_metrics (to its cohort and to "all")"""
+        with self._lock:
+            if cohort and cohort not in self._cohorts and len(self._cohorts) >= MAX_COHORTS:
+                cohort = None
+            cohorts = {DEFAULT_COHORT, cohort or DEFAULT_COHORT}
+            self._cohorts.update(cohorts)
+            for metric in METRICS:
+                value = metrics.get(metric)
+                if isinstance(value, (int, float)):
+                    for name in cohorts:
+                        key = sketch_key(name, language, metric)
+                        sketch = self._delta.get(key)
+                        if sketch is None:
+                            sketch = self._delta[key] = KLLSketch()
+                        sketch.add(value)
+            self._pending += 1
+            due = self.path and (self._pending >= self.flush_every
+                                 or time.monotonic() - self._flushed_at >= self.flush_seconds)
+        if due:
+            self.flush()
+
+    def _sketch(self, key):
+        merged, delta = self._merged.get(key), self._delta.get(key)
+        if merged and delta:
+            return merge_sketches({key: merged}, {key: delta})[key]
+        return merged or delta
+
+    def ranks(self, metrics, cohort=None, language=None):
+        """
+        {"cohort", "population", <metric>: percentile 0-100, ...}
+        A metric's rank is None until its population has MIN_POPULATION
+        analyses. Ranks are "percent of analyses below yours": higher is
+        more, not better (a high filler_rate rank means more fillers).
+        """
+        cohort = cohort or DEFAULT_COHORT
+        out = {"cohort": cohort, "population": 0}
+        with self._lock:
+            for metric in METRICS:
+                if not isinstance(metrics.get(metric), (int, float)):
+                    continue
+                sketch = self._sketch(sketch_key(cohort, language, metric))
+                population = sketch.n if sketch else 0
+                out["population"] = max(out["population"], population)
+                out[metric] = (round(100 * sketch.rank(metrics[metric]), 1)
+                               if population >= MIN_POPULATION else None)
+        return out
+
+    def summary(self, cohort=None, language=None, quantiles=(0.1, 0.25, 0.5, 0.75, 0.9)):
+        """Approximate quantiles of every metric in a cohort"""
+        cohort = cohort or DEFAULT_COHORT
+        out = {"cohort": cohort, "language": language or "auto", "metrics": {}}
+        with self._lock:
+            for metric in METRICS:
+                sketch = self._sketch(sketch_key(cohort, language, metric))
+                if sketch:
+                    out["metrics"][metric] = {"population": sketch.n,
+                                              **{f"p{round(100 * q)}": sketch.quantile(q) for q in quantiles}}
+        return out
+
+    def cohorts(self):
+        with self._lock:
+            return sorted(self._cohorts)
+
+    def flush(self):
+        """Fold the delta into the shared file and reload the merged population"""
+        if not self.path:
+            return
+        with self._lock:
+            delta, self._delta = self._delta, {}
+            self._pending = 0
+            self._flushed_at = time.monotonic()
+        try:
+            with open(f"{self.path}.lock", "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                merged = merge_sketches(load_table(self.path), delta)
+                tmp = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp, "w") as f:
+                    json.dump(dump_table(merged), f, separators=(",", ":"))
+                os.replace(tmp, self.path)
+        except OSError:
+            # Keep what was observed for the next attempt
+            with self._lock:
+                self._delta = merge_sketches(delta, self._delta)
+            return
+        with self._lock:
+            self._merged = merged
+            self._cohorts.update(key.split("|")[0] for key in merged)
+
+
+# Accuracy, update cost and merging vs exact ranks:
+# python -m vocalize_engine.percentiles [n]
+# Merge sketch files from several hosts:
+# python -m vocalize_engine.percentiles merge a.json b.json > merged.json
+# (tests: tests/test_percentiles.py)
+if __name__ == "__main__":
+    import sys
+    import tempfile
+
+    if len(sys.argv) > 1 and sys.argv[1] == "merge":
+        json.dump(dump_table(merge_sketches(*(load_table(path) for path in sys.argv[2:]))), sys.stdout)
+        sys.exit(0)
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = random.Random(5)
+    values = [max(0.0, rng.gauss(135, 25)) for _ in range(n)]
+    probes = [rng.gauss(135, 30) for _ in range(200)]
+
+    def exact_rank(sorted_values, x):
+        lo, hi = bisect_left(sorted_values, x), bisect_right(sorted_values, x)
+        return (lo + (hi - lo) / 2) / len(sorted_values)
+
+    started = time.perf_counter()
+    sketch = KLLSketch()
+    for value in values:
+        sketch.add(value)
+    add_s = time.perf_counter() - started
+
+    # Four "workers" see a quarter each, then merge
+    parts = [KLLSketch() for _ in range(4)]
+    for i, value in enumerate(values):
+        parts[i % 4].add(value)
+    merged = merge_sketches(*({"wpm": part} for part in parts))["wpm"]
+
+    exact = sorted(values)
+    started = time.perf_counter()
+    for x in probes:
+        sketch.rank(x)
+    rank_s = (time.perf_counter() - started) / len(probes)
+    started = time.perf_counter()
+    for x in probes[:20]:
+        exact_rank(sorted(values), x)
+    scan_s = (time.perf_counter() - started) / 20
+    error = max(abs(sketch.rank(x) - exact_rank(exact, x)) for x in probes)
+    merged_error = max(abs(merged.rank(x) - exact_rank(exact, x)) for x in probes)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sketches.json")
+        workers = [Population(path, flush_every=10 ** 9) for _ in range(3)]
+        for i, value in enumerate(values[:30_000]):
+            workers[i % 3].observe({"wpm": value})
+        for worker in workers:
+            worker.flush()
+        shared = Population(path)
+        file_kb = os.path.getsize(path) / 1024
+        shared_n = shared.summary()["metrics"]["wpm"]["population"]
+
+    print(f"\n  {n} observations, k={SKETCH_K}, {len(probes)} rank queries")
+    print("  " + "─" * 58)
+    print(f"  {'update':<34} {1e6 * add_s / n:>8.2f}µs / value")
+    print(f"  {'rank from the sketch':<34} {1e6 * rank_s:>8.1f}µs")
+    print(f"  {'rank by sorting all values':<34} {1e6 * scan_s:>8.1f}µs")
+    print(f"  {'items kept':<34} {sketch._size():>8}")
+    print(f"  {'max rank error (one sketch)':<34} {100 * error:>8.2f} points")
+    print(f"  {'max rank error (4 merged)':<34} {100 * merged_error:>8.2f} points")
+    print(f"  {'3 workers -> shared file':<34} {shared_n:>8} values, {file_kb:.1f}KB\n")
@@ -0,0 +1,404 @@
+"""Plan STT requests around the inline speech:recognize limits
+
+Synchronous recognize accepts at most ~60s of audio and ~10MB of request
+body (base64 inflates audio by 4/3). Instead of sending whatever arrives
+and getting a 400 back, the planner measures the audio first and picks:
+
+    single        fits both limits: one speech:recognize call
+    split         LINEAR16 over the limits: cut at quiet frames into <=55s
+                  chunks, recognize them in parallel, merge word timings
+    long_running  compressed audio (Opus/FLAC) too long for sync but small
+                  enough inline: speech:longrunningrecognize + polling
+    reject        nothing fits and no local decoder: fail before any request
+
+Every result carries {"plan": {...}} saying which plan ran and why.
+"""
+import math
+import operator
+import os
+import struct
+import tempfile
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import requests
+
+from vocalize_engine import hedging, stt
+from vocalize_engine.acoustic import read_pcm16
+from vocalize_engine.breaker import stt_breaker
+from vocalize_engine.credentials import CredentialPool, audio_seconds
+from vocalize_engine.sharedpcm import content, source_size
+from vocalize_engine.wavfile import open_wav
+from vocalize_engine.workers import http_session
+
+SYNC_MAX_SECONDS = 60.0
+INLINE_MAX_BYTES = 10 * 1000 * 1000  # whole JSON request body
+JSON_OVERHEAD = 2048                  # config + envelope around the base64
+CHUNK_SECONDS = 55.0                  # split target, leaves room to find a quiet cut
+CUT_SEARCH_SECONDS = 5.0              # look this far back from the target for silence
+CUT_FRAME_SECONDS = 0.02
+MAX_PARALLEL = 8
+
+LRO_POLL_START = 0.5
+LRO_POLL_MAX = 5.0
+LRO_TIMEOUT = 600.0
+
+# Opus at its lowest practical VBR rate (~6kbps); bounds WebM duration from size
+MIN_OPUS_BYTES_PER_SECOND = 750
+
+NO_RESULTS = "No transcription results returned"
+
+
+def payload_bytes(audio_bytes):
+    """Request body size for inline audio of this many bytes"""
+    return 4 * math.ceil(audio_bytes / 3) + JSON_OVERHEAD
+
+
+def audio_duration(path, encoding):
+    """
+    (seconds, exact) for the audio as it will be sent
+
+    Exact for WAV, FLAC (STREAMINFO) and Ogg Opus (last granule position);
+    WebM from MediaRecorder usually has no Duration element, so that falls
+    back to an upper bound from the file size.
+    """
+    if encoding == "LINEAR16":
+        with open_wav(path) as wav_in:
+            return wav_in.duration, True
+
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        head = f.read(4096)
+        if encoding == "OGG_OPUS":
+            f.seek(max(0, size - 65536))
+            tail = f.read()
+
+    if encoding == "FLAC" and len(head) >= 26:
+        packed, = struct.unpack('>Q', head[18:26])
+        rate, total = packed >> 44, packed & ((1 << 36) - 1)
+        if rate and total:
+            return total / rate, True
+    elif encoding == "OGG_OPUS":
+        page = tail.rfind(b'OggS')
+        head_pos = head.find(b'OpusHead')
+        if page >= 0 and len(tail) >= page + 14 and head_pos >= 0:
+            granule, = struct.unpack_from('<q', tail, page + 6)
+            pre_skip, = struct.unpack_from('<H', head, head_pos + 10)
+            return max(0, granule - pre_skip) / 48000, True
+    elif encoding == "WEBM_OPUS":
+        # Segment Info Duration (0x4489) in TimecodeScale units (default 1ms)
+        pos = head.find(b'\x44\x89')
+        if pos >= 0 and len(head) >= pos + 11:
+            if head[pos + 2] == 0x88:
+                return struct.unpack_from('>d', head, pos + 3)[0] / 1000, True
+            if head[pos + 2] == 0x84:
+                return struct.unpack_from('>f', head, pos + 3)[0] / 1000, True
+    return size / MIN_OPUS_BYTES_PER_SECOND, False
+
+
+def plan_recognition(path, encoding="LINEAR16", decoder=None):
+    """
+    Choose how to recognize path (no network)
+
+    decoder: name of the local decoder (codecs.decoder_available()), used
+    when compressed audio is too large to send inline.
+    """
+    duration, exact = audio_duration(path, encoding)
+    return plan_for(source_size(path), duration, exact, encoding, decoder)
+
+
+def plan_for(size, duration, exact=True, encoding="LINEAR16", decoder=None):
+    """plan_recognition from measurements: size in bytes of the audio as sent"""
+    payload = payload_bytes(size)
+    plan = {"duration": round(duration, 2), "duration_exact": exact, "bytes": size, "payload_bytes": payload}
+    fits_inline = payload <= INLINE_MAX_BYTES
+    too_long = duration > SYNC_MAX_SECONDS
+    over = []
+    if too_long:
+        over.append(f"{'~' if not exact else ''}{duration:.0f}s > {SYNC_MAX_SECONDS:.0f}s sync limit")
+    if not fits_inline:
+        over.append(f"{payload / 1e6:.1f}MB > {INLINE_MAX_BYTES / 1e6:.0f}MB inline limit")
+
+    if not over:
+        plan.update(plan="single", reason="within sync duration and inline size limits")
+    elif encoding == "LINEAR16":
+        chunks = math.ceil(duration / CHUNK_SECONDS)
+        plan.update(plan="split", chunks=chunks,
+                    reason=f"{' and '.join(over)}: {chunks} parallel chunks of <= {CHUNK_SECONDS:.0f}s")
+    elif fits_inline:
+        plan.update(plan="long_running", reason=f"{' and '.join(over)}; compressed audio fits inline")
+    elif decoder:
+        chunks = math.ceil(duration / CHUNK_SECONDS)
+        plan.update(plan="split", chunks=chunks, decode=True,
+                    reason=f"{' and '.join(over)}: decode with {decoder}, then split")
+    else:
+        plan.update(plan="reject", reason=f"{' and '.join(over)} and no local decoder to split it")
+    return plan
+
+
+def split_points(samples, rate, chunk_seconds=CHUNK_SECONDS):
+    """Sample offsets [0, ..., len]; each cut is the quietest frame before the chunk limit"""
+    chunk = int(chunk_seconds * rate)
+    search = int(CUT_SEARCH_SECONDS * rate)
+    frame = max(1, int(CUT_FRAME_SECONDS * rate))
+    mul = operator.mul
+    cuts = [0]
+    while len(samples) - cuts[-1] > chunk:
+        end = cuts[-1] + chunk
+        best, best_energy = end, None
+        for start in range(end - search, end - frame + 1, frame):
+            segment = samples[start:start + frame]
+            energy = sum(map(mul, segment, segment))
+            if best_energy is None or energy < best_energy:
+                best, best_energy = start + frame // 2, energy
+        cuts.append(best)
+    cuts.append(len(samples))
+    return cuts
+
+
+def wav_bytes(samples, rate):
+    """16-bit mono WAV file bytes for an array('h')"""
+    out = BytesIO()
+    with wave.open(out, 'wb') as wav_out:
+        wav_out.setnchannels(1)
+        wav_out.setsampwidth(2)
+        wav_out.setframerate(rate)
+        wav_out.writeframes(samples.tobytes())
+    return out.getvalue()
+
+
+def recognize_split(path, api_key, language_code="en-US", max_parallel=MAX_PARALLEL, deadline=None):
+    """Recognize a 16-bit mono WAV in parallel chunks; word times are shifted back"""
+    samples, rate = read_pcm16(path)
+    cuts = split_points(samples, rate)
+    chunks = [wav_bytes(samples[a:b], rate) for a, b in zip(cuts, cuts[1:])]
+
+    def recognize(chunk):
+        return stt.recognize_content(chunk, api_key, language_code, "LINEAR16", rate, deadline)
+
+    with ThreadPoolExecutor(max_workers=min(max_parallel, len(chunks))) as pool:
+        results = list(pool.map(recognize, chunks))
+
+    words = []
+    transcripts = []
+    for offset, result in zip(cuts, results):
+        if "error" in result:
+            if result["error"] == NO_RESULTS:
+                continue  # a silent chunk
+            return result
+        shift = offset / rate
+        transcripts.append(result["transcript"])
+        for w in result["words"]:
+            words.append({"word": w["word"],
+                          "startTime": round(w["startTime"] + shift, 3),
+                          "endTime": round(w["endTime"] + shift, 3)})
+    if not words:
+        return {"error": NO_RESULTS}
+    return {"transcript": " ".join(t for t in transcripts if t), "words": words, "word_count": len(words),
+            "chunks": [round(c / rate, 2) for c in cuts]}
+
+
+def recognize_long_running(audio_content, api_key, language_code="en-US", encoding="LINEAR16",
+                           sample_rate_hertz=16000, deadline=None, breaker=None):
+    """
+    speech:longrunningrecognize, then poll the operation with backoff
+    Not hedged: a duplicate would start a second billed operation.
+    Checked against and reported to the circuit breaker like recognize_content;
+    api_key may be a CredentialPool (polls use the key that started the operation).
+    """
+    if isinstance(api_key, CredentialPool):
+        return api_key.call(lambda credential: recognize_long_running(
+            audio_content, credential.secret, language_code, encoding, sample_rate_hertz, deadline,
+            breaker=credential), audio_seconds=audio_seconds(audio_content, encoding, sample_rate_hertz),
+            deadline=deadline)
+    breaker = breaker or stt_breaker
+    unavailable = breaker.unavailable()
+    if unavailable:
+        return unavailable
+    if deadline is None:
+        deadline = time.monotonic() + LRO_TIMEOUT
+    budget = deadline - time.monotonic()
+    timeout = lambda: (hedging.CONNECT_TIMEOUT, max(0.001, deadline - time.monotonic()))  # noqa: E731
+
+    base = stt.base_url()   # the operation is polled where it was started
+
+    def failed(message, response):
+        error = {"error": f"{message}: {response.status_code}", "details": response.text}
+        if breaker.record_status(response.status_code):
+            error["stt_unavailable"] = True
+        if response.status_code >= 500:
+            stt.endpoint_failed(base, f"HTTP {response.status_code}")
+        return error
+    try:
+        session = http_session()
+        response = session.post(f"{base}/speech:longrunningrecognize?key={api_key}",
+                                json=stt.request_body(audio_content, language_code, encoding, sample_rate_hertz),
+                                timeout=timeout())
+        if response.status_code != 200:
+            return failed("API request failed", response)
+        breaker.success()
+        name = response.json()["name"]
+
+        delay = LRO_POLL_START
+        while True:
+            response = session.get(f"{base}/operations/{name}?key={api_key}", timeout=timeout())
+            if response.status_code != 200:
+                return failed("Operation poll failed", response)
+            operation = response.json()
+            if operation.get("done"):
+                if "error" in operation:
+                    return {"error": f"Long-running recognition failed: {operation['error'].get('message', '')}"}
+                return stt.parse_results(operation.get("response", {}))
+            if time.monotonic() + delay > deadline:
+                return {"error": "STT deadline exceeded: long-running recognition still running",
+                        "deadline_exceeded": True, "operation": name}
+            time.sleep(delay)
+            delay = min(delay * 1.5, LRO_POLL_MAX)
+    except requests.Timeout:
+        breaker.record_timeout(budget)
+        return {"error": "STT deadline exceeded: long-running recognition", "deadline_exceeded": True}
+    except requests.RequestException as e:
+        breaker.failure(type(e).__name__)
+        stt.endpoint_failed(base, type(e).__name__)
+        return {"error": f"Speech recognition failed: {str(e)}", "stt_unavailable": True}
+    except Exception as e:
+        return {"error": f"Speech recognition failed: {str(e)}"}
+
+
+def recognize_planned(audio_file_path, api_key, language_code="en-US", encoding="LINEAR16",
+                      sample_rate_hertz=16000, deadline=None):
+    """
+    Plan, then run the matching recognizer; the result always includes "plan"
+    audio_file_path may also be a sharedpcm.SharedWav (converted WAV in shared memory).
+    """
+    from vocalize_engine.codecs import decode_to_wav, decoder_available
+
+    try:
+        plan = plan_recognition(audio_file_path, encoding,
+                                decoder_available() if encoding != "LINEAR16" else None)
+    except (OSError, ValueError) as e:
+        return {"error": f"Speech recognition failed: {str(e)}"}
+
+    if plan["plan"] == "reject":
+        result = {"error": f"Audio too large to recognize: {plan['reason']}"}
+    elif plan["plan"] == "split" and plan.get("decode"):
+        with tempfile.TemporaryDirectory() as tmp:
+            decoded = decode_to_wav(audio_file_path, os.path.join(tmp, "decoded.wav"))
+            result = recognize_split(decoded, api_key, language_code, deadline=deadline)
+    elif plan["plan"] == "split":
+        result = recognize_split(audio_file_path, api_key, language_code, deadline=deadline)
+    else:
+        with content(audio_file_path) as audio_content:
+            if plan["plan"] == "single":
+                result = stt.recognize_content(audio_content, api_key, language_code, encoding, sample_rate_hertz,
+                                               deadline)
+            else:
+                result = recognize_long_running(audio_content, api_key, language_code, encoding,
+                                                sample_rate_hertz, deadline)
+
+    if "error" not in result:
+        print(f"✅ Transcription complete: {result['word_count']} words detected ({plan['plan']})")
+    result["plan"] = plan
+    return result
+
+
+# Against a local stand-in of the API: python -m vocalize_engine.planner
+if __name__ == "__main__":
+    import base64
+    import json
+    import random
+    import threading
+    from array import array
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    LATENCY = 0.15          # per request
+    SECONDS_PER_MINUTE = 1.0  # processing time per minute of audio
+    operations = {}
+
+    def fake_results(seconds):
+        words, t = [], 0.3
+        while t + 0.3 < seconds:
+            words.append({"word": "word", "startTime": f"{t:.1f}s", "endTime": f"{t + 0.3:.1f}s"})
+            t += 0.4
+        return {"results": [{"alternatives": [{"transcript": " ".join(w["word"] for w in words),
+                                               "words": words}]}]} if words else {}
+
+    class StandIn(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def reply(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            length = int(self.headers["Content-Length"])
+            body = json.loads(self.rfile.read(length))
+            audio = base64.b64decode(body["audio"]["content"])
+            seconds = (len(audio) - 44) / 32000  # stand-in only handles 16kHz LINEAR16
+            time.sleep(LATENCY)
+            if "longrunning" in self.path:
+                name = str(len(operations) + 1)
+                operations[name] = (time.monotonic() + seconds / 60 * SECONDS_PER_MINUTE, seconds)
+                return self.reply(200, {"name": name})
+            if length > INLINE_MAX_BYTES:
+                return self.reply(400, {"error": {"message": "Request payload size exceeds the limit"}})
+            if seconds > SYNC_MAX_SECONDS:
+                return self.reply(400, {"error": {"message": "Sync input too long."}})
+            time.sleep(seconds / 60 * SECONDS_PER_MINUTE)
+            self.reply(200, fake_results(seconds))
+
+        def do_GET(self):
+            ready_at, seconds = operations[self.path.split("/")[-1].split("?")[0]]
+            if time.monotonic() < ready_at:
+                return self.reply(200, {"done": False})
+            self.reply(200, {"done": True, "response": fake_results(seconds)})
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stt.STT_BASE_URL = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    def speech_like(seconds, rate=16000):
+        """Noise bursts with short silences every ~2s, so cuts have somewhere to go"""
+        rng = random.Random(3)
+        samples = array('h', bytes(2 * int(seconds * rate)))
+        for i in range(0, len(samples), rate // 10):
+            if (i // (rate // 10)) % 20 < 17:
+                for j in range(i, min(i + rate // 10, len(samples)), 4):
+                    samples[j] = rng.randint(-8000, 8000)
+        return samples
+
+    print(f"\n  Stand-in: {LATENCY * 1000:.0f}ms/request + {SECONDS_PER_MINUTE:.1f}s per audio minute")
+    print(f"\n  {'Audio':>7} {'Naive single request':<28} {'Plan':<13} {'Planned':>9}  Reason")
+    print("  " + "─" * 100)
+    with tempfile.TemporaryDirectory() as tmp:
+        for seconds in (30, 150, 600):
+            path = os.path.join(tmp, f"{seconds}.wav")
+            with open(path, 'wb') as f:
+                f.write(wav_bytes(speech_like(seconds), 16000))
+            started = time.perf_counter()
+            naive = stt.recognize_speech_with_api_key(path, "key")
+            naive_s = time.perf_counter() - started
+            naive_cell = f"{naive_s:>5.2f}s " + ("ok" if "error" not in naive else naive["error"])
+            started = time.perf_counter()
+            result = recognize_planned(path, "key")
+            planned_s = time.perf_counter() - started
+            plan = result["plan"]
+            print(f"  {seconds:>6}s {naive_cell:<28} {plan['plan']:<13} {planned_s:>8.2f}s  {plan['reason']}")
+
+            if plan["plan"] == "split":
+                # The same audio through the long-running flow, for comparison
+                with open(path, 'rb') as f:
+                    content = f.read()
+                started = time.perf_counter()
+                lro = recognize_long_running(content, "key")
+                print(f"  {'':>7} {'':<28} {'(lro)':<13} {time.perf_counter() - started:>8.2f}s  "
+                      f"{lro['word_count']} words vs {result['word_count']} split")
+    server.shutdown()
+    print()
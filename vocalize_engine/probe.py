@@ -0,0 +1,172 @@
+"""Cheap pre-flight probe of an upload (no conversion, no STT call)
+
+Answers "what is this file and will /analyze take it?" in milliseconds:
+container/codec, duration, sample rate, channels, an estimated speech
+ratio from a strided energy scan, the STT plan /analyze would pick, its
+estimated cost and how long conversion should take (at the rate
+rates.choose_sample_rate would send).
+
+    STT_PRICE_PER_MINUTE    list price of recognition in USD (0.024)
+    STT_BILLING_INCREMENT   seconds each request is rounded up to (15)
+"""
+import math
+import os
+import time
+
+from vocalize_engine.acoustic import FRAME_SECONDS, speech_threshold
+from vocalize_engine.codecs import SNIFF_BYTES, decoder_available, probe_media
+from vocalize_engine.convert import TARGET_RATE
+from vocalize_engine.planner import CHUNK_SECONDS, audio_duration, plan_for
+from vocalize_engine.rates import choose_sample_rate, convert_cost
+from vocalize_engine.wavfile import open_wav
+
+PRICE_PER_MINUTE = float(os.getenv("STT_PRICE_PER_MINUTE", 0.024))
+BILLING_INCREMENT = float(os.getenv("STT_BILLING_INCREMENT", 15))
+
+SCAN_FRAMES = 2000          # 10ms frames looked at, spread evenly over the file
+SAMPLES_PER_FRAME = 40      # each frame is decimated to about this many samples
+MIN_SPEECH_RATIO = 0.05     # below this the file is probably silent
+DECODE_SPEED = 100.0        # local decode, x realtime (conservative for PyAV/ffmpeg)
+
+# Full-scale of each PCM width relative to int16, so dB levels are comparable
+SCALE_TO_INT16 = {1: 256.0, 2: 1.0, 3: 1 / 256, 4: 1 / 65536}
+
+
+def scan_speech_ratio(wav_in):
+    """Fraction of (sampled) 10ms frames above the speech threshold, first channel only"""
+    frame_len = max(1, int(wav_in.rate * FRAME_SECONDS))
+    n_frames = wav_in.n_frames // frame_len
+    if n_frames == 0:
+        return 0.0
+    frame_step = max(1, n_frames // SCAN_FRAMES)
+    stride = max(1, frame_len // SAMPLES_PER_FRAME) * wav_in.channels
+    scale = 32768.0 if wav_in.is_float else SCALE_TO_INT16[wav_in.sample_width]
+    center = 128 if wav_in.sample_width == 1 and not wav_in.is_float else 0
+
+    db = []
+    for i in range(0, n_frames, frame_step):
+        start = i * frame_len
+        picked = wav_in.samples(start, start + frame_len)[::stride]
+        power = sum((s - center) * (s - center) for s in picked) / max(1, len(picked))
+        db.append(10 * math.log10(power * scale * scale + 1.0))
+    threshold = speech_threshold(db)
+    return round(sum(1 for level in db if level > threshold) / len(db), 2)
+
+
+def billed_seconds(plan):
+    """Seconds Google bills for the plan (each request rounded up separately)"""
+    duration = plan["duration"]
+    if plan["plan"] == "split":
+        full, last = divmod(duration, CHUNK_SECONDS)
+        requests_ = [CHUNK_SECONDS] * int(full) + ([last] if last else [])
+    else:
+        requests_ = [duration]
+    return sum(math.ceil(seconds / BILLING_INCREMENT) * BILLING_INCREMENT for seconds in requests_)
+
+
+def probe_audio(path, max_bytes=None, max_seconds=None, total_bytes=None):
+    """
+    Describe an upload and predict what /analyze would do with it
+
+    total_bytes: real upload size when only a prefix of it was saved to path.
+    Returns {"accepted", "reasons", "warnings", "container", "codec",
+    "duration", "sample_rate_hertz", "channels", "speech_ratio", "plan",
+    "estimated_cost_usd", "estimated_conversion_seconds", "probe_ms"}.
+    """
+    started = time.perf_counter()
+    saved = os.path.getsize(path)
+    size = max(saved, total_bytes or 0)
+    with open(path, 'rb') as f:
+        info = probe_media(f.read(SNIFF_BYTES))
+    result = {"accepted": False, "reasons": [], "warnings": [], "container": info["container"],
+              "codec": info["codec"], "bytes": size, "duration": None, "duration_exact": False,
+              "sample_rate_hertz": info["sample_rate_hertz"], "channels": info["channels"],
+              "speech_ratio": None, "plan": None, "estimated_cost_usd": None,
+              "estimated_conversion_seconds": None}
+    reasons = result["reasons"]
+    decoder = decoder_available()
+
+    if max_bytes and size > max_bytes:
+        reasons.append(f"Upload exceeds {max_bytes} bytes")
+
+    native = info["stt_encoding"] is not None and info["container"] != "wav"
+    if info["container"] is None:
+        reasons.append("Unsupported audio format (unrecognized file header)")
+    elif info["container"] == "wav":
+        try:
+            with open_wav(path) as wav_in:
+                # A saved prefix only holds part of the data: extrapolate from the upload size
+                n_frames = wav_in.n_frames
+                if size > saved:
+                    n_frames = max(n_frames, (size - wav_in.data_offset) // wav_in.frame_size)
+                duration = n_frames / wav_in.rate
+                result.update(sample_rate_hertz=wav_in.rate, channels=wav_in.channels,
+                              sample_width=wav_in.sample_width, duration_exact=n_frames == wav_in.n_frames,
+                              speech_ratio=scan_speech_ratio(wav_in))
+                fmt = (wav_in.rate, wav_in.channels, wav_in.sample_width, wav_in.is_float)
+        except ValueError as e:
+            reasons.append(f"Invalid WAV: {e}")
+        else:
+            rate, channels, sample_width, is_float = fmt
+            # What /analyze's streaming converter would do with it
+            target_rate, _ = choose_sample_rate(*fmt, backend="stdlib")
+            result["duration"] = round(duration, 2)
+            result["stt_sample_rate_hertz"] = target_rate
+            passthrough = rate == target_rate and channels == 1 and sample_width == 2 and not is_float
+            result["estimated_conversion_seconds"] = 0.0 if passthrough else round(
+                duration * channels * convert_cost(rate, target_rate, "stdlib"), 3)
+            sent_bytes = int(duration * target_rate) * 2 + 44
+            result["plan"] = plan_for(sent_bytes, duration, True, "LINEAR16", decoder)
+    elif native or decoder:
+        encoding = info["stt_encoding"]
+        if encoding:
+            duration, exact = audio_duration(path, encoding)
+            result.update(duration=round(duration, 2), duration_exact=exact)
+        if native:
+            result["stt_sample_rate_hertz"] = info["sample_rate_hertz"]
+            result["estimated_conversion_seconds"] = 0.0
+            result["plan"] = plan_for(size, duration, exact, encoding, decoder)
+        else:
+            result["warnings"].append(f"{info['codec'] or info['container']} is decoded locally with {decoder}")
+            if encoding:
+                result["stt_sample_rate_hertz"] = TARGET_RATE
+                result["estimated_conversion_seconds"] = round(duration / DECODE_SPEED, 3)
+                result["plan"] = plan_for(int(duration * TARGET_RATE) * 2 + 44, duration, exact, "LINEAR16", decoder)
+    else:
+        reasons.append(f"{info['codec'] or info['container']} needs a local decoder (pip install av, or install ffmpeg)")
+
+    duration = result["duration"]
+    if max_seconds and duration is not None and duration > max_seconds:
+        reasons.append(f"Audio exceeds {max_seconds:.0f}s" if result["duration_exact"]
+                       else f"Audio may exceed {max_seconds:.0f}s")
+    plan = result["plan"]
+    if plan and plan["plan"] == "reject":
+        reasons.append(plan["reason"])
+    elif plan:
+        result["billed_seconds"] = billed_seconds(plan)
+        result["estimated_cost_usd"] = round(result["billed_seconds"] / 60 * PRICE_PER_MINUTE, 4)
+    if result["speech_ratio"] is not None and result["speech_ratio"] < MIN_SPEECH_RATIO:
+        result["warnings"].append("Little or no speech detected")
+
+    result["accepted"] = not reasons
+    result["probe_ms"] = round(1000 * (time.perf_counter() - started), 2)
+    return result
+
+
+# Probe time on the bundled recordings: python -m vocalize_engine.probe [file ...]
+if __name__ == "__main__":
+    import sys
+
+    from vocalize_engine.bench import bundled_wavs, timeit
+
+    print(f"\n  {'File':<36} {'Audio':>7} {'Probe':>8} {'Speech':>7} {'Plan':<8} {'Cost':>8} {'Convert':>8}")
+    print("  " + "─" * 90)
+    for path in sys.argv[1:] or bundled_wavs():
+        mean_s, _, result = timeit(lambda: probe_audio(path), runs=20)
+        cost = f"${result['estimated_cost_usd']:.4f}" if result["estimated_cost_usd"] is not None else "-"
+        convert_s = result["estimated_conversion_seconds"]
+        print(f"  {os.path.basename(path):<36} {result['duration'] or 0:>6.1f}s {1000 * mean_s:>6.1f}ms "
+              f"{result['speech_ratio'] if result['speech_ratio'] is not None else '-':>7} "
+              f"{(result['plan'] or {}).get('plan', '-'):<8} {cost:>8} "
+              f"{f'{1000 * convert_s:.0f}ms' if convert_s is not None else '-':>8}")
+    print()
@@ -0,0 +1,184 @@
+"""Named fluency scoring profiles
+Each profile bundles a filler vocabulary, a token normalizer, pause
+thresholds and the 0-5 score rubric. Profiles are compiled once at import
+(filler sets/phrase tables built, normalizer resolved) and then selected
+per request by name; "standard" reproduces the original hardcoded rules.
+
+Extra profiles can be loaded at startup from a JSON file named by
+$VOCALIZE_PROFILES_FILE: {"name": {...ScoringProfile keyword args...}}.
+Entries extend a base profile with "base": "<name>".
+"""
+import json
+import os
+import unicodedata
+
+FILLERS = {'um', 'uh', 'like', 'you know', 'basically', 'actually', 'so'}
+PAUSE_GAP = 0.8        # seconds of silence before a word that count as a pause
+LONG_PAUSE_GAP = 1.5   # ... and as a long pause
+
+DEFAULT_PROFILE = "standard"
+
+# Punctuation Google attaches to words with enableAutomaticPunctuation,
+# plus the Devanagari/Gurmukhi danda
+_STRIP = ".,!?;:\"'()[]…-–—।॥"
+
+
+def normalize_lower(token):
+    """Original behaviour: case-fold only ("so," is not "so")"""
+    return token.lower()
+
+
+def normalize_plain(token):
+    """Case-fold and strip attached punctuation"""
+    return token.lower().strip(_STRIP)
+
+
+def normalize_indic(token):
+    """NFC (Gurmukhi/Devanagari have several encodings of the same glyph), then plain"""
+    return normalize_plain(unicodedata.normalize("NFC", token))
+
+
+NORMALIZERS = {
+    "lower": normalize_lower,
+    "plain": normalize_plain,
+    "indic": normalize_indic,
+}
+
+
+class ScoringProfile:
+    """
+    Compiled scoring rules
+
+    fillers may contain multi-word phrases ("you know"); every word of a
+    matched phrase counts as a filler. Phrases are looked up by their last
+    token so matching stays a single pass over the words.
+    """
+
+    def __init__(self, name, fillers=(), normalizer="plain", pause_gap=PAUSE_GAP,
+                 long_pause_gap=LONG_PAUSE_GAP, wpm_range=(120, 150), max_filler_rate=0.10,
+                 wpm_penalty=1.0, filler_penalty=1.0, long_pause_penalty=0.5, max_score=5.0,
+                 description=""):
+        if normalizer not in NORMALIZERS:
+            raise ValueError(f"Unknown token normalizer: {normalizer}")
+        if not 0 < pause_gap <= long_pause_gap:
+            raise ValueError("Expected 0 < pause_gap <= long_pause_gap")
+        self.name = name
+        self.description = description
+        self.normalizer = normalizer
+        self.normalize = NORMALIZERS[normalizer]
+        self.pause_gap = float(pause_gap)
+        self.long_pause_gap = float(long_pause_gap)
+        self.wpm_range = (float(wpm_range[0]), float(wpm_range[1]))
+        self.max_filler_rate = float(max_filler_rate)
+        self.wpm_penalty = float(wpm_penalty)
+        self.filler_penalty = float(filler_penalty)
+        self.long_pause_penalty = float(long_pause_penalty)
+        self.max_score = float(max_score)
+
+        self.fillers = frozenset(self.normalize(f) for f in fillers)
+        words = set()
+        phrases = {}  # last token -> tuple of (token, ...) phrases ending with it
+        for filler in self.fillers:
+            tokens = tuple(filler.split())
+            if len(tokens) == 1:
+                words.add(tokens[0])
+            elif tokens:
+                phrases.setdefault(tokens[-1], []).append(tokens)
+        self.filler_words = frozenset(words)
+        self.filler_phrases = {last: tuple(sorted(group, key=len, reverse=True))
+                               for last, group in phrases.items()}
+        self.max_phrase_len = max((len(p) for group in phrases.values() for p in group), default=1)
+
+    def score(self, wpm, filler_rate, long_pauses):
+        """0-max_score heuristic score"""
+        score = self.max_score
+        low, high = self.wpm_range
+        if wpm < low or wpm > high:
+            score -= self.wpm_penalty
+        if filler_rate > self.max_filler_rate:
+            score -= self.filler_penalty
+        score -= (long_pauses * self.long_pause_penalty)
+        return max(0, round(score, 1))
+
+    def describe(self):
+        """JSON-friendly settings (what /profiles reports)"""
+        return {
+            "name": self.name,
+            "description": self.description,
+            "fillers": sorted(self.fillers),
+            "normalizer": self.normalizer,
+            "pause_gap": self.pause_gap,
+            "long_pause_gap": self.long_pause_gap,
+            "wpm_range": list(self.wpm_range),
+            "max_filler_rate": self.max_filler_rate,
+            "wpm_penalty": self.wpm_penalty,
+            "filler_penalty": self.filler_penalty,
+            "long_pause_penalty": self.long_pause_penalty,
+            "max_score": self.max_score,
+        }
+
+
+# Settings only; compiled into PROFILES below
+PROFILE_SETTINGS = {
+    "standard": {
+        "description": "Original rubric: 120-150 WPM, 0.8s/1.5s pauses",
+        # Words are single tokens and were only case-folded, so the
+        # "you know" entry never matched; keep exactly that behaviour
+        "fillers": {f for f in FILLERS if ' ' not in f},
+        "normalizer": "lower",
+    },
+    "esl": {
+        "description": "English learners: slower pace and longer thinking pauses are fine",
+        "fillers": FILLERS | {'er', 'erm', 'hmm', 'i mean'},
+        "pause_gap": 1.0,
+        "long_pause_gap": 2.0,
+        "wpm_range": (90, 150),
+        "max_filler_rate": 0.15,
+        "long_pause_penalty": 0.25,
+    },
+    "executive": {
+        "description": "Presentations: brisk pace, very few fillers",
+        "fillers": FILLERS | {'er', 'erm', 'right', 'okay', 'kind of', 'sort of', 'i mean'},
+        "pause_gap": 0.7,
+        "long_pause_gap": 1.2,
+        "wpm_range": (130, 160),
+        "max_filler_rate": 0.05,
+        "filler_penalty": 1.5,
+    },
+    "pa-hi": {
+        "description": "Punjabi/Hindi (and code-switched) speech",
+        "fillers": FILLERS | {
+            'matlab', 'haan', 'accha', 'acha', 'yaani', 'woh', 'toh', 'na',
+            'मतलब', 'हाँ', 'अच्छा', 'यानी', 'वो', 'तो',
+            'ਮਤਲਬ', 'ਹਾਂ', 'ਅੱਛਾ', 'ਜਿਵੇਂ', 'ਤਾਂ',
+        },
+        "normalizer": "indic",
+        "wpm_range": (100, 150),
+    },
+}
+
+
+def load_profiles(settings, extra_file=None):
+    """Compile {name: settings}, then merge overrides from extra_file (JSON)"""
+    settings = {name: dict(values) for name, values in settings.items()}
+    if extra_file:
+        with open(extra_file, encoding="utf-8") as f:
+            for name, values in json.load(f).items():
+                base = values.pop("base", None)
+                if base is not None and base not in settings:
+                    raise ValueError(f"Profile {name!r} extends unknown profile {base!r}")
+                settings[name] = {**settings.get(base or name, {}), **values}
+    return {name: ScoringProfile(name, **values) for name, values in settings.items()}
+
+
+PROFILES = load_profiles(PROFILE_SETTINGS, os.getenv("VOCALIZE_PROFILES_FILE"))
+
+
+def get_profile(profile=None):
+    """Resolve a profile by name (None -> standard); profiles pass through"""
+    if isinstance(profile, ScoringProfile):
+        return profile
+    name = profile or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown scoring profile: {name}")
+    return PROFILES[name]
@@ -0,0 +1,246 @@
+"""Opt-in per-request CPU and allocation profiles
+
+A profiled request runs each pipeline stage (decode, acoustic pass, STT +
+fluency) under cProfile and/or tracemalloc, in whichever process or thread
+the stage normally runs in, and saves one artifact per request to
+PROFILE_DIR: <id>.prof (merged pstats, open with `python -m pstats` or
+snakeviz) and <id>.json (stage timings, top functions, top allocation
+sites). The directory is shared by every gunicorn worker, so any worker can
+serve any artifact.
+
+Nothing here runs unless a request is selected: the backend checks a
+ContextVar that is None for unprofiled requests.
+
+    PROFILE_SAMPLE_RATE   fraction of requests profiled at random (0)
+    PROFILE_DIR           where artifacts are written (/tmp/vocalize_profiles)
+    PROFILE_KEEP          newest artifacts kept, older ones are deleted (50)
+"""
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager, nullcontext
+
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/vocalize_profiles")
+KEEP = int(os.getenv("PROFILE_KEEP", 50))
+
+KINDS = ("cpu", "alloc")
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 15
+
+_ID = re.compile(r"^[0-9a-f]{32}$")
+
+# The RequestProfile of the request being handled (None: not profiled)
+current = contextvars.ContextVar("vocalize_profile", default=None)
+
+# cProfile/tracemalloc are per-process tools; only one stage per process at a time
+_busy = threading.Lock()
+
+
+def requested_kinds(header=None, sample_rate=SAMPLE_RATE):
+    """
+    Kinds to capture for a request, or None
+    header is the X-Profile value ("cpu", "alloc", "cpu,alloc", "all"/"1");
+    without one the request is sampled at sample_rate with both kinds.
+    """
+    if header:
+        value = header.strip().lower()
+        if value in ("1", "all", "true"):
+            return KINDS
+        kinds = tuple(k for k in KINDS if k in {part.strip() for part in value.split(",")})
+        return kinds or None
+    if sample_rate > 0 and random.random() < sample_rate:
+        return KINDS
+    return None
+
+
+def run_profiled(kinds, stage, fn, *args, **kwargs):
+    """
+    fn(*args, **kwargs) under the requested profilers -> (result, record)
+    Module-level so it can be sent to the process pool; the record (plain
+    dicts and the raw pstats table) is pickled back to the web worker.
+    """
+    record = {"stage": stage, "pid": os.getpid()}
+    if not _busy.acquire(blocking=False):
+        # Another profiled stage owns this process's profilers (threaded STT calls)
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        record.update(wall=time.perf_counter() - started, skipped="profiler busy in this process")
+        return result, record
+
+    profiler = cProfile.Profile() if "cpu" in kinds else None
+    tracing = "alloc" in kinds and not tracemalloc.is_tracing()
+    try:
+        if tracing:
+            tracemalloc.start()
+        started = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            if profiler:
+                profiler.disable()
+            record["wall"] = time.perf_counter() - started
+            if tracing:
+                record["alloc"] = _allocations(tracemalloc.take_snapshot(), tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+    finally:
+        _busy.release()
+    if profiler:
+        profiler.create_stats()
+        record["cpu"] = profiler.stats
+    return result, record
+
+
+def _allocations(snapshot, peak):
+    snapshot = snapshot.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+    top = snapshot.statistics("lineno")
+    return {
+        "peak_kb": round(peak / 1024, 1),
+        "top": [{"where": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                 "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+                for stat in top[:TOP_ALLOCATIONS]],
+    }
+
+
+class _Table:
+    """Raw pstats table in the shape pstats.Stats loads from"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class RequestProfile:
+    """Stage records collected for one request, saved as a single artifact"""
+
+    def __init__(self, kinds, endpoint):
+        self.id = uuid.uuid4().hex
+        self.kinds = tuple(kinds)
+        self.endpoint = endpoint
+        self.created_at = time.time()
+        self.started = time.perf_counter()
+        self.stages = []
+
+    def add(self, record):
+        self.stages.append(record)
+
+    @contextmanager
+    def timed(self, stage):
+        """Wall time only, for stages that share the event loop with other requests"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append({"stage": stage, "pid": os.getpid(), "wall": time.perf_counter() - started,
+                                "skipped": "timed only (runs on the event loop)"})
+
+    def save(self, directory=PROFILE_DIR, status=None):
+        """Write <id>.json (and <id>.prof when CPU was captured); returns the summary"""
+        os.makedirs(directory, exist_ok=True)
+        tables = [_Table(record.pop("cpu")) for record in self.stages if "cpu" in record]
+        summary = {
+            "id": self.id,
+            "endpoint": self.endpoint,
+            "kinds": list(self.kinds),
+            "created_at": self.created_at,
+            "total": round(time.perf_counter() - self.started, 4),
+            "status": status,
+            "stages": [{**record, "wall": round(record["wall"], 4)} for record in self.stages],
+        }
+        if tables:
+            stats = pstats.Stats(*tables)
+            stats.dump_stats(os.path.join(directory, f"{self.id}.prof"))
+            out = io.StringIO()
+            stats.stream = out
+            stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+            summary["top_functions"] = out.getvalue()
+        with open(os.path.join(directory, f"{self.id}.json"), "w") as f:
+            json.dump(summary, f)
+        prune(directory)
+        return summary
+
+
+def stage(name):
+    """Context manager timing a stage of the current request (no-op when unprofiled)"""
+    profile = current.get()
+    return profile.timed(name) if profile is not None else nullcontext()
+
+
+def prune(directory=PROFILE_DIR, keep=KEEP):
+    """Delete all but the newest `keep` artifacts"""
+    summaries = sorted((entry for entry in os.scandir(directory) if entry.name.endswith(".json")),
+                       key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in summaries[keep:]:
+        for suffix in (".json", ".prof"):
+            try:
+                os.remove(os.path.join(directory, entry.name[:-5] + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(directory=PROFILE_DIR):
+    """Saved artifacts, newest first (without the top_functions text)"""
+    if not os.path.isdir(directory):
+        return []
+    items = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith(".json"):
+            summary = load(entry.name[:-5], directory)
+            if summary:
+                summary.pop("top_functions", None)
+                summary["stages"] = [{"stage": s["stage"], "wall": s["wall"]} for s in summary["stages"]]
+                items.append(summary)
+    return sorted(items, key=lambda item: item["created_at"], reverse=True)
+
+
+def load(profile_id, directory=PROFILE_DIR):
+    """One artifact's summary, or None"""
+    if not _ID.match(profile_id):
+        return None
+    try:
+        with open(os.path.join(directory, f"{profile_id}.json")) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def pstats_path(profile_id, directory=PROFILE_DIR):
+    """Path of an artifact's .prof file, or None"""
+    path = os.path.join(directory, f"{profile_id}.prof")
+    return path if _ID.match(profile_id) and os.path.exists(path) else None
+
+
+# Profile one bundled recording end to end: python -m vocalize_engine.profiling
+if __name__ == "__main__":
+    import tempfile
+
+    from vocalize_engine.acoustic import analyze_acoustic_fluency
+    from vocalize_engine.bench import bundled_wavs
+    from vocalize_engine.convert import convert_to_google_format
+
+    path = bundled_wavs()[0]
+    with tempfile.TemporaryDirectory() as directory, tempfile.NamedTemporaryFile(suffix=".wav") as out:
+        profile = RequestProfile(KINDS, "cli")
+        _, record = run_profiled(profile.kinds, "convert_to_google_format", convert_to_google_format, path, out.name)
+        profile.add(record)
+        _, record = run_profiled(profile.kinds, "analyze_acoustic_fluency", analyze_acoustic_fluency, out.name)
+        profile.add(record)
+        summary = profile.save(directory)
+        print(f"\n  {os.path.basename(path)}")
+        for record in summary["stages"]:
+            print(f"  {record['stage']:<28} {1000 * record['wall']:>8.1f}ms  "
+                  f"peak {record['alloc']['peak_kb']:>8.1f}KB")
+        print(summary["top_functions"])
@@ -0,0 +1,128 @@
+"""Sample-rate policy: which rate LINEAR16 audio is sent to STT at
+
+The Speech API accepts LINEAR16 at any rate from 8000 to 48000Hz, so a
+resample to 16000Hz is only needed outside that range. Inside it the
+choice is a trade: resampling costs CPU per input sample, sending the
+native rate costs upload bytes (base64'd) per extra sample. Both scale
+with duration, so the decision depends only on the input format:
+
+    native   rate <= 16000, or sending the extra bytes is cheaper than
+             the conversion pass (measured once per rate per process)
+    16000    outside the API's range, or resampling is cheaper
+
+    STT_SAMPLE_RATE_POLICY        auto (default), native, or 16000 (always resample)
+    STT_UPLINK_BYTES_PER_SECOND   upload bandwidth to the API (12.5e6, i.e. 100Mbit/s)
+"""
+import functools
+import os
+import tempfile
+import time
+import wave
+
+from vocalize_engine.backends import get_backend
+from vocalize_engine.convert import TARGET_RATE
+from vocalize_engine.wavfile import open_wav
+
+MIN_STT_RATE = 8000
+MAX_STT_RATE = 48000
+
+POLICY = os.getenv("STT_SAMPLE_RATE_POLICY", "auto")
+UPLINK_BYTES_PER_SECOND = float(os.getenv("STT_UPLINK_BYTES_PER_SECOND", 12.5e6))
+
+BASE64_INFLATION = 4 / 3
+CALIBRATION_SECONDS = 0.5
+
+
+@functools.lru_cache(maxsize=None)
+def convert_cost(rate, target_rate=TARGET_RATE, backend=None):
+    """Seconds of converter CPU per second of mono 16-bit audio (measured once per process)"""
+    with tempfile.NamedTemporaryFile(suffix=".wav") as tmp:
+        with wave.open(tmp.name, 'wb') as wav_out:
+            wav_out.setnchannels(1)
+            wav_out.setsampwidth(2)
+            wav_out.setframerate(rate)
+            wav_out.writeframes(b'\x01\x00\xff\xff' * int(rate * CALIBRATION_SECONDS / 2))
+        convert = get_backend(backend).convert
+        with open_wav(tmp.name) as wav_in:
+            convert(wav_in, target_rate)  # first call pays imports/allocation
+            started = time.perf_counter()
+            convert(wav_in, target_rate)
+            return (time.perf_counter() - started) / CALIBRATION_SECONDS
+
+
+def upload_seconds_per_byte(uplink=None):
+    """Time to push one more PCM byte to the API (base64 inflated)"""
+    return BASE64_INFLATION / (uplink or UPLINK_BYTES_PER_SECOND)
+
+
+def choose_sample_rate(rate, channels=1, sample_width=2, is_float=False, policy=None, backend=None, uplink=None):
+    """
+    (rate to send at, reason) for a WAV recorded at `rate`
+    policy: "auto", "native" or "16000" (default: $STT_SAMPLE_RATE_POLICY)
+    backend: converter backend whose cost is weighed (ingest always uses "stdlib")
+    """
+    policy = policy or POLICY
+    if not MIN_STT_RATE <= rate <= MAX_STT_RATE:
+        return TARGET_RATE, f"{rate}Hz is outside the API's {MIN_STT_RATE}-{MAX_STT_RATE}Hz range"
+    if rate == TARGET_RATE:
+        return rate, "already 16000Hz"
+    if policy == str(TARGET_RATE):
+        return TARGET_RATE, "policy: always 16000Hz"
+    if policy == "native":
+        return rate, "policy: native"
+    if rate < TARGET_RATE:
+        return rate, "below 16000Hz: resampling would only add bytes"
+
+    # Per second of audio: CPU of each conversion plus the upload of what it produces
+    passthrough = channels == 1 and sample_width == 2 and not is_float
+    cpu_native = 0.0 if passthrough else convert_cost(rate, rate, backend)
+    cpu_resampled = convert_cost(rate, TARGET_RATE, backend)
+    extra_upload = 2 * (rate - TARGET_RATE) * upload_seconds_per_byte(uplink)
+    if cpu_native + extra_upload <= cpu_resampled:
+        return rate, (f"native: {1000 * (cpu_native + extra_upload):.1f}ms per audio second "
+                      f"vs {1000 * cpu_resampled:.1f}ms to resample")
+    return TARGET_RATE, (f"resample: {1000 * cpu_resampled:.1f}ms per audio second "
+                         f"vs {1000 * (cpu_native + extra_upload):.1f}ms to send native")
+
+
+# Both trade-offs per input rate: python -m vocalize_engine.rates [seconds]
+if __name__ == "__main__":
+    import sys
+
+    from vocalize_engine.backends import available_backends
+    from vocalize_engine.bench import timeit
+    from vocalize_engine.conformance import write_wav
+    from vocalize_engine.convert import convert_to_google_format
+
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10.0
+    rates = (8000, 11025, 22050, 32000, 44100, 48000)
+    uplinks = (("10Mbit/s", 1.25e6), ("100Mbit/s", 12.5e6), ("1Gbit/s", 125e6))
+
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as devnull:
+        out = os.path.join(tmp, "out.wav")
+        for name in available_backends():
+            print(f"\n  Backend: {name} ({seconds:.0f}s mono 16-bit input; time = convert + upload)")
+            print(f"\n  {'Rate':>6} {'To 16k':>8} {'Native':>8} {'Bytes 16k':>10} {'Native':>8}  "
+                  + "  ".join(f"{label:>17}" for label, _ in uplinks))
+            print("  " + "─" * 104)
+            for rate in rates:
+                path = write_wav(os.path.join(tmp, f"{rate}.wav"),
+                                 [((i * 37) % 2000 - 1000,) for i in range(int(rate * seconds))], rate, 2)
+                stdout, sys.stdout = sys.stdout, devnull
+                resample_s, _, _ = timeit(lambda: convert_to_google_format(path, out, name), runs=3)
+                native_s, _, _ = timeit(lambda: convert_to_google_format(path, out, name, rate), runs=3)
+                sys.stdout = stdout
+                bytes_16k, bytes_native = 2 * TARGET_RATE * seconds, 2 * rate * seconds
+                cells = []
+                for _, uplink in uplinks:
+                    total_16k = resample_s + bytes_16k * upload_seconds_per_byte(uplink)
+                    total_native = native_s + bytes_native * upload_seconds_per_byte(uplink)
+                    chosen, _ = choose_sample_rate(rate, backend=name, policy="auto", uplink=uplink)
+                    picked = total_native if chosen == rate else total_16k
+                    # "!" marks a choice more than 10% slower than the better option
+                    flag = "!" if picked > 1.1 * min(total_16k, total_native) else " "
+                    cells.append(f"{'native' if chosen == rate else '16k':>6} {1000 * picked:>7.0f}ms{flag}")
+                print(f"  {rate:>6} {1000 * resample_s:>6.0f}ms {1000 * native_s:>6.0f}ms "
+                      f"{bytes_16k / 1e6:>8.2f}MB {bytes_native / 1e6:>6.2f}MB  " + "  ".join(cells))
+    print("\n  Uplink cells: the rate choose_sample_rate picks and its convert + upload time")
+    print("  (! = more than 10% slower than the other option)\n")
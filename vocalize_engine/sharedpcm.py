@@ -0,0 +1,516 @@
+"""Shared-memory audio handoff between web workers and the conversion processes
+
+Conversion runs in each web worker's process pool (workers.process_pool),
+and its output has to come back. Returning the PCM as bytes pickles it
+through the pool's pipe: serialized in the child, pushed through the pipe,
+rebuilt in the parent. A temp file costs a write and a read through the
+filesystem. Here the converter writes its output once into a
+multiprocessing.shared_memory segment. Only a SharedWav handle (segment
+name and size) is pickled across the process boundary; the other side
+maps the same pages.
+
+A segment holds a complete WAV image (44-byte header + 16-bit mono PCM),
+so a handle goes wherever a converted file does: open_wav maps it
+zero-copy, acoustic.read_pcm16 and the STT request paths (planner,
+recognize_speech_with_api_key) take it in place of a path, and save()
+writes it out when a real file is needed.
+
+Fresh segments are slow the first time they are touched: every 4KB page
+faults in, once in the writer and again in the reader. So a web worker
+lends segments from its own pool (lend), keeps them mapped, and takes them
+back for the next request; a pool job writes into the lent segment
+through its file descriptor (no mapping, no faults on Linux) and the web
+worker reads through its warm mapping.
+
+Ownership: segments from lend() go back to the pool when the block exits;
+a handle from convert_shared() without a lent segment must be release()d.
+Whatever a crashed worker leaves behind is unlinked by multiprocessing's
+resource tracker.
+
+    SHARED_PCM_KEEP_BYTES   idle segment bytes a web worker keeps for reuse (64MB)
+"""
+import mmap
+import os
+import struct
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+KEEP_BYTES = int(os.getenv("SHARED_PCM_KEEP_BYTES", 64 * 1024 * 1024))
+HEADER_BYTES = 44
+
+# POSIX shared memory is a tmpfs directory on Linux: segments can be written
+# with pwrite and mapped with MAP_POPULATE (one fault-in instead of one per page)
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+MAP_POPULATE = getattr(mmap, "MAP_POPULATE", 0)
+
+SharedWav = namedtuple("SharedWav", "name size")
+
+
+def wav_header(pcm_bytes, rate):
+    """Canonical 44-byte header of a 16-bit mono PCM WAV"""
+    return struct.pack('<4sI4s4sIHHIIHH4sI', b'RIFF', 36 + pcm_bytes, b'WAVE', b'fmt ', 16, 1, 1,
+                       rate, 2 * rate, 2, 16, b'data', pcm_bytes)
+
+
+class SegmentPool:
+    """This process's reusable segments, kept mapped so their pages stay warm (thread-safe)"""
+
+    def __init__(self, keep_bytes=KEEP_BYTES):
+        self.keep_bytes = keep_bytes
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.free = []      # SharedMemory objects, mapped
+        self.lent = {}      # name -> SharedMemory
+        self.grown = {}     # name -> mmap of a lent segment a writer extended past its mapping
+        self.created = 0
+        self.reused = 0
+
+    def _local(self):
+        if self._pid != os.getpid():
+            # Inherited over a fork: the parent's segments, not ours to reuse or unlink
+            self.free, self.lent, self.grown, self._pid = [], {}, {}, os.getpid()
+
+    def lend(self, size=1):
+        """Name of a segment of at least size bytes: the smallest idle one that fits, else a new one"""
+        with self._lock:
+            self._local()
+            fits = [segment for segment in self.free if segment.size >= size]
+            segment = min(fits, key=lambda s: s.size) if fits else None
+            if segment is not None:
+                self.free.remove(segment)
+                self.reused += 1
+        if segment is None:
+            segment = shared_memory.SharedMemory(create=True, size=max(1, size))
+            with self._lock:
+                self.created += 1
+        with self._lock:
+            self.lent[segment.name] = segment
+        return segment.name
+
+    def mapped(self, name, size):
+        """This process's mapping (a memoryview) of a lent segment, at least size bytes long; None if not ours"""
+        with self._lock:
+            self._local()
+            segment = self.lent.get(name)
+            if segment is None:
+                return None
+            if segment.size >= size:
+                return segment.buf
+            # The writer grew it (pwrite past the end, so SHM_DIR is set). Map the new length
+            # next to the pool's own SharedMemory: attaching a second one would register the
+            # name with the resource tracker again (Python < 3.13), and only the creator should
+            grown = self.grown.get(name)
+            if grown is None or len(grown) < size:
+                if grown is not None:
+                    _close_mapping(grown)
+                with open(os.path.join(SHM_DIR, name), 'rb') as f:
+                    grown = self.grown[name] = mmap.mmap(f.fileno(), 0, flags=mmap.MAP_SHARED | MAP_POPULATE,
+                                                         prot=mmap.PROT_READ)
+            return memoryview(grown)
+
+    def give_back(self, name):
+        """Return a lent segment (unlinked if the idle pool is full); False if name isn't ours"""
+        with self._lock:
+            self._local()
+            if any(segment.name == name for segment in self.free):
+                return True
+            segment = self.lent.pop(name, None)
+            if segment is None:
+                return False
+            grown = self.grown.pop(name, None)
+            # A grown segment is not kept: the pool's mapping no longer covers it
+            if grown is None and sum(s.size for s in self.free) + segment.size <= self.keep_bytes:
+                self.free.append(segment)
+                return True
+        if grown is not None:
+            _close_mapping(grown)
+        _close(segment, unlink=True)
+        return True
+
+    def clear(self):
+        """Unlink every idle segment (call on shutdown)"""
+        with self._lock:
+            self._local()
+            free, self.free = self.free, []
+        for segment in free:
+            _close(segment, unlink=True)
+
+    def snapshot(self):
+        with self._lock:
+            return {"idle": len(self.free), "idle_bytes": sum(s.size for s in self.free), "lent": len(self.lent),
+                    "created": self.created, "reused": self.reused}
+
+
+def _close_mapping(mapping):
+    try:
+        mapping.close()
+    except BufferError:
+        pass  # live views keep the mapping until they are collected
+
+
+def _close(segment, unlink=False):
+    try:
+        segment.close()
+    except BufferError:
+        pass  # live views keep the mapping until they are collected
+    if unlink:
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+
+
+segments = SegmentPool()
+
+
+@contextmanager
+def lend(count=1, size=1):
+    """count segment names of at least size bytes, for pool jobs to write into; returned on exit"""
+    names = []
+    try:
+        for _ in range(count):
+            names.append(segments.lend(size))
+        yield names
+    finally:
+        for name in names:
+            segments.give_back(name)
+
+
+def write_segment(name, *parts):
+    """Write bytes-like parts back to back from the start of a segment; returns the SharedWav"""
+    size = sum(len(part) for part in parts)
+    if SHM_DIR:
+        fd = os.open(os.path.join(SHM_DIR, name), os.O_RDWR)
+        try:
+            offset = 0
+            for part in parts:
+                part = memoryview(part).cast('B')
+                written = 0
+                while written < len(part):
+                    written += os.pwrite(fd, part[written:], offset + written)
+                offset += len(part)
+        finally:
+            os.close(fd)
+        return SharedWav(name, size)
+
+    segment = shared_memory.SharedMemory(name)
+    try:
+        if segment.size < size:
+            raise ValueError(f"Segment {name} holds {segment.size} bytes, {size} needed")
+        offset = 0
+        for part in parts:
+            segment.buf[offset:offset + len(part)] = part
+            offset += len(part)
+    finally:
+        segment.close()
+    return SharedWav(name, size)
+
+
+def share_bytes(*parts, into=None):
+    """Copy parts into segment into (a lent name), else into a new segment the caller must release()"""
+    if into is None:
+        segment = shared_memory.SharedMemory(create=True, size=max(1, sum(len(part) for part in parts)))
+        segment.close()
+        into = segment.name
+    return write_segment(into, *parts)
+
+
+def share_pcm(pcm, rate, into=None):
+    """16-bit mono PCM as a WAV image in a segment (see share_bytes)"""
+    return share_bytes(wav_header(len(pcm), rate), pcm, into=into)
+
+
+@contextmanager
+def attach(handle):
+    """Read-only zero-copy view of a segment's WAV image for as long as the block runs"""
+    buf = segments.mapped(handle.name, handle.size)
+    if buf is not None:
+        view = buf[:handle.size]
+        release_view = view.release
+    elif SHM_DIR:
+        with open(os.path.join(SHM_DIR, handle.name), 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, flags=mmap.MAP_SHARED | MAP_POPULATE, prot=mmap.PROT_READ)
+        view = memoryview(mapping)[:handle.size]
+
+        def release_view():
+            view.release()
+            mapping.close()
+    else:
+        segment = shared_memory.SharedMemory(handle.name)
+        view = segment.buf[:handle.size]
+
+        def release_view():
+            view.release()
+            segment.close()
+    try:
+        yield view
+    finally:
+        try:
+            release_view()
+        except BufferError:
+            pass  # live views (numpy arrays) keep the mapping until they are collected
+
+
+def release(handle):
+    """Give a lent segment back, or unlink a segment from share_bytes (no-op if already gone)"""
+    if segments.give_back(handle.name):
+        return
+    try:
+        segment = shared_memory.SharedMemory(handle.name)
+    except FileNotFoundError:
+        return
+    _close(segment, unlink=True)
+
+
+@contextmanager
+def content(source):
+    """The bytes of a WAV file, or a zero-copy view of a SharedWav, for as long as the block runs"""
+    if isinstance(source, SharedWav):
+        with attach(source) as view:
+            yield view
+    else:
+        with open(source, 'rb') as f:
+            yield f.read()
+
+
+def source_size(source):
+    """Size in bytes of a file or SharedWav"""
+    return source.size if isinstance(source, SharedWav) else os.path.getsize(source)
+
+
+def save(handle, path):
+    """Write a segment's WAV image to path; returns path"""
+    with attach(handle) as view, open(path, 'wb') as f:
+        f.write(view)
+    return path
+
+
+def converted_size(source, target_rate=None):
+    """Bytes of convert_shared's output for source (header included), to lend() segments that fit"""
+    # Imported here: wavfile imports this module for SharedWav
+    from vocalize_engine.convert import TARGET_RATE
+    from vocalize_engine.wavfile import open_wav
+
+    with open_wav(source) as wav_in:
+        frames = int(wav_in.n_frames * (target_rate or TARGET_RATE) / wav_in.rate)
+    return HEADER_BYTES + 2 * frames
+
+
+def convert_shared(source, into=None, backend=None, target_rate=None, channel=None):
+    """
+    convert_to_google_format into a segment instead of a file
+
+    source: WAV path or SharedWav; into: segment name from lend() (else a
+    new segment the caller must release()); channel: keep only this channel
+    (as in channels.extract_channel) instead of mixing to mono. Returns the
+    SharedWav of the 16-bit mono WAV at target_rate.
+    """
+    from vocalize_engine.channels import channel_pcm
+    from vocalize_engine.convert import TARGET_RATE, convert_pcm
+    from vocalize_engine.wavfile import open_wav
+
+    target_rate = target_rate or TARGET_RATE
+    with open_wav(source) as wav_in:
+        if channel is None:
+            pcm = convert_pcm(wav_in, backend, target_rate)
+        else:
+            pcm = channel_pcm(wav_in, channel, target_rate, backend)
+    return share_pcm(pcm, target_rate, into)
+
+
+def _produce(transport, nbytes, into=None):
+    """Pool job: nbytes of PCM back to the parent by transport (into: folder or segment name)"""
+    pcm = _pcm(nbytes)
+    if transport == "pickle":
+        return wav_header(len(pcm), 16000) + pcm
+    if transport == "file":
+        path = os.path.join(into, f"{os.getpid()}_{nbytes}.wav")
+        with open(path, 'wb') as f:
+            f.write(wav_header(len(pcm), 16000))
+            f.write(pcm)
+        return path
+    return share_pcm(pcm, 16000, into)
+
+
+def _consume(data):
+    """Pool job: read audio the parent handed over (bytes, path or SharedWav); returns a checksum"""
+    if isinstance(data, (bytes, bytearray)):
+        return _checksum(data)
+    with content(data) as view:
+        return _checksum(view)
+
+
+def _checksum(buf):
+    return sum(memoryview(buf).cast('B')[HEADER_BYTES::4099])
+
+
+_cache = {}
+
+
+def _pcm(nbytes):
+    """The same pseudo-random PCM in every process, built once per process"""
+    if nbytes not in _cache:
+        import random
+
+        _cache[nbytes] = random.Random(nbytes).randbytes(nbytes)
+    return _cache[nbytes]
+
+
+# IPC overhead of handing audio to / from the process pool, pickled bytes vs
+# temp files vs shared memory: python -m vocalize_engine.sharedpcm
+if __name__ == "__main__":
+    import contextlib
+    import io
+    import multiprocessing
+    import statistics
+    import sys
+    import tempfile
+    import time
+    import wave
+    from array import array
+    from concurrent.futures import ProcessPoolExecutor
+
+    from vocalize_engine.acoustic import analyze_acoustic_fluency
+    from vocalize_engine.bench import bundled_wavs
+    from vocalize_engine.channels import extract_channel
+    from vocalize_engine.convert import convert_to_google_format
+    # The module's own copies: pool jobs are pickled by reference, handles checked with isinstance
+    # and lent segments looked up in the module's pool
+    from vocalize_engine.sharedpcm import (_checksum, _consume, _pcm, _produce, content, convert_shared,
+                                           converted_size, lend, release, segments, share_bytes)
+    from vocalize_engine.workers import import_engine
+
+    MINUTES = (1, 10)            # 16kHz mono: 1.9MB per minute
+    RUNS = 9
+    transports = ("pickle", "file", "shm", "shm pooled")
+    failures = []
+
+    def median_ms(fn):
+        samples = []
+        for _ in range(RUNS):
+            started = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - started)
+        return 1000 * statistics.median(samples)
+
+    def back(pool, transport, nbytes, folder):
+        """Child -> parent: the parent ends up reading the converted audio"""
+        if transport == "shm pooled":
+            with lend(1, HEADER_BYTES + nbytes) as (name,):
+                handle = pool.submit(_produce, "shm", nbytes, name).result()
+                with content(handle) as view:
+                    return _checksum(view)
+        out = pool.submit(_produce, transport, nbytes, folder if transport == "file" else None).result()
+        if transport == "pickle":
+            return _checksum(out)
+        if transport == "file":
+            with open(out, 'rb') as f:
+                checksum = _checksum(f.read())
+            os.remove(out)
+            return checksum
+        with content(out) as view:
+            checksum = _checksum(view)
+        release(out)
+        return checksum
+
+    def forth(pool, transport, data, folder):
+        """Parent -> child: audio the parent holds in memory is handed to a pool job"""
+        if transport == "pickle":
+            return pool.submit(_consume, data).result()
+        if transport == "file":
+            path = os.path.join(folder, "upload.wav")
+            with open(path, 'wb') as f:
+                f.write(data)
+            try:
+                return pool.submit(_consume, path).result()
+            finally:
+                os.remove(path)
+        if transport == "shm pooled":
+            with lend(1, len(data)) as (name,):
+                return pool.submit(_consume, share_bytes(data, into=name)).result()
+        handle = share_bytes(data)
+        try:
+            return pool.submit(_consume, handle).result()
+        finally:
+            release(handle)
+
+    def leftover():
+        return set(os.listdir(SHM_DIR)) if SHM_DIR else set()
+
+    before = leftover()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods()
+                                          else None)
+    with tempfile.TemporaryDirectory() as tmp, \
+            ProcessPoolExecutor(1, mp_context=context, initializer=import_engine) as pool:
+        pool.submit(_pcm, 0).result()   # start the worker
+        print(f"\n  Handoff of 16kHz mono PCM between a web worker and a pool process (median of {RUNS})")
+        print(f"\n  {'Audio':>6} {'Direction':<12} " + " ".join(f"{t:>10}" for t in transports) + "   pooled vs pickle")
+        print("  " + "─" * 80)
+        for minutes in MINUTES:
+            nbytes = minutes * 60 * 16000 * 2
+            pool.submit(_pcm, nbytes).result()  # build the payload in the child first
+            data = wav_header(nbytes, 16000) + _pcm(nbytes)
+            expected = _checksum(data)
+            for direction in ("pool -> web", "web -> pool"):
+                times = {}
+                for transport in transports:
+                    if direction == "pool -> web":
+                        run = lambda: back(pool, transport, nbytes, tmp)  # noqa: E731
+                    else:
+                        run = lambda: forth(pool, transport, data, tmp)  # noqa: E731
+                    if run() != expected:
+                        failures.append(f"{minutes}min {direction} via {transport}: audio changed in transit")
+                    times[transport] = median_ms(run)
+                print(f"  {f'{minutes}min':>6} {direction:<12} " + " ".join(f"{times[t]:>8.1f}ms" for t in transports)
+                      + f"   {times['pickle'] / times['shm pooled']:>5.1f}x")
+                if minutes >= 10 and not times["shm pooled"] < times["pickle"] / 2:
+                    failures.append(f"{minutes}min {direction}: pooled shared memory not 2x faster than pickling")
+
+        # The real job: one channel of a 48kHz stereo interview, converted in the pool and read back
+        path = os.path.join(tmp, "interview.wav")
+        with wave.open(path, 'wb') as wav_out:
+            wav_out.setnchannels(2)
+            wav_out.setsampwidth(2)
+            wav_out.setframerate(48000)
+            wav_out.writeframes(array('h', [v for i in range(48000) for v in (i % 2000 - 1000, 1000 - i % 2000)])
+                                .tobytes() * 120)   # 2 minutes
+        out = os.path.join(tmp, "ch0.wav")
+
+        def via_file():
+            pool.submit(extract_channel, path, out, 0).result()
+            with open(out, 'rb') as f:
+                return _checksum(f.read())
+
+        def via_shm():
+            with lend(1, converted_size(path)) as (name,):
+                handle = pool.submit(convert_shared, path, name, channel=0).result()
+                with content(handle) as view:
+                    return _checksum(view)
+
+        if via_file() != via_shm():
+            failures.append("channel extraction differs between file and shared memory")
+        file_ms, shm_ms = median_ms(via_file), median_ms(via_shm)
+        print(f"\n  Channel 0 of a 2min 48kHz stereo WAV, converted in the pool and read back:"
+              f" file {file_ms:.0f}ms, shared memory {shm_ms:.0f}ms")
+
+        # A converted recording reads the same from a segment, in either process, as from a file
+        wav = bundled_wavs()[0]
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = analyze_acoustic_fluency(convert_to_google_format(wav, os.path.join(tmp, "converted.wav")))
+        with lend(1, converted_size(wav)) as (name,):
+            handle = pool.submit(convert_shared, wav, name).result()
+            if analyze_acoustic_fluency(handle) != expected or \
+                    pool.submit(analyze_acoustic_fluency, handle).result() != expected:
+                failures.append("acoustic analysis of a segment differs from the file")
+        print(f"  Segment pool: {segments.snapshot()}")
+
+    segments.clear()
+    leaked = leftover() - before
+    if leaked:
+        failures.append(f"{len(leaked)} segments left in {SHM_DIR}")
+    for failure in failures:
+        print(f"  ❌ {failure}")
+    print("  ✓ all checks passed\n" if not failures else "")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,278 @@
+"""SQLite store of analysis results
+Keeps transcripts and word timings so results can be rescored with a
+different profile, or charted over time, without re-uploading audio or
+paying for STT again.
+
+Word timings are stored compactly: the words as one newline-joined TEXT
+column and the times as a BLOB of little-endian int32 milliseconds
+(start, end, start, end, ...), about 8 bytes per word instead of ~60 for
+the JSON dicts. Rows are keyed by user/session and a content hash of the
+audio that was recognized, with indexes on user and time. Acoustic
+fingerprints (vocalize_engine.fingerprint) of analyzed recordings are kept
+next to them so every worker's near-duplicate index can load them.
+"""
+import hashlib
+import json
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+
+from vocalize_engine.fluency import analyze_fluency
+from vocalize_engine.profiles import get_profile
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id           INTEGER PRIMARY KEY,
+    user_id      TEXT,
+    session_id   TEXT,
+    content_hash TEXT NOT NULL,
+    created_at   REAL NOT NULL,
+    language     TEXT,
+    profile      TEXT NOT NULL,
+    transcript   TEXT NOT NULL,
+    words        TEXT NOT NULL,
+    times        BLOB NOT NULL,
+    metrics      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analyses_user_time ON analyses (user_id, created_at);
+CREATE INDEX IF NOT EXISTS analyses_time ON analyses (created_at);
+CREATE INDEX IF NOT EXISTS analyses_hash ON analyses (content_hash);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    analysis_id  INTEGER PRIMARY KEY REFERENCES analyses (id),
+    data         BLOB NOT NULL
+);
+"""
+
+# Columns returned by history() (no word data)
+SUMMARY_COLUMNS = "id, user_id, session_id, content_hash, created_at, language, profile, metrics"
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """sha256 hex digest of a file (the audio that was recognized)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def pack_words(words):
+    """(words_text, times_blob) from word dicts"""
+    times = array('i')
+    for w in words:
+        times.append(round(float(w['startTime']) * 1000))
+        times.append(round(float(w['endTime']) * 1000))
+    if sys.byteorder == 'big':
+        times.byteswap()
+    # Recognized words never contain newlines; replace defensively
+    return "\n".join(w['word'].replace("\n", " ") for w in words), times.tobytes()
+
+
+def unpack_words(words_text, times_blob):
+    """Word dicts (times in seconds) from pack_words output"""
+    if not words_text:
+        return []
+    times = array('i', times_blob)
+    if sys.byteorder == 'big':
+        times.byteswap()
+    return [
+        {"word": word, "startTime": start / 1000, "endTime": end / 1000}
+        for word, start, end in zip(words_text.split("\n"), times[0::2], times[1::2])
+    ]
+
+
+class AnalysisStore:
+    """
+    Thread-safe wrapper around one SQLite connection (WAL mode)
+
+    The backend shares a single store between request threads; every call
+    takes a short lock, so writers never see "database is locked".
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            if path != ":memory:":
+                self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SCHEMA)
+            self._db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def save(self, result, content_hash, user_id=None, session_id=None, language=None,
+             profile=None, created_at=None):
+        """Store a successful analyze_audio_* result; returns the row id"""
+        words_text, times_blob = pack_words(result.get("words", []))
+        row = (
+            user_id, session_id, content_hash,
+            time.time() if created_at is None else created_at, language,
+            get_profile(profile).name, result.get("transcript", ""),
+            words_text, times_blob,
+            json.dumps(result["fluency_metrics"], separators=(",", ":")),
+        )
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT INTO analyses (user_id, session_id, content_hash, created_at, language,"
+                " profile, transcript, words, times, metrics) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row,
+            )
+        return cursor.lastrowid
+
+    def get(self, analysis_id):
+        """Full stored result (transcript, words, metrics), or None"""
+        with self._lock:
+            row = self._db.execute("SELECT * FROM analyses WHERE id = ?", (analysis_id,)).fetchone()
+        return self._expand(row) if row else None
+
+    def find(self, content_hash, language=None):
+        """Most recent result for the same audio (and language), or None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM analyses WHERE content_hash = ? AND language IS ?"
+                " ORDER BY created_at DESC LIMIT 1",
+                (content_hash, language),
+            ).fetchone()
+        return self._expand(row) if row else None
+
+    def save_fingerprint(self, analysis_id, data):
+        """Keep the acoustic fingerprint (bytes) of a stored analysis"""
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO fingerprints (analysis_id, data) VALUES (?, ?)",
+                             (analysis_id, data))
+
+    def fingerprints(self, after_id=0, limit=None):
+        """(analysis_id, language, data) of the fingerprints saved after after_id, oldest first"""
+        query = ("SELECT f.analysis_id, a.language, f.data FROM fingerprints f"
+                 " JOIN analyses a ON a.id = f.analysis_id WHERE f.analysis_id > ? ORDER BY f.analysis_id")
+        params = [after_id]
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return [tuple(row) for row in self._db.execute(query, params).fetchall()]
+
+    def history(self, user_id, since=None, until=None, limit=100):
+        """Metric summaries for a user, newest first (uses the user/time index)"""
+        query = f"SELECT {SUMMARY_COLUMNS} FROM analyses WHERE user_id = ?"
+        params = [user_id]
+        if since is not None:
+            query += " AND created_at >= ?"
+            params.append(since)
+        if until is not None:
+            query += " AND created_at < ?"
+            params.append(until)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [dict(row, metrics=json.loads(row["metrics"])) for row in rows]
+
+    def rescore(self, profile, user_id=None, since=None, write=False, batch_size=1000):
+        """
+        Rerun analyze_fluency with profile over stored word timings
+
+        Streams rows in id order in batches. With write=True the stored
+        metrics/profile are replaced; otherwise results are only counted.
+        Returns {"profile", "rescored", "changed", "seconds"}.
+        """
+        profile = get_profile(profile)
+        where, params = [], []
+        if user_id is not None:
+            where.append("user_id = ?")
+            params.append(user_id)
+        if since is not None:
+            where.append("created_at >= ?")
+            params.append(since)
+        query = "SELECT id, words, times, metrics FROM analyses WHERE id > ?"
+        if where:
+            query += " AND " + " AND ".join(where)
+        query += " ORDER BY id LIMIT ?"
+
+        started = time.perf_counter()
+        rescored = changed = 0
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute(query, [last_id, *params, batch_size]).fetchall()
+            if not rows:
+                break
+            updates = []
+            for row in rows:
+                metrics = analyze_fluency(unpack_words(row["words"], row["times"]), profile=profile)
+                encoded = json.dumps(metrics, separators=(",", ":"))
+                changed += encoded != row["metrics"]
+                updates.append((encoded, profile.name, row["id"]))
+            rescored += len(rows)
+            last_id = rows[-1]["id"]
+            if write:
+                with self._lock, self._db:
+                    self._db.executemany("UPDATE analyses SET metrics = ?, profile = ? WHERE id = ?", updates)
+        return {
+            "profile": profile.name,
+            "rescored": rescored,
+            "changed": changed,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+
+    @staticmethod
+    def _expand(row):
+        words = unpack_words(row["words"], row["times"])
+        return {
+            "id": row["id"],
+            "user_id": row["user_id"],
+            "session_id": row["session_id"],
+            "content_hash": row["content_hash"],
+            "created_at": row["created_at"],
+            "language": row["language"],
+            "profile": row["profile"],
+            "transcript": row["transcript"],
+            "word_count": len(words),
+            "words": words,
+            "fluency_metrics": json.loads(row["metrics"]),
+        }
+
+
+# Bulk rescoring throughput: python -m vocalize_engine.store [records]
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    from vocalize_engine.encoding import synthetic_result
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    template = synthetic_result(minutes=1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "analyses.db")
+        store = AnalysisStore(path)
+        started = time.perf_counter()
+        for i in range(n):
+            store.save(template, f"{i:064x}", user_id=f"user{i % 50}", language="auto",
+                       created_at=1.7e9 + i * 60)
+        insert_s = time.perf_counter() - started
+        size = os.path.getsize(path) + os.path.getsize(path + "-wal")
+        json_size = len(json.dumps(template["words"], separators=(",", ":")))
+
+        print(f"\n  {n} analyses x {template['word_count']} words")
+        print(f"  Insert:   {n / insert_s:>8,.0f} records/s")
+        print(f"  Storage:  {size / n / 1024:>8.1f} KiB/record (word JSON alone: {json_size / 1024:.1f} KiB)")
+        started = time.perf_counter()
+        rows = store.history("user7", limit=1000)
+        print(f"  History:  {1000 * (time.perf_counter() - started):>8.2f} ms for {len(rows)} rows (indexed)")
+        for profile, write in (("standard", False), ("esl", False), ("esl", True)):
+            stats = store.rescore(profile, write=write)
+            label = f"{profile}{' +write' if write else ''}"
+            print(f"  Rescore {label:<13} {stats['rescored'] / stats['seconds']:>8,.0f} records/s"
+                  f"  ({stats['changed']} changed)")
+        store.close()
+    print()
@@ -0,0 +1,243 @@
+"""Pipelined convert-and-stream recognition (SDK streaming_recognize)
+
+The batch paths convert the whole file, re-read it and encode it before
+the first byte reaches Google. Here the WAV is converted in ~100ms slices
+by ingest's incremental converter and each slice goes out on the gRPC
+stream as soon as it exists, so conversion, upload and recognition
+overlap and final results arrive while later audio is still converting.
+
+Streams are limited to about 5 minutes of audio. Input that needs
+normalization (anything but 16-bit PCM) can only be emitted once its peak
+is known, so it converts fully before streaming; it still skips the
+re-read and encode.
+"""
+import time
+
+from vocalize_engine.breaker import stt_breaker
+from vocalize_engine.hedging import remaining
+from vocalize_engine.ingest import StreamingConverter
+from vocalize_engine.rates import choose_sample_rate
+from vocalize_engine.wavfile import WavFormat, open_wav
+
+STREAM_MAX_SECONDS = 290.0   # Google closes streams at ~305s of audio
+CHUNK_SECONDS = 0.1          # Google recommends ~100ms frames
+
+
+def pcm_chunks(wav_in, target_rate, chunk_seconds=CHUNK_SECONDS):
+    """Converted mono int16 PCM in chunk_seconds slices, produced as the file is read"""
+    fmt = WavFormat(wav_in.channels, wav_in.rate, wav_in.sample_width, wav_in.is_float)
+    converter = StreamingConverter(fmt, wav_in.n_frames, target_rate)
+    chunk_bytes = 2 * max(1, int(target_rate * chunk_seconds))
+    step = max(1, int(wav_in.rate * chunk_seconds))
+    pending = b''
+    for start in range(0, wav_in.n_frames, step):
+        pending += converter.feed(wav_in.frames(start, start + step))
+        while len(pending) >= chunk_bytes:
+            yield pending[:chunk_bytes]
+            pending = pending[chunk_bytes:]
+    pending += converter.finish()
+    for offset in range(0, len(pending), chunk_bytes):
+        yield pending[offset:offset + chunk_bytes]
+
+
+def recognize_streaming(audio_file_path, client, language_code="en-US", target_rate=None, deadline=None,
+                        breaker=None):
+    """
+    Convert and stream a WAV through client.streaming_recognize
+
+    Returns transcript/words/word_count plus "plan" and "timing" (seconds
+    from the start: first final result, conversion done, total). Checked
+    against and reported to the circuit breaker like recognize_content.
+    """
+    from google.api_core import exceptions
+    from google.cloud import speech
+
+    from vocalize_engine.stt import sdk_config, sdk_words
+
+    breaker = breaker or stt_breaker
+    started = time.perf_counter()
+    timing = {}
+    try:
+        wav_in = open_wav(audio_file_path)
+    except (OSError, ValueError) as e:
+        return {"error": f"Speech recognition failed: {str(e)}"}
+
+    with wav_in:
+        if wav_in.duration > STREAM_MAX_SECONDS:
+            return {"error": f"Recording longer than {STREAM_MAX_SECONDS:.0f}s cannot be streamed"}
+        if target_rate is None:
+            target_rate, _ = choose_sample_rate(wav_in.rate, wav_in.channels, wav_in.sample_width,
+                                                wav_in.is_float, backend="stdlib")
+        unavailable = breaker.unavailable()
+        if unavailable:
+            return unavailable
+
+        def audio_requests():
+            for chunk in pcm_chunks(wav_in, target_rate):
+                yield speech.StreamingRecognizeRequest(audio_content=chunk)
+            timing["converted"] = time.perf_counter() - started
+
+        config = speech.StreamingRecognitionConfig(config=sdk_config(language_code, "LINEAR16", target_rate))
+        budget = remaining(deadline)
+        words = []
+        transcripts = []
+        try:
+            responses = client.streaming_recognize(config, audio_requests(), timeout=budget)
+            for response in responses:
+                for result in response.results:
+                    if not result.is_final or not result.alternatives:
+                        continue
+                    timing.setdefault("first_result", time.perf_counter() - started)
+                    alternative = result.alternatives[0]
+                    transcripts.append(alternative.transcript.strip())
+                    words.extend(sdk_words(alternative))
+        except exceptions.DeadlineExceeded as e:
+            breaker.record_timeout(budget or 0)
+            return {"error": f"STT deadline exceeded: {str(e)}", "deadline_exceeded": True}
+        except exceptions.GoogleAPICallError as e:
+            error = {"error": f"Streaming recognition failed: {str(e)}"}
+            if e.code is not None and breaker.record_status(int(e.code)):
+                error["stt_unavailable"] = True
+            return error
+        except Exception as e:
+            return {"error": f"Streaming recognition failed: {str(e)}"}
+        breaker.success()
+        duration = wav_in.duration
+
+    timing["total"] = time.perf_counter() - started
+    if not words:
+        return {"error": "No transcription results returned"}
+    return {
+        "transcript": " ".join(t for t in transcripts if t),
+        "words": words,
+        "word_count": len(words),
+        "plan": {"plan": "stream", "duration": round(duration, 2), "sample_rate_hertz": target_rate,
+                 "reason": "converted and streamed in 100ms slices (streaming_recognize)"},
+        "timing": {name: round(seconds, 3) for name, seconds in timing.items()},
+    }
+
+
+# Pipelined vs convert-then-recognize against a local fake gRPC recognizer:
+# python -m vocalize_engine.streaming (tests: tests/test_streaming.py)
+if __name__ == "__main__":
+    import contextlib
+    import io
+    import math
+    import os
+    import tempfile
+    from concurrent import futures
+    from datetime import timedelta
+
+    import grpc
+    from google.cloud.speech_v1.services.speech.transports import SpeechGrpcTransport
+
+    from google.cloud import speech
+
+    from vocalize_engine.bench import bundled_wavs
+    from vocalize_engine.conformance import write_wav
+    from vocalize_engine.convert import convert_to_google_format
+    from vocalize_engine.stt import analyze_audio_streaming, analyze_audio_with_sdk
+
+    # The fake's model of the service: bytes cross the uplink at UPLINK;
+    # batch recognition starts after the whole upload and takes PROCESS x the
+    # audio length; streaming emits a final result RESULT_LATENCY after each
+    # RESULT_EVERY seconds of audio have arrived.
+    UPLINK = 1.0e6          # bytes/s
+    PROCESS = 0.1
+    RESULT_EVERY = 2.0
+    RESULT_LATENCY = 0.15
+    WORD_SECONDS = 0.5
+
+    def fake_words(start, end):
+        n = int(start / WORD_SECONDS)
+        out = []
+        while (n + 1) * WORD_SECONDS <= end + 1e-9:
+            out.append(speech.WordInfo(word=f"w{n}", start_time=timedelta(seconds=n * WORD_SECONDS),
+                                       end_time=timedelta(seconds=(n + 1) * WORD_SECONDS)))
+            n += 1
+        return out
+
+    def alternative(start, end):
+        words = fake_words(start, end)
+        return speech.SpeechRecognitionAlternative(transcript=" ".join(w.word for w in words), words=words)
+
+    def recognize(request, context):
+        content = request.audio.content
+        time.sleep(len(content) / UPLINK)
+        seconds = (len(content) - 44) / 2 / request.config.sample_rate_hertz
+        time.sleep(PROCESS * seconds)
+        return speech.RecognizeResponse(results=[speech.SpeechRecognitionResult(
+            alternatives=[alternative(0, seconds)])])
+
+    def streaming_recognize(request_iterator, context):
+        rate = next(request_iterator).streaming_config.config.sample_rate_hertz
+        received = 0.0
+        emitted = 0.0
+        due = []  # (time, start, end): recognized segments, answered without blocking the upload
+
+        def ready(until):
+            while due and due[0][0] <= until:
+                _, start, end = due.pop(0)
+                yield speech.StreamingRecognizeResponse(results=[speech.StreamingRecognitionResult(
+                    alternatives=[alternative(start, end)], is_final=True)])
+
+        for request in request_iterator:
+            time.sleep(len(request.audio_content) / UPLINK)
+            received += len(request.audio_content) / 2 / rate
+            if received - emitted >= RESULT_EVERY:
+                end = math.floor(received / WORD_SECONDS) * WORD_SECONDS
+                due.append((time.monotonic() + RESULT_LATENCY, emitted, end))
+                emitted = end
+            yield from ready(time.monotonic())
+        due.append((time.monotonic() + RESULT_LATENCY, emitted, received))
+        time.sleep(max(0.0, due[-1][0] - time.monotonic()))
+        yield from ready(float("inf"))
+
+    handler = grpc.method_handlers_generic_handler("google.cloud.speech.v1.Speech", {
+        "Recognize": grpc.unary_unary_rpc_method_handler(
+            recognize, request_deserializer=speech.RecognizeRequest.deserialize,
+            response_serializer=speech.RecognizeResponse.serialize),
+        "StreamingRecognize": grpc.stream_stream_rpc_method_handler(
+            streaming_recognize, request_deserializer=speech.StreamingRecognizeRequest.deserialize,
+            response_serializer=speech.StreamingRecognizeResponse.serialize),
+    })
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    server.add_generic_rpc_handlers((handler,))
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    client = speech.SpeechClient(transport=SpeechGrpcTransport(channel=grpc.insecure_channel(f"127.0.0.1:{port}")))
+
+    def batch(path, out):
+        """Today's SDK path: convert everything, then one recognize call"""
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            convert_to_google_format(path, out)
+        result = analyze_audio_with_sdk(out, None, client=client)
+        return time.perf_counter() - started, result
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "out.wav")
+        long_path = os.path.join(tmp, "speech_44k_stereo_50s.wav")
+        rate = 44100
+        write_wav(long_path, [(int(8000 * math.sin(i / 9)), int(6000 * math.sin(i / 7)))
+                              for i in range(50 * rate)], rate, 2)
+        paths = bundled_wavs()[:1] + [p for p in bundled_wavs() if "test_audio.wav" in p] + [long_path]
+
+        print(f"\n  Fake recognizer: {UPLINK / 1e6:.0f}MB/s uplink, batch {PROCESS:.2f}x realtime, "
+              f"stream result every {RESULT_EVERY:.0f}s (+{1000 * RESULT_LATENCY:.0f}ms)")
+        print(f"\n  {'File':<32} {'Audio':>6} {'Batch':>8} {'Stream 1st':>11} {'Converted':>10} {'Stream':>8}")
+        print("  " + "─" * 82)
+        for path in paths:
+            with open_wav(path) as w:
+                seconds = w.duration
+            batch_s, _ = batch(path, out)
+            streamed = analyze_audio_streaming(path, None, client=client)
+            if "error" in streamed:
+                print(f"  {os.path.basename(path):<32} {seconds:>5.1f}s {streamed['error']}")
+                continue
+            timing = streamed["timing"]
+            print(f"  {os.path.basename(path):<32} {seconds:>5.1f}s {1000 * batch_s:>6.0f}ms "
+                  f"{1000 * timing['first_result']:>9.0f}ms {1000 * timing['converted']:>8.0f}ms "
+                  f"{1000 * timing['total']:>6.0f}ms")
+    print()
+    server.stop(None)
@@ -0,0 +1,362 @@
+"""Google STT: REST (API key) and SDK (service account) recognizers"""
+import os
+import base64
+import requests
+from dotenv import load_dotenv
+
+from vocalize_engine.fluency import analyze_fluency
+from vocalize_engine import hedging
+from vocalize_engine.breaker import stt_breaker
+from vocalize_engine.credentials import SDK, CredentialPool, audio_seconds
+from vocalize_engine.endpoints import load_endpoints
+from vocalize_engine.sharedpcm import content
+from vocalize_engine.workers import speech_client
+
+load_dotenv()
+
+# Overridable for a local stand-in of the API (see planner's benchmark)
+STT_BASE_URL = os.getenv("STT_BASE_URL", "https://speech.googleapis.com/v1")
+
+# Several endpoints (STT_ENDPOINTS): REST calls go to the fastest healthy one
+stt_endpoints = load_endpoints()
+
+
+def base_url():
+    """Base URL for the next REST call: the pick of STT_ENDPOINTS, else STT_BASE_URL"""
+    return stt_endpoints.choose() if stt_endpoints else STT_BASE_URL
+
+
+def endpoint_failed(url, reason):
+    """Report a connection failure / 5xx from url so the next calls avoid it"""
+    if stt_endpoints:
+        stt_endpoints.failed(url, reason)
+
+
+def build_config(language_code="en-US", encoding="LINEAR16", sample_rate_hertz=16000):
+    """REST RecognitionConfig; sample_rate_hertz=None lets the API read it (FLAC/WAV headers)"""
+    config_data = {"encoding": encoding}
+    if sample_rate_hertz:
+        config_data["sampleRateHertz"] = sample_rate_hertz
+    # Auto-detect: English primary, Punjabi/Hindi alternatives
+    if language_code == "auto":
+        config_data["languageCode"] = "en-US"
+        config_data["alternativeLanguageCodes"] = ["pa-IN", "hi-IN"]
+    else:
+        config_data["languageCode"] = language_code
+    config_data["enableWordTimeOffsets"] = True
+    config_data["enableAutomaticPunctuation"] = True
+    return config_data
+
+
+def parse_results(result):
+    """transcript/words/word_count from a RecognizeResponse (or LRO response) dict"""
+    if 'results' not in result or not result['results']:
+        return {"error": "No transcription results returned"}
+    
+    # Process results
+    processed_words = []
+    full_transcript = ""
+    
+    for res in result['results']:
+        if 'alternatives' in res and res['alternatives']:
+            alternative = res['alternatives'][0]
+            full_transcript += alternative.get('transcript', '') + " "
+            
+            # Extract word timings
+            if 'words' in alternative:
+                for word_info in alternative['words']:
+                    start_time = float(word_info.get('startTime', '0s').replace('s', ''))
+                    end_time = float(word_info.get('endTime', '0s').replace('s', ''))
+                    
+                    processed_words.append({
+                        "word": word_info.get('word', ''),
+                        "startTime": start_time,
+                        "endTime": end_time
+                    })
+    
+    return {
+        "transcript": full_transcript.strip(),
+        "words": processed_words,
+        "word_count": len(processed_words)
+    }
+
+
+def request_body(audio_content, language_code="en-US", encoding="LINEAR16", sample_rate_hertz=16000):
+    """JSON body for speech:recognize / speech:longrunningrecognize"""
+    return {
+        "config": build_config(language_code, encoding, sample_rate_hertz),
+        "audio": {
+            "content": base64.b64encode(audio_content).decode('utf-8')
+        }
+    }
+
+
+def recognize_content(audio_content, api_key, language_code="en-US",
+                      encoding="LINEAR16", sample_rate_hertz=16000, deadline=None, breaker=None):
+    """
+    One synchronous speech:recognize call on in-memory audio bytes
+    deadline: time.monotonic() value the answer is needed by; the call is
+    hedged after the p95 latency (see hedging)
+    breaker: circuit breaker to check and report to (default: stt_breaker);
+    failures that mean the service is down are flagged "stt_unavailable"
+    api_key may be a CredentialPool: the call goes to its least-loaded
+    healthy credential (see vocalize_engine.credentials)
+    """
+    if isinstance(api_key, CredentialPool):
+        return api_key.call(lambda credential: recognize_content(
+            audio_content, credential.secret, language_code, encoding, sample_rate_hertz, deadline,
+            breaker=credential), audio_seconds=audio_seconds(audio_content, encoding, sample_rate_hertz),
+            deadline=deadline)
+    breaker = breaker or stt_breaker
+    unavailable = breaker.unavailable()
+    if unavailable:
+        return unavailable
+    budget = hedging.remaining(deadline)
+    base = base_url()
+    try:
+        url = f"{base}/speech:recognize?key={api_key}"
+        headers = {"Content-Type": "application/json"}
+        data = request_body(audio_content, language_code, encoding, sample_rate_hertz)
+        
+        response = hedging.post(url, deadline=deadline, headers=headers, json=data)
+        
+        service_down = breaker.record_status(response.status_code)
+        if response.status_code >= 500:
+            endpoint_failed(base, f"HTTP {response.status_code}")
+        if response.status_code != 200:
+            error = {
+                "error": f"API request failed: {response.status_code}",
+                "details": response.text
+            }
+            if service_down:
+                error["stt_unavailable"] = True
+            return error
+        
+        return parse_results(response.json())
+    
+    except (hedging.DeadlineExceeded, requests.Timeout) as e:
+        breaker.record_timeout(budget)
+        return {"error": f"STT deadline exceeded: {str(e)}", "deadline_exceeded": True}
+    except requests.RequestException as e:
+        # Connection refused/reset, DNS: the service is unreachable
+        breaker.failure(type(e).__name__)
+        endpoint_failed(base, type(e).__name__)
+        return {"error": f"Speech recognition failed: {str(e)}", "stt_unavailable": True}
+    except Exception as e:
+        return {"error": f"Speech recognition failed: {str(e)}"}
+
+
+def file_seconds(audio_file_path, encoding="LINEAR16", sample_rate_hertz=16000):
+    """audio_seconds of a file about to be sent (0 if it can't be read)"""
+    try:
+        if encoding == "LINEAR16":
+            from vocalize_engine.wavfile import open_wav
+
+            with open_wav(audio_file_path) as wav_in:
+                return wav_in.duration
+        with open(audio_file_path, 'rb') as f:
+            return audio_seconds(f.read(), encoding, sample_rate_hertz)
+    except (OSError, ValueError):
+        return 0.0
+
+
+def recognize_speech_with_api_key(audio_file_path, api_key, language_code="en-US",
+                                  encoding="LINEAR16", sample_rate_hertz=16000, deadline=None):
+    """
+    Google Speech-to-Text API call (single synchronous request)
+
+    encoding/sample_rate_hertz describe the file as sent: LINEAR16 16000 for
+    converted WAV, or a native encoding (OGG_OPUS, WEBM_OPUS, FLAC) from
+    codecs.prepare_for_stt. Long recordings go through planner.recognize_planned.
+    """
+    try:
+        # Read and encode (a sharedpcm.SharedWav is sent straight from its segment)
+        with content(audio_file_path) as audio_content:
+            result = recognize_content(audio_content, api_key, language_code, encoding, sample_rate_hertz, deadline)
+    except OSError as e:
+        return {"error": f"Speech recognition failed: {str(e)}"}
+    
+    if "error" not in result:
+        print(f"✅ Transcription complete: {len(result['words'])} words detected")
+    return result
+
+
+def analyze_audio_with_api_key(audio_file_path, api_key, language_code="en-US", annotate=False,
+                               encoding="LINEAR16", sample_rate_hertz=16000, profile=None, deadline=None,
+                               timeline=None, reference=None):
+    """
+    Complete pipeline: Audio → Speech Recognition → Fluency Analysis
+    Uses API key authentication
+    
+    Args:
+        audio_file_path: Path to audio file
+        api_key: Your Google Cloud API key
+        language_code: Language code (default: "en-US")
+        annotate: Also return per-word filler/pause annotations
+        encoding, sample_rate_hertz: Audio format as sent (see codecs.prepare_for_stt)
+        profile: Scoring profile name (see vocalize_engine.profiles)
+        deadline: time.monotonic() value by which STT must have answered
+        timeline: window seconds for a per-window metrics series (see vocalize_engine.timeline)
+        reference: passage read aloud; adds read-aloud accuracy (see vocalize_engine.alignment)
+    
+    Returns:
+        dict with transcript, words, fluency metrics (and annotations), plus
+        "plan": how the audio was sent to STT and why (see planner)
+    """
+    # Imported here: planner builds on this module's request helpers
+    from vocalize_engine.planner import recognize_planned
+
+    # Step 1: Recognize speech (single request, parallel chunks or long-running)
+    speech_result = recognize_planned(audio_file_path, api_key, language_code,
+                                      encoding, sample_rate_hertz, deadline)
+    
+    if "error" in speech_result:
+        return speech_result
+    
+    # Step 2: Analyze fluency
+    fluency_metrics = analyze_fluency(speech_result['words'], annotate=annotate, profile=profile,
+                                      timeline=timeline, reference=reference)
+    
+    # Step 3: Combine results
+    result = {
+        "transcript": speech_result['transcript'],
+        "word_count": speech_result['word_count'],
+        "words": speech_result['words'],
+        "fluency_metrics": fluency_metrics,
+        "plan": speech_result["plan"]
+    }
+    if "annotations" in fluency_metrics:
+        result["annotations"] = fluency_metrics.pop("annotations")
+    return result
+
+
+def sdk_config(language_code="en-US", encoding="LINEAR16", sample_rate_hertz=16000):
+    """SDK RecognitionConfig; same settings as build_config"""
+    from google.cloud import speech
+
+    config = speech.RecognitionConfig(
+        encoding=speech.RecognitionConfig.AudioEncoding[encoding],
+        language_code="en-US" if language_code == "auto" else language_code,
+        enable_word_time_offsets=True,
+        enable_automatic_punctuation=True,
+    )
+    if sample_rate_hertz:
+        config.sample_rate_hertz = sample_rate_hertz
+    if language_code == "auto":
+        config.alternative_language_codes = ["pa-IN", "hi-IN"]
+    return config
+
+
+def sdk_words(alternative):
+    """Word timings from an SDK SpeechRecognitionAlternative"""
+    return [{
+        "word": word_info.word,
+        "startTime": word_info.start_time.total_seconds(),
+        "endTime": word_info.end_time.total_seconds()
+    } for word_info in alternative.words]
+
+
+def analyze_audio_with_sdk(audio_file_path, credentials_info, language_code="en-US",
+                           encoding="LINEAR16", sample_rate_hertz=16000, profile=None, client=None,
+                           breaker=None):
+    """
+    Analyze audio using the official Google Cloud Speech SDK.
+    credentials_info: dict containing service account info (or an API key), or a CredentialPool
+    encoding, sample_rate_hertz: Audio format as sent (see codecs.prepare_for_stt)
+    profile: Scoring profile name (see vocalize_engine.profiles)
+    client: SpeechClient to use instead of the cached one for credentials_info
+    breaker: reported to with the call's outcome (a pool's Credential sheds itself on 429)
+    """
+    # Imported lazily so the REST path and local analyzers work without the SDK
+    from google.cloud import speech
+
+    if isinstance(credentials_info, CredentialPool):
+        return credentials_info.call(lambda credential: analyze_audio_with_sdk(
+            audio_file_path, credentials_info=credential.secret, language_code=language_code, encoding=encoding,
+            sample_rate_hertz=sample_rate_hertz, profile=profile, client=client, breaker=credential),
+            kind=SDK, audio_seconds=file_seconds(audio_file_path, encoding, sample_rate_hertz))
+    try:
+        client = client or speech_client(credentials_info)
+        
+        with open(audio_file_path, "rb") as audio_file:
+            content = audio_file.read()
+
+        audio = speech.RecognitionAudio(content=content)
+        config = sdk_config(language_code, encoding, sample_rate_hertz)
+
+        response = client.recognize(config=config, audio=audio)
+        if breaker:
+            breaker.success()
+
+        processed_words = []
+        full_transcript = ""
+
+        for result in response.results:
+            alternative = result.alternatives[0]
+            full_transcript += alternative.transcript + " "
+            processed_words.extend(sdk_words(alternative))
+
+        if not processed_words:
+            return {"error": "No transcription results returned"}
+
+        fluency_metrics = analyze_fluency(processed_words, profile=profile)
+
+        return {
+            "transcript": full_transcript.strip(),
+            "word_count": len(processed_words),
+            "words": processed_words,
+            "fluency_metrics": fluency_metrics
+        }
+    except Exception as e:
+        error = {"error": f"SDK Speech recognition failed: {str(e)}"}
+        # GoogleAPICallError carries the HTTP status (ResourceExhausted: 429)
+        if breaker and isinstance(getattr(e, "code", None), int) and breaker.record_status(e.code):
+            error["stt_unavailable"] = True
+        return error
+
+
+def analyze_audio_streaming(audio_file_path, credentials_info, language_code="en-US", annotate=False,
+                            profile=None, deadline=None, client=None, timeline=None, reference=None,
+                            breaker=None):
+    """
+    Like analyze_audio_with_sdk, but the WAV is converted and streamed in
+    ~100ms slices (streaming_recognize), so conversion, upload and
+    recognition overlap. Takes any WAV the converter reads, up to ~5 minutes.
+
+    credentials_info: service account dict, an API key string, or a CredentialPool
+    deadline: time.monotonic() value by which STT must have answered
+    timeline: window seconds for a per-window metrics series
+    reference: passage read aloud (read-aloud accuracy)
+    Returns the analyze_audio_with_api_key shape plus "timing"
+    (first_result / converted / total seconds).
+    """
+    from vocalize_engine.streaming import recognize_streaming
+
+    if isinstance(credentials_info, CredentialPool):
+        return credentials_info.call(lambda credential: analyze_audio_streaming(
+            audio_file_path, credential.secret, language_code, annotate, profile, deadline, client, timeline,
+            reference, breaker=credential), kind=SDK, audio_seconds=file_seconds(audio_file_path),
+            deadline=deadline)
+    try:
+        client = client or speech_client(credentials_info)
+    except Exception as e:
+        return {"error": f"SDK Speech recognition failed: {str(e)}"}
+
+    speech_result = recognize_streaming(audio_file_path, client, language_code, deadline=deadline,
+                                        breaker=breaker)
+    if "error" in speech_result:
+        return speech_result
+
+    fluency_metrics = analyze_fluency(speech_result['words'], annotate=annotate, profile=profile,
+                                      timeline=timeline, reference=reference)
+    result = {
+        "transcript": speech_result['transcript'],
+        "word_count": speech_result['word_count'],
+        "words": speech_result['words'],
+        "fluency_metrics": fluency_metrics,
+        "plan": speech_result["plan"],
+        "timing": speech_result["timing"]
+    }
+    if "annotations" in fluency_metrics:
+        result["annotations"] = fluency_metrics.pop("annotations")
+    return result
@@ -0,0 +1,163 @@
+"""Fluency metrics over time: fixed-window series and arbitrary ranges
+
+analyze_fluency gives one aggregate for the whole recording. For long
+sessions coaches want the same numbers per minute, or for any stretch they
+pick. FluencyIndex keeps prefix sums of fillers, pauses and long pauses over
+the word list (built from the per-word flags analyze_fluency already
+computes), so a [t0, t1) window costs two binary searches instead of a rescan
+of `words`.
+
+A window holds the words that start inside it; a pause belongs to the
+window of the word after it (as in annotations). Windows that partition the
+recording therefore add up to the aggregate, and the full range reproduces
+analyze_fluency exactly.
+"""
+from bisect import bisect_left
+from itertools import accumulate
+
+from vocalize_engine.fluency import GAP_LONG, analyze_fluency, summarize
+from vocalize_engine.profiles import get_profile
+
+DEFAULT_WINDOW = 60.0
+MIN_WINDOW = 1.0
+MAX_WINDOWS = 2000  # series longer than this are refused (window too short)
+
+SERIES_FIELDS = ("word_count", "wpm", "filler_rate", "pause_frequency", "long_pauses", "fluency_score")
+
+
+class TimelineError(ValueError):
+    """A timeline window that is too short, or gives too many windows for the recording"""
+
+
+def window_count(window, end, start=0.0):
+    """Windows of `window` seconds covering [start, end); TimelineError past MIN_WINDOW / MAX_WINDOWS"""
+    window = float(window)
+    count = -int(-(end - start) // window) if window > 0 and end > start else 0
+    if window < MIN_WINDOW or count > MAX_WINDOWS:
+        raise TimelineError(f"timeline window must be at least {MIN_WINDOW:.0f}s "
+                            f"and give at most {MAX_WINDOWS} windows")
+    return count
+
+
+class FluencyIndex:
+    """
+    Interval index over one recording's word timings
+
+    flags: analyze_fluency's per-word flags (bit 0 filler, bits 1-2 gap
+    class); without them they are computed with the same profile.
+    """
+
+    def __init__(self, words, flags=None, profile=None):
+        self.profile = get_profile(profile)
+        if flags is None:
+            flags = analyze_fluency(words, annotate=True, profile=self.profile).get("annotations", {}).get("flags", [])
+        self.starts = [float(w['startTime']) for w in words]
+        self.ends = [float(w['endTime']) for w in words]
+        # prefix[i]: count over words[:i]
+        self._fillers = [0, *accumulate(f & 1 for f in flags)]
+        self._pauses = [0, *accumulate(f >> 1 > 0 for f in flags)]
+        self._long = [0, *accumulate(f >> 1 == GAP_LONG for f in flags)]
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def end(self):
+        return max(self.ends, default=0.0)
+
+    def span(self, t0, t1):
+        """Word index range [lo, hi) of the words starting in [t0, t1)"""
+        return bisect_left(self.starts, t0), bisect_left(self.starts, t1)
+
+    def counts(self, lo, hi):
+        """(fillers, pauses, long_pauses) over words[lo:hi]"""
+        return (self._fillers[hi] - self._fillers[lo], self._pauses[hi] - self._pauses[lo],
+                self._long[hi] - self._long[lo])
+
+    def window(self, t0, t1):
+        """analyze_fluency's metrics for the words starting in [t0, t1), plus the range"""
+        lo, hi = self.span(t0, t1)
+        if hi <= lo:
+            metrics = {"word_count": 0, "wpm": 0, "avg_word_time": 0, "filler_rate": 0, "pause_frequency": 0,
+                       "long_pauses": 0, "fluency_score": 0}
+        else:
+            fillers, pauses, long_pauses = self.counts(lo, hi)
+            metrics = {"word_count": hi - lo, **summarize(hi - lo, self.ends[hi - 1] - self.starts[lo], fillers,
+                                                          pauses, long_pauses, self.profile)}
+        return {"start": t0, "end": t1, **metrics}
+
+    def series(self, window=DEFAULT_WINDOW, start=0.0, end=None):
+        """
+        Metrics for consecutive fixed windows from start to the last word
+        Columnar: {"window", "start": [...], "wpm": [...], ...}
+        """
+        window = float(window)
+        end = self.end if end is None else end
+        count = window_count(window, end, start)
+        out = {"window": window, "start": []}
+        out.update((field, []) for field in SERIES_FIELDS)
+        for i in range(count):
+            t0 = start + i * window
+            metrics = self.window(t0, t0 + window)
+            out["start"].append(round(t0, 3))
+            for field in SERIES_FIELDS:
+                out[field].append(metrics[field])
+        return out
+
+
+# Interval index vs rescanning words per range: python -m vocalize_engine.timeline [minutes]
+if __name__ == "__main__":
+    import random
+    import sys
+
+    from vocalize_engine.bench import timeit
+    from vocalize_engine.encoding import synthetic_result
+
+    minutes = float(sys.argv[1]) if len(sys.argv) > 1 else 30
+    words = synthetic_result(minutes)["words"]
+    rng = random.Random(7)
+    length = words[-1]["endTime"]
+    ranges = []
+    for _ in range(200):
+        t0 = rng.uniform(0, length - 1)
+        ranges.append((t0, rng.uniform(t0 + 1, length)))
+
+    def rescan(t0, t1):
+        return analyze_fluency([w for w in words if t0 <= w["startTime"] < t1])
+
+    aggregate_s, _, _ = timeit(lambda: analyze_fluency(words), runs=5)
+    timeline_s, _, metrics = timeit(lambda: analyze_fluency(words, timeline=60), runs=5)
+    build_s, _, index = timeit(lambda: FluencyIndex(words), runs=5)
+    rescan_s, _, _ = timeit(lambda: [rescan(*r) for r in ranges], runs=1)
+    indexed_s, _, _ = timeit(lambda: [index.window(*r) for r in ranges], runs=20)
+
+    print(f"\n  {minutes:.0f}-minute session, {len(words)} words, {len(ranges)} random ranges")
+    print("  " + "─" * 60)
+    print(f"  {'analyze_fluency':<36} {1000 * aggregate_s:>9.2f}ms")
+    print(f"  {'  + timeline=60 (one pass)':<36} {1000 * timeline_s:>9.2f}ms")
+    print(f"  {'FluencyIndex(words) from scratch':<36} {1000 * build_s:>9.2f}ms")
+    print(f"  {'ranges by rescanning words':<36} {1000 * rescan_s / len(ranges):>9.3f}ms / range")
+    print(f"  {'ranges from the index':<36} {1000 * indexed_s / len(ranges):>9.3f}ms / range")
+
+    # Brute force over the words in range; the pause before the first one counts (it is inside the range)
+    profile = get_profile()
+    fillers = [f & 1 for f in analyze_fluency(words, annotate=True)["annotations"]["flags"]]
+    failures = []
+    for t0, t1 in ranges[:50]:
+        picked = [i for i, w in enumerate(words) if t0 <= w["startTime"] < t1]
+        gaps = [words[i]["startTime"] - words[i - 1]["endTime"] for i in picked if i > 0]
+        expected = summarize(len(picked), words[picked[-1]]["endTime"] - words[picked[0]]["startTime"],
+                             sum(fillers[i] for i in picked), sum(g > profile.pause_gap for g in gaps),
+                             sum(g > profile.long_pause_gap for g in gaps))
+        got = index.window(t0, t1)
+        if any(got[k] != expected[k] for k in expected):
+            failures.append(f"[{t0:.1f}, {t1:.1f}): {got} != {expected}")
+    whole = index.window(0, float("inf"))
+    if any(whole[k] != v for k, v in analyze_fluency(words).items()):
+        failures.append("full range differs from the aggregate")
+    if sum(metrics["timeline"]["word_count"]) != len(words):
+        failures.append("timeline windows do not add up to the word count")
+    for failure in failures[:5]:
+        print(f"  ❌ {failure}")
+    print("  ✓ all checks passed\n" if not failures else "")
+    sys.exit(1 if failures else 0)
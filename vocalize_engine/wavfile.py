@@ -0,0 +1,199 @@
+"""Memory-mapped WAV reader
+Parses the RIFF chunks itself so large archives are never copied onto the heap.
+Supports PCM (8/16/24/32-bit), IEEE float (32/64-bit) and WAVE_FORMAT_EXTENSIBLE.
+"""
+import mmap
+import struct
+import sys
+from array import array
+from collections import namedtuple
+from contextlib import ExitStack
+
+from vocalize_engine.sharedpcm import SharedWav, attach
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# memoryview typecodes for sample widths that map onto a native C type
+PCM_TYPECODES = {1: 'B', 2: 'h', 4: 'i'}
+FLOAT_TYPECODES = {4: 'f', 8: 'd'}
+
+
+WavFormat = namedtuple("WavFormat", "channels rate sample_width is_float")
+
+
+def parse_fmt_chunk(buf, offset, size):
+    """Parse the body of a fmt chunk into a WavFormat (ValueError if unsupported)"""
+    if size < 16:
+        raise ValueError("fmt chunk too short")
+    format_tag, channels, rate, _, block_align, bits = struct.unpack_from('<HHIIHH', buf, offset)
+    if format_tag == WAVE_FORMAT_EXTENSIBLE:
+        if size < 40:
+            raise ValueError("WAVE_FORMAT_EXTENSIBLE fmt chunk too short")
+        # The first two bytes of the SubFormat GUID carry the real format tag
+        format_tag, = struct.unpack_from('<H', buf, offset + 24)
+
+    if format_tag == WAVE_FORMAT_PCM:
+        is_float = False
+    elif format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        is_float = True
+    else:
+        raise ValueError(f"Unsupported WAV format tag: {format_tag:#06x}")
+
+    if channels < 1 or rate < 1:
+        raise ValueError("Invalid channel count or sample rate")
+    sample_width = block_align // channels if block_align else (bits + 7) // 8
+    if is_float and sample_width not in FLOAT_TYPECODES:
+        raise ValueError(f"Unsupported float width: {sample_width}")
+    if not is_float and sample_width not in (1, 2, 3, 4):
+        raise ValueError(f"Unsupported sample width: {sample_width}")
+    return WavFormat(channels, rate, sample_width, is_float)
+
+
+def view_samples(raw, sample_width, is_float):
+    """
+    Interleaved samples from little-endian sample bytes
+
+    Zero-copy memoryview for 8/16/32-bit PCM and float; 24-bit PCM
+    has no native type, so it is decoded into a list of ints.
+    8-bit PCM is unsigned (0-255) as stored.
+    """
+    typecode = FLOAT_TYPECODES[sample_width] if is_float else PCM_TYPECODES.get(sample_width)
+    if typecode is None:
+        return [int.from_bytes(raw[i:i + 3], 'little', signed=True) for i in range(0, len(raw), 3)]
+    if sys.byteorder == 'big' and sample_width > 1:
+        values = array(typecode, raw)
+        values.byteswap()
+        return values
+    return memoryview(raw).cast('B').cast(typecode)
+
+
+class WavFile:
+    """
+    Read-only view of a WAV file backed by mmap
+
+    Attributes: channels, rate, sample_width, n_frames, is_float,
+    data_offset, data_size. Use frames()/samples()/as_array() to get
+    zero-copy views of any region of the data chunk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if isinstance(path, SharedWav):
+            # A shared-memory segment (see sharedpcm): map its pages instead of a file
+            self._file = ExitStack()
+            self._mm = self._file.enter_context(attach(path))
+        else:
+            self._file = open(path, 'rb')
+            try:
+                self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                self._file.close()
+                raise ValueError(f"Empty file: {path}")
+        try:
+            self._parse()
+        except Exception:
+            self.close()
+            raise
+
+    def _parse(self):
+        mm = self._mm
+        if len(mm) < 12 or mm[0:4] != b'RIFF' or mm[8:12] != b'WAVE':
+            raise ValueError("file does not start with RIFF id")
+
+        fmt = None
+        pos = 12
+        while pos + 8 <= len(mm):
+            chunk_id = mm[pos:pos + 4]
+            chunk_size, = struct.unpack_from('<I', mm, pos + 4)
+            body = pos + 8
+            if chunk_id == b'fmt ':
+                fmt = parse_fmt_chunk(mm, body, chunk_size)
+                self.channels, self.rate, self.sample_width, self.is_float = fmt
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError("data chunk before fmt chunk")
+                self.data_offset = body
+                # Streaming writers leave the size at 0 or 0xFFFFFFFF; trust the file length
+                available = len(mm) - body
+                self.data_size = chunk_size if 0 < chunk_size <= available else available
+                break
+            pos = body + chunk_size + (chunk_size & 1)  # chunks are word aligned
+        else:
+            raise ValueError("No data chunk found")
+
+        self.frame_size = self.channels * self.sample_width
+        self.n_frames = self.data_size // self.frame_size
+        self.data_size = self.n_frames * self.frame_size
+
+    @property
+    def duration(self):
+        return self.n_frames / self.rate
+
+    @property
+    def typecode(self):
+        """memoryview/array typecode for one sample, or None for 24-bit PCM"""
+        if self.is_float:
+            return FLOAT_TYPECODES[self.sample_width]
+        return PCM_TYPECODES.get(self.sample_width)
+
+    def frames(self, start=0, stop=None):
+        """Raw interleaved bytes for frames [start, stop) as a zero-copy memoryview"""
+        start, stop, _ = slice(start, stop).indices(self.n_frames)
+        stop = max(start, stop)
+        begin = self.data_offset + start * self.frame_size
+        return memoryview(self._mm)[begin:self.data_offset + stop * self.frame_size]
+
+    def samples(self, start=0, stop=None):
+        """Interleaved samples for frames [start, stop) (see view_samples)"""
+        return view_samples(self.frames(start, stop), self.sample_width, self.is_float)
+
+    def as_array(self, start=0, stop=None):
+        """
+        NumPy view of frames [start, stop) with shape (frames, channels)
+
+        The view shares memory with the mmap (read-only). 24-bit PCM is
+        widened to int32, which requires a copy.
+        """
+        import numpy as np
+
+        start, stop, _ = slice(start, stop).indices(self.n_frames)
+        count = max(0, stop - start)
+        offset = self.data_offset + start * self.frame_size
+        if self.sample_width == 3 and not self.is_float:
+            raw = np.frombuffer(self._mm, dtype=np.uint8, count=count * self.frame_size, offset=offset)
+            raw = raw.reshape(-1, 3).astype(np.int32)
+            data = (raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)) << 8 >> 8
+            return data.reshape(count, self.channels)
+
+        if self.is_float:
+            dtype = '<f4' if self.sample_width == 4 else '<f8'
+        else:
+            dtype = {1: 'u1', 2: '<i2', 4: '<i4'}[self.sample_width]
+        data = np.frombuffer(self._mm, dtype=dtype, count=count * self.channels, offset=offset)
+        return data.reshape(count, self.channels)
+
+    def close(self):
+        """Release the mapping (unmapped once every view handed out is gone)"""
+        if self._mm is not None:
+            try:
+                if isinstance(self._mm, memoryview):
+                    self._mm.release()
+                else:
+                    self._mm.close()
+            except BufferError:
+                pass  # Live views keep the mapping alive until they are collected
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_wav(path):
+    """Open a WAV file (or a sharedpcm.SharedWav segment) for zero-copy reading"""
+    return WavFile(path)
@@ -0,0 +1,235 @@
+"""Per-process resources for multi-worker serving
+
+Under gunicorn with preload_app the engine is imported once in the master
+and then forked. Anything holding sockets, threads or child processes must
+not cross that fork, so everything here is created lazily and keyed by pid:
+a forked worker transparently gets its own copy on first use.
+
+    http_session()   pooled keep-alive requests.Session for the REST API
+    speech_client()  cached google-cloud-speech client per service account/API key
+    process_pool()   ProcessPoolExecutor for CPU-bound conversion/analysis
+    thread_pool()    threads that carry (hedged) STT requests
+    in_flight()      counts running analyses so shutdown can drain them
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from vocalize_engine import sharedpcm
+
+HTTP_POOL_SIZE = int(os.getenv("STT_HTTP_POOL_SIZE", 16))
+
+_lock = threading.Lock()
+_state = {"pid": None, "session": None, "clients": {}, "pool": None, "threads": None}
+_active = {"count": 0}
+_idle = threading.Condition(threading.Lock())
+
+
+def import_engine():
+    """Import and compile everything a request can touch (process pool initializer)"""
+    import vocalize_engine.acoustic  # noqa: F401
+    import vocalize_engine.channels  # noqa: F401
+    import vocalize_engine.codecs  # noqa: F401
+    import vocalize_engine.fingerprint  # noqa: F401
+    import vocalize_engine.planner  # noqa: F401
+    import vocalize_engine.probe  # noqa: F401
+    from vocalize_engine.backends import get_backend
+    from vocalize_engine.profiles import get_profile
+
+    get_backend()   # numpy import is the slow part of a cold start
+    get_profile()
+
+
+def preload():
+    """
+    import_engine, then calibrate the sample-rate policy (call once before fork)
+    Calibration times the converters, so it runs in the gunicorn master and
+    workers inherit the result; pool processes only calibrate a rate if they
+    need it (rates.convert_cost is cached per process).
+    """
+    from vocalize_engine.rates import choose_sample_rate
+
+    import_engine()
+    for rate in (44100, 48000):
+        # Sample-rate policy calibration for the common browser/device rates
+        choose_sample_rate(rate, backend="stdlib")
+        choose_sample_rate(rate)
+
+
+def process_pool_size():
+    """$CONVERT_PROCESSES, else the cores left per web worker ($WEB_CONCURRENCY)"""
+    if os.getenv("CONVERT_PROCESSES"):
+        return max(1, int(os.getenv("CONVERT_PROCESSES")))
+    web_workers = int(os.getenv("WEB_CONCURRENCY", 1))
+    return max(1, (os.cpu_count() or 1) // web_workers)
+
+
+def _local():
+    """This process's resources; dropped (not closed) when we are a fresh fork"""
+    pid = os.getpid()
+    if _state["pid"] != pid:
+        with _lock:
+            if _state["pid"] != pid:
+                # Inherited from the parent: sockets/processes belong to it
+                _state.update(pid=pid, session=None, clients={}, pool=None, threads=None)
+    return _state
+
+
+def http_session():
+    state = _local()
+    if state["session"] is None:
+        with _lock:
+            if state["session"] is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                state["session"] = session
+    return state["session"]
+
+
+def speech_client(credentials_info):
+    """SpeechClient for a service account (dict) or an API key (str), built once per process"""
+    from google.cloud import speech
+
+    state = _local()
+    if isinstance(credentials_info, str):
+        key = credentials_info
+    else:
+        key = credentials_info.get("client_email") or credentials_info.get("private_key_id")
+    with _lock:
+        client = state["clients"].get(key)
+        if client is None:
+            if isinstance(credentials_info, str):
+                client = speech.SpeechClient(client_options={"api_key": credentials_info})
+            else:
+                client = speech.SpeechClient.from_service_account_info(credentials_info)
+            state["clients"][key] = client
+    return client
+
+
+def process_pool():
+    state = _local()
+    if state["pool"] is None:
+        with _lock:
+            if state["pool"] is None:
+                # forkserver: don't fork the web worker's threads/sockets into the pool
+                context = multiprocessing.get_context(
+                    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else None)
+                state["pool"] = ProcessPoolExecutor(max_workers=process_pool_size(), mp_context=context,
+                                                    initializer=import_engine)
+    return state["pool"]
+
+
+def thread_pool():
+    """Room for every pooled connection plus a hedge for each"""
+    state = _local()
+    if state["threads"] is None:
+        with _lock:
+            if state["threads"] is None:
+                state["threads"] = ThreadPoolExecutor(max_workers=2 * HTTP_POOL_SIZE, thread_name_prefix="stt")
+    return state["threads"]
+
+
+def warm(pool_size=None):
+    """Start the pool's processes and the HTTP session now, not on the first request"""
+    http_session()
+    pool = process_pool()
+    list(pool.map(_ping, range(pool_size or process_pool_size())))
+    return pool
+
+
+def _ping(_):
+    return os.getpid()
+
+
+@contextmanager
+def in_flight():
+    with _idle:
+        _active["count"] += 1
+    try:
+        yield
+    finally:
+        with _idle:
+            _active["count"] -= 1
+            _idle.notify_all()
+
+
+def active_count():
+    return _active["count"]
+
+
+def drain(timeout=None):
+    """Wait for in-flight analyses, then release this process's resources"""
+    deadline = time.monotonic() + timeout if timeout else None
+    with _idle:
+        while _active["count"]:
+            remaining = deadline - time.monotonic() if deadline else None
+            if remaining is not None and remaining <= 0:
+                break
+            _idle.wait(remaining)
+        drained = _active["count"] == 0
+    state = _local()
+    with _lock:
+        if state["pool"] is not None:
+            state["pool"].shutdown(wait=True)
+            state["pool"] = None
+        if state["threads"] is not None:
+            state["threads"].shutdown(wait=True)
+            state["threads"] = None
+        if state["session"] is not None:
+            state["session"].close()
+            state["session"] = None
+    sharedpcm.segments.clear()
+    return drained
+
+
+def _cpu_job(path):
+    """One /prescore's worth of CPU: convert to 16kHz mono, then acoustic analysis"""
+    import contextlib
+    import io
+    import tempfile
+
+    from vocalize_engine.acoustic import analyze_acoustic_fluency
+    from vocalize_engine.convert import convert_to_google_format
+
+    with tempfile.NamedTemporaryFile(suffix=".wav") as out, contextlib.redirect_stdout(io.StringIO()):
+        convert_to_google_format(path, out.name)
+        return analyze_acoustic_fluency(out.name)["fluency_metrics"]["wpm"]
+
+
+# Throughput vs pool size: python -m vocalize_engine.workers [jobs]
+if __name__ == "__main__":
+    import sys
+
+    from vocalize_engine.bench import bundled_wavs
+
+    jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 48
+    paths = [bundled_wavs()[i % len(bundled_wavs())] for i in range(jobs)]
+    cores = os.cpu_count() or 1
+    sizes = sorted({1, 2, 4, 8, cores} & set(range(1, max(cores, 2) * 2 + 1)))
+
+    preload()
+    started = time.perf_counter()
+    for path in paths:
+        _cpu_job(path)
+    inline_s = time.perf_counter() - started
+
+    print(f"\n  {jobs} convert+acoustic jobs on {cores} core(s)")
+    print(f"\n  {'Processes':>10} {'Jobs/s':>9} {'Speedup':>8}")
+    print("  " + "─" * 30)
+    print(f"  {'inline':>10} {jobs / inline_s:>9.1f} {1.0:>7.2f}x")
+    for size in sizes:
+        with ProcessPoolExecutor(max_workers=size, initializer=import_engine) as pool:
+            list(pool.map(_ping, range(size)))  # warm
+            started = time.perf_counter()
+            list(pool.map(_cpu_job, paths))
+            elapsed = time.perf_counter() - started
+        print(f"  {size:>10} {jobs / elapsed:>9.1f} {inline_s / elapsed:>7.2f}x")
+    print()